@@ -1,89 +1,168 @@
 # API Bridge Server to connect Streamlit data with React Frontend
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response, g
 from flask_cors import CORS
 import json
 import os
 from datetime import datetime
 import threading
 import time
+import metrics
+import tracing
+from bridge_core import (
+    CHANGES_BUSY_RETRY, CHANGES_MAX_WAITERS, CORS_ORIGINS, DEVICE_HEADER, build_analysis, check_features,
+    device_id, normalize_client_span, parse_changes_query, parse_incidents_query, parse_labels_query,
+    parse_similar_query, changes_payload
+)
+from correlation import Correlator
+from devices import DeviceThrottle, parse_device_history_query
+from export import EXPORT_FORMATS, export_filename, export_stream, parse_export_query
+from feature_schema import FeatureValidationError
+from retention import Compactor, RetentionPolicy, parse_timeseries_query, timeseries
+from similarity import SimilarityIndex
+from state_store import ChangeNotifier, create_store_from_env, import_json_snapshot
 
 app = Flask(__name__)
-CORS(app, origins=[
-    "http://localhost:5174", 
-    "http://localhost:3000", 
-    "https://secure-gluco.vercel.app",  # Removed trailing slash
-    "https://*.vercel.app"              # Added wildcard for preview deployments
-])  # Enable CORS for React frontend
-
-# Shared data store (in production, use Redis or database)
-shared_data = {
-    "latest_analysis": None,
-    "analysis_history": [],
-    "last_updated": None
-}
-
-# File-based data sharing (alternative to in-memory)
-DATA_FILE = os.path.join(os.path.dirname(__file__), 'shared_analysis_data.json')
-
-def save_data_to_file():
-    """Save shared data to file for persistence"""
-    try:
-        with open(DATA_FILE, 'w') as f:
-            # Convert datetime objects to strings for JSON serialization
-            data_copy = shared_data.copy()
-            if data_copy["last_updated"]:
-                data_copy["last_updated"] = data_copy["last_updated"].isoformat()
-            json.dump(data_copy, f, indent=2)
-    except Exception as e:
-        print(f"Error saving data: {e}")
+CORS(app, origins=CORS_ORIGINS)  # Enable CORS for React frontend
+
+# Shared data store: SQLite by default, Redis with BRIDGE_STATE_BACKEND=redis.
+# Lives outside the process so every gunicorn worker sees the same analyses.
+store = create_store_from_env()
+# Wakes /changes long-polls; one store poller per process, however many clients wait.
+# Held requests are capped so they can't take every gthread thread away from ingest.
+changes = ChangeNotifier(store, max_waiters=CHANGES_MAX_WAITERS)
+# Per-worker in-memory copy of the stored search vectors (caught up on each query)
+similar_index = SimilarityIndex()
+# Folds repeated alerts into incidents before they reach the store
+correlator = Correlator.from_env()
+# Per-device ingest budget, so one noisy device can't starve the others (off unless DEVICE_RATE_LIMIT is set)
+throttle = DeviceThrottle.from_env()
+# Rolls raw analyses past the raw window into minute/hour aggregates (one worker at a time)
+compactor = Compactor(store, RetentionPolicy.from_env()).start()
+
+# Instrumentation (exposed on /metrics)
+REQUEST_LATENCY = metrics.histogram(
+    "bridge_request_duration_seconds", "Bridge request latency by route", ("route", "method", "status")
+)
+PERSIST_LATENCY = metrics.histogram(
+    "bridge_persistence_write_seconds", "Time spent writing an analysis to the shared store"
+)
+HISTORY_SIZE = metrics.gauge("bridge_history_size", "Analyses currently held in history")
+ANALYSES_RECEIVED = metrics.counter(
+    "bridge_analyses_received_total", "Analyses received by threat class", ("threat_class",)
+)
+LABELS_RECEIVED = metrics.counter(
+    "bridge_labels_received_total", "Analyst labels received by label", ("label",)
+)
+SIMILARITY_INDEX_SIZE = metrics.gauge("bridge_similarity_index_size", "Vectors in this worker's similarity index")
+LONG_POLL_WAITING = metrics.gauge("bridge_longpoll_waiting", "Long-poll /changes requests currently waiting")
+LONG_POLL_BUSY = metrics.counter(
+    "bridge_longpoll_busy_total", "Long-poll /changes requests answered at once because too many were waiting"
+)
+ALERTS_CORRELATED = metrics.counter(
+    "bridge_alerts_correlated_total", "Alerts by correlation outcome (new, merged, escalated)", ("action",)
+)
+INCIDENT_KEYS = metrics.gauge("bridge_incident_keys", "(threat class, device, source) keys tracked by the correlator")
+FEATURES_CHECKED = metrics.counter(
+    "bridge_features_checked_total", "Incoming feature sets by validation outcome (accepted, clipped, rejected)",
+    ("outcome",)
+)
+
+# Legacy file-based data sharing; imported into the store once if present
+DATA_FILE = os.environ.get(
+    'BRIDGE_DATA_FILE',
+    os.path.join(os.path.dirname(__file__), 'shared_analysis_data.json')
+)
 
 def load_data_from_file():
-    """Load shared data from file"""
-    global shared_data
-    try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r') as f:
-                data = json.load(f)
-                if data.get("last_updated"):
-                    data["last_updated"] = datetime.fromisoformat(data["last_updated"])
-                shared_data.update(data)
+    """Seed an empty store from the legacy JSON snapshot"""
+    try:
+        imported = import_json_snapshot(store, DATA_FILE)
+        if imported:
+            print(f"Imported {imported} analyses from {os.path.basename(DATA_FILE)}")
+        HISTORY_SIZE.set(store.count())
     except Exception as e:
         print(f"Error loading data: {e}")
 
 # Load existing data on startup
 load_data_from_file()
 
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_request_latency(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        # Use the URL rule (not the raw path) so label cardinality stays bounded
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - start,
+            route=route, method=request.method, status=response.status_code
+        )
+    return response
+
 @app.route('/api/threat-analysis', methods=['POST'])
 def receive_analysis():
     """Receive analysis data from Streamlit app"""
     try:
         data = request.json
-        
-        # Structure the analysis data
-        analysis = {
-            "id": str(int(time.time() * 1000)),  # Unique ID
-            "timestamp": datetime.now(),
-            "threat_class": data.get("threat_class"),
-            "confidence": data.get("confidence"),
-            "probabilities": data.get("probabilities", {}),
-            "features": data.get("features", {}),
-            "recommendations": data.get("recommendations", []),
-            "risk_level": data.get("risk_level", "Unknown")
-        }
-        
-        # Update shared data
-        shared_data["latest_analysis"] = analysis
-        shared_data["last_updated"] = datetime.now()
-        
-        # Add to history (keep last 50 analyses)
-        shared_data["analysis_history"].append(analysis)
-        if len(shared_data["analysis_history"]) > 50:
-            shared_data["analysis_history"] = shared_data["analysis_history"][-50:]
-        
-        # Save to file
-        save_data_to_file()
-        
-        return jsonify({"status": "success", "message": "Analysis data received"})
+
+        # Which device sent it (payload first, header as fallback), and whether it is within its budget
+        try:
+            device = device_id(data.get("device_id") or request.headers.get(DEVICE_HEADER))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        allowed, retry_after = throttle.allow(device)
+        if not allowed:
+            response = jsonify({"status": "error", "message": f"Rate limit exceeded for device {device}"})
+            response.headers["Retry-After"] = str(max(1, round(retry_after)))
+            return response, 429
+
+        # Features must match the schema; out-of-range values are clipped, unusable ones rejected
+        try:
+            feature_issues = check_features(data)
+        except FeatureValidationError as e:
+            FEATURES_CHECKED.inc(outcome="rejected")
+            return jsonify({"status": "error", "message": str(e),
+                            "validation": e.report.summary() if e.report else None}), 400
+        FEATURES_CHECKED.inc(outcome="clipped" if feature_issues else "accepted")
+
+        # Continue the trace started in Streamlit (header first, payload as fallback)
+        trace_id, parent_id = tracing.parse_traceparent(request.headers.get(tracing.TRACEPARENT_HEADER))
+        trace_id = trace_id or data.get("trace_id")
+
+        with tracing.span("bridge.receive_analysis", trace_id=trace_id, parent=parent_id,
+                          service="bridge") as trace_span:
+            # Structure the analysis data
+            analysis = build_analysis(data, trace_id=trace_span.trace_id, device=device)
+            trace_span.attributes["analysis_id"] = analysis["id"]
+            trace_span.attributes["device_id"] = device
+            if feature_issues:
+                analysis["feature_issues"] = feature_issues
+            ANALYSES_RECEIVED.inc(threat_class=analysis["threat_class"] or "unknown")
+
+            # Fold repeats of an open incident (same threat class, device and source) into it
+            incident, action = correlator.observe(analysis)
+            INCIDENT_KEYS.set(len(correlator))
+            if incident is not None:
+                analysis["risk_level"] = incident["risk_level"]
+                analysis["incident"] = incident
+                ALERTS_CORRELATED.inc(action=action)
+                trace_span.attributes["incident_id"] = incident["incident_id"]
+                if not correlator.should_store(action):
+                    return jsonify({"status": "success", "message": "Merged into incident",
+                                    "deduplicated": True, "incident": incident,
+                                    "trace_id": trace_span.trace_id})
+
+            # Update shared store (history trimmed by the store)
+            with PERSIST_LATENCY.time(), tracing.span("bridge.persist", parent=trace_span):
+                seq = store.add_analysis(analysis, datetime.now())
+            changes.notify(seq)
+
+        return jsonify({"status": "success", "message": "Analysis data received",
+                        "deduplicated": False, "incident": incident, "feature_issues": feature_issues,
+                        "trace_id": trace_span.trace_id})
     
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -92,16 +171,12 @@ def receive_analysis():
 def get_latest_analysis():
     """Get latest analysis for React frontend"""
     try:
-        if shared_data["latest_analysis"]:
-            # Convert datetime to ISO string for JSON response
-            analysis = shared_data["latest_analysis"].copy()
-            if isinstance(analysis["timestamp"], datetime):
-                analysis["timestamp"] = analysis["timestamp"].isoformat()
-            
+        analysis = store.latest()
+        if analysis:
             return jsonify({
                 "status": "success",
                 "data": analysis,
-                "last_updated": shared_data["last_updated"].isoformat() if shared_data["last_updated"] else None
+                "last_updated": store.last_updated()
             })
         else:
             return jsonify({
@@ -116,13 +191,7 @@ def get_latest_analysis():
 def get_analysis_history():
     """Get analysis history for React frontend"""
     try:
-        # Convert datetime objects to ISO strings
-        history = []
-        for analysis in shared_data["analysis_history"]:
-            analysis_copy = analysis.copy()
-            if isinstance(analysis_copy["timestamp"], datetime):
-                analysis_copy["timestamp"] = analysis_copy["timestamp"].isoformat()
-            history.append(analysis_copy)
+        history = store.history()
         
         return jsonify({
             "status": "success",
@@ -132,15 +201,202 @@ def get_analysis_history():
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/threat-analysis/devices', methods=['GET'])
+def get_devices():
+    """Every device that sent an analysis, with its newest summary and total count"""
+    try:
+        devices = store.devices()
+        return jsonify({"status": "success", "data": devices, "count": len(devices)})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/threat-analysis/devices/<device>', methods=['GET'])
+def get_device_latest(device):
+    """Latest analysis of one device (an index lookup; other devices' traffic doesn't matter)"""
+    try:
+        analysis = store.device_latest(device_id(device))
+        return jsonify({"status": "success", "data": analysis, "device_id": device})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/threat-analysis/devices/<device>/history', methods=['GET'])
+def get_device_history(device):
+    """Newest ?limit= analyses of one device, oldest first"""
+    try:
+        history = store.device_history(device_id(device), parse_device_history_query(request.args))
+        return jsonify({"status": "success", "data": history, "count": len(history), "device_id": device})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/threat-analysis/changes', methods=['GET'])
+def get_changes():
+    """
+    Analyses newer than ?since=<seq>, oldest first. When there are none, the request
+    is held for up to ?timeout= seconds (long-poll) and answered as soon as one
+    arrives. Pass the returned `seq` as the next `since`. When CHANGES_MAX_WAITERS
+    requests are already held, the request is answered at once with retry_after.
+    """
+    try:
+        since, wait, limit = parse_changes_query(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    try:
+        latest = store.latest_seq()
+        reset = since > latest
+        retry_after = None
+        if reset:
+            since = 0
+        elif latest <= since and wait > 0:
+            LONG_POLL_WAITING.inc()
+            try:
+                newest = changes.wait_for(since, wait)
+            finally:
+                LONG_POLL_WAITING.dec()
+            if newest is None:
+                LONG_POLL_BUSY.inc()
+                retry_after = CHANGES_BUSY_RETRY
+            else:
+                latest = max(latest, newest)
+        if latest <= since:
+            analyses = []
+        else:
+            # A fresh client gets the recent history, not the oldest rows still in the raw window
+            analyses = store.history()[-limit:] if since == 0 else store.analyses_since(since, limit)
+        response = jsonify(changes_payload(analyses, latest, store.last_updated(), reset, retry_after))
+        if retry_after:
+            response.headers["Retry-After"] = str(int(retry_after))
+        return response
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/threat-analysis/export', methods=['GET'])
+def export_analyses():
+    """
+    Stream stored analyses as ndjson, csv or parquet (?format=), optionally within
+    ?start= / ?end= (ISO or epoch seconds). Rows are read and encoded page by page
+    and sent with chunked transfer encoding, so memory stays flat.
+    """
+    try:
+        fmt, start, end = parse_export_query(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    chunks = export_stream(store.iter_analyses(start, end), fmt)
+    return Response(chunks, mimetype=EXPORT_FORMATS[fmt],
+                    headers={"Content-Disposition": f"attachment; filename={export_filename(fmt)}"})
+
+@app.route('/api/threat-analysis/timeseries', methods=['GET'])
+def get_timeseries():
+    """
+    Class counts, confidence stats (and with ?features=1 feature means) per bucket
+    over ?start= / ?end= (default: the last day). Long ranges are served from the
+    minute/hour rollups, so the cost depends on the number of buckets, not on how much traffic there was.
+    """
+    try:
+        start, end, step, include_features = parse_timeseries_query(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    try:
+        return jsonify(dict(timeseries(store, start, end, step, include_features), status="success"))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/threat-analysis/incidents', methods=['GET'])
+def get_incidents():
+    """Correlated incidents, most recently active first (?limit=, default 50)"""
+    try:
+        limit = parse_incidents_query(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    try:
+        incidents = correlator.incidents(limit)
+        return jsonify({"status": "success", "data": incidents, "count": len(incidents)})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/threat-analysis/<analysis_id>/label', methods=['POST'])
+def label_analysis(analysis_id):
+    """Record an analyst-confirmed label for an analysis (feeds online fine-tuning)"""
+    try:
+        data = request.json or {}
+        if not data.get("label"):
+            return jsonify({"status": "error", "message": "label is required"}), 400
+        record = store.add_label(analysis_id, data["label"], data.get("analyst"))
+        if record is None:
+            return jsonify({"status": "error", "message": "Analysis not found"}), 404
+        LABELS_RECEIVED.inc(label=record["label"])
+        return jsonify({"status": "success", "data": record})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/threat-analysis/<analysis_id>/similar', methods=['GET'])
+def get_similar(analysis_id):
+    """Past analyses closest to this one in feature space (?k=, default 10)"""
+    try:
+        k = parse_similar_query(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    try:
+        results = similar_index.similar(store, analysis_id, k)
+        SIMILARITY_INDEX_SIZE.set(similar_index.size)
+        if results is None:
+            return jsonify({"status": "error", "message": "Analysis not found or has no features"}), 404
+        return jsonify({"status": "success", "data": results, "count": len(results),
+                        "index": similar_index.stats()})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/threat-analysis/labels', methods=['GET'])
+def get_labels():
+    """Labeled analyses after ?since=<label seq>, oldest first"""
+    try:
+        since, limit = parse_labels_query(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    try:
+        labels = store.labels_since(since, limit)
+        return jsonify({"status": "success", "data": labels, "count": len(labels)})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "last_analysis": shared_data["last_updated"].isoformat() if shared_data["last_updated"] else None
+        "last_analysis": store.last_updated()
     })
 
+@app.route('/api/traces', methods=['POST'])
+def receive_spans():
+    """Accept finished spans from the dashboard so the whole path lands in one trace file"""
+    try:
+        data = request.json
+        spans = data if isinstance(data, list) else [data]
+        spans = [span for span in map(normalize_client_span, spans) if span is not None]
+        # Nothing is kept when tracing is off (no TRACE_FILE), so nothing counts as accepted
+        accepted = len(spans) if tracing.tracing_enabled() else 0
+        for span in spans[:accepted]:
+            tracing.record_span(span)
+        return jsonify({"status": "success", "accepted": accepted})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    # Counted per scrape, not per POST: under tiered retention the store holds a day of rows
+    HISTORY_SIZE.set(store.count())
+    response = make_response(metrics.REGISTRY.render())
+    response.headers["Content-Type"] = metrics.CONTENT_TYPE
+    return response
+
 if __name__ == '__main__':
     print("🌉 API Bridge Server Starting...")
     print("📡 Bridging Streamlit ↔ React Frontend")
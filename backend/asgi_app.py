@@ -0,0 +1,499 @@
+# Async (ASGI) version of the API bridge
+#
+# Same routes and JSON shapes as app.py, served by Starlette under uvicorn:
+#     uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+#
+# Handlers never block the event loop: every shared-store call (SQLite or Redis,
+# see state_store.py) runs in a worker thread, so one process can hold thousands
+# of concurrent dashboard connections while any number of uvicorn workers see the
+# same analyses.
+import asyncio
+import contextlib
+import os
+import re
+import time
+from datetime import datetime
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+import tracing
+from bridge_core import (
+    CORS_ORIGINS, DEVICE_HEADER, build_analysis, check_features, device_id, normalize_client_span,
+    parse_changes_query, parse_incidents_query, parse_labels_query, parse_similar_query, changes_payload
+)
+from correlation import Correlator
+from devices import DeviceThrottle, parse_device_history_query
+from export import EXPORT_FORMATS, export_filename, export_stream, parse_export_query
+from feature_schema import FeatureValidationError
+from retention import Compactor, RetentionPolicy, parse_timeseries_query, timeseries
+from similarity import SimilarityIndex
+from state_store import create_store_from_env, import_json_snapshot
+
+# Same metric names as the Flask bridge so dashboards work against either
+REQUEST_LATENCY = metrics.histogram(
+    "bridge_request_duration_seconds", "Bridge request latency by route", ("route", "method", "status")
+)
+PERSIST_LATENCY = metrics.histogram(
+    "bridge_persistence_write_seconds", "Time spent writing an analysis to the shared store"
+)
+HISTORY_SIZE = metrics.gauge("bridge_history_size", "Analyses currently held in history")
+ANALYSES_RECEIVED = metrics.counter(
+    "bridge_analyses_received_total", "Analyses received by threat class", ("threat_class",)
+)
+LABELS_RECEIVED = metrics.counter(
+    "bridge_labels_received_total", "Analyst labels received by label", ("label",)
+)
+SIMILARITY_INDEX_SIZE = metrics.gauge("bridge_similarity_index_size", "Vectors in this worker's similarity index")
+LONG_POLL_WAITING = metrics.gauge("bridge_longpoll_waiting", "Long-poll /changes requests currently waiting")
+ALERTS_CORRELATED = metrics.counter(
+    "bridge_alerts_correlated_total", "Alerts by correlation outcome (new, merged, escalated)", ("action",)
+)
+INCIDENT_KEYS = metrics.gauge("bridge_incident_keys", "(threat class, device, source) keys tracked by the correlator")
+FEATURES_CHECKED = metrics.counter(
+    "bridge_features_checked_total", "Incoming feature sets by validation outcome (accepted, clipped, rejected)",
+    ("outcome",)
+)
+
+DATA_FILE = os.environ.get(
+    'BRIDGE_DATA_FILE',
+    os.path.join(os.path.dirname(__file__), 'shared_analysis_data.json')
+)
+
+store = create_store_from_env()
+
+
+class AsyncChangeNotifier:
+    """
+    asyncio counterpart of state_store.ChangeNotifier: waiting /changes requests
+    await one shared Event (replaced on every change), and a single task polls
+    store.latest_seq() for writes from other workers, only while someone waits.
+    """
+
+    def __init__(self, store, interval=0.25):
+        self.store = store
+        self.interval = interval
+        self.seq = 0
+        self._event = asyncio.Event()
+        self._waiters = 0
+        self._poller = None
+
+    def notify(self, seq):
+        if seq > self.seq:
+            self.seq = seq
+            self._event.set()
+            self._event = asyncio.Event()
+
+    async def _poll(self):
+        try:
+            while self._waiters:
+                try:
+                    self.notify(await asyncio.to_thread(self.store.latest_seq))
+                except Exception as e:
+                    print(f"Change poll failed: {e}")
+                await asyncio.sleep(self.interval)
+        finally:
+            self._poller = None
+
+    async def wait_for(self, since, timeout):
+        self._waiters += 1
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while self.seq <= since and loop.time() < deadline:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._event.wait(), deadline - loop.time())
+            return self.seq
+        finally:
+            self._waiters -= 1
+
+
+changes = AsyncChangeNotifier(store)
+similar_index = SimilarityIndex()
+correlator = Correlator.from_env()  # O(1) in-memory work per alert, fine on the event loop
+throttle = DeviceThrottle.from_env()  # likewise
+compactor = Compactor(store, RetentionPolicy.from_env())  # background thread, started in lifespan
+tracing.export_in_background()  # spans finish on the event loop; their file writes happen in a thread
+
+
+async def load_data_from_file():
+    """Seed an empty store from the legacy JSON snapshot without blocking the loop"""
+    try:
+        await asyncio.to_thread(import_json_snapshot, store, DATA_FILE)
+        HISTORY_SIZE.set(await asyncio.to_thread(store.count))
+    except Exception as e:
+        print(f"Error loading data: {e}")
+
+
+def _persist(analysis):
+    start = time.perf_counter()
+    seq = store.add_analysis(analysis, datetime.now())
+    PERSIST_LATENCY.observe(time.perf_counter() - start)
+    return seq
+
+
+# -------------------------------
+# Routes
+# -------------------------------
+async def receive_analysis(request: Request):
+    """Receive analysis data from Streamlit app"""
+    try:
+        data = await request.json()
+
+        try:
+            device = device_id(data.get("device_id") or request.headers.get(DEVICE_HEADER))
+        except ValueError as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+        allowed, retry_after = throttle.allow(device)
+        if not allowed:
+            return JSONResponse({"status": "error", "message": f"Rate limit exceeded for device {device}"},
+                                status_code=429, headers={"Retry-After": str(max(1, round(retry_after)))})
+        try:
+            feature_issues = check_features(data)
+        except FeatureValidationError as e:
+            FEATURES_CHECKED.inc(outcome="rejected")
+            return JSONResponse({"status": "error", "message": str(e),
+                                 "validation": e.report.summary() if e.report else None}, status_code=400)
+        FEATURES_CHECKED.inc(outcome="clipped" if feature_issues else "accepted")
+
+        trace_id, parent_id = tracing.parse_traceparent(request.headers.get(tracing.TRACEPARENT_HEADER))
+        trace_id = trace_id or data.get("trace_id")
+
+        with tracing.span("bridge.receive_analysis", trace_id=trace_id, parent=parent_id,
+                          service="bridge-asgi") as trace_span:
+            analysis = build_analysis(data, trace_id=trace_span.trace_id, device=device)
+            trace_span.attributes["analysis_id"] = analysis["id"]
+            trace_span.attributes["device_id"] = device
+            if feature_issues:
+                analysis["feature_issues"] = feature_issues
+            ANALYSES_RECEIVED.inc(threat_class=analysis["threat_class"] or "unknown")
+
+            incident, action = correlator.observe(analysis)
+            INCIDENT_KEYS.set(len(correlator))
+            if incident is not None:
+                analysis["risk_level"] = incident["risk_level"]
+                analysis["incident"] = incident
+                ALERTS_CORRELATED.inc(action=action)
+                trace_span.attributes["incident_id"] = incident["incident_id"]
+                if not correlator.should_store(action):
+                    return JSONResponse({"status": "success", "message": "Merged into incident",
+                                         "deduplicated": True, "incident": incident,
+                                         "trace_id": trace_span.trace_id})
+
+            with tracing.span("bridge.persist", parent=trace_span):
+                seq = await asyncio.to_thread(_persist, analysis)
+            changes.notify(seq)
+
+        return JSONResponse({"status": "success", "message": "Analysis data received",
+                             "deduplicated": False, "incident": incident, "feature_issues": feature_issues,
+                             "trace_id": trace_span.trace_id})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def get_latest_analysis(request: Request):
+    """Get latest analysis for React frontend"""
+    try:
+        analysis, last_updated = await asyncio.to_thread(lambda: (store.latest(), store.last_updated()))
+        if analysis:
+            return JSONResponse({
+                "status": "success",
+                "data": analysis,
+                "last_updated": last_updated
+            })
+        return JSONResponse({
+            "status": "success",
+            "data": None,
+            "message": "No analysis data available"
+        })
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def get_analysis_history(request: Request):
+    """Get analysis history for React frontend"""
+    try:
+        history = await asyncio.to_thread(store.history)
+        return JSONResponse({
+            "status": "success",
+            "data": history,
+            "count": len(history)
+        })
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def get_devices(request: Request):
+    """Every device that sent an analysis, with its newest summary and total count"""
+    try:
+        devices = await asyncio.to_thread(store.devices)
+        return JSONResponse({"status": "success", "data": devices, "count": len(devices)})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def get_device_latest(request: Request):
+    """Latest analysis of one device (an index lookup; other devices' traffic doesn't matter)"""
+    try:
+        device = device_id(request.path_params["device"])
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    try:
+        analysis = await asyncio.to_thread(store.device_latest, device)
+        return JSONResponse({"status": "success", "data": analysis, "device_id": device})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def get_device_history(request: Request):
+    """Newest ?limit= analyses of one device, oldest first"""
+    try:
+        device = device_id(request.path_params["device"])
+        limit = parse_device_history_query(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    try:
+        history = await asyncio.to_thread(store.device_history, device, limit)
+        return JSONResponse({"status": "success", "data": history, "count": len(history), "device_id": device})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def get_changes(request: Request):
+    """Analyses newer than ?since=<seq>; held up to ?timeout= seconds when there are none"""
+    try:
+        since, wait, limit = parse_changes_query(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    try:
+        latest = await asyncio.to_thread(store.latest_seq)
+        reset = since > latest
+        if reset:
+            since = 0
+        elif latest <= since and wait > 0:
+            LONG_POLL_WAITING.inc()
+            try:
+                latest = max(latest, await changes.wait_for(since, wait))
+            finally:
+                LONG_POLL_WAITING.dec()
+        def _read():
+            if latest <= since:
+                return [], store.last_updated()
+            analyses = store.history()[-limit:] if since == 0 else store.analyses_since(since, limit)
+            return analyses, store.last_updated()
+
+        analyses, last_updated = await asyncio.to_thread(_read)
+        return JSONResponse(changes_payload(analyses, latest, last_updated, reset))
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def export_analyses(request: Request):
+    """Stream stored analyses as ndjson, csv or parquet (?format=, ?start=, ?end=)"""
+    try:
+        fmt, start, end = parse_export_query(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    # A sync iterator: Starlette pulls each chunk in a worker thread, so store reads never block the loop
+    chunks = export_stream(store.iter_analyses(start, end), fmt)
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[fmt],
+                             headers={"Content-Disposition": f"attachment; filename={export_filename(fmt)}"})
+
+
+async def get_timeseries(request: Request):
+    """Per-bucket class counts and confidence stats over ?start= / ?end=, from the coarsest tier needed"""
+    try:
+        start, end, step, include_features = parse_timeseries_query(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    try:
+        result = await asyncio.to_thread(timeseries, store, start, end, step, include_features)
+        return JSONResponse(dict(result, status="success"))
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def get_incidents(request: Request):
+    """Correlated incidents, most recently active first (?limit=, default 50)"""
+    try:
+        limit = parse_incidents_query(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    try:
+        incidents = correlator.incidents(limit)
+        return JSONResponse({"status": "success", "data": incidents, "count": len(incidents)})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def label_analysis(request: Request):
+    """Record an analyst-confirmed label for an analysis (feeds online fine-tuning)"""
+    try:
+        data = await request.json()
+        if not data.get("label"):
+            return JSONResponse({"status": "error", "message": "label is required"}, status_code=400)
+        record = await asyncio.to_thread(
+            store.add_label, request.path_params["analysis_id"], data["label"], data.get("analyst")
+        )
+        if record is None:
+            return JSONResponse({"status": "error", "message": "Analysis not found"}, status_code=404)
+        LABELS_RECEIVED.inc(label=record["label"])
+        return JSONResponse({"status": "success", "data": record})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def get_similar(request: Request):
+    """Past analyses closest to this one in feature space (?k=, default 10)"""
+    try:
+        k = parse_similar_query(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    try:
+        results = await asyncio.to_thread(similar_index.similar, store, request.path_params["analysis_id"], k)
+        SIMILARITY_INDEX_SIZE.set(similar_index.size)
+        if results is None:
+            return JSONResponse({"status": "error", "message": "Analysis not found or has no features"},
+                                status_code=404)
+        return JSONResponse({"status": "success", "data": results, "count": len(results),
+                             "index": similar_index.stats()})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def get_labels(request: Request):
+    """Labeled analyses after ?since=<label seq>, oldest first"""
+    try:
+        since, limit = parse_labels_query(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    try:
+        labels = await asyncio.to_thread(store.labels_since, since, limit)
+        return JSONResponse({"status": "success", "data": labels, "count": len(labels)})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def health_check(request: Request):
+    """Health check endpoint"""
+    return JSONResponse({
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "last_analysis": await asyncio.to_thread(store.last_updated)
+    })
+
+
+async def receive_spans(request: Request):
+    """Accept finished spans from the dashboard"""
+    try:
+        data = await request.json()
+        spans = [normalize_client_span(s) for s in (data if isinstance(data, list) else [data])]
+        spans = [s for s in spans if s is not None]
+        # Nothing is kept when tracing is off (no TRACE_FILE), so nothing counts as accepted
+        accepted = len(spans) if tracing.tracing_enabled() else 0
+        for s in spans[:accepted]:
+            tracing.record_span(s)  # only enqueued, see tracing.export_in_background()
+        return JSONResponse({"status": "success", "accepted": accepted})
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def metrics_endpoint(request: Request):
+    """Prometheus scrape endpoint"""
+    # Counted per scrape, not per POST: under tiered retention the store holds a day of rows
+    HISTORY_SIZE.set(await asyncio.to_thread(store.count))
+    return Response(metrics.REGISTRY.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+routes = [
+    Route('/api/threat-analysis', receive_analysis, methods=['POST']),
+    Route('/api/threat-analysis', get_latest_analysis, methods=['GET']),
+    Route('/api/threat-analysis/history', get_analysis_history, methods=['GET']),
+    Route('/api/threat-analysis/labels', get_labels, methods=['GET']),
+    Route('/api/threat-analysis/changes', get_changes, methods=['GET']),
+    Route('/api/threat-analysis/incidents', get_incidents, methods=['GET']),
+    Route('/api/threat-analysis/export', export_analyses, methods=['GET']),
+    Route('/api/threat-analysis/timeseries', get_timeseries, methods=['GET']),
+    Route('/api/threat-analysis/devices', get_devices, methods=['GET']),
+    Route('/api/threat-analysis/devices/{device}', get_device_latest, methods=['GET']),
+    Route('/api/threat-analysis/devices/{device}/history', get_device_history, methods=['GET']),
+    Route('/api/threat-analysis/{analysis_id}/label', label_analysis, methods=['POST']),
+    Route('/api/threat-analysis/{analysis_id}/similar', get_similar, methods=['GET']),
+    Route('/api/health', health_check, methods=['GET']),
+    Route('/api/traces', receive_spans, methods=['POST']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+]
+_ROUTE_PATHS = {route.endpoint: route.path for route in routes}
+
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency (same labels as the Flask bridge)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router writes the matched endpoint back into scope
+            route = _ROUTE_PATHS.get(scope.get("endpoint"), "unmatched")
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - start, route=route, method=scope["method"], status=status[0]
+            )
+
+
+def _cors_middleware():
+    exact = [o for o in CORS_ORIGINS if "*" not in o]
+    wildcards = [re.escape(o).replace(r"\*", r"[^/]+") for o in CORS_ORIGINS if "*" in o]
+    return Middleware(
+        CORSMiddleware,
+        allow_origins=exact,
+        allow_origin_regex="|".join(wildcards) or None,
+        allow_methods=["*"],
+        allow_headers=["*"]
+    )
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await load_data_from_file()
+    compactor.start()
+    yield
+    compactor.stop()
+
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(RequestMetricsMiddleware), _cors_middleware()],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("🌉 Async API Bridge Server Starting...")
+    port = int(os.environ.get('PORT', 5000))
+    uvicorn.run(app, host='0.0.0.0', port=port, log_level="warning")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Flask bridge (wsgi.py under gunicorn) against the async bridge
+(asgi_app.py under uvicorn) with identical traffic from loadtest.py.
+
+For each server and each concurrency level the same POST/GET mix is run and
+throughput plus p50/p99 latency are reported side by side. --held-connections
+additionally keeps N long-lived client connections open during the run (each
+sends an unfinished request and waits, like a streaming dashboard client) to
+show how many workers such clients tie up.
+
+Usage:
+    python benchmark_bridge.py
+    python benchmark_bridge.py --concurrency 16 64 256 --duration 10
+    python benchmark_bridge.py --held-connections 500 --gunicorn-workers 4
+"""
+
+import argparse
+import json
+import socket
+import time
+
+from loadtest import start_bridge, stop_bridge, run_load, summarize
+
+
+def hold_connections(base_url, count):
+    """Open `count` sockets that each start a request and never finish it"""
+    host, port = base_url.replace("http://", "").split(":")
+    held = []
+    for _ in range(count):
+        try:
+            sock = socket.create_connection((host, int(port)), timeout=5)
+            sock.sendall(f"GET /api/threat-analysis HTTP/1.1\r\nHost: {host}\r\n".encode())
+            held.append(sock)
+        except OSError:
+            break
+    return held
+
+
+def release_connections(held):
+    for sock in held:
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+
+def bench_server(label, server, workers, port, concurrency_levels, duration, post_ratio, held_connections):
+    results = []
+    proc, base_url = start_bridge(server, port=port, workers=workers)
+    try:
+        held = hold_connections(base_url, held_connections) if held_connections else []
+        try:
+            for clients in concurrency_levels:
+                records, elapsed = run_load(base_url, clients=clients, duration=duration, post_ratio=post_ratio)
+                overall = summarize(records, elapsed)["overall"]
+                overall.update({"server": label, "clients": clients, "held_connections": len(held)})
+                results.append(overall)
+                print(f"  {label:<24} clients={clients:<5} {overall['throughput_rps']:>9.1f} req/s  "
+                      f"p50 {overall['p50_ms']:>8.2f} ms  p99 {overall['p99_ms']:>8.2f} ms  "
+                      f"errors {overall['error_rate']:.2%}")
+        finally:
+            release_connections(held)
+    finally:
+        stop_bridge(proc)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the Flask and ASGI API bridges")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--post-ratio", type=float, default=0.2)
+    parser.add_argument("--gunicorn-workers", type=int, default=4)
+    parser.add_argument("--uvicorn-workers", type=int, default=1)
+    parser.add_argument("--held-connections", type=int, default=0,
+                        help="Long-lived idle client connections to keep open during each run")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--json-out", help="Write all results as JSON")
+    args = parser.parse_args()
+
+    servers = [
+        (f"flask/gunicorn x{args.gunicorn_workers}", "gunicorn", args.gunicorn_workers),
+        (f"asgi/uvicorn x{args.uvicorn_workers}", "uvicorn", args.uvicorn_workers),
+    ]
+
+    print(f"🏁 Bridge benchmark: {args.duration:.0f}s per level, POST {args.post_ratio:.0%}, "
+          f"{args.held_connections} held connections")
+    results = []
+    for label, server, workers in servers:
+        results.extend(bench_server(
+            label, server, workers, args.port, args.concurrency,
+            args.duration, args.post_ratio, args.held_connections
+        ))
+        time.sleep(0.5)  # let the port free up before the next server binds it
+
+    print(f"\n📊 {'clients':>8}" + "".join(f"{label:>32}" for label, _, _ in servers))
+    for clients in args.concurrency:
+        row = f"{clients:>11}"
+        for label, _, _ in servers:
+            r = next(r for r in results if r["server"] == label and r["clients"] == clients)
+            row += f"{r['throughput_rps']:>14.1f} rps / {r['p99_ms']:>7.1f} ms"
+        print(row)
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
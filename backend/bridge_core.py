@@ -0,0 +1,244 @@
+# Framework-independent pieces of the API bridge
+#
+# Shared by the Flask app (app.py) and the ASGI app (asgi_app.py) so both
+# structure and serialize analyses identically.
+import json
+import math
+import os
+import re
+import time
+from array import array
+from datetime import datetime
+
+from feature_schema import FEATURE_NAMES, FeatureValidationError, validate_features
+
+# Keep last N analyses in history
+HISTORY_LIMIT = 50
+# Devices the stores track at once (device ids are client-chosen); the least recently seen are evicted
+MAX_STORED_DEVICES = int(os.environ.get("BRIDGE_MAX_DEVICES", 1000))
+
+# Long-poll /changes: default and maximum hold time, and analyses per response
+CHANGES_DEFAULT_WAIT = 25.0
+CHANGES_MAX_WAIT = float(os.environ.get("CHANGES_MAX_WAIT", 55))
+CHANGES_LIMIT = 100
+# Under Flask every held /changes request occupies a gthread thread, so at most this many are held
+# per worker; the rest are answered at once with retry_after, leaving threads free for ingest
+CHANGES_MAX_WAITERS = int(os.environ.get("CHANGES_MAX_WAITERS", 16))
+CHANGES_BUSY_RETRY = 5.0
+
+# Feature order of the vectors indexed for similar-incident search and of exports
+# (the schema order, same as FEATURE_NAMES in streamlit_app/inference.py)
+FEATURE_ORDER = list(FEATURE_NAMES)
+
+# Device (or tenant) an analysis belongs to: "device_id" in the payload, or this header
+DEVICE_HEADER = "X-Device-ID"
+DEFAULT_DEVICE = "default"  # analyses from senders that don't name a device
+_DEVICE_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.:-]{0,63}$")
+
+CORS_ORIGINS = [
+    "http://localhost:5174",
+    "http://localhost:3000",
+    "https://secure-gluco.vercel.app",
+    "https://*.vercel.app"              # Wildcard for preview deployments
+]
+
+
+def device_id(value):
+    """Validated device id (letters, digits, _ . : -, at most 64); DEFAULT_DEVICE when absent"""
+    if value is None or value == "":
+        return DEFAULT_DEVICE
+    value = str(value)
+    if not _DEVICE_ID.match(value):
+        raise ValueError(f"Invalid device id {value[:80]!r}: use letters, digits, '_', '.', ':' or '-' (at most 64)")
+    return value
+
+
+def build_analysis(data, trace_id=None, device=None):
+    """Structure an incoming Streamlit payload as a stored analysis"""
+    analysis = {
+        "id": str(int(time.time() * 1000)),  # Unique ID
+        "timestamp": datetime.now(),
+        "device_id": device or device_id(data.get("device_id")),
+        "threat_class": data.get("threat_class"),
+        "confidence": data.get("confidence"),
+        "probabilities": data.get("probabilities", {}),
+        "features": data.get("features", {}),
+        "recommendations": data.get("recommendations", []),
+        "risk_level": data.get("risk_level", "Unknown")
+    }
+    if trace_id:
+        analysis["trace_id"] = trace_id
+    if isinstance(data.get("flow"), dict):
+        # Flow identity from the pcap replay pipeline (src/dst/ports/proto/packets)
+        analysis["flow"] = data["flow"]
+    if data.get("source"):
+        # Where the traffic came from, when the sender knows it without a flow (correlation.alert_source)
+        analysis["source"] = str(data["source"])[:128]
+    if isinstance(data.get("attributions"), list):
+        # Top contributing features (streamlit_app/attribution.py)
+        analysis["attributions"] = data["attributions"]
+    return analysis
+
+
+def check_features(data):
+    """
+    Validate a payload's "features" against the feature schema (feature_schema.py).
+    Out-of-range values are clipped in `data` and described in the returned list
+    (e.g. ["Rate below_min"]); missing, non-numeric or contradictory features raise
+    FeatureValidationError. Payloads without features pass untouched.
+    """
+    features = data.get("features")
+    if not features:
+        return []
+    if not isinstance(features, dict):
+        raise FeatureValidationError("features must be an object of feature values")
+    report = validate_features([features])
+    issues = report.row_issues(0)
+    if report.rejected[0]:
+        shown = ", ".join(issues[:10]) + (f" and {len(issues) - 10} more" if len(issues) > 10 else "")
+        raise FeatureValidationError(f"Invalid features: {shown}", report)
+    if report.clipped[0]:
+        data["features"] = dict(features, **dict(zip(FEATURE_NAMES, report.rows[0].tolist())))
+    return issues
+
+
+def analysis_to_json(analysis):
+    """Copy of an analysis with the timestamp converted to an ISO string"""
+    analysis_copy = analysis.copy()
+    if isinstance(analysis_copy.get("timestamp"), datetime):
+        analysis_copy["timestamp"] = analysis_copy["timestamp"].isoformat()
+    return analysis_copy
+
+
+def analysis_time(record):
+    """Epoch seconds of a stored analysis' timestamp (ISO string or datetime); now if missing"""
+    value = record.get("timestamp")
+    try:
+        if isinstance(value, datetime):
+            return value.timestamp()
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def parse_time(value):
+    """Epoch seconds from an ISO time or a number; None when absent"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def feature_vector(features):
+    """
+    Search vector of an analysis' features as float32 bytes, or None without features.
+    Each feature is sign(x) * log1p(|x|): a fixed, scaler-free transform (the bridge
+    doesn't ship the model's StandardScaler) that tames the heavy-tailed rates and
+    counts, so stored vectors never need re-encoding.
+    """
+    if not isinstance(features, dict) or not features:
+        return None
+    values = []
+    for name in FEATURE_ORDER:
+        try:
+            x = float(features.get(name, 0.0) or 0.0)
+        except (TypeError, ValueError):
+            x = 0.0
+        values.append(math.copysign(math.log1p(abs(x)), x) if math.isfinite(x) else 0.0)
+    return array("f", values).tobytes()
+
+
+def incident_summary(record):
+    """What similar-incident results show for a stored analysis"""
+    summary = {k: record.get(k) for k in ("id", "timestamp", "threat_class", "confidence", "risk_level")}
+    summary["device_id"] = record.get("device_id", DEFAULT_DEVICE)
+    if isinstance(record.get("flow"), dict):
+        summary["flow"] = record["flow"]
+    return summary
+
+
+def read_json(path):
+    """Load a JSON snapshot, or None when the file does not exist"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def query_number(args, name, default, low, high, kind=int):
+    """Query parameter `name` as `kind`, clamped to [low, high]; raises ValueError naming it when malformed"""
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        value = kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be {'an integer' if kind is int else 'a number'}")
+    if value != value:  # NaN
+        raise ValueError(f"{name} must be a number")
+    return min(max(value, low), high)
+
+
+def parse_changes_query(args):
+    """(since, wait seconds, limit) from /changes query parameters, clamped to sane ranges"""
+    since = query_number(args, "since", 0, 0, 2 ** 63 - 1)
+    wait = query_number(args, "timeout", CHANGES_DEFAULT_WAIT, 0.0, CHANGES_MAX_WAIT, kind=float)
+    limit = query_number(args, "limit", CHANGES_LIMIT, 1, HISTORY_LIMIT * 10)
+    return since, wait, limit
+
+
+def parse_labels_query(args):
+    """(since, limit) from /labels query parameters"""
+    return query_number(args, "since", 0, 0, 2 ** 63 - 1), query_number(args, "limit", 500, 1, 5000)
+
+
+def parse_incidents_query(args):
+    """?limit= for /incidents (default 50, at most 1000)"""
+    return query_number(args, "limit", 50, 1, 1000)
+
+
+def parse_similar_query(args):
+    """?k= for /<id>/similar (default 10, at most 100)"""
+    return query_number(args, "k", 10, 1, 100)
+
+
+def changes_payload(analyses, latest_seq, last_updated, reset=False, retry_after=None):
+    """
+    Body of a /changes response. `seq` is the cursor for the next call; reset tells
+    the client its cursor was ahead of the store (e.g. the store was recreated),
+    so it should drop what it has and use this data as the full history.
+    retry_after (seconds) is set when the bridge couldn't hold the request because
+    too many were already waiting; the client should wait that long before polling again.
+    """
+    seq = analyses[-1]["seq"] if analyses else latest_seq
+    payload = {"status": "success", "data": analyses, "count": len(analyses), "seq": seq,
+               "last_updated": last_updated, "reset": reset}
+    if retry_after:
+        payload["retry_after"] = retry_after
+    return payload
+
+
+def normalize_client_span(s):
+    """
+    Validate a span reported by the dashboard; returns a span dict, or None when it
+    has no trace_id or name. Raises ValueError when start/duration_ms aren't numbers.
+    """
+    if not isinstance(s, dict) or not s.get("trace_id") or not s.get("name"):
+        return None
+    try:
+        start = float(s.get("start", time.time()))
+        duration_ms = float(s.get("duration_ms", 0.0))
+    except (TypeError, ValueError):
+        raise ValueError(f"Span {str(s['name'])[:80]!r}: start and duration_ms must be numbers")
+    return {
+        "trace_id": str(s["trace_id"]),
+        "span_id": str(s.get("span_id") or os.urandom(8).hex()),
+        "parent_id": s.get("parent_id"),
+        "name": str(s["name"]),
+        "service": str(s.get("service") or "dashboard"),
+        "start": start,
+        "duration_ms": duration_ms,
+        "attributes": s.get("attributes") or {}
+    }
@@ -0,0 +1,51 @@
+# backend/conftest.py
+# Route tests drive both bridges (Flask and ASGI) through the same httpx client API, each test against a fresh store.
+import os
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+# Set before app.py / asgi_app.py are first imported, so their module-level store never touches the committed files
+_SCRATCH = tempfile.mkdtemp(prefix="bridge_tests_")
+os.environ.setdefault("BRIDGE_DB_FILE", os.path.join(_SCRATCH, "shared_analysis.db"))
+os.environ.setdefault("BRIDGE_DATA_FILE", os.path.join(_SCRATCH, "shared_analysis_data.json"))
+
+
+def _fresh_state(module, tmp_path, monkeypatch, changes):
+    from correlation import Correlator
+    from devices import DeviceThrottle
+    from similarity import SimilarityIndex
+    from state_store import SQLiteStateStore
+
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    monkeypatch.setattr(module, "store", store)
+    monkeypatch.setattr(module, "changes", changes(store))
+    monkeypatch.setattr(module, "similar_index", SimilarityIndex())
+    monkeypatch.setattr(module, "correlator", Correlator())
+    monkeypatch.setattr(module, "throttle", DeviceThrottle())
+    return store
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def bridge(request, tmp_path, monkeypatch):
+    """SimpleNamespace(kind, module, store, client) for one bridge; client is an httpx-style client"""
+    if request.param == "flask":
+        import httpx
+
+        import app as module
+        from bridge_core import CHANGES_MAX_WAITERS
+        from state_store import ChangeNotifier
+
+        store = _fresh_state(module, tmp_path, monkeypatch,
+                             lambda s: ChangeNotifier(s, interval=0.05, max_waiters=CHANGES_MAX_WAITERS))
+        with httpx.Client(transport=httpx.WSGITransport(app=module.app), base_url="http://testserver") as client:
+            yield SimpleNamespace(kind="flask", module=module, store=store, client=client)
+    else:
+        from starlette.testclient import TestClient
+
+        import asgi_app as module
+
+        store = _fresh_state(module, tmp_path, monkeypatch, lambda s: module.AsyncChangeNotifier(s, interval=0.05))
+        with TestClient(module.app) as client:
+            yield SimpleNamespace(kind="asgi", module=module, store=store, client=client)
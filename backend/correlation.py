@@ -0,0 +1,181 @@
+# Sliding-window alert correlation for the bridge ingest path
+#
+# A sustained attack used to become thousands of near-identical history entries
+# (one per Analyze click or scored flow window). The Correlator folds repeated
+# alerts for the same (threat class, device, source) into one incident instead.
+# The source is the flow's src address or the payload's "source", never the
+# connection's peer: every Streamlit analysis comes from the one Streamlit host,
+# and behind a proxy the peer is the load balancer.
+#
+#   new        first alert of a key, or the first after `merge_gap` seconds of
+#              quiet: opens an incident and is stored as usual
+#   escalated  the alert rate over the last `window` seconds crossed an
+#              ESCALATION threshold, so the incident's risk_level went up: the
+#              alert is stored (with the raised risk_level) so dashboards see it
+#   merged     anything else: count / last_seen are updated; the alert is stored
+#              annotated with its incident, or, with dedup on, not stored at all
+#
+# The rate for each key comes from a ring of `window / bucket` counters. An event
+# clears only the buckets that expired since that key's last event, so the work
+# per event is O(1), bounded by the number of buckets. Keys are kept in LRU order
+# and capped at `max_keys`, so memory stays bounded however many sources show up.
+# Benign analyses are not alerts and pass through untouched.
+#
+# State lives in the worker process: with several gunicorn workers, one burst
+# can open one incident per worker. The default start command runs a single
+# (threaded) worker.
+#
+# Configuration (Correlator.from_env):
+#   CORRELATION_WINDOW=60      seconds of history behind the alert rate
+#   CORRELATION_BUCKET=5       seconds per rate bucket
+#   CORRELATION_MERGE_GAP=300  quiet seconds after which a key opens a new incident
+#   CORRELATION_MAX_KEYS=10000 (threat class, device, source) keys tracked at once
+#   CORRELATION_DEDUP=0        1 drops merged alerts instead of storing them (off by default)
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from bridge_core import DEFAULT_DEVICE
+
+RISK_ORDER = ["Unknown", "Low", "Medium", "High", "Critical"]
+
+# (alerts per minute, minimum risk_level), checked from the highest rate down
+ESCALATION = ((300.0, "Critical"), (30.0, "High"))
+
+BENIGN_CLASSES = ("benign", "normal")
+
+
+def _rank(risk_level):
+    return RISK_ORDER.index(risk_level) if risk_level in RISK_ORDER else 0
+
+
+def alert_source(analysis):
+    """Where an alert came from: the flow's source address or the payload's source ("unknown" without either)"""
+    flow = analysis.get("flow")
+    if isinstance(flow, dict) and flow.get("src"):
+        return str(flow["src"])
+    return str(analysis.get("source") or "unknown")
+
+
+class RateWindow:
+    """Event count over the last len(counts) buckets, kept as a ring"""
+
+    __slots__ = ("counts", "head", "total")
+
+    def __init__(self, n_buckets):
+        self.counts = [0] * n_buckets
+        self.head = None
+        self.total = 0
+
+    def add(self, bucket):
+        n = len(self.counts)
+        if self.head is None or bucket - self.head >= n:
+            self.counts = [0] * n
+            self.total = 0
+            self.head = bucket
+        elif bucket > self.head:
+            for b in range(self.head + 1, bucket + 1):
+                self.total -= self.counts[b % n]
+                self.counts[b % n] = 0
+            self.head = bucket
+        # An event from a clock that stepped back is counted in the newest bucket
+        self.counts[self.head % n] += 1
+        self.total += 1
+
+
+class Correlator:
+    def __init__(self, window=60.0, bucket=5.0, merge_gap=300.0, max_keys=10000, dedup=False,
+                 escalation=ESCALATION):
+        self.window = window
+        self.bucket = bucket
+        self.n_buckets = max(1, int(round(window / bucket)))
+        self.merge_gap = merge_gap
+        self.max_keys = max_keys
+        self.dedup = dedup
+        self.escalation = escalation
+        self._keys = OrderedDict()  # (threat_class, device_id, source) -> [incident, RateWindow]
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            window=float(os.environ.get("CORRELATION_WINDOW", 60)),
+            bucket=float(os.environ.get("CORRELATION_BUCKET", 5)),
+            merge_gap=float(os.environ.get("CORRELATION_MERGE_GAP", 300)),
+            max_keys=int(os.environ.get("CORRELATION_MAX_KEYS", 10000)),
+            dedup=os.environ.get("CORRELATION_DEDUP", "0") == "1",
+        )
+
+    def _rate_risk(self, per_minute):
+        for threshold, risk_level in self.escalation:
+            if per_minute >= threshold:
+                return risk_level
+        return None
+
+    def observe(self, analysis, now=None):
+        """
+        Fold one analysis into its incident. Returns (incident snapshot, action) with
+        action "new", "escalated" or "merged", or (None, None) for benign traffic.
+        """
+        threat_class = analysis.get("threat_class")
+        if not threat_class or str(threat_class).lower() in BENIGN_CLASSES:
+            return None, None
+        now = time.time() if now is None else now
+        key = (str(threat_class), str(analysis.get("device_id") or DEFAULT_DEVICE), alert_source(analysis))
+        bucket = int(now // self.bucket)
+
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None or now - entry[0]["last_seen"] > self.merge_gap:
+                incident = {
+                    "incident_id": f"inc-{int(now * 1000)}-{next(self._ids)}",
+                    "threat_class": key[0], "device_id": key[1], "source": key[2], "count": 0,
+                    "first_seen": now, "last_seen": now, "first_analysis_id": analysis.get("id"),
+                    "risk_level": analysis.get("risk_level") or "Unknown", "rate_per_min": 0.0,
+                }
+                entry = self._keys[key] = [incident, RateWindow(self.n_buckets)]
+                action = "new"
+            else:
+                action = "merged"
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+
+            incident, rate = entry
+            rate.add(bucket)
+            incident["count"] += 1
+            incident["last_seen"] = max(incident["last_seen"], now)
+            incident["rate_per_min"] = rate.total * 60.0 / (self.n_buckets * self.bucket)
+
+            risk_level = max(incident["risk_level"], analysis.get("risk_level") or "Unknown",
+                             self._rate_risk(incident["rate_per_min"]) or "Unknown", key=_rank)
+            if _rank(risk_level) > _rank(incident["risk_level"]):
+                incident["risk_level"] = risk_level
+                if action == "merged":
+                    action = "escalated"
+            return self._snapshot(incident), action
+
+    def should_store(self, action):
+        """Whether an alert with this correlation outcome becomes its own stored analysis"""
+        return action != "merged" or not self.dedup
+
+    @staticmethod
+    def _snapshot(incident):
+        snapshot = dict(incident)
+        snapshot["first_seen"] = datetime.fromtimestamp(incident["first_seen"]).isoformat()
+        snapshot["last_seen"] = datetime.fromtimestamp(incident["last_seen"]).isoformat()
+        snapshot["rate_per_min"] = round(incident["rate_per_min"], 3)
+        return snapshot
+
+    def incidents(self, limit=50):
+        """Most recently active incidents first"""
+        with self._lock:
+            recent = itertools.islice(reversed(self._keys.values()), max(int(limit), 0))
+            return [self._snapshot(incident) for incident, _ in recent]
+
+    def __len__(self):
+        return len(self._keys)
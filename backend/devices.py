@@ -0,0 +1,73 @@
+# Per-device ingest fairness for the bridge
+#
+# Every analysis belongs to a device (bridge_core.device_id: the payload's
+# "device_id" or the X-Device-ID header). The stores partition reads by device
+# (state_store.py), so a device's latest/history queries never touch another
+# device's rows. Writes still share one store, though: a monitor stuck in a retry
+# loop could fill the gunicorn threads and the SQLite write lock, and every
+# other device's ingest would queue behind it.
+#
+# DeviceThrottle gives each device a token bucket (`rate` analyses per second,
+# `burst` at most). A device over its budget gets 429 with Retry-After, and other
+# devices keep their full rate. Buckets are kept in LRU order and capped at
+# `max_devices`, as in correlation.py. The state is per worker process, so with N
+# workers a device can reach N times the rate.
+#
+# Configuration (DeviceThrottle.from_env):
+#   DEVICE_RATE_LIMIT=0        analyses per second per device (0 = unlimited, the default)
+#   DEVICE_BURST=<2 x rate>    analyses a device may send at once
+#   DEVICE_MAX_TRACKED=10000   devices tracked at once
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from bridge_core import HISTORY_LIMIT, query_number
+
+THROTTLED = metrics.counter("bridge_device_throttled_total", "Analyses rejected by the per-device rate limit")
+
+
+class DeviceThrottle:
+    def __init__(self, rate=0.0, burst=None, max_devices=10000):
+        self.rate = rate
+        self.burst = burst if burst else max(2 * rate, 1.0)
+        self.max_devices = max_devices
+        self._buckets = OrderedDict()  # device -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            rate=float(os.environ.get("DEVICE_RATE_LIMIT", 0)),
+            burst=float(os.environ.get("DEVICE_BURST", 0)) or None,
+            max_devices=int(os.environ.get("DEVICE_MAX_TRACKED", 10000)),
+        )
+
+    def allow(self, device, now=None):
+        """(True, 0) when `device` may ingest one more analysis, else (False, seconds until it may)"""
+        if not self.rate:
+            return True, 0.0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(device)
+            if bucket is None:
+                bucket = self._buckets[device] = [self.burst, now]
+            self._buckets.move_to_end(device)
+            while len(self._buckets) > self.max_devices:
+                self._buckets.popitem(last=False)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return True, 0.0
+        THROTTLED.inc()
+        return False, (1.0 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def parse_device_history_query(args):
+    """?limit= for a device's history, clamped to 1..10 x HISTORY_LIMIT (default HISTORY_LIMIT)"""
+    return query_number(args, "limit", HISTORY_LIMIT, 1, HISTORY_LIMIT * 10)
@@ -0,0 +1,155 @@
+# Streaming bulk export of stored analyses (GET /api/threat-analysis/export)
+#
+# The store hands out analyses page by page (store.iter_analyses, keyset-paged on
+# timestamp and seq), and the encoders below turn them into chunks as they arrive.
+# Both bridges return the generator as a streaming response without a
+# Content-Length, so the body goes out with chunked transfer encoding. The first
+# byte is sent immediately and memory stays flat however long the range is:
+#
+#   ndjson   one analysis per line, exactly as stored
+#   csv      fixed columns (EXPORT_COLUMNS + the 45 features), header first
+#   parquet  same columns, one row group per PARQUET_ROW_GROUP rows; each row group
+#            is flushed to the client as soon as it is encoded. Needs pyarrow,
+#            which the bridge doesn't require otherwise.
+#
+# The CSV header and the Parquet magic bytes go out before the first row is read.
+# Buffered rows are flushed after CSV_FLUSH_ROWS / PARQUET_ROW_GROUP rows or
+# FLUSH_SECONDS, whichever comes first, so small or slow exports never look hung
+# to the client or to a proxy waiting for bytes.
+#
+# Once tiered retention is on (retention.py), only analyses still inside the raw
+# window are stored as rows, so the export covers that window; older traffic is
+# available only as aggregates from /timeseries.
+#
+# Query parameters: format=ndjson|csv|parquet, start/end as ISO times or epoch
+# seconds (start inclusive, end exclusive).
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+from bridge_core import FEATURE_ORDER, parse_time
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_COLUMNS = ["seq", "id", "timestamp", "threat_class", "confidence", "risk_level"]
+CSV_FLUSH_ROWS = 500
+PARQUET_ROW_GROUP = 10000
+FLUSH_SECONDS = 1.0
+
+
+def parse_export_query(args):
+    """(format, start, end) from /export query parameters; raises ValueError on bad input"""
+    fmt = (args.get("format") or "ndjson").lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(EXPORT_FORMATS)}")
+    try:
+        start, end = parse_time(args.get("start")), parse_time(args.get("end"))
+    except ValueError:
+        raise ValueError("start and end must be ISO times or epoch seconds")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet export needs the 'pyarrow' package (pip install pyarrow)")
+    return fmt, start, end
+
+
+def export_filename(fmt):
+    return f"threat_analyses_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+
+
+def _row(analysis):
+    features = analysis.get("features") or {}
+    row = [analysis.get(column) for column in EXPORT_COLUMNS]
+    for name in FEATURE_ORDER:
+        value = features.get(name)
+        row.append(float(value) if isinstance(value, (int, float)) else None)
+    return row
+
+
+def _ndjson(analyses):
+    for analysis in analyses:
+        yield json.dumps(analysis) + "\n"
+
+
+def _csv(analyses):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS + FEATURE_ORDER)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    rows, flushed_at = 0, time.monotonic()
+    for analysis in analyses:
+        writer.writerow(_row(analysis))
+        rows += 1
+        if rows >= CSV_FLUSH_ROWS or time.monotonic() - flushed_at >= FLUSH_SECONDS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows, flushed_at = 0, time.monotonic()
+    if rows:
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that keeps what was written until drain() hands it out"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _parquet(analyses):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [pa.field("seq", pa.int64()), pa.field("id", pa.string()), pa.field("timestamp", pa.string()),
+         pa.field("threat_class", pa.string()), pa.field("confidence", pa.float64()),
+         pa.field("risk_level", pa.string())]
+        + [pa.field(name, pa.float32()) for name in FEATURE_ORDER]
+    )
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    magic = sink.drain()
+    if magic:
+        yield magic
+    pending = []
+    flushed_at = time.monotonic()
+
+    def _flush():
+        columns = list(zip(*pending))
+        writer.write_table(pa.table([pa.array(c, f.type) for c, f in zip(columns, schema)], schema=schema))
+        pending.clear()
+
+    for analysis in analyses:
+        pending.append(_row(analysis))
+        if len(pending) >= PARQUET_ROW_GROUP or time.monotonic() - flushed_at >= FLUSH_SECONDS:
+            _flush()
+            yield sink.drain()
+            flushed_at = time.monotonic()
+    if pending:
+        _flush()
+    writer.close()
+    yield sink.drain()
+
+
+def export_stream(analyses, fmt):
+    """Chunks (str or bytes) encoding an iterable of analyses in `fmt`"""
+    return {"ndjson": _ndjson, "csv": _csv, "parquet": _parquet}[fmt](analyses)
@@ -0,0 +1,257 @@
+# Declarative schema of the 45 model features, and a vectorized batch validator
+#
+# SCHEMA is the single source of truth for the feature order (inference.
+# FEATURE_NAMES and bridge_core.FEATURE_ORDER are taken from it). Each
+# feature also declares its type and its valid range:
+#
+#   binary   TCP flag and protocol indicators: 0 or 1
+#   integer  whole numbers (the IP protocol number)
+#   real     anything finite inside [low, high]
+#
+# ONE_HOT_GROUPS lists indicators that exclude each other: a flow window has one
+# transport protocol, so at most one of TCP/UDP/ICMP/IGMP is set. The application
+# and link indicators are not exclusive (a window can match HTTP and HTTPS ports,
+# or carry both ARP and IP), so they are only checked as binaries.
+#
+# FeatureValidator checks a whole (n, 45) batch with a handful of array
+# operations and never loops over rows. Every row ends up in one of three states:
+#
+#   accepted   valid as given
+#   clipped    out of range or not a whole number: clipped to [low, high] and
+#              rounded (mode="clip", the default); rejected with mode="reject"
+#   rejected   missing or non-finite values, non-numeric input, or more than one
+#              indicator of a one-hot group set
+#
+# The ValidationReport has the sanitized rows, the per-row masks and per-feature
+# issue counts, so callers report a bad batch once instead of failing row by
+# row. Input may be a DataFrame (columns are matched by name, so their order
+# doesn't matter), dicts of feature values, or an array already in schema order.
+from collections import namedtuple
+
+import numpy as np
+
+Feature = namedtuple("Feature", "name kind low high")
+
+BINARY, INTEGER, REAL = "binary", "integer", "real"
+_INF = float("inf")
+
+
+def _binary(*names):
+    return [Feature(name, BINARY, 0.0, 1.0) for name in names]
+
+
+def _non_negative(*names):
+    return [Feature(name, REAL, 0.0, _INF) for name in names]
+
+
+SCHEMA = tuple(
+    _non_negative('Header_Length')
+    + [Feature('Protocol_Type', INTEGER, 0.0, 255.0)]
+    + _non_negative('Duration', 'Rate', 'Srate', 'Drate')
+    + _binary('fin_flag_number', 'syn_flag_number', 'rst_flag_number', 'psh_flag_number',
+              'ack_flag_number', 'ece_flag_number', 'cwr_flag_number')
+    + _non_negative('ack_count', 'syn_count', 'fin_count', 'rst_count')
+    + _binary('HTTP', 'HTTPS', 'DNS', 'Telnet', 'SMTP', 'SSH', 'IRC',
+              'TCP', 'UDP', 'DHCP', 'ARP', 'ICMP', 'IGMP', 'IPv', 'LLC')
+    + _non_negative('Tot_sum', 'Min', 'Max', 'AVG', 'Std', 'Tot_size', 'IAT',
+                    'Number', 'Magnitude', 'Radius')
+    + [Feature('Covariance', REAL, -_INF, _INF)]
+    + _non_negative('Variance', 'Weight')
+)
+FEATURE_NAMES = [feature.name for feature in SCHEMA]
+
+ONE_HOT_GROUPS = {"transport": ('TCP', 'UDP', 'ICMP', 'IGMP')}
+
+# Per-cell issue bits (ValidationReport.codes)
+MISSING, NOT_FINITE, BELOW_MIN, ABOVE_MAX, NOT_INTEGER = 1, 2, 4, 8, 16
+REASONS = {MISSING: "missing", NOT_FINITE: "not_finite", BELOW_MIN: "below_min", ABOVE_MAX: "above_max",
+           NOT_INTEGER: "not_integer"}
+_REJECT = MISSING | NOT_FINITE
+_CLIP = BELOW_MIN | ABOVE_MAX | NOT_INTEGER
+
+
+class FeatureValidationError(ValueError):
+    """Raised when input can't be scored; .report holds the ValidationReport"""
+
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        self.report = report
+
+
+def feature_order(names):
+    """
+    The schema's feature order, after checking that `names` (any container,
+    e.g. a set) holds exactly the schema features; raises ValueError otherwise
+    """
+    names = set(names)
+    missing = [name for name in FEATURE_NAMES if name not in names]
+    unknown = sorted(names - set(FEATURE_NAMES))
+    if missing or unknown:
+        raise ValueError(f"Feature names don't match the schema (missing {missing}, unknown {unknown})")
+    return list(FEATURE_NAMES)
+
+
+def _as_float(values):
+    """float64 copy of an array that may hold numeric strings, None or junk (junk becomes NaN)"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        def _to_float(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return np.nan
+        return np.vectorize(_to_float, otypes=[np.float64])(np.asarray(values, dtype=object))
+
+
+class ValidationReport:
+    def __init__(self, rows, codes, group_violations, rejected, clipped, unknown_columns):
+        self.rows = rows                          # (n, 45) float64, sanitized where clipped
+        self.codes = codes                        # (n, 45) uint8 issue bits per cell
+        self.group_violations = group_violations  # {group: (n,) bool}
+        self.rejected = rejected                  # (n,) bool
+        self.clipped = clipped                    # (n,) bool, never set for rejected rows
+        self.unknown_columns = unknown_columns
+
+    @property
+    def accepted(self):
+        return ~self.rejected
+
+    def __len__(self):
+        return len(self.rows)
+
+    def issue_counts(self):
+        """{feature or group: {reason: rows}} over the whole batch"""
+        counts = {}
+        for bit, reason in REASONS.items():
+            per_feature = np.count_nonzero(self.codes & bit, axis=0)
+            for i in np.flatnonzero(per_feature):
+                counts.setdefault(FEATURE_NAMES[i], {})[reason] = int(per_feature[i])
+        for group, violated in self.group_violations.items():
+            n = int(np.count_nonzero(violated))
+            if n:
+                counts[group] = {"one_hot": n}
+        return counts
+
+    def row_issues(self, i):
+        """Readable issues of row i, e.g. ["Rate below_min", "transport one_hot"]"""
+        issues = [f"{FEATURE_NAMES[j]} {reason}" for j in np.flatnonzero(self.codes[i])
+                  for bit, reason in REASONS.items() if self.codes[i, j] & bit]
+        return issues + [f"{group} one_hot" for group, violated in self.group_violations.items() if violated[i]]
+
+    def summary(self, locations=None, max_rows=20):
+        """JSON-ready bulk report; rejected rows are listed by index (or by `locations`) up to max_rows"""
+        rejected = np.flatnonzero(self.rejected)[:max_rows]
+        if locations is not None:
+            rejected = np.asarray(locations)[rejected]
+        return {
+            "rows": len(self),
+            "rejected": int(np.count_nonzero(self.rejected)),
+            "clipped": int(np.count_nonzero(self.clipped)),
+            "issues": self.issue_counts(),
+            "rejected_rows": [int(r) for r in rejected],
+            "unknown_columns": list(self.unknown_columns),
+        }
+
+
+def merge_summaries(summaries, max_rows=20):
+    """One summary for a batch validated in parts (e.g. per shard)"""
+    merged = {"rows": 0, "rejected": 0, "clipped": 0, "issues": {}, "rejected_rows": [], "unknown_columns": []}
+    for summary in summaries:
+        for key in ("rows", "rejected", "clipped"):
+            merged[key] += summary[key]
+        for name, reasons in summary["issues"].items():
+            for reason, n in reasons.items():
+                merged["issues"].setdefault(name, {})[reason] = merged["issues"].get(name, {}).get(reason, 0) + n
+        merged["rejected_rows"] = (merged["rejected_rows"] + summary["rejected_rows"])[:max_rows]
+        merged["unknown_columns"] += [c for c in summary["unknown_columns"] if c not in merged["unknown_columns"]]
+    return merged
+
+
+class FeatureValidator:
+    def __init__(self, schema=SCHEMA, groups=ONE_HOT_GROUPS, mode="clip"):
+        if mode not in ("clip", "reject"):
+            raise ValueError(f"Unknown validation mode {mode!r}; expected 'clip' or 'reject'")
+        self.names = [feature.name for feature in schema]
+        self.low = np.array([feature.low for feature in schema])
+        self.high = np.array([feature.high for feature in schema])
+        self.whole = np.array([feature.kind in (BINARY, INTEGER) for feature in schema])
+        index = {name: i for i, name in enumerate(self.names)}
+        self.groups = {group: [index[name] for name in members] for group, members in groups.items()}
+        self.mode = mode
+
+    def to_matrix(self, data):
+        """(rows (n, 45) float64 in schema order, missing (n, 45) bool or None, unknown column names)"""
+        width, known = len(self.names), set(self.names)
+        if hasattr(data, "columns"):  # DataFrame: match columns by name
+            unknown = [str(c) for c in data.columns if c not in known]
+            absent = [i for i, name in enumerate(self.names) if name not in data.columns]
+            frame = data.reindex(columns=self.names)
+            try:
+                rows = frame.to_numpy(dtype=np.float64)
+            except (TypeError, ValueError):
+                rows = _as_float(frame.to_numpy())
+            missing = None
+            if absent:
+                missing = np.zeros(rows.shape, dtype=bool)
+                missing[:, absent] = True
+            return rows, missing, unknown
+        if isinstance(data, dict):
+            data = [data]
+        data = list(data) if not isinstance(data, np.ndarray) else data
+        if len(data) and isinstance(data[0], dict):
+            keys = set().union(*data)
+            unknown = sorted(str(k) for k in keys - known)
+            missing = np.array([[name not in row for name in self.names] for row in data], dtype=bool)
+            rows = _as_float([[row.get(name) for name in self.names] for row in data])
+            return rows, missing, unknown
+        rows = (np.asarray(data, dtype=np.float64) if isinstance(data, np.ndarray) and data.dtype.kind in "fiub"
+                else _as_float(data) if len(data) else np.empty((0, width)))
+        if rows.ndim == 1:
+            rows = rows[None, :]
+        if rows.ndim != 2 or rows.shape[1] != width:
+            raise ValueError(f"Expected rows of {width} features in schema order, got shape {rows.shape}")
+        return rows, None, []
+
+    def validate(self, data):
+        """ValidationReport for a batch (DataFrame, dict(s) of features, or (n, 45) array)"""
+        rows, missing, unknown = self.to_matrix(data)
+        # Each check is one pass over the whole batch, ORed into uint8 issue bits. Column
+        # slices would be strided in a row-major batch, so every check covers all 45 columns,
+        # with infinite bounds and a whole-number mask turning the check off where it doesn't apply.
+        finite = np.isfinite(rows)
+        codes = (~finite).view(np.uint8) << 1                                      # NOT_FINITE
+        if missing is not None and missing.any():
+            codes[missing] = MISSING
+        with np.errstate(invalid="ignore"):
+            codes |= np.less(rows, self.low).view(np.uint8) << 2                   # BELOW_MIN
+            codes |= np.greater(rows, self.high).view(np.uint8) << 3               # ABOVE_MAX
+            fractional = np.not_equal(rows, np.rint(rows))
+        fractional &= finite
+        fractional &= self.whole
+        codes |= fractional.view(np.uint8) << 4                                    # NOT_INTEGER
+
+        issues = np.bitwise_or.reduce(codes, axis=1)
+        out_of_shape = (issues & _CLIP) != 0
+        rejected = (issues & _REJECT) != 0
+        if self.mode == "reject":
+            rejected |= out_of_shape
+        elif out_of_shape.any():
+            rows = np.clip(rows, self.low, self.high)
+            np.rint(rows, out=rows, where=self.whole)
+
+        group_violations = {}
+        for group, cols in self.groups.items():
+            group_violations[group] = np.nansum(rows[:, cols], axis=1) > 1
+            rejected |= group_violations[group]
+        return ValidationReport(rows, codes, group_violations, rejected, out_of_shape & ~rejected, unknown)
+
+
+_VALIDATORS = {}
+
+
+def validate_features(data, mode="clip"):
+    """Validate a batch against SCHEMA (see FeatureValidator.validate)"""
+    if mode not in _VALIDATORS:
+        _VALIDATORS[mode] = FeatureValidator(mode=mode)
+    return _VALIDATORS[mode].validate(data)
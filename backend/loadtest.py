@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for the API bridge.
+
+Starts the bridge locally (Flask dev server via app.py, wsgi.py under gunicorn, or
+the async asgi_app.py under uvicorn)
+against a scratch data file, drives a configurable mix of concurrent POST/GET
+requests with realistic analysis payloads, and reports throughput, p50/p95/p99
+latency and error rates per route.
+
+Usage:
+    python loadtest.py                                   # flask, 8 clients, 20s
+    python loadtest.py --server gunicorn --workers 4 --clients 32
+    python loadtest.py --url http://localhost:5000 --duration 60
+    python loadtest.py --post-ratio 0.5 --json-out results.json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FEATURE_NAMES = [
+    'Header_Length', 'Protocol_Type', 'Duration', 'Rate', 'Srate', 'Drate',
+    'fin_flag_number', 'syn_flag_number', 'rst_flag_number', 'psh_flag_number',
+    'ack_flag_number', 'ece_flag_number', 'cwr_flag_number',
+    'ack_count', 'syn_count', 'fin_count', 'rst_count',
+    'HTTP', 'HTTPS', 'DNS', 'Telnet', 'SMTP', 'SSH', 'IRC',
+    'TCP', 'UDP', 'DHCP', 'ARP', 'ICMP', 'IGMP', 'IPv', 'LLC',
+    'Tot_sum', 'Min', 'Max', 'AVG', 'Std', 'Tot_size', 'IAT',
+    'Number', 'Magnitude', 'Radius', 'Covariance', 'Variance', 'Weight'
+]
+
+THREAT_CLASSES = ['Benign', 'DDoS', 'Malware', 'MQTT', 'Port_Scan', 'Recon', 'Spoofing']
+
+# Per-class traffic profiles (mirrors the Streamlit SAMPLE_DATA shapes); anything
+# not listed is 0
+TRAFFIC_PROFILES = {
+    'Benign': {
+        'Header_Length': 20, 'Protocol_Type': 6, 'Duration': 0.5, 'Rate': 1000, 'Srate': 500, 'Drate': 500,
+        'fin_flag_number': 1, 'syn_flag_number': 1, 'psh_flag_number': 1, 'ack_flag_number': 1,
+        'ack_count': 10, 'syn_count': 1, 'fin_count': 1, 'HTTP': 1, 'TCP': 1, 'IPv': 1,
+        'Tot_sum': 1500, 'Min': 64, 'Max': 1500, 'AVG': 750, 'Std': 200, 'Tot_size': 3000,
+        'IAT': 0.1, 'Number': 20, 'Magnitude': 1.5, 'Radius': 0.8, 'Covariance': 0.3,
+        'Variance': 0.4, 'Weight': 1.0
+    },
+    'DDoS': {
+        'Header_Length': 20, 'Protocol_Type': 17, 'Duration': 0.001, 'Rate': 50000, 'Srate': 25000, 'Drate': 25000,
+        'syn_flag_number': 1, 'syn_count': 1000, 'UDP': 1, 'IPv': 1,
+        'Tot_sum': 64000, 'Min': 64, 'Max': 64, 'AVG': 64, 'Tot_size': 64000,
+        'IAT': 0.00001, 'Number': 1000, 'Magnitude': 10.0, 'Radius': 5.0, 'Covariance': 0.9,
+        'Variance': 0.95, 'Weight': 5.0
+    },
+    'Port_Scan': {
+        'Header_Length': 20, 'Protocol_Type': 6, 'Duration': 0.01, 'Rate': 10000, 'Srate': 5000, 'Drate': 5000,
+        'fin_flag_number': 1, 'syn_flag_number': 1, 'rst_flag_number': 1,
+        'syn_count': 100, 'rst_count': 100, 'Telnet': 1, 'SSH': 1, 'TCP': 1, 'IPv': 1,
+        'Tot_sum': 6400, 'Min': 64, 'Max': 64, 'AVG': 64, 'Tot_size': 6400,
+        'IAT': 0.0001, 'Number': 100, 'Magnitude': 3.0, 'Radius': 2.0, 'Covariance': 0.7,
+        'Variance': 0.8, 'Weight': 3.0
+    },
+    'Malware': {
+        'Header_Length': 20, 'Protocol_Type': 6, 'Duration': 5.0, 'Rate': 100, 'Srate': 50, 'Drate': 50,
+        'fin_flag_number': 1, 'syn_flag_number': 1, 'psh_flag_number': 1, 'ack_flag_number': 1,
+        'ack_count': 50, 'syn_count': 1, 'fin_count': 1, 'HTTPS': 1, 'TCP': 1, 'IPv': 1,
+        'Tot_sum': 5000, 'Min': 100, 'Max': 100, 'AVG': 100, 'Tot_size': 5000,
+        'IAT': 0.05, 'Number': 50, 'Magnitude': 2.0, 'Radius': 1.2, 'Covariance': 0.6,
+        'Variance': 0.7, 'Weight': 2.0
+    }
+}
+
+RISK_BY_CLASS = {'Benign': 'Low', 'DDoS': 'Critical', 'Port_Scan': 'High', 'Malware': 'High'}
+
+
+def build_payload(rng):
+    """Build a realistic analysis payload like send_analysis_to_frontend() posts"""
+    threat_class = rng.choice(list(TRAFFIC_PROFILES.keys()))
+    profile = TRAFFIC_PROFILES[threat_class]
+
+    features = {}
+    for name in FEATURE_NAMES:
+        value = profile.get(name, 0)
+        # jitter continuous features by +/-20%, keep flags, one-hots and the protocol number exact
+        if isinstance(value, float) or (value > 1 and name != "Protocol_Type"):
+            value = value * rng.uniform(0.8, 1.2)
+        features[name] = float(value)
+
+    raw = [rng.random() for _ in THREAT_CLASSES]
+    raw[THREAT_CLASSES.index(threat_class)] += len(THREAT_CLASSES)
+    total = sum(raw)
+    probabilities = {cls: r / total for cls, r in zip(THREAT_CLASSES, raw)}
+
+    return {
+        "threat_class": threat_class,
+        "confidence": probabilities[threat_class],
+        "probabilities": probabilities,
+        "features": features,
+        "recommendations": ["🔍 Load test recommendation", "📊 Continue monitoring"],
+        "risk_level": RISK_BY_CLASS[threat_class],
+        "timestamp": datetime.now().isoformat(),
+        "model_used": "loadtest"
+    }
+
+
+# -------------------------------
+# Local bridge server
+# -------------------------------
+def server_command(server, port, workers):
+    """Command line used to start the bridge for a given server flavour"""
+    if server == "flask":
+        return [sys.executable, "app.py"]
+    if server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "wsgi:app",
+                "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+                "--log-level", "warning"]
+    if server == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "asgi_app:app",
+                "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+                "--log-level", "warning"]
+    raise ValueError(f"Unknown server type: {server}")
+
+
+def start_bridge(server="flask", port=5055, workers=1, data_file=None, timeout=20.0, extra_env=None):
+    """
+    Start the bridge in a subprocess and wait for /api/health.
+    Returns (process, base_url). Uses a scratch directory for the data file and
+    state database so the committed shared_analysis_data.json is never touched.
+    """
+    scratch_dir = None
+    if data_file is None:
+        scratch_dir = tempfile.mkdtemp(prefix="bridge_loadtest_")
+        data_file = os.path.join(scratch_dir, "shared_analysis_data.json")
+
+    env = os.environ.copy()
+    env.update({
+        "PORT": str(port),
+        "FLASK_ENV": "production",
+        "BRIDGE_DATA_FILE": data_file,
+        "BRIDGE_DB_FILE": os.path.join(os.path.dirname(data_file), "shared_analysis.db"),
+        "PYTHONUNBUFFERED": "1"
+    })
+    if extra_env:
+        env.update(extra_env)
+
+    proc = subprocess.Popen(
+        server_command(server, port, workers),
+        cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    proc.scratch_dir = scratch_dir
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{server} bridge exited early with code {proc.returncode}")
+        try:
+            if requests.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                return proc, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+
+    stop_bridge(proc)
+    raise RuntimeError(f"{server} bridge did not become healthy within {timeout}s")
+
+
+def stop_bridge(proc):
+    """Terminate a bridge subprocess started by start_bridge()"""
+    if proc is None:
+        return
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    scratch_dir = getattr(proc, "scratch_dir", None)
+    if scratch_dir:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+# -------------------------------
+# Load generation
+# -------------------------------
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, rank))]
+
+
+def _client_loop(base_url, stop_at, max_requests, counter, counter_lock, post_ratio, history_ratio, seed, records):
+    rng = random.Random(seed)
+    session = requests.Session()
+
+    while time.time() < stop_at:
+        if max_requests:
+            with counter_lock:
+                if counter[0] >= max_requests:
+                    break
+                counter[0] += 1
+
+        roll = rng.random()
+        if roll < post_ratio:
+            route, method = "POST /api/threat-analysis", "post"
+            url, kwargs = f"{base_url}/api/threat-analysis", {"json": build_payload(rng)}
+        elif roll < post_ratio + history_ratio:
+            route, method = "GET /api/threat-analysis/history", "get"
+            url, kwargs = f"{base_url}/api/threat-analysis/history", {}
+        else:
+            route, method = "GET /api/threat-analysis", "get"
+            url, kwargs = f"{base_url}/api/threat-analysis", {}
+
+        start = time.perf_counter()
+        try:
+            response = getattr(session, method)(url, timeout=10, **kwargs)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        records.append((route, time.perf_counter() - start, ok))
+
+
+def run_load(base_url, clients=8, duration=20.0, max_requests=0, post_ratio=0.2, history_ratio=0.1, seed=42):
+    """
+    Drive concurrent traffic against base_url.
+    Returns a list of (route, latency_seconds, ok) records and the wall-clock time.
+    """
+    stop_at = time.time() + duration
+    counter, counter_lock = [0], threading.Lock()
+    per_client = [[] for _ in range(clients)]
+
+    threads = [
+        threading.Thread(
+            target=_client_loop,
+            args=(base_url, stop_at, max_requests, counter, counter_lock,
+                  post_ratio, history_ratio, seed + i, per_client[i]),
+            daemon=True
+        )
+        for i in range(clients)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    records = [r for client_records in per_client for r in client_records]
+    return records, elapsed
+
+
+def summarize(records, elapsed):
+    """Aggregate raw records into per-route and overall stats"""
+    def _stats(rows):
+        latencies = sorted(lat for _, lat, _ in rows)
+        errors = sum(1 for _, _, ok in rows if not ok)
+        return {
+            "requests": len(rows),
+            "errors": errors,
+            "error_rate": errors / len(rows) if rows else 0.0,
+            "throughput_rps": len(rows) / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": (latencies[-1] * 1000) if latencies else 0.0
+        }
+
+    by_route = {}
+    for row in records:
+        by_route.setdefault(row[0], []).append(row)
+
+    return {
+        "elapsed_s": elapsed,
+        "overall": _stats(records),
+        "routes": {route: _stats(rows) for route, rows in sorted(by_route.items())}
+    }
+
+
+def print_summary(summary, title="Load test results"):
+    print(f"\n📊 {title} ({summary['elapsed_s']:.1f}s)")
+    header = f"{'route':<36}{'reqs':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err %':>8}"
+    print(header)
+    print("-" * len(header))
+    rows = list(summary["routes"].items()) + [("TOTAL", summary["overall"])]
+    for route, s in rows:
+        print(f"{route:<36}{s['requests']:>8}{s['throughput_rps']:>10.1f}{s['p50_ms']:>10.2f}"
+              f"{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['error_rate'] * 100:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the SecureGluco API bridge")
+    parser.add_argument("--url", help="Target an already running bridge instead of starting one")
+    parser.add_argument("--server", choices=["flask", "gunicorn", "uvicorn"], default="flask",
+                        help="How to start the local bridge (ignored with --url)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn/uvicorn worker count")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after N requests (0 = duration only)")
+    parser.add_argument("--post-ratio", type=float, default=0.2, help="Fraction of POST /api/threat-analysis")
+    parser.add_argument("--history-ratio", type=float, default=0.1, help="Fraction of GET .../history")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json-out", help="Write the summary as JSON for regression tracking")
+    args = parser.parse_args()
+
+    proc = None
+    base_url = args.url
+    try:
+        if base_url is None:
+            print(f"🌉 Starting local {args.server} bridge on port {args.port}...")
+            proc, base_url = start_bridge(args.server, args.port, args.workers)
+
+        print(f"🚀 {args.clients} clients → {base_url} "
+              f"(POST {args.post_ratio:.0%}, history {args.history_ratio:.0%})")
+        records, elapsed = run_load(
+            base_url, clients=args.clients, duration=args.duration, max_requests=args.requests,
+            post_ratio=args.post_ratio, history_ratio=args.history_ratio, seed=args.seed
+        )
+        summary = summarize(records, elapsed)
+        summary["config"] = {k: v for k, v in vars(args).items() if k != "json_out"}
+        print_summary(summary)
+
+        if args.json_out:
+            with open(args.json_out, "w") as f:
+                json.dump(summary, f, indent=2)
+            print(f"\n💾 Summary written to {args.json_out}")
+    finally:
+        stop_bridge(proc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# Tiered retention: raw analyses → per-minute → per-hour aggregates → expiry
+#
+#   raw     full analyses, kept for BRIDGE_RAW_RETENTION seconds (e.g. 86400 for a day)
+#   minute  one aggregate per minute, kept for BRIDGE_MINUTE_RETENTION (default 7 days)
+#   hour    one aggregate per hour, kept for BRIDGE_HOUR_RETENTION (default 90 days), then dropped
+#
+# An aggregate holds sums, not averages: counts by class, confidence
+# n/sum/sum of squares/min/max, and per-feature sums. So any number of them
+# merge exactly, whether from rows compacted in several passes or from
+# minutes rolled into an hour.
+#
+# The Compactor moves data down the tiers in a background thread. It takes a
+# store lease first, so only one worker compacts at a time. Each batch is moved
+# atomically (store.apply_rollup writes the merged aggregates and deletes what
+# they replace in one transaction), so every analysis is counted in exactly one
+# tier at any moment. timeseries() therefore sums all three tiers for a range and
+# stays exact. Old ranges are read from the coarse tiers, so cost stays bounded
+# by the number of buckets plus the raw window, however long the range is.
+#
+# The similar-incident search vectors (state_store.py) outlive the raw rows and
+# are expired together with the hour tier, in the same pass.
+#
+# Tiering is off unless BRIDGE_RAW_RETENTION is set: by default the store keeps
+# only the newest HISTORY_LIMIT analyses per device, as before.
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import metrics
+from bridge_core import FEATURE_ORDER, analysis_time, parse_time
+
+TIERS = (("minute", 60), ("hour", 3600))
+MAX_POINTS = 1500
+
+COMPACTED = metrics.counter(
+    "bridge_retention_compacted_total", "Raw rows and minute buckets rolled up, hour buckets and search vectors expired", ("tier",)
+)
+
+
+class RetentionPolicy:
+    def __init__(self, raw=86400.0, minute=7 * 86400.0, hour=90 * 86400.0):
+        if raw and not raw < minute < hour:
+            raise ValueError("Retention windows must grow: raw < minute < hour")
+        self.raw = raw
+        self.minute = minute
+        self.hour = hour
+
+    @property
+    def enabled(self):
+        return bool(self.raw)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            raw=float(os.environ.get("BRIDGE_RAW_RETENTION", 0)),
+            minute=float(os.environ.get("BRIDGE_MINUTE_RETENTION", 7 * 86400)),
+            hour=float(os.environ.get("BRIDGE_HOUR_RETENTION", 90 * 86400)),
+        )
+
+
+# -------------------------------
+# Aggregates
+# -------------------------------
+def empty_rollup(bucket):
+    return {"bucket": int(bucket), "count": 0, "classes": {},
+            "confidence": {"n": 0, "sum": 0.0, "sumsq": 0.0, "min": None, "max": None},
+            "features": {"n": 0, "sum": [0.0] * len(FEATURE_ORDER)}}
+
+
+def add_analysis(rollup, analysis):
+    """Fold one raw analysis into an aggregate (in place)"""
+    rollup["count"] += 1
+    threat_class = str(analysis.get("threat_class") or "unknown")
+    rollup["classes"][threat_class] = rollup["classes"].get(threat_class, 0) + 1
+    confidence = analysis.get("confidence")
+    if isinstance(confidence, (int, float)) and math.isfinite(confidence):
+        stats = rollup["confidence"]
+        stats["n"] += 1
+        stats["sum"] += confidence
+        stats["sumsq"] += confidence * confidence
+        stats["min"] = confidence if stats["min"] is None else min(stats["min"], confidence)
+        stats["max"] = confidence if stats["max"] is None else max(stats["max"], confidence)
+    features = analysis.get("features")
+    if isinstance(features, dict) and features:
+        sums = rollup["features"]["sum"]
+        for i, name in enumerate(FEATURE_ORDER):
+            value = features.get(name)
+            if isinstance(value, (int, float)) and math.isfinite(value):
+                sums[i] += value
+        rollup["features"]["n"] += 1
+    return rollup
+
+
+def merge_rollup(into, other):
+    """Add aggregate `other` into `into` (in place); the bucket of `into` is kept"""
+    into["count"] += other["count"]
+    for threat_class, n in other["classes"].items():
+        into["classes"][threat_class] = into["classes"].get(threat_class, 0) + n
+    a, b = into["confidence"], other["confidence"]
+    a["n"] += b["n"]
+    a["sum"] += b["sum"]
+    a["sumsq"] += b["sumsq"]
+    lows = [x for x in (a["min"], b["min"]) if x is not None]
+    highs = [x for x in (a["max"], b["max"]) if x is not None]
+    a["min"] = min(lows) if lows else None
+    a["max"] = max(highs) if highs else None
+    into["features"]["n"] += other["features"]["n"]
+    into["features"]["sum"] = [x + y for x, y in zip(into["features"]["sum"], other["features"]["sum"])]
+    return into
+
+
+def aggregate(analyses, step):
+    """{bucket start: aggregate} of raw analyses in `step`-second buckets"""
+    buckets = {}
+    for analysis in analyses:
+        bucket = int(analysis_time(analysis) // step * step)
+        add_analysis(buckets.setdefault(bucket, empty_rollup(bucket)), analysis)
+    return buckets
+
+
+def rebucket(rollups, step):
+    """{bucket start: aggregate} of finer aggregates merged into `step`-second buckets"""
+    buckets = {}
+    for rollup in rollups:
+        bucket = int(rollup["bucket"] // step * step)
+        merge_rollup(buckets.setdefault(bucket, empty_rollup(bucket)), rollup)
+    return buckets
+
+
+def summarize(rollup, include_features=False):
+    """API view of an aggregate: means and spreads instead of sums"""
+    stats = rollup["confidence"]
+    n = stats["n"]
+    mean = stats["sum"] / n if n else None
+    summary = {
+        "bucket": rollup["bucket"],
+        "start": datetime.fromtimestamp(rollup["bucket"]).isoformat(),
+        "count": rollup["count"],
+        "classes": rollup["classes"],
+        "confidence": {
+            "mean": mean,
+            "std": math.sqrt(max(stats["sumsq"] / n - mean * mean, 0.0)) if n else None,
+            "min": stats["min"], "max": stats["max"],
+        },
+    }
+    if include_features:
+        m = rollup["features"]["n"]
+        summary["feature_means"] = ({name: s / m for name, s in zip(FEATURE_ORDER, rollup["features"]["sum"])}
+                                    if m else {})
+    return summary
+
+
+# -------------------------------
+# Queries
+# -------------------------------
+def choose_step(start, end, step=None, max_points=MAX_POINTS):
+    """Bucket width for a range: the requested step, widened to a tier size so at most max_points come back"""
+    if step:
+        step = max(float(step), (end - start) / max_points)
+    else:
+        step = (end - start) / max_points
+    for _, seconds in TIERS:
+        if step <= seconds:
+            return seconds
+    return int(math.ceil(step / 3600.0)) * 3600
+
+
+def parse_timeseries_query(args, now=None):
+    """(start, end, step, include_features) from /timeseries query parameters (default: the last day)"""
+    try:
+        end = parse_time(args.get("end"))
+        end = (time.time() if now is None else now) if end is None else end
+        start = parse_time(args.get("start"))
+        start = end - 86400 if start is None else start
+        step = float(args.get("step")) if args.get("step") else None
+    except ValueError:
+        raise ValueError("start and end must be ISO times or epoch seconds, step a number of seconds")
+    if start >= end:
+        raise ValueError("start must be before end")
+    return start, end, step, str(args.get("features", "")).lower() in ("1", "true")
+
+
+def timeseries(store, start, end, step=None, include_features=False):
+    """
+    Aggregates over [start, end) in `step`-second buckets, served from whichever
+    tiers hold the range: hour and minute rollups (index range reads), plus the raw
+    analyses still inside the raw window.
+    """
+    step = choose_step(start, end, step)
+    buckets = {}
+    for tier, seconds in TIERS:
+        rollups = store.rollups(tier, start // seconds * seconds, end)
+        for bucket, rollup in rebucket(rollups, max(step, seconds)).items():
+            merge_rollup(buckets.setdefault(bucket, empty_rollup(bucket)), rollup)
+    # Raw rows only exist inside the raw window, so this read is bounded by it whatever the range
+    for bucket, rollup in aggregate(store.iter_analyses(start, end), step).items():
+        merge_rollup(buckets.setdefault(bucket, empty_rollup(bucket)), rollup)
+    points = [summarize(buckets[b], include_features) for b in sorted(buckets)]
+    return {"step": step, "start": start, "end": end, "points": points}
+
+
+# -------------------------------
+# Background compaction
+# -------------------------------
+class Compactor:
+    def __init__(self, store, policy, interval=60.0, batch_size=5000):
+        self.store = store
+        self.policy = policy
+        self.interval = interval
+        self.batch_size = batch_size
+        self._thread = None
+        self._stop = threading.Event()
+
+    def run_once(self, now=None):
+        """
+        One compaction pass; returns {"raw": rows rolled up, "minute": minutes rolled
+        up, "hour": hours expired, "vectors": search vectors expired}, or None when
+        another worker holds the lease
+        """
+        now = time.time() if now is None else now
+        if not self.policy.enabled or not self.store.try_lease("compactor", self.interval * 2):
+            return None
+        done = {"raw": 0, "minute": 0, "hour": 0, "vectors": 0}
+        while True:
+            expired = self.store.expired_analyses(now - self.policy.raw, self.batch_size)
+            if not expired:
+                break
+            self.store.apply_rollup("minute", aggregate(expired, 60), seqs=[a["seq"] for a in expired])
+            done["raw"] += len(expired)
+        while True:
+            expired = self.store.rollups("minute", None, now - self.policy.minute, limit=self.batch_size)
+            if not expired:
+                break
+            self.store.apply_rollup("hour", rebucket(expired, 3600),
+                                    consumed=("minute", [r["bucket"] for r in expired]))
+            done["minute"] += len(expired)
+        done["hour"] = self.store.expire_rollups("hour", now - self.policy.hour)
+        done["vectors"] = self.store.expire_vectors(now - self.policy.hour)
+        for tier, n in done.items():
+            COMPACTED.inc(n, tier=tier)
+        return done
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Compaction failed: {e}")
+
+    def start(self):
+        if self._thread is None and self.policy.enabled:
+            self._thread = threading.Thread(target=self._run, name="retention-compactor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# Similar-incident search over every stored analysis
+#
+# The stores keep a 45-dim float32 search vector per analysis (bridge_core.
+# feature_vector), untrimmed, so the history cap doesn't limit search.
+# SimilarityIndex mirrors those vectors in memory and catches up incrementally
+# on each query (one "seq > last" read), so every worker answers from its own copy:
+#
+#   exact  up to `exact_limit` vectors: one vectorized pass over a compact,
+#          contiguous float32 matrix plus argpartition
+#   ivf    beyond that: an inverted-file index. k-means (on a sample) splits the
+#          space into ~2·sqrt(N) cells. A query scans only the `nprobe` nearest cells.
+#          New vectors are appended to their cell; the quantizer is retrained
+#          when the index has doubled since the last training.
+#
+# Under tiered retention the compactor expires old vectors from the store (in
+# whichever worker holds the lease). Each sync therefore also asks the store for
+# its oldest remaining seq and drops everything before it: rows are appended in
+# seq order, so expired rows are a prefix, removed in one slice (IVF cells are
+# renumbered and the new arrays are copies, so a running trainer's snapshot stays
+# valid).
+#
+# Training runs in a background thread on a snapshot of the vectors, never inside
+# add() and so never inside a /similar request. Until it finishes, queries keep
+# using the previous centroids (or exact search before the first training). The
+# new cells are then swapped in under the lock, together with the vectors added
+# while it ran.
+#
+# Distances are squared L2, computed from the differences (the |a|² - 2a·b + |b|²
+# shortcut loses near neighbours to float32 cancellation). Memory is 4 bytes x 45
+# dims per analysis (~180 MB for a million) plus 8 bytes of bookkeeping per analysis.
+#
+# Usage:
+#     python similarity.py --rows 1000000 --queries 200      # build + query latency benchmark
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from bridge_core import FEATURE_ORDER
+
+DIM = len(FEATURE_ORDER)
+
+
+def _kmeans(sample, n_clusters, iterations=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()))]  # re-seed dead cells
+    return centroids
+
+
+def _nearest(vectors, centroids, chunk=65536):
+    """Index of the closest centroid for each vector (chunked to bound memory)"""
+    c_norms = (centroids * centroids).sum(axis=1)
+    out = np.empty(len(vectors), dtype=np.int32)
+    for lo in range(0, len(vectors), chunk):
+        block = vectors[lo:lo + chunk]
+        out[lo:lo + chunk] = np.argmin(c_norms[None, :] - 2.0 * block @ centroids.T, axis=1)
+    return out
+
+
+class SimilarityIndex:
+    def __init__(self, dim=DIM, exact_limit=20000, nprobe=8, sync_batch=50000, background=True):
+        self.dim = dim
+        self.exact_limit = exact_limit
+        self.nprobe = nprobe
+        self.sync_batch = sync_batch
+        self.last_seq = 0
+        self._lock = threading.RLock()
+        self._size = 0
+        self._vectors = np.empty((1024, dim), dtype=np.float32)
+        self._seqs = np.empty(1024, dtype=np.int64)
+        self._centroids = None
+        self._lists = []
+        self._pending = {}
+        self._trained_size = 0
+        self._dropped = 0  # rows removed from the front by expire_before(), ever
+        self.background = background
+        self._trainer = None
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def mode(self):
+        return "ivf" if self._centroids is not None else "exact"
+
+    # -------------------------------
+    # Building
+    # -------------------------------
+    def _reserve(self, n):
+        if self._size + n <= len(self._seqs):
+            return
+        capacity = max(2 * len(self._seqs), self._size + n)
+        for name in ("_vectors", "_seqs"):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add(self, seqs, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            lo = self._size
+            self._reserve(len(vectors))
+            self._vectors[lo:lo + len(vectors)] = vectors
+            self._seqs[lo:lo + len(vectors)] = seqs
+            self._size += len(vectors)
+            if len(seqs):
+                self.last_seq = max(self.last_seq, int(np.max(seqs)))
+
+            if self._centroids is not None:
+                self._assign_pending(lo, self._size)
+            if self._size > self.exact_limit and self._size >= 2 * self._trained_size and self._trainer is None:
+                # Rows are only appended in place (_reserve and expire_before copy to new arrays), so
+                # (array, size, dropped) is a stable snapshot
+                snapshot = (self._vectors, self._size, self._dropped)
+                if self.background:
+                    self._trainer = threading.Thread(target=self._train, args=snapshot, name="similarity-train",
+                                                     daemon=True)
+                    self._trainer.start()
+                else:
+                    self._trainer = True
+                    self._train(*snapshot)
+
+    def _assign_pending(self, lo, hi):
+        for row, cell in zip(range(lo, hi), _nearest(self._vectors[lo:hi], self._centroids)):
+            self._pending.setdefault(int(cell), []).append(row)
+
+    def _train(self, vectors, n, dropped=0):
+        """k-means over the first n rows of `vectors`, outside the lock; then swap the new cells in"""
+        try:
+            n_lists = max(16, int(2 * np.sqrt(n)))
+            rng = np.random.default_rng(n)
+            sample = vectors[rng.choice(n, min(n, 16 * n_lists), replace=False)]
+            centroids = _kmeans(sample, n_lists)
+            assign = _nearest(vectors[:n], centroids)
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(n_lists + 1))
+            lists = [order[bounds[i]:bounds[i + 1]] for i in range(n_lists)]
+            with self._lock:
+                shift = self._dropped - dropped  # rows expired while training ran
+                lists = [rows[rows >= shift] - shift for rows in lists] if shift else lists
+                self._centroids, self._lists, self._pending = centroids, lists, {}
+                self._assign_pending(max(n - shift, 0), self._size)  # added while training ran
+                self._trained_size = max(n - shift, 0)
+        except Exception as e:
+            print(f"Similarity index training failed: {e}")
+        finally:
+            self._trainer = None
+
+    def join(self, timeout=None):
+        """Wait for a background training run, if one is going"""
+        trainer = self._trainer
+        if isinstance(trainer, threading.Thread):
+            trainer.join(timeout)
+
+    def expire_before(self, seq):
+        """Drop every vector with a seq below `seq`; returns how many"""
+        with self._lock:
+            drop = int(np.searchsorted(self._seqs[:self._size], seq))
+            if drop == 0:
+                return 0
+            keep = self._size - drop
+            capacity = max(1024, len(self._seqs) if keep > len(self._seqs) // 4 else 2 * keep)
+            vectors = np.empty((capacity, self.dim), dtype=np.float32)
+            seqs = np.empty(capacity, dtype=np.int64)
+            vectors[:keep], seqs[:keep] = self._vectors[drop:self._size], self._seqs[drop:self._size]
+            self._vectors, self._seqs, self._size = vectors, seqs, keep
+            self._lists = [rows[rows >= drop] - drop for rows in self._lists]
+            self._pending = {cell: [r - drop for r in rows if r >= drop] for cell, rows in self._pending.items()}
+            self._trained_size = max(self._trained_size - drop, 0)
+            self._dropped += drop
+            return drop
+
+    def sync(self, store):
+        """Drop vectors the store has expired, then pull those stored since the last sync (all on first use)"""
+        with self._lock:
+            oldest = store.oldest_vector_seq()
+            self.expire_before(self.last_seq + 1 if oldest is None else oldest)
+            while True:
+                rows = store.vectors_since(self.last_seq, self.sync_batch)
+                if not rows:
+                    return self._size
+                seqs = np.fromiter((seq for seq, _ in rows), dtype=np.int64, count=len(rows))
+                vectors = np.frombuffer(b"".join(v for _, v in rows), dtype=np.float32).reshape(-1, self.dim)
+                self.add(seqs, vectors)
+                if len(rows) < self.sync_batch:
+                    return self._size
+
+    # -------------------------------
+    # Queries
+    # -------------------------------
+    def _candidates(self, query):
+        if self._centroids is None:
+            return None
+        c_dist = (self._centroids * self._centroids).sum(axis=1) - 2.0 * (self._centroids @ query)
+        probe = np.argpartition(c_dist, min(self.nprobe, len(c_dist) - 1))[:self.nprobe]
+        for cell in probe:
+            if self._pending.get(int(cell)):
+                self._lists[cell] = np.concatenate([self._lists[cell], self._pending.pop(int(cell))])
+        return np.concatenate([self._lists[cell] for cell in probe])
+
+    def search(self, vector, k=10, exclude_seq=None):
+        """(seqs, squared distances) of the k nearest stored vectors, closest first"""
+        query = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            rows = self._candidates(query)
+            if rows is None:
+                vectors, seqs = self._vectors[:self._size], self._seqs[:self._size]
+            else:
+                vectors, seqs = self._vectors[rows], self._seqs[rows]
+        diff = vectors - query
+        distances = np.einsum("ij,ij->i", diff, diff)
+        if exclude_seq is not None:
+            distances = np.where(seqs == exclude_seq, np.inf, distances)
+        k = min(k, int(np.isfinite(distances).sum()))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        best = np.argpartition(distances, k - 1)[:k]
+        best = best[np.argsort(distances[best])]
+        return seqs[best], np.maximum(distances[best], 0.0)
+
+    def similar(self, store, analysis_id, k=10):
+        """Summaries of the k analyses closest to `analysis_id`, or None if it has no vector"""
+        self.sync(store)
+        found = store.get_vector(analysis_id)
+        if found is None:
+            return None
+        seq, vector = found
+        seqs, distances = self.search(np.frombuffer(vector, dtype=np.float32), k, exclude_seq=seq)
+        summaries = store.vector_summaries(seqs.tolist())
+        return [dict(summaries[int(s)], seq=int(s), distance=round(float(np.sqrt(d)), 6))
+                for s, d in zip(seqs, distances) if int(s) in summaries]
+
+    def stats(self):
+        return {"size": self._size, "mode": self.mode, "lists": len(self._lists), "nprobe": self.nprobe}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similarity index build/query benchmark on synthetic vectors")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--exact-limit", type=int, default=20000)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Clustered like traffic: a few hundred behaviours with per-flow noise
+    centers = rng.normal(scale=3.0, size=(500, DIM)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), args.rows)] + rng.normal(size=(args.rows, DIM)).astype(np.float32)
+
+    index = SimilarityIndex(exact_limit=args.exact_limit, nprobe=args.nprobe, background=False)
+    start = time.perf_counter()
+    for lo in range(0, args.rows, 100000):
+        index.add(np.arange(lo, min(lo + 100000, args.rows)) + 1, vectors[lo:lo + 100000])
+    print(f"🏗️ {index.size:,} vectors indexed in {time.perf_counter() - start:.1f}s ({index.mode}, "
+          f"{len(index._lists)} lists)")
+
+    queries = rng.integers(0, args.rows, args.queries)
+    exact = SimilarityIndex(exact_limit=args.rows + 1)
+    exact.add(np.arange(args.rows) + 1, vectors)
+    latencies, recall = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        seqs, _ = index.search(vectors[q], args.k, exclude_seq=q + 1)
+        latencies.append(time.perf_counter() - t0)
+        truth, _ = exact.search(vectors[q], args.k, exclude_seq=q + 1)
+        recall.append(len(set(seqs.tolist()) & set(truth.tolist())) / args.k)
+    latencies = np.array(latencies) * 1000
+    print(f"🔎 {args.queries} queries: p50 {np.percentile(latencies, 50):.2f} ms, "
+          f"p99 {np.percentile(latencies, 99):.2f} ms, recall@{args.k} {np.mean(recall):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,880 @@
+# Shared analysis state for the API bridge, safe across gunicorn/uvicorn workers
+#
+# The module-level dict the bridge used to keep gave every worker its own
+# diverging copy. These stores keep the state outside the process instead:
+#
+#   SQLiteStateStore  default; one WAL-mode database file shared by all workers
+#                     on the host
+#   RedisStateStore   optional; shared by workers on any number of hosts
+#
+# Both store analyses as JSON (timestamps already ISO strings) in insertion
+# order, stamped with a monotonically increasing "seq" that is allocated in the
+# same transaction that writes the row (so latest_seq() never names an analysis
+# readers can't see yet, and /changes cursors never skip one). Analyst labels (used
+# for online fine-tuning) are kept separately with their own "seq" and a copy of
+# the labeled analysis' features, so they outlive the trimmed history.
+# Each analysis also carries its timestamp as epoch seconds ("ts", indexed in
+# SQLite) so time-range reads (iter_analyses, used by the streaming export) page
+# through the store instead of loading it.
+# Likewise every analysis with features gets a search vector (bridge_core.
+# feature_vector) and a short summary that are not trimmed with the history;
+# similarity.py indexes them for similar-incident search. Under tiered retention
+# they are kept as long as the hour tier and then expired (expire_vectors).
+#
+# With tiered retention (retention.py) the stores keep every analysis inside the raw
+# window instead of trimming to HISTORY_LIMIT (history() still returns the newest
+# HISTORY_LIMIT), plus per-minute and per-hour rollups that the compactor moves
+# older data into. apply_rollup() merges aggregates and deletes what they replace
+# atomically, and try_lease() makes sure only one worker compacts at a time.
+#
+# Analyses are partitioned by device_id. Each device keeps its own newest
+# HISTORY_LIMIT analyses when history is trimmed, so a chatty pump can't push a
+# quiet monitor's history out. Per-device reads go through an index on
+# (device, seq) in SQLite or a sorted set per device in Redis. Their cost
+# therefore depends only on that device's rows, however much traffic the others
+# send. A small devices table/hash keeps each device's newest summary and total
+# count for the device list. Both backends hold the same rows (the union of the
+# devices' histories), so count(), history() and analyses_since() agree.
+# Device ids are chosen by the sender, so at most max_devices (BRIDGE_MAX_DEVICES)
+# are tracked: a new device past the cap evicts the least recently seen one,
+# together with its trimmed history.
+#
+# ChangeNotifier lets long-poll handlers ("changes since seq") wait for new
+# analyses: one poller per process watches the newest seq, so store load stays
+# flat no matter how many dashboards are waiting.
+#
+# Backend selection (create_store_from_env):
+#   BRIDGE_STATE_BACKEND=sqlite|redis   (default sqlite)
+#   BRIDGE_DB_FILE=<path>               SQLite file (default shared_analysis.db next to app.py)
+#   REDIS_URL=redis://host:6379/0       Redis connection for the redis backend
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from bridge_core import (
+    DEFAULT_DEVICE, HISTORY_LIMIT, MAX_STORED_DEVICES, analysis_time, analysis_to_json, feature_vector,
+    incident_summary, read_json
+)
+from retention import RetentionPolicy, merge_rollup
+
+DEFAULT_DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared_analysis.db')
+
+
+class SQLiteStateStore:
+    """Analysis history in a SQLite file; every worker process opens its own connection"""
+
+    def __init__(self, path=DEFAULT_DB_FILE, history_limit=HISTORY_LIMIT, timeout=5.0, trim_history=True,
+                 max_devices=MAX_STORED_DEVICES):
+        self.path = path
+        self.history_limit = history_limit
+        self.trim_history = trim_history  # False under tiered retention: the compactor removes old rows
+        self.max_devices = max_devices
+        self.timeout = timeout
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self):
+        # Connections are per thread and per process (never reuse one across a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                ts REAL,
+                device TEXT NOT NULL DEFAULT 'default'
+            );
+            CREATE INDEX IF NOT EXISTS idx_analyses_id ON analyses(id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS labels (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL,
+                payload TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS vectors (
+                seq INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                ts REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_vectors_id ON vectors(id);
+            CREATE TABLE IF NOT EXISTS rollups (
+                tier TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (tier, bucket)
+            );
+            CREATE TABLE IF NOT EXISTS devices (
+                device TEXT PRIMARY KEY,
+                latest_seq INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                last_seen TEXT,
+                summary TEXT NOT NULL
+            );
+        """)
+        # Databases created before analyses had a "ts" column: add and backfill it
+        if "ts" not in {row[1] for row in conn.execute("PRAGMA table_info(analyses)")}:
+            try:
+                conn.execute("ALTER TABLE analyses ADD COLUMN ts REAL")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+            rows = conn.execute("SELECT seq, payload FROM analyses WHERE ts IS NULL").fetchall()
+            conn.executemany("UPDATE analyses SET ts = ? WHERE seq = ?",
+                             [(analysis_time(json.loads(payload)), seq) for seq, payload in rows])
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_ts ON analyses(ts)")
+        # ...and before they were partitioned by device (existing rows belong to the default device)
+        if "device" not in {row[1] for row in conn.execute("PRAGMA table_info(analyses)")}:
+            try:
+                conn.execute(f"ALTER TABLE analyses ADD COLUMN device TEXT NOT NULL DEFAULT '{DEFAULT_DEVICE}'")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_device ON analyses(device, seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_seen ON devices(latest_seq)")
+        # Analyses stored before the devices table existed: list their devices (totals count the kept rows)
+        if conn.execute("SELECT 1 FROM analyses LIMIT 1").fetchone() and \
+                not conn.execute("SELECT 1 FROM devices LIMIT 1").fetchone():
+            rows = conn.execute(
+                "SELECT a.device, a.seq, a.payload, t.total FROM analyses a JOIN "
+                "(SELECT device, MAX(seq) AS seq, COUNT(*) AS total FROM analyses GROUP BY device) t "
+                "ON a.seq = t.seq"
+            ).fetchall()
+            conn.executemany(
+                "INSERT OR IGNORE INTO devices (device, latest_seq, total, last_seen, summary) VALUES (?, ?, ?, ?, ?)",
+                [(device, seq, total, json.loads(payload).get("timestamp"),
+                  json.dumps(incident_summary(self._decode(seq, payload)))) for device, seq, payload, total in rows]
+            )
+        # ...and before vectors expired with the hour tier (their summary carries the timestamp)
+        if "ts" not in {row[1] for row in conn.execute("PRAGMA table_info(vectors)")}:
+            try:
+                conn.execute("ALTER TABLE vectors ADD COLUMN ts REAL")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+            rows = conn.execute("SELECT seq, summary FROM vectors WHERE ts IS NULL").fetchall()
+            conn.executemany("UPDATE vectors SET ts = ? WHERE seq = ?",
+                             [(analysis_time(json.loads(summary)), seq) for seq, summary in rows])
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_ts ON vectors(ts)")
+
+    @staticmethod
+    def _decode(seq, payload):
+        analysis = json.loads(payload)
+        analysis["seq"] = seq
+        analysis.setdefault("device_id", DEFAULT_DEVICE)
+        return analysis
+
+    def add_analysis(self, analysis, last_updated):
+        """Append an analysis, trim its device's history and record last_updated; returns its seq"""
+        record = analysis_to_json(analysis)
+        device = record.setdefault("device_id", DEFAULT_DEVICE)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                "INSERT INTO analyses (id, payload, ts, device) VALUES (?, ?, ?, ?)",
+                (str(record.get("id")), json.dumps(record), analysis_time(record), device)
+            )
+            seq = cur.lastrowid
+            vector = feature_vector(record.get("features"))
+            if vector is not None:
+                conn.execute(
+                    "INSERT INTO vectors (seq, id, summary, vector, ts) VALUES (?, ?, ?, ?, ?)",
+                    (seq, str(record.get("id")), json.dumps(incident_summary(record)), vector, analysis_time(record))
+                )
+            if self.history_limit and self.trim_history:
+                # Newest seq past this device's limit (index range on (device, seq)), then drop it and older
+                row = conn.execute(
+                    "SELECT seq FROM analyses WHERE device = ? ORDER BY seq DESC LIMIT 1 OFFSET ?",
+                    (device, self.history_limit)
+                ).fetchone()
+                if row:
+                    conn.execute("DELETE FROM analyses WHERE device = ? AND seq <= ?", (device, row[0]))
+            conn.execute(
+                "INSERT INTO devices (device, latest_seq, total, last_seen, summary) VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT(device) DO UPDATE SET latest_seq = excluded.latest_seq, total = total + 1, "
+                "last_seen = excluded.last_seen, summary = excluded.summary",
+                (device, seq, record.get("timestamp"), json.dumps(incident_summary(record)))
+            )
+            if self.max_devices and conn.execute("SELECT total FROM devices WHERE device = ?",
+                                                 (device,)).fetchone()[0] == 1:
+                self._evict_devices(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_updated', ?)",
+                (last_updated.isoformat(),)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return seq
+
+    def _evict_devices(self, conn):
+        # Only a new device can push the table past the cap, so this runs once per new device
+        excess = conn.execute("SELECT COUNT(*) FROM devices").fetchone()[0] - self.max_devices
+        if excess <= 0:
+            return
+        stale = [row[0] for row in conn.execute(
+            "SELECT device FROM devices ORDER BY latest_seq LIMIT ?", (excess,)
+        )]
+        conn.executemany("DELETE FROM devices WHERE device = ?", [(d,) for d in stale])
+        if self.history_limit and self.trim_history:
+            # Under tiered retention the rows stay until the compactor rolls them up
+            conn.executemany("DELETE FROM analyses WHERE device = ?", [(d,) for d in stale])
+
+    def latest(self):
+        row = self._connect().execute(
+            "SELECT seq, payload FROM analyses ORDER BY seq DESC LIMIT 1"
+        ).fetchone()
+        return self._decode(*row) if row else None
+
+    def history(self):
+        rows = self._connect().execute(
+            "SELECT seq, payload FROM (SELECT seq, payload FROM analyses ORDER BY seq DESC LIMIT ?) ORDER BY seq",
+            (self.history_limit or -1,)
+        ).fetchall()
+        return [self._decode(seq, payload) for seq, payload in rows]
+
+    def last_updated(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'last_updated'").fetchone()
+        return row[0] if row else None
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def latest_seq(self):
+        """Newest seq ever assigned (0 when empty); cheap enough to poll"""
+        # From sqlite_sequence, not MAX(seq): compaction may have removed every raw row
+        row = self._connect().execute("SELECT seq FROM sqlite_sequence WHERE name = 'analyses'").fetchone()
+        return row[0] if row else 0
+
+    def analyses_since(self, seq=0, limit=100):
+        rows = self._connect().execute(
+            "SELECT seq, payload FROM analyses WHERE seq > ? ORDER BY seq LIMIT ?", (int(seq), int(limit))
+        ).fetchall()
+        return [self._decode(s, payload) for s, payload in rows]
+
+    def iter_analyses(self, start=None, end=None, batch_size=500):
+        """
+        Analyses with start <= ts < end (epoch seconds, None = unbounded) in time order,
+        fetched batch_size rows at a time by keyset paging on (ts, seq)
+        """
+        start = float("-inf") if start is None else float(start)
+        end = float("inf") if end is None else float(end)
+        last_ts, last_seq = start, -1
+        while True:
+            rows = self._connect().execute(
+                "SELECT seq, ts, payload FROM analyses WHERE ts >= ? AND ts < ? AND (ts > ? OR (ts = ? AND seq > ?)) "
+                "ORDER BY ts, seq LIMIT ?", (start, end, last_ts, last_ts, last_seq, int(batch_size))
+            ).fetchall()
+            for seq, ts, payload in rows:
+                yield self._decode(seq, payload)
+            if len(rows) < batch_size:
+                return
+            last_seq, last_ts = rows[-1][0], rows[-1][1]
+
+    # -------------------------------
+    # Per-device reads
+    # -------------------------------
+    def device_latest(self, device):
+        row = self._connect().execute(
+            "SELECT seq, payload FROM analyses WHERE device = ? ORDER BY seq DESC LIMIT 1", (str(device),)
+        ).fetchone()
+        return self._decode(*row) if row else None
+
+    def device_history(self, device, limit=None):
+        """A device's newest `limit` (default history_limit) analyses, oldest first"""
+        rows = self._connect().execute(
+            "SELECT seq, payload FROM (SELECT seq, payload FROM analyses WHERE device = ? ORDER BY seq DESC LIMIT ?) "
+            "ORDER BY seq", (str(device), int(limit or self.history_limit or -1))
+        ).fetchall()
+        return [self._decode(seq, payload) for seq, payload in rows]
+
+    def devices(self):
+        """Every device that sent an analysis: newest summary, seq and total count, most recent first"""
+        rows = self._connect().execute(
+            "SELECT device, latest_seq, total, last_seen, summary FROM devices ORDER BY latest_seq DESC"
+        ).fetchall()
+        return [{"device_id": device, "latest_seq": seq, "total": total, "last_seen": last_seen,
+                 "latest": json.loads(summary)} for device, seq, total, last_seen, summary in rows]
+
+    # -------------------------------
+    # Tiered retention
+    # -------------------------------
+    def expired_analyses(self, cutoff, limit=5000):
+        """Oldest raw analyses with ts < cutoff"""
+        rows = self._connect().execute(
+            "SELECT seq, payload FROM analyses WHERE ts < ? ORDER BY ts, seq LIMIT ?", (float(cutoff), int(limit))
+        ).fetchall()
+        return [self._decode(seq, payload) for seq, payload in rows]
+
+    def rollups(self, tier, start=None, end=None, limit=None):
+        """Aggregates of a tier with start <= bucket < end, oldest first"""
+        rows = self._connect().execute(
+            "SELECT payload FROM rollups WHERE tier = ? AND bucket >= ? AND bucket < ? ORDER BY bucket LIMIT ?",
+            (tier, float("-inf") if start is None else start, float("inf") if end is None else end,
+             -1 if limit is None else int(limit))
+        ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def apply_rollup(self, tier, buckets, seqs=(), consumed=None):
+        """
+        In one transaction: merge {bucket: aggregate} into `tier` and delete what the
+        aggregates replace (raw analyses by seq, or consumed=(tier, buckets))
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for bucket, rollup in buckets.items():
+                row = conn.execute("SELECT payload FROM rollups WHERE tier = ? AND bucket = ?",
+                                   (tier, int(bucket))).fetchone()
+                if row:
+                    rollup = merge_rollup(json.loads(row[0]), rollup)
+                conn.execute("INSERT OR REPLACE INTO rollups (tier, bucket, payload) VALUES (?, ?, ?)",
+                             (tier, int(bucket), json.dumps(rollup)))
+            conn.executemany("DELETE FROM analyses WHERE seq = ?", [(int(s),) for s in seqs])
+            if consumed:
+                conn.executemany("DELETE FROM rollups WHERE tier = ? AND bucket = ?",
+                                 [(consumed[0], int(b)) for b in consumed[1]])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def expire_rollups(self, tier, cutoff):
+        return self._connect().execute(
+            "DELETE FROM rollups WHERE tier = ? AND bucket < ?", (tier, float(cutoff))
+        ).rowcount
+
+    def expire_vectors(self, cutoff):
+        """Drop search vectors of analyses with ts < cutoff; returns how many"""
+        return self._connect().execute("DELETE FROM vectors WHERE ts < ?", (float(cutoff),)).rowcount
+
+    def try_lease(self, name, ttl):
+        """True if this caller holds lease `name` for the next ttl seconds (free or expired before)"""
+        now = time.time()
+        cur = self._connect().execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value "
+            "WHERE CAST(meta.value AS REAL) <= ?", (f"lease:{name}", str(now + ttl), now)
+        )
+        return cur.rowcount == 1
+
+    def vectors_since(self, seq=0, limit=50000):
+        """[(seq, float32 vector bytes)] of analyses after `seq`, oldest first"""
+        return self._connect().execute(
+            "SELECT seq, vector FROM vectors WHERE seq > ? ORDER BY seq LIMIT ?", (int(seq), int(limit))
+        ).fetchall()
+
+    def oldest_vector_seq(self):
+        """Seq of the oldest stored search vector, None when there are none"""
+        return self._connect().execute("SELECT MIN(seq) FROM vectors").fetchone()[0]
+
+    def get_vector(self, analysis_id):
+        row = self._connect().execute(
+            "SELECT seq, vector FROM vectors WHERE id = ? ORDER BY seq DESC LIMIT 1", (str(analysis_id),)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def vector_summaries(self, seqs):
+        seqs = [int(s) for s in seqs]
+        if not seqs:
+            return {}
+        rows = self._connect().execute(
+            f"SELECT seq, summary FROM vectors WHERE seq IN ({','.join('?' * len(seqs))})", seqs
+        ).fetchall()
+        return {seq: json.loads(summary) for seq, summary in rows}
+
+    def claim_once(self, name):
+        """True for exactly one caller across all workers (used for one-off startup tasks)"""
+        cur = self._connect().execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, '1')", (f"claim:{name}",))
+        return cur.rowcount == 1
+
+    def get_analysis(self, analysis_id):
+        row = self._connect().execute(
+            "SELECT seq, payload FROM analyses WHERE id = ? ORDER BY seq DESC LIMIT 1", (str(analysis_id),)
+        ).fetchone()
+        return self._decode(*row) if row else None
+
+    def add_label(self, analysis_id, label, analyst=None):
+        """Record an analyst label for a stored analysis; returns the label record or None"""
+        analysis = self.get_analysis(analysis_id)
+        if analysis is None:
+            return None
+        record = label_record(analysis, label, analyst)
+        cur = self._connect().execute(
+            "INSERT INTO labels (id, payload) VALUES (?, ?)", (record["id"], json.dumps(record))
+        )
+        record["seq"] = cur.lastrowid
+        return record
+
+    def labels_since(self, seq=0, limit=500):
+        rows = self._connect().execute(
+            "SELECT seq, payload FROM labels WHERE seq > ? ORDER BY seq LIMIT ?", (int(seq), int(limit))
+        ).fetchall()
+        return [self._decode(s, payload) for s, payload in rows]
+
+
+class RedisStateStore:
+    """
+    Analysis history in Redis, as a sorted set scored by seq so readers always see
+    seq order even when workers race. Each device also gets its own sorted set of the
+    same records, and an id -> seq hash serves lookups by analysis id. Only uses
+    WATCH/MULTI/INCR/ZADD/ZREM/ZREMRANGEBYSCORE/ZRANGE/ZRANGEBYSCORE/ZCARD/GET/SET/
+    DEL/EXISTS/HSET/HGET/HMGET/HDEL/HINCRBY/HGETALL/HKEYS, so any redis-py compatible
+    client works, including fakeredis.FakeRedis() in tests.
+    """
+
+    def __init__(self, client=None, url=None, prefix="securegluco", history_limit=HISTORY_LIMIT, trim_history=True,
+                 max_devices=MAX_STORED_DEVICES):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("RedisStateStore needs the 'redis' package (pip install redis)") from e
+            client = redis.Redis.from_url(url or os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+        self.client = client
+        self.history_limit = history_limit
+        self.trim_history = trim_history
+        self.max_devices = max_devices
+        self.prefix = prefix
+        self.seq_key = f"{prefix}:seq"
+        self.history_key = f"{prefix}:history"
+        self.updated_key = f"{prefix}:last_updated"
+        self.label_seq_key = f"{prefix}:label_seq"
+        self.labels_key = f"{prefix}:labels"
+        self.vector_seqs_key = f"{prefix}:vector_seqs"
+        self.vectors_key = f"{prefix}:vectors"
+        self.vector_ids_key = f"{prefix}:vector_ids"
+        self.summaries_key = f"{prefix}:summaries"
+        self.vector_times_key = f"{prefix}:vector_times"
+        self.devices_key = f"{prefix}:devices"
+        self.device_totals_key = f"{prefix}:device_totals"
+        self.device_seen_key = f"{prefix}:device_seen"  # device -> latest seq, for eviction
+        self.ids_key = f"{prefix}:ids"  # analysis id -> seq of its newest stored analysis
+        self._migrate()
+
+    @staticmethod
+    def _decode(raw):
+        if raw is None:
+            return None
+        analysis = json.loads(raw)
+        analysis.setdefault("device_id", DEFAULT_DEVICE)
+        return analysis
+
+    def _device_key(self, device):
+        return f"{self.prefix}:device:{device}"
+
+    @staticmethod
+    def _text(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _migrate(self):
+        # Stores written before the id index existed: rebuild it, and the device list and sets when those
+        # are missing too. The global history is refilled from the device sets it used to trim away.
+        if self.client.exists(self.ids_key) or not self.client.exists(self.history_key):
+            return
+        known = [self._text(d) for d in self.client.hkeys(self.devices_key)]
+        rows = self.client.zrange(self.history_key, 0, -1, withscores=True)
+        for device in known:
+            rows += self.client.zrange(self._device_key(device), 0, -1, withscores=True)
+        latest, totals = {}, {}
+        pipe = self.client.pipeline(transaction=True)
+        for raw, seq in sorted(set(rows), key=lambda row: row[1]):
+            record, seq = self._decode(raw), int(seq)
+            device = record["device_id"]
+            pipe.zadd(self.history_key, {raw: seq})
+            pipe.zadd(self._device_key(device), {raw: seq})
+            pipe.hset(self.ids_key, str(record.get("id")), seq)
+            latest[device] = (seq, record)
+            totals[device] = totals.get(device, 0) + 1
+        for device, (seq, record) in latest.items():
+            if device not in known:
+                pipe.hset(self.devices_key, device, json.dumps(
+                    {"latest_seq": seq, "last_seen": record.get("timestamp"), "latest": incident_summary(record)}
+                ))
+                pipe.hset(self.device_totals_key, device, totals[device])
+            pipe.zadd(self.device_seen_key, {device: seq})
+        pipe.execute()
+
+    def _drop(self, payloads, pipe):
+        """Queue removal of stored analyses from the global history and the id index"""
+        if not payloads:
+            return
+        pipe.zrem(self.history_key, *payloads)
+        records = [json.loads(raw) for raw in payloads]
+        ids = [str(r.get("id")) for r in records]
+        # An id sent again later points at the newer analysis; only unmap ids still pointing here
+        stale = [i for i, r, seq in zip(ids, records, self.client.hmget(self.ids_key, ids))
+                 if seq is not None and int(seq) == r["seq"]]
+        if stale:
+            pipe.hdel(self.ids_key, *stale)
+
+    def _evict_devices(self):
+        excess = int(self.client.zcard(self.device_seen_key)) - self.max_devices
+        if excess <= 0:
+            return
+        pipe = self.client.pipeline(transaction=True)
+        for device in (self._text(d) for d in self.client.zrange(self.device_seen_key, 0, excess - 1)):
+            if self.history_limit and self.trim_history:
+                # Under tiered retention the rows stay in the global history until the compactor rolls them up
+                self._drop(self.client.zrange(self._device_key(device), 0, -1), pipe)
+            pipe.delete(self._device_key(device))  # the compactor only trims the sets of listed devices
+            pipe.hdel(self.devices_key, device)
+            pipe.hdel(self.device_totals_key, device)
+            pipe.zrem(self.device_seen_key, device)
+        pipe.execute()
+
+    def _write_analysis(self, record, last_updated):
+        """
+        Allocate the next seq and write the analysis in one WATCH/MULTI transaction, so
+        the seq counter never runs ahead of the committed rows: latest_seq() (the
+        /changes cursor) can't skip an analysis that is still being written, and
+        analyses commit in seq order across workers. Returns the device's new total.
+        """
+        from redis.exceptions import WatchError
+
+        device = record["device_id"]
+        vector = feature_vector(record.get("features"))
+        with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(self.seq_key)
+                    record["seq"] = int(pipe.get(self.seq_key) or 0) + 1
+                    payload = json.dumps(record)
+                    pipe.multi()
+                    pipe.hincrby(self.device_totals_key, device, 1)
+                    pipe.set(self.seq_key, record["seq"])
+                    pipe.zadd(self.history_key, {payload: record["seq"]})
+                    pipe.zadd(self._device_key(device), {payload: record["seq"]})
+                    pipe.hset(self.ids_key, str(record.get("id")), record["seq"])
+                    pipe.hset(self.devices_key, device, json.dumps(
+                        {"latest_seq": record["seq"], "last_seen": record.get("timestamp"),
+                         "latest": incident_summary(record)}
+                    ))
+                    pipe.zadd(self.device_seen_key, {device: record["seq"]})
+                    pipe.set(self.updated_key, last_updated.isoformat())
+                    if vector is not None:
+                        pipe.zadd(self.vector_seqs_key, {str(record["seq"]): record["seq"]})
+                        pipe.zadd(self.vector_times_key, {str(record["seq"]): analysis_time(record)})
+                        pipe.hset(self.vectors_key, record["seq"], vector)
+                        pipe.hset(self.vector_ids_key, str(record.get("id")), record["seq"])
+                        pipe.hset(self.summaries_key, record["seq"], json.dumps(incident_summary(record)))
+                    return pipe.execute()[0]
+                except WatchError:
+                    continue  # another worker took this seq first; retry with the next one
+
+    def add_analysis(self, analysis, last_updated):
+        record = analysis_to_json(analysis)
+        device = record.setdefault("device_id", DEFAULT_DEVICE)
+        total = self._write_analysis(record, last_updated)
+        if self.history_limit and self.trim_history:
+            # Trim the device's set and drop the same analyses from the global history, as SQLite does.
+            # Removal is by member, so concurrent writers converge on the newest history_limit.
+            overflow = self.client.zrange(self._device_key(device), 0, -self.history_limit - 1)
+            if overflow:
+                pipe = self.client.pipeline(transaction=True)
+                pipe.zrem(self._device_key(device), *overflow)
+                self._drop(overflow, pipe)
+                pipe.execute()
+        if self.max_devices and int(total) == 1:
+            self._evict_devices()
+        return record["seq"]
+
+    def latest(self):
+        newest = self.client.zrange(self.history_key, -1, -1)
+        return self._decode(newest[0]) if newest else None
+
+    def history(self):
+        start = -self.history_limit if self.history_limit else 0
+        return [self._decode(raw) for raw in self.client.zrange(self.history_key, start, -1)]
+
+    def last_updated(self):
+        value = self.client.get(self.updated_key)
+        if isinstance(value, bytes):
+            value = value.decode()
+        return value
+
+    def count(self):
+        return int(self.client.zcard(self.history_key))
+
+    def latest_seq(self):
+        return int(self.client.get(self.seq_key) or 0)
+
+    def analyses_since(self, seq=0, limit=100):
+        raw = self.client.zrangebyscore(self.history_key, f"({int(seq)}", "+inf", start=0, num=int(limit))
+        return [self._decode(r) for r in raw]
+
+    def iter_analyses(self, start=None, end=None, batch_size=500):
+        """Analyses with start <= ts < end, paged by seq (seq order is ingest order)"""
+        last = 0
+        while True:
+            batch = self.analyses_since(last, batch_size)
+            for analysis in batch:
+                ts = analysis_time(analysis)
+                if (start is None or ts >= start) and (end is None or ts < end):
+                    yield analysis
+            if len(batch) < batch_size:
+                return
+            last = batch[-1]["seq"]
+
+    def device_latest(self, device):
+        newest = self.client.zrange(self._device_key(device), -1, -1)
+        return self._decode(newest[0]) if newest else None
+
+    def device_history(self, device, limit=None):
+        limit = int(limit or self.history_limit or 0)
+        return [self._decode(raw) for raw in self.client.zrange(self._device_key(device), -limit if limit else 0, -1)]
+
+    def devices(self):
+        totals = {self._text(k): int(v) for k, v in self.client.hgetall(self.device_totals_key).items()}
+        devices = []
+        for device, raw in self.client.hgetall(self.devices_key).items():
+            device = self._text(device)
+            devices.append(dict(json.loads(raw), device_id=device, total=totals.get(device, 0)))
+        return sorted(devices, key=lambda d: d["latest_seq"], reverse=True)
+
+    def expired_analyses(self, cutoff, limit=5000):
+        # seq order is ingest order, so expired analyses are a prefix of the history set
+        expired = []
+        for raw in self.client.zrange(self.history_key, 0, int(limit) - 1):
+            analysis = self._decode(raw)
+            if analysis_time(analysis) >= cutoff:
+                break
+            expired.append(analysis)
+        return expired
+
+    def _rollup_keys(self, tier):
+        return f"{self.prefix}:rollup:{tier}", f"{self.prefix}:rollup_buckets:{tier}"
+
+    def rollups(self, tier, start=None, end=None, limit=None):
+        data_key, index_key = self._rollup_keys(tier)
+        buckets = self.client.zrangebyscore(index_key, "-inf" if start is None else start,
+                                            "+inf" if end is None else f"({end}",
+                                            start=0 if limit else None, num=int(limit) if limit else None)
+        if not buckets:
+            return []
+        return [json.loads(raw) for raw in self.client.hmget(data_key, buckets) if raw is not None]
+
+    def apply_rollup(self, tier, buckets, seqs=(), consumed=None):
+        data_key, index_key = self._rollup_keys(tier)
+        bucket_ids = [int(b) for b in buckets]
+        existing = self.client.hmget(data_key, bucket_ids) if bucket_ids else []
+        pipe = self.client.pipeline(transaction=True)
+        for bucket, raw in zip(bucket_ids, existing):
+            rollup = merge_rollup(json.loads(raw), buckets[bucket]) if raw is not None else buckets[bucket]
+            pipe.hset(data_key, bucket, json.dumps(rollup))
+            pipe.zadd(index_key, {bucket: bucket})
+        if seqs:
+            # expired_analyses() hands out a prefix of the history, so a score range removes exactly those
+            # (and the same prefix of every device's set)
+            newest = max(int(s) for s in seqs)
+            self._drop(self.client.zrangebyscore(self.history_key, "-inf", newest), pipe)
+            for device in self.client.hkeys(self.devices_key):
+                pipe.zremrangebyscore(self._device_key(self._text(device)), "-inf", newest)
+        if consumed and consumed[1]:
+            consumed_data, consumed_index = self._rollup_keys(consumed[0])
+            pipe.hdel(consumed_data, *[int(b) for b in consumed[1]])
+            pipe.zrem(consumed_index, *[int(b) for b in consumed[1]])
+        pipe.execute()
+
+    def expire_rollups(self, tier, cutoff):
+        data_key, index_key = self._rollup_keys(tier)
+        buckets = self.client.zrangebyscore(index_key, "-inf", f"({cutoff}")
+        if buckets:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.hdel(data_key, *buckets)
+            pipe.zrem(index_key, *buckets)
+            pipe.execute()
+        return len(buckets)
+
+    def expire_vectors(self, cutoff):
+        seqs = [int(s) for s in self.client.zrangebyscore(self.vector_times_key, "-inf", f"({cutoff}")]
+        if not seqs:
+            return 0
+        ids = [str(json.loads(raw)["id"]) for raw in self.client.hmget(self.summaries_key, seqs) if raw is not None]
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zrem(self.vector_seqs_key, *seqs)
+        pipe.zrem(self.vector_times_key, *seqs)
+        pipe.hdel(self.vectors_key, *seqs)
+        pipe.hdel(self.summaries_key, *seqs)
+        pipe.execute()
+        # An id re-sent later points at a newer seq; only unmap ids still pointing at an expired one
+        expired = set(seqs)
+        current = self.client.hmget(self.vector_ids_key, ids) if ids else []
+        stale = [i for i, seq in zip(ids, current) if seq is not None and int(seq) in expired]
+        if stale:
+            self.client.hdel(self.vector_ids_key, *stale)
+        return len(seqs)
+
+    def try_lease(self, name, ttl):
+        return bool(self.client.set(f"{self.prefix}:lease:{name}", 1, nx=True, px=int(ttl * 1000)))
+
+    def vectors_since(self, seq=0, limit=50000):
+        seqs = [int(s) for s in self.client.zrangebyscore(self.vector_seqs_key, f"({int(seq)}", "+inf",
+                                                          start=0, num=int(limit))]
+        return list(zip(seqs, self.client.hmget(self.vectors_key, seqs))) if seqs else []
+
+    def oldest_vector_seq(self):
+        oldest = self.client.zrange(self.vector_seqs_key, 0, 0)
+        return int(oldest[0]) if oldest else None
+
+    def get_vector(self, analysis_id):
+        seq = self.client.hget(self.vector_ids_key, str(analysis_id))
+        if seq is None:
+            return None
+        return int(seq), self.client.hget(self.vectors_key, int(seq))
+
+    def vector_summaries(self, seqs):
+        seqs = [int(s) for s in seqs]
+        if not seqs:
+            return {}
+        return {s: json.loads(raw) for s, raw in zip(seqs, self.client.hmget(self.summaries_key, seqs))
+                if raw is not None}
+
+    def claim_once(self, name):
+        """True for exactly one caller across all workers (used for one-off startup tasks)"""
+        return bool(self.client.set(f"{self.seq_key}:claim:{name}", 1, nx=True))
+
+    def get_analysis(self, analysis_id):
+        seq = self.client.hget(self.ids_key, str(analysis_id))
+        if seq is None:
+            return None
+        found = self.client.zrangebyscore(self.history_key, int(seq), int(seq))
+        return self._decode(found[0]) if found else None
+
+    def add_label(self, analysis_id, label, analyst=None):
+        analysis = self.get_analysis(analysis_id)
+        if analysis is None:
+            return None
+        record = label_record(analysis, label, analyst)
+        record["seq"] = int(self.client.incr(self.label_seq_key))
+        self.client.zadd(self.labels_key, {json.dumps(record): record["seq"]})
+        return record
+
+    def labels_since(self, seq=0, limit=500):
+        raw = self.client.zrangebyscore(self.labels_key, f"({int(seq)}", "+inf", start=0, num=int(limit))
+        return [self._decode(r) for r in raw]
+
+
+class ChangeNotifier:
+    """
+    Wakes long-poll handlers when the newest analysis seq moves past theirs.
+
+    Writes made by this process call notify() and wake waiters immediately.
+    Writes from other workers or hosts are seen by a single background poller,
+    which reads store.latest_seq() every `interval` seconds and only while someone
+    is waiting. A waiting client is just a thread blocked on a Condition, and
+    never queries the store itself. With max_waiters set, at most that many
+    threads are held at once (see wait_for).
+    """
+
+    def __init__(self, store, interval=0.25, max_waiters=None):
+        self.store = store
+        self.interval = interval
+        self.max_waiters = max_waiters
+        self.seq = 0
+        self._cond = threading.Condition()
+        self._waiters = 0
+        self._poller = None
+
+    def notify(self, seq):
+        with self._cond:
+            if seq > self.seq:
+                self.seq = seq
+                self._cond.notify_all()
+
+    def _poll(self):
+        while True:
+            with self._cond:
+                if not self._waiters:
+                    self._poller = None
+                    return
+            try:
+                self.notify(self.store.latest_seq())
+            except Exception as e:
+                print(f"Change poll failed: {e}")
+            time.sleep(self.interval)
+
+    def wait_for(self, since, timeout):
+        """
+        Block until an analysis newer than `since` exists or timeout passes; returns
+        the newest seq, or None without waiting when max_waiters are already waiting
+        """
+        with self._cond:
+            if self.seq > since:
+                return self.seq
+            if self.max_waiters is not None and self._waiters >= self.max_waiters:
+                return None
+            self._waiters += 1
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name="change-notifier", daemon=True)
+                self._poller.start()
+            try:
+                self._cond.wait_for(lambda: self.seq > since, timeout)
+                return self.seq
+            finally:
+                self._waiters -= 1
+
+    @property
+    def waiting(self):
+        return self._waiters
+
+
+def label_record(analysis, label, analyst=None):
+    """Snapshot of what fine-tuning needs from a labeled analysis"""
+    return {
+        "id": str(analysis.get("id")),
+        "label": str(label),
+        "predicted": analysis.get("threat_class"),
+        "features": analysis.get("features") or {},
+        "analyst": analyst,
+        "labeled_at": datetime.now().isoformat(),
+    }
+
+
+def create_store_from_env():
+    """Build the store selected by BRIDGE_STATE_BACKEND"""
+    backend = os.environ.get("BRIDGE_STATE_BACKEND", "sqlite").lower()
+    trim_history = not RetentionPolicy.from_env().enabled
+    if backend == "redis":
+        return RedisStateStore(url=os.environ.get("REDIS_URL"), trim_history=trim_history)
+    if backend == "sqlite":
+        return SQLiteStateStore(os.environ.get("BRIDGE_DB_FILE", DEFAULT_DB_FILE), trim_history=trim_history)
+    raise ValueError(f"Unknown BRIDGE_STATE_BACKEND: {backend}")
+
+
+def import_json_snapshot(store, path):
+    """
+    One-off migration from the old shared_analysis_data.json: seed an empty store
+    with the snapshot's history. Returns the number of analyses imported.
+    """
+    if store.count() > 0:
+        return 0
+    try:
+        data = read_json(path)
+    except ValueError as e:
+        print(f"Skipping unreadable snapshot {path}: {e}")
+        return 0
+    if not data or not store.claim_once("json_snapshot_imported"):
+        return 0
+
+    history = data.get("analysis_history") or []
+    last_updated = data.get("last_updated")
+    last_updated = datetime.fromisoformat(last_updated) if last_updated else datetime.now()
+    for analysis in history:
+        store.add_analysis(analysis, last_updated)
+    return len(history)
@@ -0,0 +1,98 @@
+# backend/test_bridge_routes.py
+# The Flask and ASGI bridges must answer every route the same way, including 400s for bad query parameters.
+import pytest
+
+import tracing
+from feature_schema import FEATURE_NAMES
+
+API = "/api/threat-analysis"
+
+
+def _features(**overrides):
+    features = dict.fromkeys(FEATURE_NAMES, 0.0)
+    features.update(Header_Length=20.0, Protocol_Type=6.0, Rate=1000.0, TCP=1.0, IPv=1.0)
+    features.update(overrides)
+    return features
+
+
+def test_ingest_latest_and_history(bridge):
+    client = bridge.client
+    assert client.get(API).json()["data"] is None
+    body = client.post(API, json={"threat_class": "Benign", "confidence": 0.9, "features": _features(Rate=-1.0)},
+                       headers={"X-Device-ID": "pump-7"}).json()
+    assert body["status"] == "success" and body["feature_issues"] == ["Rate below_min"]
+    client.post(API, json={"threat_class": "Benign", "confidence": 0.8, "device_id": "cgm-1"})
+
+    latest = client.get(API).json()
+    assert latest["data"]["device_id"] == "cgm-1" and latest["last_updated"]
+    history = client.get(f"{API}/history").json()
+    assert history["count"] == 2 and history["data"][0]["features"]["Rate"] == 0.0
+    assert client.get("/api/health").json()["status"] == "healthy"
+
+    devices = client.get(f"{API}/devices").json()
+    assert sorted(d["device_id"] for d in devices["data"]) == ["cgm-1", "pump-7"]
+    assert client.get(f"{API}/devices/pump-7").json()["data"]["confidence"] == 0.9
+    assert client.get(f"{API}/devices/pump-7/history", params={"limit": 5}).json()["count"] == 1
+
+
+def test_ingest_rejections(bridge):
+    client = bridge.client
+    response = client.post(API, json={"threat_class": "DDoS", "features": {"Rate": 1.0}})
+    assert response.status_code == 400 and response.json()["validation"]["rejected"] == 1
+    assert client.post(API, json={"threat_class": "DDoS"}, headers={"X-Device-ID": "../etc"}).status_code == 400
+    assert client.get(API).json()["data"] is None
+
+
+def test_labels_incidents_and_similar(bridge):
+    client = bridge.client
+    for i in range(3):
+        body = client.post(API, json={"threat_class": "DDoS", "confidence": 0.9, "features": _features(Rate=1000.0 + i)},
+                           headers={"X-Device-ID": "pump-7"}).json()
+        assert body["deduplicated"] is False
+    client.post(API, json={"threat_class": "DDoS", "confidence": 0.9}, headers={"X-Device-ID": "cgm-1"})
+    history = client.get(f"{API}/history").json()["data"]
+    # every repeat is stored, annotated with the one incident it was folded into
+    assert len(history) == 4 and len({a["incident"]["incident_id"] for a in history[:3]}) == 1
+    incidents = client.get(f"{API}/incidents", params={"limit": 10}).json()
+    assert [(i["device_id"], i["count"]) for i in incidents["data"]] == [("cgm-1", 1), ("pump-7", 3)]
+
+    analysis_id = history[0]["id"]
+    assert client.post(f"{API}/{analysis_id}/label", json={"label": "DDoS"}).json()["data"]["label"] == "DDoS"
+    assert client.post(f"{API}/nope/label", json={"label": "DDoS"}).status_code == 404
+    assert client.post(f"{API}/{analysis_id}/label", json={}).status_code == 400
+    labels = client.get(f"{API}/labels", params={"since": 0}).json()
+    assert labels["count"] == 1 and labels["data"][0]["id"] == analysis_id
+
+    similar = client.get(f"{API}/{analysis_id}/similar", params={"k": 3}).json()
+    assert similar["status"] == "success" and similar["count"] == 2
+    assert client.get(f"{API}/nope/similar").status_code == 404
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/incidents", {"limit": "abc"}),
+    ("/labels", {"since": "x"}),
+    ("/labels", {"limit": "1.5"}),
+    ("/changes", {"since": "abc"}),
+    ("/changes", {"timeout": "nan"}),
+    ("/nope/similar", {"k": "many"}),
+    ("/devices/pump-7/history", {"limit": "abc"}),
+    ("/timeseries", {"start": "yesterday"}),
+    ("/export", {"format": "xml"}),
+])
+def test_bad_query_parameters_are_400(bridge, path, params):
+    response = bridge.client.get(API + path, params=params)
+    assert response.status_code == 400 and response.json()["status"] == "error"
+
+
+def test_export_and_timeseries(bridge):
+    bridge.client.post(API, json={"threat_class": "Benign", "confidence": 0.5})
+    export = bridge.client.get(f"{API}/export", params={"format": "ndjson"})
+    assert export.status_code == 200 and export.text.count("\n") == 1
+    series = bridge.client.get(f"{API}/timeseries").json()
+    assert series["status"] == "success" and sum(p["count"] for p in series["points"]) == 1
+
+
+def test_spans_not_accepted_without_tracing(bridge, monkeypatch):
+    monkeypatch.setattr(tracing, "_exporter", None)
+    body = bridge.client.post("/api/traces", json=[{"trace_id": "a" * 32, "name": "render"}]).json()
+    assert body == {"status": "success", "accepted": 0}
@@ -0,0 +1,70 @@
+# backend/test_changes.py
+# The /changes long-poll must hand out every analysis once via its cursor, and wake as soon as one is posted.
+import threading
+import time
+
+import pytest
+
+import bridge_core
+
+URL = "/api/threat-analysis/changes"
+
+
+def _post(client, n=1):
+    for _ in range(n):
+        assert client.post("/api/threat-analysis", json={"threat_class": "Benign", "confidence": 0.9}).status_code == 200
+
+
+def test_cursor_and_reset(bridge):
+    client = bridge.client
+    body = client.get(URL, params={"since": 0, "timeout": 0}).json()
+    assert body["data"] == [] and body["seq"] == 0 and body["reset"] is False
+
+    _post(client, 3)
+    body = client.get(URL, params={"since": 0, "timeout": 0}).json()
+    assert [a["seq"] for a in body["data"]] == [1, 2, 3] and body["seq"] == 3
+    body = client.get(URL, params={"since": 1, "timeout": 0}).json()
+    assert [a["seq"] for a in body["data"]] == [2, 3] and body["seq"] == 3
+    assert client.get(URL, params={"since": 3, "timeout": 0}).json()["data"] == []
+
+    # a cursor ahead of the store (e.g. the store was recreated) gets the whole history again
+    body = client.get(URL, params={"since": 99, "timeout": 0}).json()
+    assert body["reset"] is True and len(body["data"]) == 3 and body["seq"] == 3
+
+
+def test_timeout_is_clamped(bridge, monkeypatch):
+    monkeypatch.setattr(bridge_core, "CHANGES_MAX_WAIT", 0.2)
+    _post(bridge.client)
+    start = time.perf_counter()
+    body = bridge.client.get(URL, params={"since": 1, "timeout": 600}).json()
+    assert body["data"] == [] and body["seq"] == 1 and time.perf_counter() - start < 3
+    assert bridge_core.parse_changes_query({"timeout": "-5", "limit": "0"})[1:] == (0.0, 1)
+
+
+def test_post_wakes_waiter(bridge):
+    _post(bridge.client)
+    result = {}
+
+    def _wait():
+        start = time.perf_counter()
+        result["body"] = bridge.client.get(URL, params={"since": 1, "timeout": 10}).json()
+        result["seconds"] = time.perf_counter() - start
+
+    waiter = threading.Thread(target=_wait)
+    waiter.start()
+    time.sleep(0.3)
+    _post(bridge.client)
+    waiter.join(15)
+    assert [a["seq"] for a in result["body"]["data"]] == [2] and result["seconds"] < 5
+
+
+def test_flask_caps_held_requests(bridge, monkeypatch):
+    if bridge.kind != "flask":
+        pytest.skip("asyncio waiters hold no thread and are not capped")
+    monkeypatch.setattr(bridge.module.changes, "max_waiters", 0)
+    start = time.perf_counter()
+    response = bridge.client.get(URL, params={"since": 0, "timeout": 10})
+    body = response.json()
+    assert time.perf_counter() - start < 2
+    assert body["retry_after"] == bridge_core.CHANGES_BUSY_RETRY and response.headers["Retry-After"] == "5"
+    assert "retry_after" not in bridge.client.get(URL, params={"since": 0, "timeout": 0}).json()
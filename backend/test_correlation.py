@@ -0,0 +1,61 @@
+# backend/test_correlation.py
+# Repeated alerts must fold into one incident, escalate on rate and keep memory bounded.
+from correlation import Correlator, RateWindow, alert_source
+
+
+def _alert(threat_class="DDoS", src="10.0.0.5", risk_level="Medium", device="pump-7"):
+    return {"id": "a", "threat_class": threat_class, "risk_level": risk_level, "flow": {"src": src},
+            "device_id": device}
+
+
+def test_repeats_merge_and_rate_escalates():
+    correlator = Correlator(window=60, bucket=5, merge_gap=300, dedup=True,
+                            escalation=((300.0, "Critical"), (30.0, "High")))
+    incident, action = correlator.observe(_alert(), now=1000.0)
+    assert action == "new" and incident["count"] == 1 and incident["risk_level"] == "Medium"
+
+    actions = [correlator.observe(_alert(), now=1000.0 + i * 0.1)[1] for i in range(1, 400)]
+    incident = correlator.incidents()[0]
+    assert incident["count"] == 400 and incident["rate_per_min"] == 400.0
+    assert incident["risk_level"] == "Critical"
+    assert actions.count("escalated") == 2 and set(actions) == {"merged", "escalated"}
+    assert not correlator.should_store("merged") and correlator.should_store("escalated")
+
+    # another source, device or class is its own incident; benign traffic is not correlated
+    assert correlator.observe(_alert(src="10.0.0.6"), now=1050.0)[1] == "new"
+    assert correlator.observe(_alert(device="cgm-1"), now=1050.0)[1] == "new"
+    assert correlator.observe(_alert(threat_class="Port_Scan"), now=1050.0)[1] == "new"
+    assert correlator.observe(_alert(threat_class="Benign"), now=1050.0) == (None, None)
+
+    # after the merge gap the same key opens a new incident at its own risk level
+    incident, action = correlator.observe(_alert(), now=2000.0)
+    assert action == "new" and incident["count"] == 1 and incident["risk_level"] == "Medium"
+
+
+def test_source_comes_from_the_payload_and_repeats_are_stored_by_default(monkeypatch):
+    monkeypatch.delenv("CORRELATION_DEDUP", raising=False)
+    correlator = Correlator.from_env()
+    assert correlator.should_store("merged")  # merged alerts are annotated, not dropped
+    assert alert_source({"flow": {"src": "10.0.0.5"}, "source": "ward-3"}) == "10.0.0.5"
+    assert alert_source({"source": "ward-3"}) == "ward-3" and alert_source({}) == "unknown"
+    incident, _ = correlator.observe({"id": "a", "threat_class": "DDoS"}, now=1.0)
+    assert (incident["device_id"], incident["source"]) == ("default", "unknown")
+
+
+def test_rate_window_expires_old_buckets():
+    window = RateWindow(4)
+    for bucket in (0, 0, 1, 3):
+        window.add(bucket)
+    assert window.total == 4
+    window.add(5)  # buckets 0 and 1 fall out
+    assert window.total == 2
+    window.add(100)
+    assert window.total == 1
+
+
+def test_tracked_keys_are_bounded():
+    correlator = Correlator(max_keys=100)
+    for i in range(1000):
+        correlator.observe(_alert(src=f"10.0.{i // 256}.{i % 256}"), now=float(i))
+    assert len(correlator) == 100
+    assert correlator.incidents(limit=1)[0]["source"] == "10.0.3.231"
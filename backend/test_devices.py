@@ -0,0 +1,29 @@
+# backend/test_devices.py
+# Device ids must be validated, and one device's burst must not eat another device's ingest budget.
+import pytest
+
+from bridge_core import DEFAULT_DEVICE, build_analysis, device_id
+from devices import DeviceThrottle
+
+
+def test_device_id_validation():
+    assert device_id(None) == device_id("") == DEFAULT_DEVICE
+    assert device_id("pump-7") == "pump-7" and device_id("cgm:ward3.bed12") == "cgm:ward3.bed12"
+    for bad in ("../etc", "a b", "x" * 65, "-leading"):
+        with pytest.raises(ValueError):
+            device_id(bad)
+    assert build_analysis({"threat_class": "DDoS"})["device_id"] == DEFAULT_DEVICE
+    assert build_analysis({"device_id": "cgm-1"})["device_id"] == "cgm-1"
+
+
+def test_throttle_is_per_device():
+    throttle = DeviceThrottle(rate=10, burst=5, max_devices=2)
+    assert [throttle.allow("pump", now=0.0)[0] for _ in range(6)] == [True] * 5 + [False]
+    allowed, retry_after = throttle.allow("pump", now=0.0)
+    assert not allowed and retry_after == pytest.approx(0.1)
+    assert throttle.allow("cgm", now=0.0) == (True, 0.0)  # unaffected by the pump
+    assert throttle.allow("pump", now=0.1)[0]  # refilled at `rate`
+
+    throttle.allow("third", now=0.2)
+    assert len(throttle) == 2  # least recently seen device dropped
+    assert DeviceThrottle().allow("pump") == (True, 0.0)  # rate 0: unlimited
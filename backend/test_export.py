@@ -0,0 +1,77 @@
+# backend/test_export.py
+# Exports must stream in chunks, keep every stored row and decode back in each format.
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+import export
+from bridge_core import FEATURE_ORDER, analysis_to_json, build_analysis
+from export import export_stream, parse_export_query
+from state_store import SQLiteStateStore
+
+
+def _store(tmp_path, n):
+    store = SQLiteStateStore(str(tmp_path / "state.db"), history_limit=0)
+    for i in range(n):
+        analysis = build_analysis({"threat_class": "DDoS", "confidence": 0.9,
+                                   "features": {name: float(i) for name in FEATURE_ORDER}})
+        analysis["id"] = f"a{i}"
+        store.add_analysis(analysis, datetime.now())
+    return store
+
+
+def test_ndjson_and_csv_stream_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "CSV_FLUSH_ROWS", 100)
+    store = _store(tmp_path, 250)
+
+    lines = "".join(export_stream(store.iter_analyses(batch_size=64), "ndjson")).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [f"a{i}" for i in range(250)]
+
+    chunks = list(export_stream(store.iter_analyses(batch_size=64), "csv"))
+    assert len(chunks) == 4 and chunks[0].startswith("seq,id,") and chunks[0].count("\n") == 1
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert len(rows) == 250 and rows[7]["id"] == "a7" and float(rows[7]["Rate"]) == 7.0
+
+
+def test_parquet_flushes_row_groups(tmp_path, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(export, "PARQUET_ROW_GROUP", 100)
+    store = _store(tmp_path, 250)
+
+    chunks = list(export_stream(store.iter_analyses(), "parquet"))
+    assert len(chunks) == 4 and all(chunks) and chunks[0] == b"PAR1"
+    table = pq.read_table(io.BytesIO(b"".join(chunks)))
+    assert table.num_rows == 250 and pq.ParquetFile(io.BytesIO(b"".join(chunks))).num_row_groups == 3
+    assert table.column("Weight").to_pylist()[249] == 249.0
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_first_byte_and_time_bound_flushes(fmt, monkeypatch):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    read = []
+
+    def _slow_rows():
+        for i in range(3):
+            read.append(i)
+            yield analysis_to_json(build_analysis({"threat_class": "DDoS", "features": {"Rate": float(i)}}))
+
+    chunks = export_stream(_slow_rows(), fmt)
+    assert next(chunks) and read == []  # header / magic before any row is read
+
+    monkeypatch.setattr(export, "FLUSH_SECONDS", 0.0)  # every row is past the time bound
+    next(chunks)
+    assert read == [0]  # flushed after one row, far below the row bound
+    assert len(list(chunks)) == (2 if fmt == "csv" else 3)  # rows 1 and 2 (+ the Parquet footer)
+
+
+def test_export_query_validation():
+    assert parse_export_query({}) == ("ndjson", None, None)
+    fmt, start, end = parse_export_query({"format": "CSV", "start": "2025-01-01T00:00:00", "end": "1800000000"})
+    assert fmt == "csv" and start < end == 1800000000.0
+    for bad in ({"format": "xml"}, {"start": "yesterday"}):
+        with pytest.raises(ValueError):
+            parse_export_query(bad)
@@ -0,0 +1,79 @@
+# backend/test_feature_schema.py
+# Bad feature rows must be clipped or rejected as a batch, with one report covering the whole batch.
+import numpy as np
+import pytest
+
+from bridge_core import FEATURE_ORDER, check_features
+from feature_schema import (
+    FEATURE_NAMES, FeatureValidationError, feature_order, merge_summaries, validate_features
+)
+
+INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+
+def _clean(n):
+    rows = np.zeros((n, len(FEATURE_NAMES)))
+    rows[:, INDEX["Rate"]] = 100.0
+    rows[:, INDEX["Protocol_Type"]] = 6
+    rows[:, INDEX["TCP"]] = 1
+    return rows
+
+
+def test_clip_and_reject():
+    rows = _clean(5)
+    rows[1, INDEX["Rate"]] = -3.0         # clipped to 0
+    rows[2, INDEX["syn_flag_number"]] = 2  # clipped to 1
+    rows[2, INDEX["Protocol_Type"]] = 6.4  # rounded to 6
+    rows[3, INDEX["IAT"]] = np.nan        # rejected
+    rows[4, INDEX["UDP"]] = 1             # TCP and UDP: rejected
+
+    report = validate_features(rows)
+    assert report.rejected.tolist() == [False, False, False, True, True]
+    assert report.clipped.tolist() == [False, True, True, False, False]
+    assert report.rows[1, INDEX["Rate"]] == 0 and report.rows[2, INDEX["syn_flag_number"]] == 1
+    assert report.rows[2, INDEX["Protocol_Type"]] == 6
+    assert report.row_issues(4) == ["transport one_hot"]
+    assert report.issue_counts()["IAT"] == {"not_finite": 1}
+    assert rows[1, INDEX["Rate"]] == -3.0  # input left alone
+
+    strict = validate_features(rows, mode="reject")
+    assert strict.rejected.tolist() == [False, True, True, True, True] and not strict.clipped.any()
+
+
+def test_dataframe_and_dict_input():
+    pd = pytest.importorskip("pandas")
+    frame = pd.DataFrame(_clean(3), columns=FEATURE_NAMES)
+    shuffled = frame[FEATURE_NAMES[::-1]].assign(extra=1)
+    report = validate_features(shuffled)
+    assert np.array_equal(report.rows, _clean(3)) and report.unknown_columns == ["extra"]
+
+    report = validate_features(frame.drop(columns=["Weight"]))
+    assert report.rejected.all() and report.issue_counts()["Weight"] == {"missing": 3}
+
+    row = dict(zip(FEATURE_NAMES, _clean(1)[0].tolist()), Rate="fast")
+    assert validate_features(row).row_issues(0) == ["Rate not_finite"]
+    with pytest.raises(ValueError):
+        validate_features(np.zeros((2, 44)))
+
+
+def test_feature_order_and_bridge_check():
+    assert feature_order(set(FEATURE_NAMES)) == FEATURE_NAMES == FEATURE_ORDER
+    with pytest.raises(ValueError):
+        feature_order(set(FEATURE_NAMES[:-1]))
+
+    data = {"features": dict(zip(FEATURE_NAMES, _clean(1)[0].tolist()), Rate=-1.0)}
+    assert check_features(data) == ["Rate below_min"] and data["features"]["Rate"] == 0.0
+    assert check_features({"threat_class": "DDoS"}) == []
+    with pytest.raises(FeatureValidationError) as e:
+        check_features({"features": {"Rate": 1.0}})
+    assert e.value.report.summary()["rejected"] == 1
+
+
+def test_merge_summaries():
+    bad = _clean(4)
+    bad[0, INDEX["Rate"]] = np.inf
+    parts = [validate_features(_clean(2)).summary(locations=[10, 11]),
+             validate_features(bad).summary(locations=[20, 21, 22, 23])]
+    merged = merge_summaries(parts)
+    assert merged["rows"] == 6 and merged["rejected"] == 1 and merged["rejected_rows"] == [20]
+    assert merged["issues"] == {"Rate": {"not_finite": 1}}
@@ -0,0 +1,35 @@
+# backend/test_loadtest.py
+# The load-test report must turn raw request records into the right per-route percentiles and rates.
+import random
+
+import pytest
+
+from feature_schema import validate_features
+from loadtest import build_payload, percentile, summarize
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50 and percentile(values, 95) == 95 and percentile(values, 99) == 99
+    assert percentile(values, 100) == 100 and percentile(values, 0) == 1
+    assert percentile([7], 99) == 7 and percentile([], 50) == 0.0
+
+
+def test_summary_per_route():
+    records = [("GET /a", i / 1000, True) for i in range(1, 101)]
+    records += [("POST /b", 0.5, i % 4 != 0) for i in range(20)]
+    summary = summarize(records, elapsed=10.0)
+
+    a, b = summary["routes"]["GET /a"], summary["routes"]["POST /b"]
+    assert list(summary["routes"]) == ["GET /a", "POST /b"]
+    assert a["requests"] == 100 and a["throughput_rps"] == pytest.approx(10.0)
+    assert (a["p50_ms"], a["p95_ms"], a["p99_ms"], a["max_ms"]) == pytest.approx((50, 95, 99, 100))
+    assert b["errors"] == 5 and b["error_rate"] == pytest.approx(0.25) and b["p99_ms"] == pytest.approx(500)
+    assert summary["overall"]["requests"] == 120 and summary["overall"]["throughput_rps"] == pytest.approx(12.0)
+    assert summarize([], 0.0)["overall"]["throughput_rps"] == 0.0
+
+
+def test_payloads_pass_the_feature_schema():
+    rng = random.Random(1)
+    report = validate_features([build_payload(rng)["features"] for _ in range(200)])
+    assert not report.rejected.any() and not report.clipped.any()
@@ -0,0 +1,66 @@
+# backend/test_metrics.py
+# /metrics must speak the Prometheus text format: escaped labels, cumulative buckets, +Inf/_sum/_count.
+import pytest
+
+from metrics import CONTENT_TYPE, Registry
+
+
+def test_counter_and_gauge_exposition():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests by route", ("route",))
+    requests.inc(route="/a")
+    requests.inc(2.5, route="/a")
+    requests.inc(route="/b")
+    size = registry.gauge("queue_size", "Items queued")
+    size.set(7)
+    size.dec(2)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests by route",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a"} 3.5',
+        'requests_total{route="/b"} 1',
+        "# HELP queue_size Items queued",
+        "# TYPE queue_size gauge",
+        "queue_size 5",
+    ]
+    assert registry.counter("requests_total", "again", ("route",)) is requests
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total", "wrong kind")
+    with pytest.raises(ValueError):
+        requests.inc(path="/a")  # unknown label
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("odd_total", "Odd labels", ("value",)).inc(value='say "hi"\\\nbye')
+    assert 'odd_total{value="say \\"hi\\"\\\\\\nbye"} 1' in registry.render().splitlines()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("op_seconds", "Op latency", ("op",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, op="read")
+
+    lines = registry.render().splitlines()
+    assert lines[1] == "# TYPE op_seconds histogram"
+    assert lines[2:] == [
+        'op_seconds_bucket{op="read",le="0.1"} 2',  # upper bounds are inclusive
+        'op_seconds_bucket{op="read",le="1"} 3',
+        'op_seconds_bucket{op="read",le="+Inf"} 4',
+        'op_seconds_sum{op="read"} 3.65',
+        'op_seconds_count{op="read"} 4',
+    ]
+    assert latency.snapshot(op="read") == (pytest.approx(3.65), 4) and latency.snapshot(op="write") == (0.0, 0)
+
+
+def test_metrics_route(bridge):
+    bridge.client.post("/api/threat-analysis", json={"threat_class": "Benign", "confidence": 0.5})
+    response = bridge.client.get("/metrics")
+    assert response.status_code == 200 and response.headers["Content-Type"] == CONTENT_TYPE
+    body = response.text
+    assert "# TYPE bridge_request_duration_seconds histogram" in body and body.endswith("\n")
+    assert 'bridge_analyses_received_total{threat_class="Benign"}' in body
+    assert "bridge_history_size 1" in body.splitlines()  # counted at scrape time
+    assert 'route="/api/threat-analysis",method="POST",status="200",le="+Inf"' in body
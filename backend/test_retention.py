@@ -0,0 +1,90 @@
+# backend/test_retention.py
+# Compaction must move every analysis down the tiers exactly once, so long-range series stay exact.
+import time
+from datetime import datetime
+
+import pytest
+
+from bridge_core import build_analysis
+from retention import Compactor, RetentionPolicy, choose_step, timeseries
+from state_store import RedisStateStore, SQLiteStateStore
+
+NOW = 1_700_000_000.0 // 3600 * 3600  # on an hour boundary
+
+
+def _sqlite(tmp_path):
+    return SQLiteStateStore(str(tmp_path / "state.db"), history_limit=5, trim_history=False)
+
+
+def _redis(tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisStateStore(client=fakeredis.FakeRedis(), history_limit=5, trim_history=False)
+
+
+@pytest.mark.parametrize("make_store", [_sqlite, _redis])
+def test_compaction_keeps_series_exact(tmp_path, make_store):
+    store = make_store(tmp_path)
+    # one analysis every 90 s over the last 3 hours; confidence and Rate follow the index
+    for i in range(120):
+        analysis = build_analysis({"threat_class": "DDoS" if i % 3 else "Benign", "confidence": (i % 10) / 10,
+                                   "features": {"Rate": float(i)}})
+        analysis["id"] = f"a{i}"
+        analysis["timestamp"] = datetime.fromtimestamp(NOW - 3 * 3600 + 90 * i)
+        store.add_analysis(analysis, datetime.now())
+    assert len(store.history()) == 5 and store.count() == 120
+
+    def _series():
+        result = timeseries(store, NOW - 4 * 3600, NOW, step=3600, include_features=True)
+        return [(p["bucket"], p["count"], p["classes"], round(p["confidence"]["mean"], 9),
+                 round(p["feature_means"]["Rate"], 9)) for p in result["points"]]
+
+    before = _series()
+    policy = RetentionPolicy(raw=1800, minute=2 * 3600, hour=86400)
+    done = Compactor(store, policy, interval=0.01).run_once(now=NOW)
+    assert done == {"raw": 100, "minute": 40, "hour": 0, "vectors": 0}
+    assert store.count() == 20 and len(store.rollups("hour")) == 1
+    assert _series() == before  # same numbers, now served from three tiers
+    assert sum(p[1] for p in before) == 120
+
+    # later, everything has aged past the hour tier and expires
+    time.sleep(0.03)  # let the compactor lease lapse
+    assert Compactor(store, policy, interval=0.01).run_once(now=NOW + 2 * 86400)["hour"] == 3
+    assert store.count() == 0 and store.rollups("minute") == [] and store.rollups("hour") == []
+
+
+@pytest.mark.parametrize("make_store", [_sqlite, _redis])
+def test_search_vectors_expire_with_the_hour_tier(tmp_path, make_store):
+    store = make_store(tmp_path)
+    for i, age in enumerate((3 * 86400, 2 * 86400, 3600, 60)):
+        analysis = build_analysis({"threat_class": "Benign", "features": {"Rate": float(i)}})
+        analysis["id"] = "resent" if i in (0, 3) else f"a{i}"
+        analysis["timestamp"] = datetime.fromtimestamp(NOW - age)
+        store.add_analysis(analysis, datetime.now())
+
+    policy = RetentionPolicy(raw=1800, minute=7200, hour=86400)
+    assert Compactor(store, policy, interval=0.01).run_once(now=NOW)["vectors"] == 2
+    assert [seq for seq, _ in store.vectors_since(0)] == [3, 4]
+    assert store.get_vector("a1") is None and store.vector_summaries([1, 2, 3]).keys() == {3}
+    assert store.get_vector("resent")[0] == 4  # a newer analysis with the same id keeps its vector
+
+
+def test_tiering_is_off_unless_configured(monkeypatch):
+    monkeypatch.delenv("BRIDGE_RAW_RETENTION", raising=False)
+    assert not RetentionPolicy.from_env().enabled
+    monkeypatch.setenv("BRIDGE_RAW_RETENTION", "86400")
+    assert RetentionPolicy.from_env().raw == 86400
+
+
+def test_compactor_lease_is_exclusive(tmp_path):
+    store = _sqlite(tmp_path)
+    policy = RetentionPolicy(raw=60, minute=120, hour=240)
+    assert Compactor(store, policy, interval=10).run_once() is not None
+    assert Compactor(store, policy, interval=10).run_once() is None
+    assert Compactor(store, RetentionPolicy(raw=0)).run_once() is None  # retention off
+
+
+def test_step_widens_to_a_tier():
+    assert choose_step(0, 3600) == 60
+    assert choose_step(0, 30 * 86400) == 3600
+    assert choose_step(0, 3600, step=600) == 3600
+    assert choose_step(0, 365 * 86400) == 6 * 3600
@@ -0,0 +1,106 @@
+# backend/test_similarity.py
+# The approximate (IVF) index must return the exact neighbours on clustered data; /similar serves them by id.
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from bridge_core import FEATURE_ORDER, build_analysis
+import similarity
+from similarity import DIM, SimilarityIndex
+from state_store import SQLiteStateStore
+
+
+def test_ivf_matches_exact_search():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(scale=4.0, size=(40, DIM)).astype(np.float32)
+    vectors = centers[rng.integers(0, 40, 6000)] + rng.normal(size=(6000, DIM)).astype(np.float32)
+    seqs = np.arange(1, 6001)
+
+    exact = SimilarityIndex(exact_limit=10 ** 6)
+    exact.add(seqs, vectors)
+    ivf = SimilarityIndex(exact_limit=1000, nprobe=8, background=False)
+    ivf.add(seqs[:3000], vectors[:3000])
+    ivf.add(seqs[3000:], vectors[3000:])  # appended to trained cells, then retrained on doubling
+    assert exact.mode == "exact" and ivf.mode == "ivf"
+
+    hits = 0
+    for q in rng.integers(0, 6000, 50):
+        truth, _ = exact.search(vectors[q], 10, exclude_seq=seqs[q])
+        found, distances = ivf.search(vectors[q], 10, exclude_seq=seqs[q])
+        assert seqs[q] not in found and list(distances) == sorted(distances)
+        hits += len(set(found) & set(truth))
+    assert hits / 500 > 0.95
+
+
+def test_similar_analyses_from_store(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.db"), history_limit=5)
+    ids = []
+    for i in range(30):
+        analysis = build_analysis({"threat_class": "DDoS" if i % 2 else "Benign",
+                                   "features": {name: float(i % 2) * 1e4 + i for name in FEATURE_ORDER}})
+        analysis["id"] = f"a{i}"
+        store.add_analysis(analysis, datetime.now())
+        ids.append(analysis["id"])
+
+    index = SimilarityIndex()
+    similar = index.similar(store, "a1", k=3)  # a1 aged out of the history but is still searchable
+    assert [s["id"] for s in similar] == ["a3", "a5", "a7"]
+    assert all(s["threat_class"] == "DDoS" for s in similar)
+    assert index.size == 30 and index.similar(store, "missing") is None
+
+
+def test_training_runs_in_the_background(monkeypatch):
+    release = threading.Event()
+    kmeans = similarity._kmeans
+
+    def _slow_kmeans(*args, **kwargs):
+        release.wait(10)
+        return kmeans(*args, **kwargs)
+
+    monkeypatch.setattr(similarity, "_kmeans", _slow_kmeans)
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(3000, DIM)).astype(np.float32)
+    index = SimilarityIndex(exact_limit=1000)
+
+    start = time.perf_counter()
+    index.add(np.arange(1, 2001), vectors[:2000])  # starts training, doesn't wait for it
+    index.add(np.arange(2001, 3001), vectors[2000:])
+    found, _ = index.search(vectors[2500], 1)  # still served (exactly) while training is held
+    assert time.perf_counter() - start < 5 and index.mode == "exact" and found.tolist() == [2501]
+
+    assert index.expire_before(501) == 500  # the trainer's snapshot still numbers these rows
+    release.set()
+    index.join(10)
+    assert index.mode == "ivf" and index.stats()["lists"] >= 16
+    assert index.search(vectors[2500], 1)[0].tolist() == [2501]  # rows added during training are searchable
+    index.search(vectors[0], 1)  # folds the pending rows into their cells
+    cells = np.concatenate(index._lists + [np.array(rows, dtype=np.int64) for rows in index._pending.values()])
+    assert sorted(cells.tolist()) == list(range(2500))
+
+
+def test_expired_vectors_leave_the_index(tmp_path):
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(3000, DIM)).astype(np.float32)
+    index = SimilarityIndex(exact_limit=1000, background=False)
+    index.add(np.arange(1, 3001), vectors)
+    assert index.mode == "ivf" and index.expire_before(1) == 0
+
+    assert index.expire_before(1001) == 1000 and index.size == 2000
+    assert index.search(vectors[2500], 1)[0].tolist() == [2501]  # cells renumbered, not scrambled
+    seqs, _ = index.search(vectors[10], 50)
+    assert len(seqs) == 50 and seqs.min() > 1000
+    assert sum(len(rows) for rows in index._lists) == 2000
+
+    # sync follows the store: the compactor expired the oldest vectors in some worker
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    for i, age in enumerate((86400 * 3, 60, 30)):
+        analysis = build_analysis({"threat_class": "DDoS", "features": {"Rate": 1000.0 + i}})
+        analysis["id"] = f"a{i}"
+        analysis["timestamp"] = datetime.fromtimestamp(time.time() - age)
+        store.add_analysis(analysis, datetime.now())
+    index = SimilarityIndex()
+    assert len(index.similar(store, "a1", k=5)) == 2
+    store.expire_vectors(time.time() - 86400)
+    assert [s["id"] for s in index.similar(store, "a1", k=5)] == ["a2"] and index.size == 2
@@ -0,0 +1,244 @@
+# backend/test_state_store.py
+# Shared-state backends must give every worker the same view of the analyses.
+import multiprocessing
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from bridge_core import analysis_time, build_analysis, changes_payload
+from state_store import ChangeNotifier, SQLiteStateStore, RedisStateStore, import_json_snapshot
+
+
+def _analysis(threat_class, n=0):
+    analysis = build_analysis({"threat_class": threat_class, "confidence": 0.9})
+    analysis["id"] = f"{analysis['id']}-{n}"
+    return analysis
+
+
+def _write_from_worker(path, worker, count):
+    store = SQLiteStateStore(path, history_limit=1000)
+    for i in range(count):
+        store.add_analysis(_analysis(f"worker{worker}", i), datetime.now())
+
+
+def _check_store_contract(writer, reader):
+    assert reader.latest() is None
+    assert reader.count() == 0
+
+    seqs = [writer.add_analysis(_analysis("DDoS", i), datetime.now()) for i in range(5)]
+    assert seqs == sorted(seqs)
+
+    latest = reader.latest()
+    assert latest["threat_class"] == "DDoS"
+    assert latest["seq"] == seqs[-1]
+    assert isinstance(latest["timestamp"], str)
+    assert reader.last_updated() is not None
+
+    # history is trimmed to the limit, oldest first
+    history = reader.history()
+    assert [a["seq"] for a in history] == seqs[-3:]
+
+    # changes feed: strictly newer than the cursor, oldest first, bounded by limit
+    assert reader.latest_seq() == seqs[-1]
+    assert [a["seq"] for a in reader.analyses_since(seqs[-2])] == seqs[-1:]
+    assert [a["seq"] for a in reader.analyses_since(0, limit=2)] == seqs[-3:-1]
+    assert reader.analyses_since(seqs[-1]) == []
+
+    # time-range reads page through the store in time order, start inclusive and end exclusive
+    assert [a["seq"] for a in reader.iter_analyses(batch_size=2)] == seqs[-3:]
+    start, end = analysis_time(history[1]), analysis_time(history[2])
+    assert [a["seq"] for a in reader.iter_analyses(start, end, batch_size=1)] == seqs[-2:-1]
+
+    # search vectors outlive the trimmed history; analyses without features have none
+    flagged = _analysis("Port_Scan", 99)
+    flagged["features"] = {"Rate": 1200.0, "syn_count": 30}
+    seq = writer.add_analysis(flagged, datetime.now())
+    assert [s for s, _ in reader.vectors_since(0)] == [seq]
+    assert reader.get_vector(flagged["id"])[0] == seq and reader.get_vector(latest["id"]) is None
+    assert reader.vector_summaries([seq])[seq]["threat_class"] == "Port_Scan"
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    _check_store_contract(
+        SQLiteStateStore(path, history_limit=3),
+        SQLiteStateStore(path, history_limit=3)
+    )
+
+
+def test_sqlite_store_is_consistent_across_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    SQLiteStateStore(path)  # create schema up front
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_write_from_worker, args=(path, w, 20)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+
+    store = SQLiteStateStore(path, history_limit=1000)
+    history = store.history()
+    assert store.count() == len(history) == 80
+    assert [a["seq"] for a in history] == sorted(a["seq"] for a in history)
+    assert store.latest()["seq"] == history[-1]["seq"]
+
+
+def test_redis_store_against_fake():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    _check_store_contract(
+        RedisStateStore(client=fakeredis.FakeRedis(server=server), history_limit=3),
+        RedisStateStore(client=fakeredis.FakeRedis(server=server), history_limit=3)
+    )
+
+
+def test_redis_seq_never_runs_ahead_of_committed_rows(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    writer = RedisStateStore(client=fakeredis.FakeRedis(server=server))
+    other = RedisStateStore(client=fakeredis.FakeRedis(server=server))  # e.g. another gunicorn worker
+    writer.add_analysis(_analysis("Benign", 0), datetime.now())
+    cursors = []
+    make_pipeline = writer.client.pipeline
+
+    def pipeline(*args, **kwargs):
+        pipe = make_pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def execute_after_poll(*a, **kw):
+            if not cursors:  # the seq is chosen, the row not yet committed
+                cursors.append(changes_payload(other.analyses_since(1), other.latest_seq(), None)["seq"])
+                other.add_analysis(_analysis("DDoS", 1), datetime.now())  # and another worker commits first
+            return execute(*a, **kw)
+
+        pipe.execute = execute_after_poll
+        return pipe
+
+    monkeypatch.setattr(writer.client, "pipeline", pipeline)
+    seq = writer.add_analysis(_analysis("Benign", 2), datetime.now())
+    assert cursors == [1]  # a poll in the gap doesn't move the cursor past the pending analysis
+    assert seq == 3 and [a["seq"] for a in other.analyses_since(1)] == [2, 3] and other.latest_seq() == 3
+
+
+def test_json_snapshot_imported_once(tmp_path):
+    snapshot = tmp_path / "shared_analysis_data.json"
+    snapshot.write_text(
+        '{"latest_analysis": null, "last_updated": "2025-09-20T10:00:00",'
+        ' "analysis_history": [{"id": "1", "timestamp": "2025-09-20T10:00:00", "threat_class": "Benign"}]}'
+    )
+    path = str(tmp_path / "state.db")
+    assert import_json_snapshot(SQLiteStateStore(path), str(snapshot)) == 1
+    assert import_json_snapshot(SQLiteStateStore(path), str(snapshot)) == 0
+    assert SQLiteStateStore(path).latest()["threat_class"] == "Benign"
+
+
+def test_labels_outlive_trimmed_history(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.db"), history_limit=2)
+    first = _analysis("Benign", 0)
+    first["features"] = {"Rate": 41.0}
+    store.add_analysis(first, datetime.now())
+    assert store.add_label("missing", "DDoS") is None
+
+    record = store.add_label(first["id"], "DDoS", analyst="soc")
+    assert record["predicted"] == "Benign" and record["features"] == {"Rate": 41.0}
+    for i in range(1, 4):
+        store.add_analysis(_analysis("Benign", i), datetime.now())
+
+    labels = store.labels_since(0)
+    assert [l["label"] for l in labels] == ["DDoS"] and labels[0]["seq"] == record["seq"]
+    assert store.labels_since(record["seq"]) == []
+
+
+def test_change_notifier_wakes_on_write_from_another_instance(tmp_path):
+    path = str(tmp_path / "state.db")
+    notifier = ChangeNotifier(SQLiteStateStore(path), interval=0.02)
+
+    start = time.perf_counter()
+    assert notifier.wait_for(0, timeout=0.1) == 0
+    assert time.perf_counter() - start >= 0.1
+
+    writer = SQLiteStateStore(path)  # e.g. another gunicorn worker
+    threading.Timer(0.1, lambda: writer.add_analysis(_analysis("DDoS"), datetime.now())).start()
+    start = time.perf_counter()
+    assert notifier.wait_for(0, timeout=5) == 1
+    assert time.perf_counter() - start < 2
+    assert notifier.waiting == 0
+
+    # local writes wake waiters without the poller
+    notifier.notify(7)
+    assert notifier.wait_for(1, timeout=0) == 7
+
+
+def _store(tmp_path, backend, **kwargs):
+    if backend == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        return RedisStateStore(client=fakeredis.FakeRedis(), **kwargs)
+    return SQLiteStateStore(str(tmp_path / "state.db"), **kwargs)
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "redis"])
+def test_history_is_partitioned_by_device(tmp_path, backend):
+    store = _store(tmp_path, backend, history_limit=3)
+    quiet = build_analysis({"threat_class": "Benign", "device_id": "cgm-1"})
+    quiet_seq = store.add_analysis(quiet, datetime.now())
+    for i in range(10):  # a noisy pump
+        store.add_analysis(build_analysis({"threat_class": "DDoS", "device_id": "pump-7"}), datetime.now())
+
+    # the pump's burst trims only its own history; the monitor keeps its analysis
+    assert store.device_latest("cgm-1")["seq"] == quiet_seq
+    assert [a["device_id"] for a in store.device_history("pump-7")] == ["pump-7"] * 3
+    assert store.device_history("pump-7", limit=2) == store.device_history("pump-7")[-2:]
+    assert store.device_latest("nobody") is None and store.device_history("nobody") == []
+
+    devices = store.devices()
+    assert [(d["device_id"], d["total"]) for d in devices] == [("pump-7", 10), ("cgm-1", 1)]
+    assert devices[1]["latest"]["threat_class"] == "Benign" and devices[0]["latest_seq"] == store.latest_seq()
+
+    # both backends keep the union of the device histories and look analyses up by id across all of them
+    assert store.count() == 4 and len(store.history()) == 3
+    assert [a["seq"] for a in store.analyses_since(0)] == [quiet_seq] + list(range(9, 12))
+    assert store.get_analysis(quiet["id"])["seq"] == quiet_seq
+    assert store.add_label(quiet["id"], "Benign")["id"] == quiet["id"]
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "redis"])
+def test_tracked_devices_are_capped(tmp_path, backend):
+    store = _store(tmp_path, backend, history_limit=3, max_devices=2)
+    for device in ("cgm-1", "pump-7", "cgm-1", "spoof-1", "spoof-2"):
+        store.add_analysis(build_analysis({"threat_class": "Benign", "device_id": device}), datetime.now())
+
+    # each new device past the cap evicts the least recently seen one, with its history
+    assert [d["device_id"] for d in store.devices()] == ["spoof-2", "spoof-1"]
+    assert store.count() == 2 and store.device_history("cgm-1") == [] and store.device_latest("pump-7") is None
+
+
+def test_sqlite_migration_lists_existing_devices(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SQLiteStateStore(path)
+    for device in ("cgm-1", "pump-7", "pump-7"):
+        store.add_analysis(build_analysis({"threat_class": "Benign", "device_id": device}), datetime.now())
+    store._connect().execute("DROP TABLE devices")  # as written before the devices table existed
+
+    devices = SQLiteStateStore(path).devices()
+    assert [(d["device_id"], d["latest_seq"], d["total"]) for d in devices] == [("pump-7", 3, 2), ("cgm-1", 1, 1)]
+    assert devices[0]["latest"]["threat_class"] == "Benign"
+
+
+def test_redis_migration_rebuilds_indexes():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    store = RedisStateStore(client=client, history_limit=3)
+    ids = [store.add_analysis(build_analysis({"threat_class": "Benign", "device_id": d}), datetime.now())
+           for d in ("cgm-1", "pump-7", "pump-7")]
+    analysis_id = store.latest()["id"]
+    # as written before devices and the id index existed
+    client.delete(store.ids_key, store.devices_key, store.device_totals_key, store.device_seen_key,
+                  store._device_key("cgm-1"), store._device_key("pump-7"))
+
+    store = RedisStateStore(client=client, history_limit=3)
+    assert [(d["device_id"], d["total"]) for d in store.devices()] == [("pump-7", 2), ("cgm-1", 1)]
+    assert [a["seq"] for a in store.device_history("pump-7")] == ids[1:]
+    assert store.get_analysis(analysis_id)["seq"] == ids[-1]
@@ -0,0 +1,107 @@
+# backend/test_tracing.py
+# A trace must survive the hop into the bridge, and bad trace input must be ignored or refused, never a 500.
+import threading
+
+import pytest
+
+import tracing
+from bridge_core import normalize_client_span
+
+TRACE_ID, SPAN_ID = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+
+class _ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = _ListExporter()
+    monkeypatch.setattr(tracing, "_exporter", exporter)
+    return exporter
+
+
+def test_parse_traceparent():
+    assert tracing.parse_traceparent(f"00-{TRACE_ID}-{SPAN_ID}-01") == (TRACE_ID, SPAN_ID)
+    assert tracing.parse_traceparent(f" 00-{TRACE_ID.upper()}-{SPAN_ID}-00 ") == (TRACE_ID, SPAN_ID)
+    assert tracing.parse_traceparent(tracing.format_traceparent(TRACE_ID, SPAN_ID)) == (TRACE_ID, SPAN_ID)
+    for bad in (None, "", "garbage", f"00-{TRACE_ID}-{SPAN_ID}", f"00-{TRACE_ID[:-1]}x-{SPAN_ID}-01",
+                f"00-{TRACE_ID}-{SPAN_ID[:8]}-01", f"ff-{TRACE_ID}-{SPAN_ID}-01",
+                f"00-{'0' * 32}-{SPAN_ID}-01", f"00-{TRACE_ID}-{'0' * 16}-01"):
+        assert tracing.parse_traceparent(bad) == (None, None)
+
+
+def test_normalize_client_span():
+    span = normalize_client_span({"trace_id": TRACE_ID, "name": "render", "start": "12.5", "duration_ms": 3})
+    assert span["start"] == 12.5 and span["duration_ms"] == 3.0 and span["service"] == "dashboard"
+    assert normalize_client_span({"name": "no trace"}) is None and normalize_client_span("x") is None
+    with pytest.raises(ValueError):
+        normalize_client_span({"trace_id": TRACE_ID, "name": "render", "start": "soon"})
+
+
+def test_trace_propagates_into_stored_analysis(bridge, exporter):
+    client = bridge.client
+    body = client.post("/api/threat-analysis", json={"threat_class": "Benign"},
+                       headers={"traceparent": f"00-{TRACE_ID}-{SPAN_ID}-01"}).json()
+    assert body["trace_id"] == TRACE_ID and bridge.store.latest()["trace_id"] == TRACE_ID
+    receive = next(s for s in exporter.spans if s["name"] == "bridge.receive_analysis")
+    persist = next(s for s in exporter.spans if s["name"] == "bridge.persist")
+    assert receive["parent_id"] == SPAN_ID and persist["parent_id"] == receive["span_id"]
+
+    # payload trace_id is the fallback; a malformed header starts nothing bogus
+    other = "a" * 32
+    assert client.post("/api/threat-analysis", json={"threat_class": "Benign", "trace_id": other},
+                       headers={"traceparent": "00-bad-ids-01"}).json()["trace_id"] == other
+    minted = client.post("/api/threat-analysis", json={"threat_class": "Benign"}).json()["trace_id"]
+    assert len(minted) == 32 and minted not in (TRACE_ID, other)
+
+
+def test_dashboard_span_ingest(bridge, exporter):
+    spans = [{"trace_id": TRACE_ID, "name": "dashboard.render", "duration_ms": 4.2},
+             {"name": "missing trace id"}]
+    body = bridge.client.post("/api/traces", json=spans).json()
+    assert body == {"status": "success", "accepted": 1}
+    assert [s["name"] for s in exporter.spans] == ["dashboard.render"] and exporter.spans[0]["duration_ms"] == 4.2
+
+    response = bridge.client.post("/api/traces", json={"trace_id": TRACE_ID, "name": "x", "start": "soon"})
+    assert response.status_code == 400 and "must be numbers" in response.json()["message"]
+
+
+def test_background_exporter_writes_off_the_caller_thread(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    writers = []
+
+    class _File(tracing.FileSpanExporter):
+        def export_many(self, spans):
+            writers.append(threading.current_thread().name)
+            super().export_many(spans)
+
+    exporter = tracing.BackgroundSpanExporter(_File(str(path)), max_queue=100)
+    for i in range(50):
+        exporter.export({"trace_id": TRACE_ID, "name": f"s{i}"})
+    exporter.flush()
+    assert path.read_text().count("\n") == 50 and set(writers) == {"span-exporter"}
+
+    class _Stuck(_ListExporter):
+        def __init__(self):
+            super().__init__()
+            self.entered, self.release = threading.Event(), threading.Event()
+
+        def export(self, span):
+            self.entered.set()
+            self.release.wait(10)
+            super().export(span)
+
+    stuck = _Stuck()
+    exporter = tracing.BackgroundSpanExporter(stuck, max_queue=1)
+    exporter.export({"name": "taken"})
+    assert stuck.entered.wait(10)
+    exporter.export({"name": "queued"})
+    exporter.export({"name": "dropped"})  # a slow exporter never blocks the caller
+    stuck.release.set()
+    exporter.flush()
+    assert exporter.dropped == 1 and [s["name"] for s in stuck.spans] == ["taken", "queued"]
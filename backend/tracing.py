@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# Lightweight request tracing for Streamlit → API bridge → React dashboard
+#
+# A trace ID is minted when an analysis is run and travels with it in the payload
+# ("trace_id") and in a W3C-style `traceparent` header. Each hop records spans
+# (name, start, duration, parent) to a local JSONL file so end-to-end latency can
+# be broken down without an external tracing service.
+#
+# Spans are only written when TRACE_FILE is set; otherwise recording is a no-op.
+# The ASGI bridge wraps the exporter in a BackgroundSpanExporter, so finishing a
+# span only enqueues it and the file is written by a thread, never on the event loop.
+#
+# Usage:
+#     TRACE_FILE=spans.jsonl python app.py
+#     python tracing.py spans.jsonl                 # summarise every trace
+#     python tracing.py spans.jsonl --trace <id>    # breakdown of one trace
+import argparse
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+TRACEPARENT_HEADER = "traceparent"
+
+
+def new_trace_id():
+    return secrets.token_hex(16)
+
+
+def new_span_id():
+    return secrets.token_hex(8)
+
+
+def format_traceparent(trace_id, span_id):
+    """Encode a trace context as a W3C traceparent header value"""
+    return f"00-{trace_id}-{span_id}-01"
+
+
+def _is_id(value, length):
+    """Lowercase hex of the given length and not all zeros (the W3C invalid id)"""
+    return len(value) == length and all(c in "0123456789abcdef" for c in value) and value.strip("0") != ""
+
+
+def parse_traceparent(value):
+    """Return (trace_id, parent_span_id) from a traceparent header, or (None, None) if malformed"""
+    if not value:
+        return None, None
+    parts = value.strip().lower().split("-")
+    if (len(parts) != 4 or len(parts[0]) != 2 or parts[0] == "ff" or len(parts[3]) != 2
+            or not _is_id(parts[1], 32) or not _is_id(parts[2], 16)):
+        return None, None
+    return parts[1], parts[2]
+
+
+class FileSpanExporter:
+    """Append finished spans to a JSONL file (one span per line)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        self.export_many([span])
+
+    def export_many(self, spans):
+        lines = "".join(json.dumps(span, default=str) + "\n" for span in spans)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(lines)
+
+
+class BackgroundSpanExporter:
+    """
+    Hands spans to `exporter` from a daemon thread: export() only enqueues, and the
+    thread writes whatever has queued up in one batch. When the queue is full (the
+    exporter can't keep up) spans are dropped and counted rather than blocking callers.
+    """
+
+    def __init__(self, exporter, max_queue=10000, batch_size=500):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if hasattr(self.exporter, "export_many"):
+                    self.exporter.export_many(batch)
+                else:
+                    for span in batch:
+                        self.exporter.export(span)
+            except Exception as e:
+                print(f"Error exporting spans: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Wait until every queued span has been handed to the exporter"""
+        self._queue.join()
+
+
+_exporter = FileSpanExporter(os.environ["TRACE_FILE"]) if os.environ.get("TRACE_FILE") else None
+
+
+def set_exporter(exporter):
+    """Replace the process-wide exporter (None disables tracing)"""
+    global _exporter
+    _exporter = exporter
+
+
+def export_in_background():
+    """Move span export off the calling thread (used by the ASGI bridge); no-op when tracing is off"""
+    if _exporter is not None and not isinstance(_exporter, BackgroundSpanExporter):
+        set_exporter(BackgroundSpanExporter(_exporter))
+
+
+def tracing_enabled():
+    return _exporter is not None
+
+
+def record_span(span):
+    """Export an already finished span dict (e.g. one reported by the dashboard)"""
+    if _exporter is None:
+        return
+    try:
+        _exporter.export(span)
+    except Exception as e:
+        print(f"Error exporting span: {e}")
+
+
+class SpanContext:
+    """Handle yielded by span(); use it as the parent of nested spans or to add attributes"""
+
+    def __init__(self, name, trace_id, parent_id=None, service=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id or new_trace_id()
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.service = service
+        self.attributes = dict(attributes or {})
+
+    @property
+    def traceparent(self):
+        return format_traceparent(self.trace_id, self.span_id)
+
+
+@contextmanager
+def span(name, trace_id=None, parent=None, service=None, **attributes):
+    """
+    Time a block as a span. `parent` may be a SpanContext or a parent span ID.
+    Starts a new trace when neither trace_id nor parent is given.
+    """
+    parent_id = parent.span_id if isinstance(parent, SpanContext) else parent
+    if trace_id is None and isinstance(parent, SpanContext):
+        trace_id = parent.trace_id
+    if service is None and isinstance(parent, SpanContext):
+        service = parent.service
+    ctx = SpanContext(name, trace_id, parent_id, service, attributes)
+
+    start_wall = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield ctx
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        if _exporter is not None:
+            finished = {
+                "trace_id": ctx.trace_id,
+                "span_id": ctx.span_id,
+                "parent_id": ctx.parent_id,
+                "name": name,
+                "service": ctx.service,
+                "start": start_wall,
+                "duration_ms": (time.perf_counter() - start) * 1000,
+                "attributes": ctx.attributes
+            }
+            if error:
+                finished["error"] = error
+            record_span(finished)
+
+
+# -------------------------------
+# Offline breakdown of a span file
+# -------------------------------
+def load_spans(path):
+    traces = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                s = json.loads(line)
+            except ValueError:
+                continue
+            traces.setdefault(s.get("trace_id"), []).append(s)
+    return traces
+
+
+def print_trace(trace_id, spans):
+    spans = sorted(spans, key=lambda s: s["start"])
+    t0 = spans[0]["start"]
+    end = max(s["start"] + s["duration_ms"] / 1000.0 for s in spans)
+    print(f"\n🧵 trace {trace_id}  end-to-end {(end - t0) * 1000:.1f} ms, {len(spans)} spans")
+    for s in spans:
+        offset = (s["start"] - t0) * 1000
+        service = s.get("service") or "-"
+        print(f"  +{offset:9.1f} ms  {s['duration_ms']:9.2f} ms  [{service}] {s['name']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Break down end-to-end latency from a span file")
+    parser.add_argument("span_file")
+    parser.add_argument("--trace", help="Only show this trace ID")
+    parser.add_argument("--last", type=int, default=10, help="Show the N most recent traces")
+    args = parser.parse_args()
+
+    traces = load_spans(args.span_file)
+    if args.trace:
+        if args.trace not in traces:
+            print(f"❌ Trace {args.trace} not found")
+            return
+        print_trace(args.trace, traces[args.trace])
+        return
+
+    recent = sorted(traces.items(), key=lambda kv: min(s["start"] for s in kv[1]))[-args.last:]
+    for trace_id, spans in recent:
+        print_trace(trace_id, spans)
+
+
+if __name__ == "__main__":
+    main()
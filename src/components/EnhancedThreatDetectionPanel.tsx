@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Brain, Zap, AlertTriangle, CheckCircle, BarChart3, Network, Wifi, WifiOff } from 'lucide-react';
-import { ThreatAnalysisData, threatAnalysisService } from '../services/threatAnalysisService';
+import { SimilarAnalysis, ThreatAnalysisData, threatAnalysisService } from '../services/threatAnalysisService';
 
 interface ThreatDetectionPanelProps {
   onThreatDetected: (threat: any) => void;
@@ -12,11 +12,12 @@ export const EnhancedThreatDetectionPanel: React.FC<ThreatDetectionPanelProps> =
   const [isConnected, setIsConnected] = useState(false);
   const [lastUpdate, setLastUpdate] = useState<Date | null>(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [similarAnalyses, setSimilarAnalyses] = useState<SimilarAnalysis[]>([]);
 
-  // Fetch data from API bridge
-  const fetchStreamlitData = async () => {
+  // Apply a batch of new analyses from the API bridge's changes feed
+  const applyChanges = (analyses: ThreatAnalysisData[], reset: boolean) => {
     try {
-      const data = await threatAnalysisService.getLatestAnalysis();
+      const data = analyses[analyses.length - 1];
       if (data) {
         setStreamlitData(data);
         setLastUpdate(new Date(data.timestamp));
@@ -35,8 +36,7 @@ export const EnhancedThreatDetectionPanel: React.FC<ThreatDetectionPanelProps> =
         }
       }
       
-      const history = await threatAnalysisService.getAnalysisHistory();
-      setAnalysisHistory(history);
+      setAnalysisHistory(history => (reset ? analyses : [...history, ...analyses]).slice(-50));
       
       setIsConnected(true);
       setIsLoading(false);
@@ -54,20 +54,34 @@ export const EnhancedThreatDetectionPanel: React.FC<ThreatDetectionPanelProps> =
   };
 
   useEffect(() => {
-    // Initial fetch
-    fetchStreamlitData();
     checkConnection();
 
-    // Set up polling for new data
-    const dataInterval = setInterval(fetchStreamlitData, 3000); // Check every 3 seconds
+    // Long-poll for new data; the first batch is the current history
+    const stopWatching = threatAnalysisService.watchChanges(applyChanges, () => {
+      setIsConnected(false);
+      setIsLoading(false);
+    });
     const healthInterval = setInterval(checkConnection, 30000); // Health check every 30 seconds
 
     return () => {
-      clearInterval(dataInterval);
+      stopWatching();
       clearInterval(healthInterval);
     };
   }, []);
 
+  // Look up similar past incidents whenever a new threat is shown
+  useEffect(() => {
+    if (!streamlitData || streamlitData.threat_class.toLowerCase() === 'benign') {
+      setSimilarAnalyses([]);
+      return;
+    }
+    let cancelled = false;
+    threatAnalysisService.getSimilarAnalyses(streamlitData.id).then(similar => {
+      if (!cancelled) setSimilarAnalyses(similar);
+    });
+    return () => { cancelled = true; };
+  }, [streamlitData?.id]);
+
   const getRiskColor = (riskLevel: string) => {
     switch (riskLevel.toLowerCase()) {
       case 'critical': return 'text-red-600 bg-red-50 border-red-200';
@@ -168,6 +182,15 @@ export const EnhancedThreatDetectionPanel: React.FC<ThreatDetectionPanelProps> =
               </div>
             </div>
 
+            {/* Correlated Incident */}
+            {streamlitData.incident && streamlitData.incident.count > 1 && (
+              <div className="bg-orange-50 border border-orange-200 rounded-lg p-3 mt-4 text-sm text-orange-800">
+                Part of incident {streamlitData.incident.incident_id}: {streamlitData.incident.count} alerts from{' '}
+                {streamlitData.incident.source} since {new Date(streamlitData.incident.first_seen).toLocaleTimeString()}
+                {' '}({streamlitData.incident.rate_per_min.toFixed(1)}/min)
+              </div>
+            )}
+
             {/* Probability Distribution */}
             <div className="bg-white border border-gray-200 rounded-lg p-4 mt-4">
               <h4 className="font-semibold text-gray-900 mb-3">Class Probabilities</h4>
@@ -191,6 +214,54 @@ export const EnhancedThreatDetectionPanel: React.FC<ThreatDetectionPanelProps> =
               </div>
             </div>
 
+            {/* Feature Attributions */}
+            {streamlitData.attributions && streamlitData.attributions.length > 0 && (() => {
+              const largest = Math.max(...streamlitData.attributions.map(a => Math.abs(a.attribution)), 1e-9);
+              return (
+                <div className="bg-white border border-gray-200 rounded-lg p-4 mt-4">
+                  <h4 className="font-semibold text-gray-900 mb-3">Why This Was Flagged</h4>
+                  <div className="space-y-2">
+                    {streamlitData.attributions.map(({ feature, value, attribution }) => (
+                      <div key={feature} className="flex items-center justify-between">
+                        <span className="text-sm text-gray-700">
+                          {feature} <span className="font-mono text-xs text-gray-500">= {value.toFixed(2)}</span>
+                        </span>
+                        <div className="flex items-center space-x-2">
+                          <div className="w-32 bg-gray-200 rounded-full h-2">
+                            <div
+                              className={`${attribution >= 0 ? 'bg-red-500' : 'bg-blue-500'} h-2 rounded-full`}
+                              style={{ width: `${(Math.abs(attribution) / largest) * 100}%` }}
+                            ></div>
+                          </div>
+                          <span className="text-sm font-mono text-gray-900">
+                            {attribution >= 0 ? '+' : ''}{attribution.toFixed(3)}
+                          </span>
+                        </div>
+                      </div>
+                    ))}
+                  </div>
+                </div>
+              );
+            })()}
+
+            {/* Similar Past Incidents */}
+            {similarAnalyses.length > 0 && (
+              <div className="bg-white border border-gray-200 rounded-lg p-4 mt-4">
+                <h4 className="font-semibold text-gray-900 mb-3">Similar Past Incidents</h4>
+                <div className="space-y-2">
+                  {similarAnalyses.map(similar => (
+                    <div key={similar.seq} className="flex items-center justify-between text-sm">
+                      <span className="text-gray-700">
+                        {similar.threat_class}
+                        <span className="text-xs text-gray-500 ml-2">{new Date(similar.timestamp).toLocaleString()}</span>
+                      </span>
+                      <span className="font-mono text-xs text-gray-600">distance {similar.distance.toFixed(3)}</span>
+                    </div>
+                  ))}
+                </div>
+              </div>
+            )}
+
             {/* Recommendations */}
             {streamlitData.recommendations && streamlitData.recommendations.length > 0 && (
               <div className="bg-gray-50 rounded-lg p-4 mt-4">
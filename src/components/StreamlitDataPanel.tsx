@@ -23,11 +23,9 @@ export const StreamlitDataPanel: React.FC<StreamlitDataPanelProps> = ({ onThreat
   const [isConnected, setIsConnected] = useState(false);
   const [lastUpdate, setLastUpdate] = useState<Date | null>(null);
 
-  // Fetch data from API bridge
-  const fetchData = async () => {
+  // Show the newest analysis from the API bridge
+  const handleAnalysis = (result: StreamlitData | null) => {
     try {
-      const result = await apiService.getLatestAnalysis();
-      
       if (result) {
         setStreamlitData(result);
         setLastUpdate(new Date(result.timestamp));
@@ -55,9 +53,11 @@ export const StreamlitDataPanel: React.FC<StreamlitDataPanelProps> = ({ onThreat
   };
 
   useEffect(() => {
-    fetchData();
-    const interval = setInterval(fetchData, 3000); // Check every 3 seconds
-    return () => clearInterval(interval);
+    // Long-poll: the bridge answers as soon as a new analysis arrives
+    return apiService.watchChanges(
+      (analyses) => handleAnalysis(analyses[analyses.length - 1]),
+      () => setIsConnected(false)
+    );
   }, []);
 
   const getRiskColor = (riskLevel: string): string => {
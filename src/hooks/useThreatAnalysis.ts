@@ -46,23 +46,19 @@ export const useThreatAnalysis = (autoUpdate: boolean = true) => {
     checkApiHealth();
 
     if (autoUpdate) {
-      // Subscribe to real-time updates
-      const unsubscribe = threatAnalysisService.subscribe((data) => {
-        setLatestAnalysis(data);
-        // Refresh history when new data arrives
-        if (data) {
-          fetchAnalysisHistory();
-        }
-      });
+      // Subscribe to real-time updates; history arrives incrementally with them
+      const unsubscribe = threatAnalysisService.subscribe(setLatestAnalysis);
+      const unsubscribeHistory = threatAnalysisService.subscribeHistory(setAnalysisHistory);
 
-      // Start polling
-      threatAnalysisService.startPolling(3000); // Poll every 3 seconds
+      // Long-poll the bridge's changes feed
+      threatAnalysisService.startPolling();
 
       // Health check interval
       const healthInterval = setInterval(checkApiHealth, 30000); // Check every 30 seconds
 
       return () => {
         unsubscribe();
+        unsubscribeHistory();
         threatAnalysisService.stopPolling();
         clearInterval(healthInterval);
       };
@@ -1,4 +1,6 @@
 // API service for threat analysis data
+import { reportFetchSpan } from '../utils/tracing';
+
 export interface ThreatAnalysisData {
   id: string;
   timestamp: string;
@@ -9,6 +11,48 @@ export interface ThreatAnalysisData {
   recommendations: string[];
   risk_level: 'Low' | 'Medium' | 'High' | 'Critical';
   model_used?: 'real' | 'demo';
+  trace_id?: string;
+  attributions?: FeatureAttribution[];
+  incident?: Incident;
+  device_id?: string;
+}
+
+// One entry of /threat-analysis/devices: a monitor or pump and its newest analysis
+export interface DeviceSummary {
+  device_id: string;
+  latest_seq: number;
+  total: number;
+  last_seen: string | null;
+  latest: Pick<ThreatAnalysisData, 'id' | 'timestamp' | 'threat_class' | 'confidence' | 'risk_level'>;
+}
+
+// One bucket of /threat-analysis/timeseries (raw, minute or hour tier, whichever holds the range)
+export interface TimeseriesPoint {
+  bucket: number;
+  start: string;
+  count: number;
+  classes: Record<string, number>;
+  confidence: { mean: number | null; std: number | null; min: number | null; max: number | null };
+  feature_means?: Record<string, number>;
+}
+
+// Repeated alerts for one threat class and source, folded together by the bridge (backend/correlation.py)
+export interface Incident {
+  incident_id: string;
+  threat_class: string;
+  source: string;
+  count: number;
+  first_seen: string;
+  last_seen: string;
+  rate_per_min: number;
+  risk_level: 'Unknown' | 'Low' | 'Medium' | 'High' | 'Critical';
+}
+
+// A feature's contribution to the predicted class (streamlit_app/attribution.py)
+export interface FeatureAttribution {
+  feature: string;
+  value: number;
+  attribution: number;
 }
 
 export interface ApiResponse<T> {
@@ -19,9 +63,34 @@ export interface ApiResponse<T> {
   count?: number;
 }
 
+// A past analysis close to a given one in feature space (/threat-analysis/<id>/similar)
+export interface SimilarAnalysis {
+  id: string;
+  seq: number;
+  timestamp: string;
+  threat_class: string;
+  confidence: number;
+  risk_level: string;
+  distance: number;
+}
+
+// Response of the long-poll /threat-analysis/changes endpoint
+export interface ChangesResponse {
+  data: ThreatAnalysisData[];
+  seq: number;
+  reset: boolean;
+  retryAfter?: number; // seconds to wait before polling again (the bridge was holding too many requests)
+}
+
+const LONG_POLL_TIMEOUT_S = 25;
+const HISTORY_LIMIT = 50; // matches the bridge's HISTORY_LIMIT
+const MAX_BACKOFF_MS = 30000;
+
 class ThreatAnalysisService {
   private baseUrl = this.getApiBaseUrl();
-  private pollingInterval: number | null = null;
+  private stopWatching: (() => void) | null = null;
+  private history: ThreatAnalysisData[] = [];
+  private historyListeners: Array<(history: ThreatAnalysisData[]) => void> = [];
   private listeners: Array<(data: ThreatAnalysisData | null) => void> = [];
 
   private getApiBaseUrl(): string {
@@ -45,6 +114,8 @@ class ThreatAnalysisService {
   async getLatestAnalysis(): Promise<ThreatAnalysisData | null> {
     try {
       console.log(`Fetching analysis from: ${this.baseUrl}/threat-analysis`);
+      const startedAt = Date.now();
+      const fetchStart = performance.now();
       const response = await fetch(`${this.baseUrl}/threat-analysis`, {
         method: 'GET',
         headers: { 'Content-Type': 'application/json' },
@@ -53,6 +124,10 @@ class ThreatAnalysisService {
       const result: ApiResponse<ThreatAnalysisData> = await response.json();
       
       if (result.status === 'success') {
+        reportFetchSpan(
+          `${this.baseUrl}/traces`, 'dashboard.fetch_latest', result.data,
+          startedAt, performance.now() - fetchStart
+        );
         return result.data || null;
       }
       return null;
@@ -78,6 +153,135 @@ class ThreatAnalysisService {
     }
   }
 
+  // Devices (glucose monitors, insulin pumps) that have sent analyses, most recently active first
+  async getDevices(): Promise<DeviceSummary[]> {
+    try {
+      const response = await fetch(`${this.baseUrl}/threat-analysis/devices`);
+      const result: ApiResponse<DeviceSummary[]> = await response.json();
+      return result.status === 'success' ? result.data || [] : [];
+    } catch (error) {
+      console.error('Failed to fetch devices:', error);
+      return [];
+    }
+  }
+
+  // Latest analysis of one device
+  async getDeviceLatest(deviceId: string): Promise<ThreatAnalysisData | null> {
+    try {
+      const response = await fetch(`${this.baseUrl}/threat-analysis/devices/${encodeURIComponent(deviceId)}`);
+      const result: ApiResponse<ThreatAnalysisData | null> = await response.json();
+      return result.status === 'success' ? result.data || null : null;
+    } catch (error) {
+      console.error(`Failed to fetch latest analysis for ${deviceId}:`, error);
+      return null;
+    }
+  }
+
+  // Newest `limit` analyses of one device, oldest first
+  async getDeviceHistory(deviceId: string, limit: number = 50): Promise<ThreatAnalysisData[]> {
+    try {
+      const response = await fetch(
+        `${this.baseUrl}/threat-analysis/devices/${encodeURIComponent(deviceId)}/history?limit=${limit}`
+      );
+      const result: ApiResponse<ThreatAnalysisData[]> = await response.json();
+      return result.status === 'success' ? result.data || [] : [];
+    } catch (error) {
+      console.error(`Failed to fetch history for ${deviceId}:`, error);
+      return [];
+    }
+  }
+
+  // Analyses newer than `since`; the bridge holds the request until one arrives or timeout (s) passes
+  async getChanges(since: number, timeout: number = LONG_POLL_TIMEOUT_S, signal?: AbortSignal): Promise<ChangesResponse> {
+    const response = await fetch(
+      `${this.baseUrl}/threat-analysis/changes?since=${since}&timeout=${timeout}`,
+      { method: 'GET', mode: 'cors', signal }
+    );
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+    const result = await response.json();
+    if (result.status !== 'success') {
+      throw new Error(result.message || 'Failed to fetch changes');
+    }
+    return { data: result.data || [], seq: result.seq || 0, reset: Boolean(result.reset), retryAfter: result.retry_after };
+  }
+
+  // Long-poll loop: calls onChanges with each batch of new analyses (the first call
+  // carries the current history). Backs off on errors; returns a stop function.
+  watchChanges(
+    onChanges: (analyses: ThreatAnalysisData[], reset: boolean) => void,
+    onError?: (error: unknown) => void
+  ): () => void {
+    const controller = new AbortController();
+    const loop = async () => {
+      let since = 0;
+      let first = true;
+      let backoff = 1000;
+      while (!controller.signal.aborted) {
+        try {
+          const changes = await this.getChanges(since, first ? 0 : LONG_POLL_TIMEOUT_S, controller.signal);
+          if (changes.data.length || changes.reset || first) {
+            onChanges(changes.data, changes.reset || first);
+          }
+          since = changes.seq;
+          first = false;
+          backoff = 1000;
+          if (changes.retryAfter) {
+            await new Promise(resolve => setTimeout(resolve, changes.retryAfter! * 1000));
+          }
+        } catch (error) {
+          if (controller.signal.aborted) return;
+          onError?.(error);
+          await new Promise(resolve => setTimeout(resolve, backoff));
+          backoff = Math.min(backoff * 2, MAX_BACKOFF_MS);
+        }
+      }
+    };
+    loop();
+    return () => controller.abort();
+  }
+
+  // Class counts and confidence per bucket between two epoch-second times (default: the last day)
+  async getTimeseries(start?: number, end?: number, step?: number): Promise<TimeseriesPoint[]> {
+    const params = new URLSearchParams();
+    if (start !== undefined) params.set('start', String(start));
+    if (end !== undefined) params.set('end', String(end));
+    if (step !== undefined) params.set('step', String(step));
+    try {
+      const response = await fetch(`${this.baseUrl}/threat-analysis/timeseries?${params}`);
+      const result: { status: string; points?: TimeseriesPoint[] } = await response.json();
+      return result.status === 'success' ? result.points || [] : [];
+    } catch (error) {
+      console.error('Failed to fetch timeseries:', error);
+      return [];
+    }
+  }
+
+  // Correlated incidents, most recently active first
+  async getIncidents(limit: number = 20): Promise<Incident[]> {
+    try {
+      const response = await fetch(`${this.baseUrl}/threat-analysis/incidents?limit=${limit}`);
+      const result: ApiResponse<Incident[]> = await response.json();
+      return result.status === 'success' ? result.data || [] : [];
+    } catch (error) {
+      console.error('Failed to fetch incidents:', error);
+      return [];
+    }
+  }
+
+  // Most similar past analyses (nearest neighbours over every stored analysis)
+  async getSimilarAnalyses(id: string, k: number = 5): Promise<SimilarAnalysis[]> {
+    try {
+      const response = await fetch(`${this.baseUrl}/threat-analysis/${encodeURIComponent(id)}/similar?k=${k}`);
+      const result: ApiResponse<SimilarAnalysis[]> = await response.json();
+      return result.status === 'success' ? result.data || [] : [];
+    } catch (error) {
+      console.error('Failed to fetch similar analyses:', error);
+      return [];
+    }
+  }
+
   // Check API health
   async checkHealth(): Promise<boolean> {
     try {
@@ -90,26 +294,38 @@ class ThreatAnalysisService {
     }
   }
 
-  // Start polling for new data
-  startPolling(interval: number = 5000) {
-    if (this.pollingInterval) {
+  // Start receiving new data (long-poll; history is kept incrementally)
+  startPolling() {
+    if (this.stopWatching) {
       this.stopPolling();
     }
 
-    this.pollingInterval = setInterval(async () => {
-      const latestData = await this.getLatestAnalysis();
-      this.notifyListeners(latestData);
-    }, interval) as unknown as number;
+    this.stopWatching = this.watchChanges((analyses, reset) => {
+      this.history = (reset ? analyses : [...this.history, ...analyses]).slice(-HISTORY_LIMIT);
+      this.historyListeners.forEach(callback => callback(this.history));
+      this.notifyListeners(this.history[this.history.length - 1] || null);
+    });
   }
 
-  // Stop polling
+  // Stop receiving
   stopPolling() {
-    if (this.pollingInterval) {
-      clearInterval(this.pollingInterval);
-      this.pollingInterval = null;
+    if (this.stopWatching) {
+      this.stopWatching();
+      this.stopWatching = null;
     }
   }
 
+  // Subscribe to history updates (same order as /history: oldest first)
+  subscribeHistory(callback: (history: ThreatAnalysisData[]) => void) {
+    this.historyListeners.push(callback);
+    return () => {
+      const index = this.historyListeners.indexOf(callback);
+      if (index > -1) {
+        this.historyListeners.splice(index, 1);
+      }
+    };
+  }
+
   // Subscribe to data updates
   subscribe(callback: (data: ThreatAnalysisData | null) => void) {
     this.listeners.push(callback);
@@ -1,4 +1,6 @@
 // Simple integration service without complex TypeScript issues
+import { reportFetchSpan } from './tracing';
+
 export interface StreamlitAnalysisData {
   id: string;
   timestamp: string;
@@ -8,6 +10,7 @@ export interface StreamlitAnalysisData {
   features: Record<string, number>;
   recommendations: string[];
   risk_level: string;
+  trace_id?: string;
 }
 
 class SimpleAPIService {
@@ -38,6 +41,8 @@ class SimpleAPIService {
   async getLatestAnalysis(): Promise<StreamlitAnalysisData | null> {
     try {
       console.log(`Fetching from: ${this.baseUrl}/api/threat-analysis`);
+      const startedAt = Date.now();
+      const fetchStart = performance.now();
       const response = await fetch(`${this.baseUrl}/api/threat-analysis`, {
         method: 'GET',
         headers: {
@@ -53,6 +58,10 @@ class SimpleAPIService {
       const result = await response.json();
       
       if (result.status === 'success' && result.data) {
+        reportFetchSpan(
+          `${this.baseUrl}/api/traces`, 'dashboard.fetch_latest', result.data,
+          startedAt, performance.now() - fetchStart
+        );
         return result.data;
       }
       return null;
@@ -62,6 +71,49 @@ class SimpleAPIService {
     }
   }
 
+  // Long-poll the bridge's changes feed; onChanges gets each batch of new analyses
+  // (oldest first; the first batch is the current history). Returns a stop function.
+  watchChanges(
+    onChanges: (analyses: StreamlitAnalysisData[]) => void,
+    onError?: (error: unknown) => void
+  ): () => void {
+    const controller = new AbortController();
+    const loop = async () => {
+      let since = 0;
+      let timeout = 0;
+      let backoff = 1000;
+      while (!controller.signal.aborted) {
+        try {
+          const response = await fetch(
+            `${this.baseUrl}/api/threat-analysis/changes?since=${since}&timeout=${timeout}`,
+            { method: 'GET', mode: 'cors', signal: controller.signal }
+          );
+          if (!response.ok) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+          }
+          const result = await response.json();
+          if (result.status !== 'success') {
+            throw new Error(result.message || 'Failed to fetch changes');
+          }
+          if (result.data?.length) {
+            onChanges(result.data);
+          }
+          since = result.seq || 0;
+          timeout = 25;
+          backoff = 1000;
+        } catch (error) {
+          if (controller.signal.aborted) return;
+          console.error('Changes feed failed:', error);
+          onError?.(error);
+          await new Promise(resolve => setTimeout(resolve, backoff));
+          backoff = Math.min(backoff * 2, 30000);
+        }
+      }
+    };
+    loop();
+    return () => controller.abort();
+  }
+
   async checkHealth(): Promise<boolean> {
     try {
       console.log(`Health check: ${this.baseUrl}/api/health`);
@@ -0,0 +1,48 @@
+// Report dashboard fetch timings back to the API bridge so they join the
+// Streamlit → bridge trace of the analysis being displayed
+const reportedAnalyses = new Set<string>();
+
+const randomHex = (bytes: number): string => {
+  const values = new Uint8Array(bytes);
+  crypto.getRandomValues(values);
+  return Array.from(values, (v) => v.toString(16).padStart(2, '0')).join('');
+};
+
+export interface TracedAnalysis {
+  id: string;
+  trace_id?: string;
+}
+
+// Record one span per analysis the first time this dashboard receives it.
+// startMs is a Date.now() timestamp taken before the fetch started.
+export const reportFetchSpan = (
+  tracesUrl: string,
+  spanName: string,
+  analysis: TracedAnalysis | null | undefined,
+  startMs: number,
+  durationMs: number
+): void => {
+  if (!analysis?.trace_id || reportedAnalyses.has(analysis.id)) {
+    return;
+  }
+  reportedAnalyses.add(analysis.id);
+
+  const span = {
+    trace_id: analysis.trace_id,
+    span_id: randomHex(8),
+    parent_id: null,
+    name: spanName,
+    service: 'dashboard',
+    start: startMs / 1000,
+    duration_ms: durationMs,
+    attributes: { analysis_id: analysis.id, received_at: new Date().toISOString() },
+  };
+
+  // Fire and forget: tracing must never affect the dashboard
+  fetch(tracesUrl, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(span),
+    mode: 'cors',
+  }).catch(() => undefined);
+};
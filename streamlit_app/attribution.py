@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Per-feature attributions: why a row was given its class.
+
+Both methods work on the scaled inputs of LightweightANN (or any model mapping
+scaled features to logits) and explain the logit of the predicted class. A
+whole batch is handled in vectorized passes:
+
+    input_x_gradient       x * d logit / d x                    one forward + backward
+    integrated_gradients   (x - baseline) * mean over `steps` interpolations of
+                           the gradient; all steps of a chunk of rows go through
+                           the network as one stacked batch.     `steps` forward + backward
+
+The baseline is the training mean (0 in scaled space), so an attribution reads as
+"how much this feature's deviation from typical traffic pushed the score".
+Attributions are cached in an LRU keyed by model version, method and a digest of the
+raw feature row, so re-sent or replayed analyses are not recomputed. Cost is bounded
+per call: `max_rows` caps how many rows are explained (the rest get None) and
+integrated gradients processes rows in chunks of at most `max_batch` interpolated inputs.
+
+Usage:
+    python attribution.py --rows 1000 --method integrated_gradients --steps 32
+"""
+
+import argparse
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from inference import FEATURE_NAMES
+import metrics
+
+METHODS = ("input_x_gradient", "integrated_gradients")
+
+ATTRIBUTION_LATENCY = metrics.histogram(
+    "attribution_seconds", "Time to compute attributions for a batch", ("method",)
+)
+ATTRIBUTION_ROWS = metrics.counter("attribution_rows_total", "Rows explained by cache outcome", ("cache",))
+
+
+def _scaled_tensor(features, scaler, device):
+    x = scaler.transform(np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURE_NAMES)))
+    return torch.as_tensor(x, dtype=torch.float32, device=device)
+
+
+def _target_gradients(model, x, targets):
+    """d logit[target] / d x for each row, plus the logits; one forward and one backward pass"""
+    x = x.detach().requires_grad_(True)
+    logits = model(x)
+    if targets is None:
+        targets = logits.argmax(dim=1)
+    chosen = logits.gather(1, targets.view(-1, 1)).sum()  # rows are independent, so one backward covers all
+    (gradients,) = torch.autograd.grad(chosen, x)
+    return gradients, logits.detach(), targets
+
+
+def input_x_gradient(model, x, targets=None):
+    """(N, F) attributions and the explained target index per row"""
+    gradients, _, targets = _target_gradients(model, x, targets)
+    return (x * gradients).detach(), targets
+
+
+def integrated_gradients(model, x, targets=None, steps=16, baseline=None, max_batch=8192):
+    """(N, F) attributions by the Riemann midpoint rule over `steps` points from baseline to x"""
+    baseline = torch.zeros_like(x) if baseline is None else baseline.expand_as(x)
+    if targets is None:
+        with torch.no_grad():
+            targets = model(x).argmax(dim=1)
+    alphas = ((torch.arange(steps, dtype=x.dtype, device=x.device) + 0.5) / steps).view(-1, 1, 1)
+    rows_per_chunk = max(1, max_batch // steps)
+    out = torch.empty_like(x)
+    for lo in range(0, len(x), rows_per_chunk):
+        xs, bs, ts = x[lo:lo + rows_per_chunk], baseline[lo:lo + rows_per_chunk], targets[lo:lo + rows_per_chunk]
+        path = (bs + alphas * (xs - bs)).reshape(-1, x.shape[1])  # (steps * n, F), step-major
+        gradients, _, _ = _target_gradients(model, path, ts.repeat(steps))
+        out[lo:lo + len(xs)] = (xs - bs) * gradients.view(steps, len(xs), -1).mean(dim=0)
+    return out.detach(), targets
+
+
+def top_features(attributions, features, k=5, feature_names=FEATURE_NAMES):
+    """Per row: the k features with the largest |attribution|, as dicts for the bridge payload"""
+    attributions = np.asarray(attributions)
+    k = min(k, attributions.shape[1])
+    order = np.argsort(-np.abs(attributions), axis=1)[:, :k]
+    return [
+        [{"feature": feature_names[j], "value": float(features[i][j]),
+          "attribution": round(float(attributions[i, j]), 6)} for j in order[i]]
+        for i in range(len(order))
+    ]
+
+
+def row_digest(row):
+    return hashlib.blake2b(np.ascontiguousarray(row, dtype=np.float64).tobytes(), digest_size=12).hexdigest()
+
+
+class AttributionEngine:
+    """
+    Batched attributions with an LRU cache. Defaults are set here and can be
+    overridden per call (method, steps, top_k, max_rows).
+    """
+
+    def __init__(self, method="input_x_gradient", steps=16, top_k=5, max_rows=4096, cache_size=4096):
+        if method not in METHODS:
+            raise ValueError(f"Unknown attribution method {method!r}; expected one of {METHODS}")
+        self.method = method
+        self.steps = steps
+        self.top_k = top_k
+        self.max_rows = max_rows
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, keys):
+        with self._lock:
+            hits = {}
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    hits[i] = self._cache[key]
+            return hits
+
+    def _store(self, items):
+        with self._lock:
+            for key, value in items:
+                self._cache[key] = value
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def explain(self, features, model, scaler, device, version="initial", method=None, steps=None, top_k=None,
+                max_rows=None):
+        """
+        Top-k contributing features for each row of `features` (raw, unscaled), for the
+        class the model predicts. Rows past max_rows are returned as None.
+        """
+        method = method or self.method
+        steps = steps or self.steps
+        top_k = top_k or self.top_k
+        max_rows = self.max_rows if max_rows is None else max_rows
+        features = np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURE_NAMES))
+        n = min(len(features), max_rows)
+
+        keys = [(version, method, steps if method == "integrated_gradients" else 0, row_digest(row))
+                for row in features[:n]]
+        results = self._lookup(keys)
+        missing = [i for i in range(n) if i not in results]
+        ATTRIBUTION_ROWS.inc(n - len(missing), cache="hit")
+        if missing:
+            ATTRIBUTION_ROWS.inc(len(missing), cache="miss")
+            with ATTRIBUTION_LATENCY.time(method=method):
+                attributions = self.attribute(features[missing], model, scaler, device, method, steps)
+            # Cache the full vector so a later call with a larger top_k is still a hit
+            self._store((keys[i], attributions[j]) for j, i in enumerate(missing))
+            results.update({i: attributions[j] for j, i in enumerate(missing)})
+
+        explained = top_features(np.stack([results[i] for i in range(n)]), features[:n], top_k) if n else []
+        return explained + [None] * (len(features) - n)
+
+    def attribute(self, features, model, scaler, device, method=None, steps=None):
+        """(N, F) attribution matrix for raw feature rows"""
+        method = method or self.method
+        x = _scaled_tensor(features, scaler, device)  # the serving model is shared and already in eval mode
+        if method == "integrated_gradients":
+            attributions, _ = integrated_gradients(model, x, steps=steps or self.steps)
+        elif method == "input_x_gradient":
+            attributions, _ = input_x_gradient(model, x)
+        else:
+            raise ValueError(f"Unknown attribution method {method!r}; expected one of {METHODS}")
+        return attributions.cpu().numpy()
+
+
+def main():
+    from inference import load_artifacts
+    from feature_store import read_features
+
+    parser = argparse.ArgumentParser(description="Time batched attributions on train_features rows")
+    parser.add_argument("--data", help="Feature file (default: train_features)")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--method", choices=METHODS, default="input_x_gradient")
+    parser.add_argument("--steps", type=int, default=16, help="Integrated-gradients interpolation steps")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    model, scaler, label_encoder, device, use_real_model = load_artifacts()
+    if not use_real_model:
+        print("⚠️ best_model.pth not found: explaining the untrained demo weights")
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    frame = read_features(args.data or os.path.join(base_dir, "train_features.csv"), columns=FEATURE_NAMES)
+    features = frame.to_numpy(dtype=np.float64)[:args.rows]
+
+    engine = AttributionEngine(args.method, args.steps, args.top_k, max_rows=len(features))
+    start = time.perf_counter()
+    explained = engine.explain(features, model, scaler, device)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    engine.explain(features, model, scaler, device)
+    warm = time.perf_counter() - start
+
+    print(f"🔍 {len(features):,} rows with {args.method}: {1e6 * cold / len(features):.1f} µs/row "
+          f"(cached: {1e6 * warm / len(features):.1f} µs/row)")
+    for item in explained[0]:
+        print(f"   {item['feature']:<18}{item['value']:>14.4g}{item['attribution']:>+12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Multiprocess sharded batch scoring for large feature files.
+
+The input is split into independent shards, and a process pool scores them:
+    CSV      byte ranges aligned to line boundaries (each worker seeks and parses
+             only its own range), at most --shard-mb (default 64 MB) each, so a
+             worker's memory doesn't grow with the file
+    Parquet  row groups
+
+Every worker loads the model, scaler and label encoder once (pool initializer)
+and runs single-threaded torch, so N workers use N cores without oversubscription.
+With --cascade, rows the cascade.json pre-filter clears as benign skip the model.
+Each shard sends back only per-class counts and its own top-k most suspicious
+rows. The parent merges these, so memory stays flat no matter how big the file is.
+
+Rows are located by byte offset (CSV) or row index (Parquet) so the top-k rows
+can be looked up in the source file afterwards. Every shard is checked against
+the feature schema (backend/feature_schema.py) first: out-of-range values are
+clipped, unusable rows are left out of the scores, and the summary reports both
+per feature. With --scores-out every row's
+scores are also written, one Arrow IPC part per shard, for
+feature_store.read_scores() to memory-map later.
+
+Usage:
+    python batch_score.py features.csv
+    python batch_score.py features.parquet --workers 8 --top-k 50 --json-out summary.json
+    python batch_score.py features.parquet --scores-out scores/
+    python batch_score.py features.parquet --cascade
+"""
+
+import argparse
+import heapq
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from cascade import cascade_predict, load_prefilter
+from feature_schema import merge_summaries, validate_features
+from feature_store import ScoresWriter
+from inference import FEATURE_NAMES, predict_batch, load_artifacts, load_temperature
+
+# Per-process state set up by _init_worker
+_worker = {}
+
+# Largest CSV byte range one worker parses at once; bigger files get more shards, not bigger ones
+MAX_SHARD_BYTES = 64 << 20
+
+
+def _init_worker(artifact_dir, cascade=False):
+    import torch
+
+    torch.set_num_threads(1)
+    model, scaler, label_encoder, device, use_real_model = load_artifacts(artifact_dir, torch.device("cpu"))
+    temperature = load_temperature(artifact_dir)
+    prefilter = load_prefilter(artifact_dir) if cascade else None
+    if cascade and prefilter is None:
+        raise FileNotFoundError(f"--cascade needs cascade.json in {artifact_dir} (run cascade.py first)")
+    classes = [str(c) for c in label_encoder.classes_]
+    benign = [i for i, c in enumerate(classes) if c.lower() in ("benign", "normal")]
+    _worker.update(model=model, scaler=scaler, label_encoder=label_encoder, device=device, temperature=temperature,
+                   use_real_model=use_real_model, classes=classes, benign=benign, prefilter=prefilter)
+
+
+# -------------------------------
+# Sharding
+# -------------------------------
+def csv_shards(path, n_shards, max_bytes=MAX_SHARD_BYTES):
+    """
+    Split a CSV into ~equal byte ranges after the header; workers align to newlines.
+    At least n_shards ranges, and more when that is needed to keep each range under max_bytes.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+    start, size = len(header), os.path.getsize(path)
+    n_shards = max(n_shards, -(-(size - start) // max_bytes))
+    step = max(1, -(-(size - start) // n_shards))
+    return [("csv", path, lo, min(lo + step, size)) for lo in range(start, size, step)]
+
+
+def parquet_shards(path):
+    import pyarrow.parquet as pq
+
+    meta = pq.ParquetFile(path).metadata
+    shards, first_row = [], 0
+    for rg in range(meta.num_row_groups):
+        shards.append(("parquet", path, rg, first_row))
+        first_row += meta.row_group(rg).num_rows
+    return shards
+
+
+def _read_csv_range(path, lo, hi):
+    """
+    Rows whose first byte lies in [lo, hi). Returns (frame, byte offset of each row).
+    A row straddling hi belongs to this shard; one straddling lo to the previous one.
+    """
+    with open(path, "rb") as f:
+        names = f.readline().decode().strip().split(",")
+        if lo > 0:
+            f.seek(lo - 1)
+            if f.read(1) != b"\n":
+                f.readline()  # finish the previous shard's row
+        begin = f.tell()
+        data = f.read(max(hi - begin, 0))
+        if data and not data.endswith(b"\n"):
+            data += f.readline()
+    if not data:
+        return pd.DataFrame(columns=names), np.empty(0, dtype=np.int64)
+    raw = np.frombuffer(data, dtype=np.uint8)
+    starts = np.r_[0, np.flatnonzero(raw == 10) + 1]
+    starts = starts[starts < len(data)]
+    frame = pd.read_csv(io.BytesIO(data), names=names, header=None)
+    return frame, begin + starts[:len(frame)]
+
+
+def _read_parquet_group(path, row_group, first_row):
+    import pyarrow.parquet as pq
+
+    table = pq.ParquetFile(path).read_row_group(row_group)
+    frame = table.to_pandas()
+    return frame, first_row + np.arange(len(frame), dtype=np.int64)
+
+
+# -------------------------------
+# Worker
+# -------------------------------
+def score_shard(shard, top_k=20, batch_size=8192, scores_path=None):
+    """Score one shard in the worker; returns counts and its local top-k"""
+    start = time.perf_counter()
+    kind, path, a, b = shard
+    frame, location = _read_csv_range(path, a, b) if kind == "csv" else _read_parquet_group(path, a, b)
+
+    classes = _worker["classes"]
+    writer = ScoresWriter(scores_path, classes) if scores_path else None
+    counts = np.zeros(len(classes), dtype=np.int64)
+    correct = labelled = short_circuited = 0
+    top = []
+    report = validate_features(frame)
+    keep = report.accepted
+    features_all = report.rows[keep]
+    labels = frame["Label"].astype(str).to_numpy()[keep] if "Label" in frame.columns else None
+    validation = report.summary(locations=location)
+    location = location[keep]
+
+    for lo in range(0, len(features_all), batch_size):
+        features = features_all[lo:lo + batch_size]
+        if _worker["prefilter"] is not None:
+            threat_classes, confidences, probabilities, cleared = cascade_predict(
+                features, _worker["prefilter"], _worker["model"], _worker["scaler"], _worker["label_encoder"],
+                _worker["device"], _worker["temperature"]
+            )
+            short_circuited += int(cleared.sum())
+        else:
+            threat_classes, confidences, probabilities = predict_batch(
+                features, _worker["model"], _worker["scaler"], _worker["label_encoder"], _worker["device"],
+                _worker["temperature"]
+            )
+        predicted = probabilities.argmax(axis=1)
+        counts += np.bincount(predicted, minlength=len(classes))
+        if labels is not None:
+            correct += int((threat_classes == labels[lo:lo + batch_size]).sum())
+            labelled += len(features)
+
+        # Suspicion = probability mass outside the benign class(es)
+        suspicion = 1.0 - probabilities[:, _worker["benign"]].sum(axis=1)
+        if writer is not None:
+            writer.write(location[lo:lo + batch_size], predicted, confidences, suspicion, probabilities)
+        k = min(top_k, len(suspicion))
+        if k:
+            best = np.argpartition(-suspicion, k - 1)[:k]
+            for i in best:
+                top.append((float(suspicion[i]), int(location[lo + i]), str(threat_classes[i]),
+                            float(confidences[i])))
+        top = heapq.nlargest(top_k, top)
+
+    if writer is not None:
+        writer.close()
+    return {
+        "rows": len(frame),
+        "counts": counts.tolist(),
+        "correct": correct,
+        "labelled": labelled,
+        "short_circuited": short_circuited,
+        "top": top,
+        "validation": validation,
+        "seconds": time.perf_counter() - start,
+        "pid": os.getpid(),
+    }
+
+
+# -------------------------------
+# Driver
+# -------------------------------
+def score_file(path, workers=None, top_k=20, shards_per_worker=4, artifact_dir=None, batch_size=8192,
+               scores_out=None, cascade=False, shard_bytes=MAX_SHARD_BYTES):
+    """
+    Score a CSV or Parquet feature file across a process pool and return the merged
+    summary. scores_out names a directory for per-shard Arrow IPC score parts.
+    With cascade, the cascade.json pre-filter runs in front of the model.
+    CSV shards are at most shard_bytes each.
+    """
+    workers = workers or os.cpu_count() or 1
+    if path.endswith((".parquet", ".pq")):
+        shards, location_kind = parquet_shards(path), "row"
+    else:
+        shards, location_kind = csv_shards(path, workers * shards_per_worker, shard_bytes), "byte_offset"
+
+    artifact_dir = artifact_dir or os.path.dirname(os.path.abspath(__file__))
+    if scores_out:
+        os.makedirs(scores_out, exist_ok=True)
+    _init_worker(artifact_dir, cascade)  # class names for the merge (and fail fast on bad artifacts)
+    classes = _worker["classes"]
+
+    start = time.perf_counter()
+    counts = np.zeros(len(classes), dtype=np.int64)
+    rows = correct = labelled = short_circuited = 0
+    top = []
+    validations = []
+    worker_pids = set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(artifact_dir, cascade)) as pool:
+        futures = [
+            pool.submit(score_shard, shard, top_k, batch_size,
+                        os.path.join(scores_out, f"part-{i:05d}.arrow") if scores_out else None)
+            for i, shard in enumerate(shards)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            rows += result["rows"]
+            counts += np.asarray(result["counts"], dtype=np.int64)
+            correct += result["correct"]
+            labelled += result["labelled"]
+            short_circuited += result["short_circuited"]
+            top = heapq.nlargest(top_k, top + [tuple(t) for t in result["top"]])
+            validations.append(result["validation"])
+            worker_pids.add(result["pid"])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "file": path,
+        "rows": rows,
+        "shards": len(shards),
+        "workers": len(worker_pids),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / max(elapsed, 1e-9), 1),
+        "model_used": "real" if _worker["use_real_model"] else "demo",
+        "scores_out": scores_out,
+        "class_counts": dict(zip(classes, counts.tolist())),
+        "validation": merge_summaries(validations),
+        "accuracy": round(correct / labelled, 4) if labelled else None,
+        "short_circuited": round(short_circuited / max(rows, 1), 4) if cascade else None,
+        "top_suspicious": [
+            {"suspicion": s, location_kind: loc, "threat_class": c, "confidence": conf}
+            for s, loc, c, conf in top
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a large CSV/Parquet feature file across all cores")
+    parser.add_argument("path", help="CSV or Parquet file with the 45 FEATURE_NAMES columns")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--top-k", type=int, default=20, help="Most suspicious rows to report")
+    parser.add_argument("--shards-per-worker", type=int, default=4, help="CSV byte ranges per worker (at least)")
+    parser.add_argument("--shard-mb", type=float, default=MAX_SHARD_BYTES / (1 << 20),
+                        help="Largest CSV byte range a worker parses at once, in MB")
+    parser.add_argument("--batch-size", type=int, default=8192, help="Rows per model call inside a worker")
+    parser.add_argument("--scores-out", help="Directory for per-row scores (Arrow IPC, one part per shard)")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Clear confidently benign rows with the cascade.json pre-filter first")
+    parser.add_argument("--json-out", help="Write the merged summary as JSON")
+    args = parser.parse_args()
+    if args.cascade and load_prefilter() is None:
+        parser.error("--cascade needs cascade.json next to the model (run cascade.py first)")
+
+    summary = score_file(args.path, args.workers, args.top_k, args.shards_per_worker,
+                         batch_size=args.batch_size, scores_out=args.scores_out, cascade=args.cascade,
+                         shard_bytes=max(int(args.shard_mb * (1 << 20)), 1))
+
+    print(f"⚡ Scored {summary['rows']:,} rows in {summary['seconds']:.2f}s "
+          f"({summary['rows_per_second']:,.0f} rows/s, {summary['workers']} workers, {summary['shards']} shards)")
+    if summary["model_used"] == "demo":
+        print("⚠️ best_model.pth not found: scores come from untrained weights (demo)")
+    for threat_class, count in summary["class_counts"].items():
+        print(f"   {threat_class:<12}{count:>12,}  ({count / max(summary['rows'], 1):.1%})")
+    validation = summary["validation"]
+    if validation["rejected"] or validation["clipped"]:
+        print(f"⚠️ {validation['rejected']:,} rows rejected, {validation['clipped']:,} clipped by the feature schema")
+        for name, reasons in sorted(validation["issues"].items()):
+            print(f"   {name:<18}" + ", ".join(f"{reason} {n:,}" for reason, n in reasons.items()))
+    if summary["accuracy"] is not None:
+        print(f"🎯 Accuracy against Label column: {summary['accuracy']:.2%}")
+    if summary["short_circuited"] is not None:
+        print(f"🪜 Cascade: {summary['short_circuited']:.1%} of rows cleared by the pre-filter")
+    print(f"🔎 Top {len(summary['top_suspicious'])} suspicious rows:")
+    for t in summary["top_suspicious"][:10]:
+        where = f"byte {t['byte_offset']}" if "byte_offset" in t else f"row {t['row']}"
+        print(f"   {where:<18}{t['threat_class']:<12}suspicion {t['suspicion']:.3f}")
+
+    if args.scores_out:
+        print(f"🗂️ Per-row scores in {args.scores_out} (load with feature_store.read_scores)")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Summary written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
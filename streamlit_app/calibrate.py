@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Temperature-scaling calibration for the serving model.
+
+The raw softmax max of a network trained with cross-entropy is usually
+over-confident, so determine_risk_level()'s "> 0.8" threshold does not mean
+"right 80% of the time". This fits one scalar temperature T on held-out
+labeled rows by minimizing the negative log-likelihood of softmax(logits / T),
+then writes it to calibration.json next to the model. Accuracy does not change,
+because argmax is unaffected.
+
+The app, the model registry (hot-reloaded with the other artifacts), batch_score
+and pcap_pipeline all pick the file up via load_temperature(). The report shows
+expected calibration error (ECE) and NLL before and after.
+
+Usage:
+    python calibrate.py --data labeled_holdout.parquet
+    python calibrate.py --data labeled_holdout.csv --artifact-dir ./candidate --dry-run
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from inference import CALIBRATION_FILE, FEATURE_NAMES, load_artifacts
+
+
+@torch.no_grad()
+def model_logits(features, model, scaler, device, batch_size=8192):
+    out = []
+    for lo in range(0, len(features), batch_size):
+        x = torch.as_tensor(scaler.transform(features[lo:lo + batch_size]), dtype=torch.float32, device=device)
+        out.append(model(x).cpu())
+    return torch.cat(out)
+
+
+def fit_temperature(logits, labels, max_iter=100):
+    """Scalar T minimizing NLL of softmax(logits / T); optimized in log space so T stays positive"""
+    labels = torch.as_tensor(labels, dtype=torch.long)
+    log_t = torch.zeros(1, requires_grad=True)
+    optimizer = torch.optim.LBFGS([log_t], lr=0.1, max_iter=max_iter)
+
+    def closure():
+        optimizer.zero_grad()
+        loss = F.cross_entropy(logits / log_t.exp(), labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return float(log_t.detach().exp().clamp(0.05, 20.0))
+
+
+def expected_calibration_error(probabilities, labels, bins=15):
+    """Mean |accuracy - confidence| over equal-width confidence bins, weighted by bin size"""
+    confidences = probabilities.max(axis=1)
+    correct = probabilities.argmax(axis=1) == labels
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    which = np.clip(np.digitize(confidences, edges[1:-1]), 0, bins - 1)
+    ece = 0.0
+    for b in range(bins):
+        in_bin = which == b
+        if in_bin.any():
+            ece += in_bin.mean() * abs(correct[in_bin].mean() - confidences[in_bin].mean())
+    return float(ece)
+
+
+def calibration_report(logits, labels, temperature):
+    labels = np.asarray(labels)
+    report = {"rows": int(len(labels)), "temperature": round(temperature, 4)}
+    for name, t in (("before", 1.0), ("after", temperature)):
+        probabilities = torch.softmax(logits / t, dim=1).numpy()
+        report[name] = {
+            "ece": round(expected_calibration_error(probabilities, labels), 4),
+            "nll": round(float(F.cross_entropy(logits / t, torch.as_tensor(labels, dtype=torch.long))), 4),
+            "mean_confidence": round(float(probabilities.max(axis=1).mean()), 4),
+            "accuracy": round(float((probabilities.argmax(axis=1) == labels).mean()), 4),
+        }
+    return report
+
+
+def write_calibration(artifact_dir, report):
+    path = os.path.join(artifact_dir, CALIBRATION_FILE)
+    payload = dict(report, fitted_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    with open(path + ".tmp", "w") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def main():
+    from feature_store import read_features
+
+    parser = argparse.ArgumentParser(description="Fit a softmax temperature on held-out labeled rows")
+    parser.add_argument("--data", help="Held-out labeled feature file (default: train_features)")
+    parser.add_argument("--artifact-dir", help="Model directory; calibration.json is written here")
+    parser.add_argument("--dry-run", action="store_true", help="Report only, don't write calibration.json")
+    args = parser.parse_args()
+
+    artifact_dir = args.artifact_dir or os.path.dirname(os.path.abspath(__file__))
+    model, scaler, label_encoder, device, use_real_model = load_artifacts(artifact_dir)
+    if not use_real_model:
+        print("⚠️ best_model.pth not found: calibrating the untrained demo weights")
+
+    frame = read_features(args.data or os.path.join(artifact_dir, "train_features.csv"))
+    known = frame["Label"].astype(str).isin(label_encoder.classes_).to_numpy()
+    features = frame[FEATURE_NAMES].to_numpy(dtype=np.float64)[known]
+    labels = label_encoder.transform(frame["Label"].astype(str).to_numpy()[known])
+
+    logits = model_logits(features, model, scaler, device)
+    temperature = fit_temperature(logits, labels)
+    report = calibration_report(logits, labels, temperature)
+
+    print(f"🌡️ Temperature {report['temperature']:.3f} fitted on {report['rows']:,} rows")
+    print(f"   {'':<8}{'ECE':>8}{'NLL':>8}{'mean conf':>11}{'accuracy':>10}")
+    for name in ("before", "after"):
+        r = report[name]
+        print(f"   {name:<8}{r['ece']:>8.4f}{r['nll']:>8.4f}{r['mean_confidence']:>11.2%}{r['accuracy']:>10.2%}")
+
+    if not args.dry_run:
+        path = write_calibration(artifact_dir, report)
+        print(f"💾 Written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Two-stage cascade scoring: a linear benign pre-filter in front of the network.
+
+Most production flows are benign, yet each one pays for the full
+45→256→128→64 forward pass. The cascade puts a logistic regression (benign vs.
+attack) in front of it, with the StandardScaler folded into its weights. That
+costs one 45-wide dot product per row:
+
+    stage 1   p_benign = sigmoid(x · w + b)          every row
+    stage 2   predict_batch() on LightweightANN      rows with p_benign < threshold
+
+Rows cleared by stage 1 are reported as the benign class with confidence
+p_benign; the remaining probability mass is spread evenly over the other classes.
+The threshold is the knob: higher means fewer rows short-circuited and less
+recall lost.
+
+Stage 1 is fit on the data's own labels when they contain both benign and attack
+rows. Otherwise (train_features.csv is all Benign) it is fit on the full model's
+predictions, so it learns to clear what the network would call benign anyway. The
+report sweeps thresholds on a held-out split and shows, for each one, the fraction
+short-circuited, the recall loss against the full model (and against the labels,
+when there are attacks) and the measured throughput gain.
+
+Usage:
+    python cascade.py                                     # fit on train_features, sweep, write cascade.json
+    python cascade.py --data labeled.parquet --max-recall-loss 0.001
+    python cascade.py --threshold 0.995 --dry-run
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from inference import FEATURE_NAMES, load_artifacts, load_temperature, predict_batch
+import metrics
+
+CASCADE_FILE = "cascade.json"
+BENIGN_CLASSES = ("benign", "normal")
+DEFAULT_THRESHOLDS = (0.9, 0.95, 0.98, 0.99, 0.995, 0.999)
+
+CASCADE_ROWS = metrics.counter("cascade_rows_total", "Rows scored by the cascade, by deciding stage", ("stage",))
+
+
+def benign_index(label_encoder):
+    for i, c in enumerate(label_encoder.classes_):
+        if str(c).lower() in BENIGN_CLASSES:
+            return i
+    raise ValueError(f"No benign class in {list(label_encoder.classes_)}")
+
+
+class Prefilter:
+    """Linear benign-vs-attack scorer on raw features (scaler folded into the weights)"""
+
+    def __init__(self, weight, bias, threshold=0.99):
+        self.weight = np.asarray(weight, dtype=np.float64)
+        self.bias = float(bias)
+        self.threshold = float(threshold)
+
+    def benign_probability(self, features):
+        z = np.asarray(features, dtype=np.float64).reshape(-1, len(self.weight)) @ self.weight + self.bias
+        return 1.0 / (1.0 + np.exp(-np.clip(z, -500, 500)))
+
+    def to_dict(self):
+        return {"weight": self.weight.tolist(), "bias": self.bias, "threshold": self.threshold,
+                "features": FEATURE_NAMES}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("features", FEATURE_NAMES) != FEATURE_NAMES:
+            raise ValueError("cascade.json was fit on a different feature list")
+        return cls(data["weight"], data["bias"], data.get("threshold", 0.99))
+
+
+def fit_prefilter(features, is_benign, scaler, threshold=0.99, C=1.0):
+    """Logistic regression on scaled features, returned with the scaling folded in"""
+    from sklearn.linear_model import LogisticRegression
+
+    is_benign = np.asarray(is_benign, dtype=bool)
+    if is_benign.all() or not is_benign.any():
+        raise ValueError("The pre-filter needs both benign and non-benign rows to fit")
+    clf = LogisticRegression(C=C, max_iter=1000).fit(scaler.transform(features), is_benign.astype(int))
+    scale = np.asarray(scaler.scale_, dtype=np.float64)
+    weight = clf.coef_[0] / scale
+    bias = float(clf.intercept_[0] - (clf.coef_[0] * np.asarray(scaler.mean_) / scale).sum())
+    return Prefilter(weight, bias, threshold)
+
+
+def load_prefilter(base_dir=None):
+    """Prefilter from cascade.json next to the model, or None when there is none"""
+    base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(base_dir, CASCADE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return Prefilter.from_dict(json.load(f))
+
+
+def write_prefilter(artifact_dir, prefilter, report=None):
+    path = os.path.join(artifact_dir, CASCADE_FILE)
+    payload = dict(prefilter.to_dict(), fitted_at=time.strftime("%Y-%m-%dT%H:%M:%S"), report=report)
+    with open(path + ".tmp", "w") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def cascade_predict(features, prefilter, model, scaler, label_encoder, device, temperature=1.0, threshold=None):
+    """
+    predict_batch() with the benign pre-filter in front. Returns (threat_classes,
+    confidences, probabilities, cleared) where cleared marks rows decided by stage 1.
+    """
+    features = np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURE_NAMES))
+    threshold = prefilter.threshold if threshold is None else threshold
+    p_benign = prefilter.benign_probability(features)
+    cleared = p_benign >= threshold
+    n_classes = len(label_encoder.classes_)
+    benign = benign_index(label_encoder)
+
+    probabilities = np.empty((len(features), n_classes))
+    probabilities[cleared] = ((1.0 - p_benign[cleared]) / max(n_classes - 1, 1))[:, None]
+    probabilities[cleared, benign] = p_benign[cleared]
+    if (~cleared).any():
+        _, _, probabilities[~cleared] = predict_batch(features[~cleared], model, scaler, label_encoder, device,
+                                                      temperature)
+    CASCADE_ROWS.inc(int(cleared.sum()), stage="prefilter")
+    CASCADE_ROWS.inc(int((~cleared).sum()), stage="model")
+
+    predicted = probabilities.argmax(axis=1)
+    confidences = probabilities[np.arange(len(predicted)), predicted]
+    return np.asarray(label_encoder.classes_)[predicted], confidences, probabilities, cleared
+
+
+# -------------------------------
+# Evaluation
+# -------------------------------
+def sweep(p_benign, model_attack, true_attack=None, thresholds=DEFAULT_THRESHOLDS):
+    """
+    Per threshold: fraction short-circuited and recall lost. Recall loss against the
+    model is the share of rows the full model flags that stage 1 would have cleared.
+    Against the labels it is the share of true attacks the full model catches but
+    stage 1 clears.
+    """
+    rows = []
+    for t in thresholds:
+        cleared = p_benign >= t
+        row = {
+            "threshold": t,
+            "short_circuit": round(float(cleared.mean()), 4),
+            "recall_loss_vs_model": round(float((cleared & model_attack).sum() / max(model_attack.sum(), 1)), 5),
+        }
+        if true_attack is not None and true_attack.any():
+            row["recall_loss_vs_labels"] = round(
+                float((cleared & model_attack & true_attack).sum() / true_attack.sum()), 5)
+        rows.append(row)
+    return rows
+
+
+def choose_threshold(rows, max_recall_loss):
+    """Lowest threshold (most short-circuiting) whose recall loss stays within budget"""
+    key = "recall_loss_vs_labels" if "recall_loss_vs_labels" in rows[0] else "recall_loss_vs_model"
+    eligible = [r for r in rows if r[key] <= max_recall_loss]
+    return min(eligible, key=lambda r: r["threshold"]) if eligible else max(rows, key=lambda r: r["threshold"])
+
+
+def measure_throughput(features, prefilter, threshold, model, scaler, label_encoder, device, temperature=1.0,
+                       batch_size=8192, repeats=3):
+    """Rows/s for the full model alone and for the cascade over the same rows"""
+    def best_of(fn):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for lo in range(0, len(features), batch_size):
+                fn(features[lo:lo + batch_size])
+            times.append(time.perf_counter() - start)
+        return len(features) / max(min(times), 1e-9)
+
+    full = best_of(lambda f: predict_batch(f, model, scaler, label_encoder, device, temperature))
+    cascade = best_of(lambda f: cascade_predict(f, prefilter, model, scaler, label_encoder, device, temperature,
+                                                threshold))
+    return {"full_rows_per_s": round(full, 1), "cascade_rows_per_s": round(cascade, 1),
+            "speedup": round(cascade / max(full, 1e-9), 2)}
+
+
+def main():
+    import torch
+    from feature_store import read_features
+
+    parser = argparse.ArgumentParser(description="Fit the benign pre-filter and report the cascade trade-off")
+    parser.add_argument("--data", help="Feature file (default: train_features)")
+    parser.add_argument("--artifact-dir", help="Model directory; cascade.json is written here")
+    parser.add_argument("--test-size", type=float, default=0.3)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=list(DEFAULT_THRESHOLDS))
+    parser.add_argument("--threshold", type=float, help="Use this threshold instead of choosing one")
+    parser.add_argument("--max-recall-loss", type=float, default=0.001,
+                        help="Recall loss budget when choosing the threshold")
+    parser.add_argument("--dry-run", action="store_true", help="Report only, don't write cascade.json")
+    parser.add_argument("--json-out", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)  # throughput comparable to one scoring worker
+    artifact_dir = args.artifact_dir or os.path.dirname(os.path.abspath(__file__))
+    model, scaler, label_encoder, device, use_real_model = load_artifacts(artifact_dir, torch.device("cpu"))
+    temperature = load_temperature(artifact_dir)
+    if not use_real_model:
+        print("⚠️ best_model.pth not found: cascading the untrained demo weights")
+
+    frame = read_features(args.data or os.path.join(artifact_dir, "train_features.csv"))
+    features = frame[FEATURE_NAMES].to_numpy(dtype=np.float64)
+    true_attack = None
+    if "Label" in frame.columns:
+        true_attack = ~frame["Label"].astype(str).str.lower().isin(BENIGN_CLASSES).to_numpy()
+
+    classes, _, _ = predict_batch(features, model, scaler, label_encoder, device, temperature)
+    model_attack = ~np.isin(np.char.lower(classes.astype(str)), BENIGN_CLASSES)
+
+    order = np.random.default_rng(0).permutation(len(features))
+    n_test = max(1, int(len(features) * args.test_size))
+    test, train = order[:n_test], order[n_test:]
+    if true_attack is not None and true_attack[train].any() and not true_attack[train].all():
+        target, source = ~true_attack[train], "labels"
+    else:
+        target, source = ~model_attack[train], "full-model predictions"
+    try:
+        prefilter = fit_prefilter(features[train], target, scaler)
+    except ValueError as e:
+        print(f"❌ {e}: every training row is {'benign' if target.all() else 'an attack'} by {source}. "
+              f"Pass --data with labeled attack rows, or train best_model.pth first.")
+        raise SystemExit(1)
+    print(f"📚 Pre-filter fit on {len(train):,} rows ({source}); evaluating on {len(test):,} held-out rows")
+
+    p_benign = prefilter.benign_probability(features[test])
+    rows = sweep(p_benign, model_attack[test], true_attack[test] if true_attack is not None else None,
+                 args.thresholds)
+    chosen = next((r for r in rows if r["threshold"] == args.threshold), None) if args.threshold else None
+    chosen = chosen or choose_threshold(rows, args.max_recall_loss)
+    prefilter.threshold = args.threshold or chosen["threshold"]
+    throughput = measure_throughput(features[test], prefilter, prefilter.threshold, model, scaler, label_encoder,
+                                    device, temperature)
+
+    has_labels = "recall_loss_vs_labels" in rows[0]
+    print(f"   {'threshold':>10}{'short-circuit':>15}{'recall loss':>13}" + (f"{'vs labels':>11}" if has_labels else ""))
+    for r in rows:
+        mark = " ← chosen" if r["threshold"] == prefilter.threshold else ""
+        print(f"   {r['threshold']:>10.3f}{r['short_circuit']:>15.2%}{r['recall_loss_vs_model']:>13.3%}"
+              + (f"{r['recall_loss_vs_labels']:>11.3%}" if has_labels else "") + mark)
+    print(f"⚡ Threshold {prefilter.threshold:g}: {throughput['full_rows_per_s']:,.0f} → "
+          f"{throughput['cascade_rows_per_s']:,.0f} rows/s ({throughput['speedup']:.2f}x)")
+
+    report = {"fit_on": source, "rows": rows, "threshold": prefilter.threshold, "throughput": throughput}
+    if not args.dry_run:
+        path = write_prefilter(artifact_dir, prefilter, report)
+        print(f"💾 Written to {path}")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,20 @@ import warnings
 import os, joblib
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 import requests
+import time
 from datetime import datetime
+from inference import (
+    FEATURE_NAMES, LightweightANN, INFERENCE_STAGE_LATENCY, ARTIFACT_LOAD_LATENCY,
+    predict_batch, predict_top_k, timed_load, get_recommendations_for_threat, determine_risk_level, ServingModel,
+    load_model_checkpoint, load_temperature, check_feature_row
+)
+from feature_schema import FeatureValidationError
+from feature_store import preferred_path, read_features
+from model_registry import ModelRegistry
+from drift_monitor import monitor_from_artifacts
+from attribution import AttributionEngine
+import metrics
+import tracing
 warnings.filterwarnings('ignore')
 
 # Set page config
@@ -84,38 +97,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# LightweightANN Model Definition (matching your architecture)
-class LightweightANN(nn.Module):
-    def __init__(self, input_size, num_classes):
-        super().__init__()
-        self.layers = nn.Sequential(
-            nn.Linear(input_size, 256),
-            nn.ReLU(),
-            nn.Dropout(0.3),
-            nn.Linear(256, 128),
-            nn.ReLU(),
-            nn.Dropout(0.2),
-            nn.Linear(128, 64),
-            nn.ReLU(),
-            nn.Dropout(0.1),
-            nn.Linear(64, num_classes)
-        )
-
-    def forward(self, x):
-        return self.layers(x)
-
-# Feature names (45 features as specified)
-FEATURE_NAMES = [
-    'Header_Length', 'Protocol_Type', 'Duration', 'Rate', 'Srate', 'Drate',
-    'fin_flag_number', 'syn_flag_number', 'rst_flag_number', 'psh_flag_number',
-    'ack_flag_number', 'ece_flag_number', 'cwr_flag_number',
-    'ack_count', 'syn_count', 'fin_count', 'rst_count',
-    'HTTP', 'HTTPS', 'DNS', 'Telnet', 'SMTP', 'SSH', 'IRC',
-    'TCP', 'UDP', 'DHCP', 'ARP', 'ICMP', 'IGMP', 'IPv', 'LLC',
-    'Tot_sum', 'Min', 'Max', 'AVG', 'Std', 'Tot_size', 'IAT',
-    'Number', 'Magnitude', 'Radius', 'Covariance', 'Variance', 'Weight'
-]
-
 # Sample data for quick testing (kept as before)
 SAMPLE_DATA = {
     'Benign Traffic': {
@@ -234,8 +215,14 @@ def _randomized_probabilities(features, label_encoder, FEATURE_NAMES, randomness
     return probs
 
 # --- new predict_threat function (replaces old) ---
-def send_analysis_to_frontend(threat_class, confidence, all_probabilities, features, feature_names):
-    """Send analysis results to React frontend via API bridge"""
+def send_analysis_to_frontend(threat_class, confidence, all_probabilities, features, feature_names,
+                              trace_context=None, attributions=None):
+    """Send analysis results to React frontend via API bridge.
+
+    trace_context (a tracing.SpanContext) is propagated in the payload and the
+    traceparent header so the bridge and dashboard spans join the same trace.
+    attributions (top contributing features from attribution.py) are sent when given.
+    """
     try:
         # Prepare the payload
         payload = {
@@ -248,11 +235,21 @@ def send_analysis_to_frontend(threat_class, confidence, all_probabilities, featu
             "timestamp": datetime.now().isoformat(),
             "model_used": "real" if st.session_state.get('use_real_model', False) else "demo"
         }
+        if os.environ.get("DEVICE_ID"):
+            # Which monitor/pump this traffic came from; the bridge keeps history per device
+            payload["device_id"] = os.environ["DEVICE_ID"]
+        if attributions:
+            payload["attributions"] = attributions
+        headers = {}
+        if trace_context is not None:
+            payload["trace_id"] = trace_context.trace_id
+            headers[tracing.TRACEPARENT_HEADER] = trace_context.traceparent
         
         # Send to API bridge
         response = requests.post(
             "https://secure-gluco.onrender.com/api/threat-analysis",  # Updated with actual Render URL
             json=payload,
+            headers=headers,
             timeout=3
         )
         
@@ -264,50 +261,49 @@ def send_analysis_to_frontend(threat_class, confidence, all_probabilities, featu
     except Exception as e:
         st.sidebar.info("ℹ️ React dashboard offline")
 
-def get_recommendations_for_threat(threat_class):
-    """Generate recommendations based on threat class"""
-    if threat_class.lower() in ['benign', 'normal']:
-        return ["✅ Traffic appears normal", "📊 Continue monitoring", "🔄 Keep systems updated"]
-    elif 'ddos' in threat_class.lower():
-        return ["🚨 Block source IP immediately", "🛡️ Activate DDoS protection", "📈 Scale infrastructure"]
-    elif 'port' in threat_class.lower() or 'scan' in threat_class.lower():
-        return ["🔒 Block scanning IP", "🔍 Strengthen firewall rules", "🔧 Check vulnerabilities"]
-    else:
-        return ["⚠️ Investigate threat immediately", "🛡️ Implement security measures", "📞 Contact security team"]
-
-def determine_risk_level(threat_class, confidence):
-    """Determine risk level"""
-    if threat_class.lower() in ['benign', 'normal']:
-        return "Low"
-    elif 'ddos' in threat_class.lower():
-        return "Critical" if confidence > 0.8 else "High"
-    else:
-        return "High" if confidence > 0.8 else "Medium"
-
-def predict_threat(features, model, scaler, label_encoder, device, use_real_model):
+def predict_threat(features, model, scaler, label_encoder, device, use_real_model, registry=None, bundle=None,
+                   temperature=1.0, top_k=None):
     """Make prediction using the trained model or randomized simulation.
 
     When use_real_model True: unchanged — uses model/scaler/label_encoder.
     When use_real_model False: returns randomized probabilities influenced by features.
+    With a model registry, the serving bundle snapshot scores the row and a sampled
+    fraction is shadow-scored by the candidate off the request path.
+    Confidence is temperature-calibrated (calibration.json) when the bundle carries one.
+    With top_k set, only the top_k classes are returned in the probability map.
+    Features are checked against the schema first (the only check on this path):
+    out-of-range values are clipped, and rows that can't be scored raise
+    FeatureValidationError.
+    Returns (threat_class, confidence, all_probabilities, features as scored, issues clipped away).
     """
+    features, issues = check_feature_row(features)
+    if use_real_model and model is not None and top_k:
+        temperature = bundle.temperature if bundle is not None else temperature
+        if registry is not None:
+            registry.observe([features])
+        top_classes, top_probabilities = predict_top_k([features], model, scaler, label_encoder, device,
+                                                       top_k, temperature)
+        all_probabilities = {str(c): float(p) for c, p in zip(top_classes[0], top_probabilities[0])}
+        return str(top_classes[0][0]), float(top_probabilities[0][0]), all_probabilities, features, issues
+
     if use_real_model and model is not None:
-        # Real model prediction (unchanged)
-        features_scaled = scaler.transform([features])
-        features_tensor = torch.tensor(features_scaled, dtype=torch.float32).to(device)
-
-        with torch.no_grad():
-            outputs = model(features_tensor)
-            probabilities = torch.softmax(outputs, dim=1)
-            predicted_class = torch.argmax(probabilities, dim=1).item()
-            confidence = probabilities[0][predicted_class].item()
-
-        threat_class = label_encoder.inverse_transform([predicted_class])[0]
-        all_probabilities = {
-            label_encoder.classes_[i]: probabilities[0][i].item()
-            for i in range(len(label_encoder.classes_))
-        }
+        # Real model prediction (batch of one through the instrumented predictor)
+        if registry is not None:
+            threat_classes, confidences, probabilities = registry.predict([features], bundle)
+        else:
+            threat_classes, confidences, probabilities = predict_batch(
+                [features], model, scaler, label_encoder, device, temperature
+            )
+
+        with INFERENCE_STAGE_LATENCY.time(stage="materialize"):
+            threat_class = threat_classes[0]
+            confidence = float(confidences[0])
+            all_probabilities = {
+                label_encoder.classes_[i]: float(probabilities[0][i])
+                for i in range(len(label_encoder.classes_))
+            }
 
-        return threat_class, confidence, all_probabilities
+        return threat_class, confidence, all_probabilities, features, issues
 
     else:
         # Demo/simulation mode: generate randomized predictions influenced by features
@@ -319,7 +315,10 @@ def predict_threat(features, model, scaler, label_encoder, device, use_real_mode
         confidence = float(probs[sampled_idx])
 
         all_probabilities = {label_encoder.classes_[i]: float(probs[i]) for i in range(len(probs))}
-        return predicted_label, confidence, all_probabilities
+        return predicted_label, confidence, all_probabilities, features, issues
+
+# Number of times the cached loader body actually ran (used to derive cache hit rate)
+_artifact_loads = 0
 
 @st.cache_resource
 def load_model_and_preprocessors():
@@ -327,6 +326,9 @@ def load_model_and_preprocessors():
     Attempts to load scaler, label encoder and model. If files are missing, creates safe fallbacks.
     Returns: model, scaler, label_encoder, device, use_real_model
     """
+    global _artifact_loads
+    _artifact_loads += 1
+    load_start = time.perf_counter()
     base = os.path.dirname(__file__)  # folder containing the app file
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
@@ -361,7 +363,7 @@ def load_model_and_preprocessors():
     for sf in possible_scaler_files:
         if os.path.exists(sf):
             try:
-                scaler = joblib.load(sf)
+                scaler = timed_load("scaler", joblib.load, sf)
                 fallback_source = f"loaded_scaler:{os.path.basename(sf)}"
                 break
             except Exception:
@@ -371,23 +373,23 @@ def load_model_and_preprocessors():
     for lf in possible_le_files:
         if os.path.exists(lf):
             try:
-                label_encoder = joblib.load(lf)
+                label_encoder = timed_load("label_encoder", joblib.load, lf)
                 fallback_source = (fallback_source or "") + f", loaded_label_encoder:{os.path.basename(lf)}"
                 break
             except Exception:
                 label_encoder = None
 
-    # If either missing, try to infer from train_features.csv
-    train_csv_path = os.path.join(base, "train_features.csv")
+    # If either missing, try to infer from train_features (typed Parquet copy preferred)
+    train_csv_path = preferred_path(os.path.join(base, "train_features.csv"))
     if (scaler is None or label_encoder is None) and os.path.exists(train_csv_path):
         try:
-            df_train = pd.read_csv(train_csv_path)
+            df_train = read_features(train_csv_path)
             # Ensure columns exist
             if set(FEATURE_NAMES).issubset(set(df_train.columns)):
-                X_train = df_train[FEATURE_NAMES].values
+                X_train = df_train[FEATURE_NAMES].to_numpy(dtype=np.float64)
                 scaler = StandardScaler().fit(X_train) if scaler is None else scaler
                 if 'Label' in df_train.columns and label_encoder is None:
-                    le_tmp = LabelEncoder().fit(df_train['Label'].values)
+                    le_tmp = LabelEncoder().fit(df_train['Label'].astype(str).values)
                     label_encoder = le_tmp
                 fallback_source = (fallback_source or "") + ", loaded_from_train_csv"
         except Exception:
@@ -406,8 +408,9 @@ def load_model_and_preprocessors():
         model_path = os.path.join(base, 'best_model.pth')
         if os.path.exists(model_path):
             try:
-                model.load_state_dict(torch.load(model_path, map_location=device))
-                model.eval()
+                # Bare state dicts and pruned/resized checkpoints (architecture recorded) both load
+                model = timed_load("model", load_model_checkpoint, model_path, num_classes, device)
+                model.to(device).eval()
                 use_real_model = True
                 fallback_source = (fallback_source or "") + f", loaded_model:{os.path.basename(model_path)}"
             except Exception as e:
@@ -427,9 +430,64 @@ def load_model_and_preprocessors():
         use_real_model = False
         fallback_source = (fallback_source or "") + f", fallback_exception:{str(e)[:80]}"
 
+    ARTIFACT_LOAD_LATENCY.observe(time.perf_counter() - load_start, artifact="bundle")
     return model, scaler, label_encoder, device, use_real_model, fallback_source
 
+@st.cache_resource
+def get_model_registry(_model, _scaler, _label_encoder, _device):
+    """
+    Process-wide holder for the scoring bundle. Predictions snapshot it per request,
+    so a swap never disturbs an in-flight analysis. The registry reloads the app
+    directory's artifacts when they change (no restart needed) and, with
+    SHADOW_CANDIDATE_DIR set, shadow-scores SHADOW_FRACTION of requests with a candidate.
+    Scored rows also feed the drift/OOD monitor (disable with DRIFT_MONITOR=0).
+    With ONLINE_UPDATE_BRIDGE set, a background thread fine-tunes from analyst labels
+    and checkpoints each round through the registry, so a reload never drops it.
+    """
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    serving = ServingModel(_model, _scaler, _label_encoder, _device, temperature=load_temperature(base_dir))
+    registry = ModelRegistry(
+        serving, base_dir,
+        candidate_dir=os.environ.get("SHADOW_CANDIDATE_DIR"),
+        shadow_fraction=float(os.environ.get("SHADOW_FRACTION", 0.1)),
+        poll_interval=float(os.environ.get("MODEL_RELOAD_INTERVAL", 5)),
+        monitor=monitor_from_artifacts(_scaler, base_dir) if os.environ.get("DRIFT_MONITOR", "1") != "0" else None,
+    ).start()
+    bridge_url = os.environ.get("ONLINE_UPDATE_BRIDGE")
+    if bridge_url:
+        from online_update import start_background_updater
+        start_background_updater(serving, bridge_url,
+                                 interval=float(os.environ.get("ONLINE_UPDATE_INTERVAL", 60)), registry=registry)
+    return registry
+
+@st.cache_resource
+def get_attribution_engine():
+    """
+    Shared "why was this flagged" engine (cached per analysed row and model version).
+    ATTRIBUTION_METHOD picks input_x_gradient (default) or integrated_gradients, or
+    "off"; ATTRIBUTION_TOP_K and ATTRIBUTION_STEPS bound the work per analysis.
+    """
+    method = os.environ.get("ATTRIBUTION_METHOD", "input_x_gradient")
+    if method == "off":
+        return None
+    return AttributionEngine(method, steps=int(os.environ.get("ATTRIBUTION_STEPS", 16)),
+                             top_k=int(os.environ.get("ATTRIBUTION_TOP_K", 5)))
+
+@st.cache_resource
+def start_metrics_exporter():
+    """Expose app metrics on METRICS_PORT (once per process); disabled when unset"""
+    port = os.environ.get("METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return metrics.start_metrics_server(int(port))
+    except OSError as e:
+        print(f"Could not start metrics server on port {port}: {e}")
+        return None
+
 def main():
+    start_metrics_exporter()
+
     # Header
     st.markdown("""
     <div class="main-header">
@@ -441,7 +499,9 @@ def main():
 
     # Load model and preprocessors
     # NOTE: load_model_and_preprocessors now returns an extra 'fallback_source' for debugging
+    loads_before = _artifact_loads
     loaded = load_model_and_preprocessors()
+    metrics.record_cache("model_artifacts", hit=_artifact_loads == loads_before)
     if len(loaded) == 6:
         model, scaler, label_encoder, device, use_real_model, fallback_source = loaded
     else:
@@ -449,6 +509,12 @@ def main():
         model, scaler, label_encoder, device, use_real_model = loaded
         fallback_source = "unknown"
 
+    # Score with whatever bundle is currently being served (hot reloads and online updates swap it)
+    registry = get_model_registry(model, scaler, label_encoder, device)
+    bundle = registry.serving.current()
+    model, scaler, label_encoder = bundle.model, bundle.scaler, bundle.label_encoder
+    use_real_model = use_real_model or registry.loaded_from_file
+
     # Model status indicator
     if use_real_model:
         st.success("✅ **Real Model Loaded** - Using trained LightweightANN model")
@@ -582,23 +648,44 @@ def main():
 
         # Analysis button
         if st.button("🔍 Analyze Network Traffic", type="primary", use_container_width=True):
-            with st.spinner("🧠 AI Model Processing..."):
+            with st.spinner("🧠 AI Model Processing..."), \
+                    tracing.span("streamlit.analyze", service="streamlit") as trace_root:
                 # Prepare features in correct order
                 features = [feature_values[name] for name in FEATURE_NAMES]
 
-                # Make prediction
-                threat_class, confidence, all_probabilities = predict_threat(
-                    features, model, scaler, label_encoder, device, use_real_model
-                )
+                # Make prediction (validates the row; features come back clipped to the schema)
+                with tracing.span("streamlit.predict_threat", parent=trace_root, real_model=bool(use_real_model)):
+                    try:
+                        threat_class, confidence, all_probabilities, features, feature_issues = predict_threat(
+                            features, model, scaler, label_encoder, device, use_real_model,
+                            registry=registry, bundle=bundle, temperature=bundle.temperature,
+                            top_k=int(os.environ.get("PREDICT_TOP_K", 0)) or None
+                        )
+                    except FeatureValidationError as e:
+                        st.error(f"❌ {e}")
+                        st.stop()
+                if feature_issues:
+                    st.warning("⚠️ Adjusted to the valid range: " + ", ".join(feature_issues))
+
+                # Explain the prediction (real model only; demo predictions are simulated)
+                attributions = None
+                engine = get_attribution_engine()
+                if use_real_model and engine is not None:
+                    with tracing.span("streamlit.attribution", parent=trace_root, method=engine.method):
+                        attributions = engine.explain([features], bundle.model, bundle.scaler, bundle.device,
+                                                      version=bundle.version)[0]
 
                 # Send data to React frontend
-                send_analysis_to_frontend(threat_class, confidence, all_probabilities, features, FEATURE_NAMES)
+                with tracing.span("streamlit.send_analysis_to_frontend", parent=trace_root) as send_span:
+                    send_analysis_to_frontend(threat_class, confidence, all_probabilities, features, FEATURE_NAMES,
+                                              trace_context=send_span, attributions=attributions)
 
                 # Store results in session state
                 st.session_state.prediction_results = {
                     'threat_class': threat_class,
                     'confidence': confidence,
-                    'probabilities': all_probabilities
+                    'probabilities': all_probabilities,
+                    'attributions': attributions
                 }
                 st.session_state.use_real_model = use_real_model
 
@@ -669,6 +756,18 @@ def main():
             prob_fig.update_layout(height=400)
             st.plotly_chart(prob_fig, use_container_width=True)
 
+            # Feature attributions
+            if results.get('attributions'):
+                st.subheader("🔍 Why This Prediction")
+                attr_df = pd.DataFrame(results['attributions'])
+                attr_fig = px.bar(
+                    attr_df[::-1], x='attribution', y='feature', orientation='h',
+                    color='attribution', color_continuous_scale='RdBu_r',
+                    hover_data=['value'], title="Top Contributing Features"
+                )
+                attr_fig.update_layout(height=300)
+                st.plotly_chart(attr_fig, use_container_width=True)
+
             # Security recommendations
             st.subheader("🛡️ Security Recommendations")
             if results['threat_class'].lower() in ['benign', 'normal']:
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Knowledge distillation of the ANN-LSTM hybrid into a compact MLP student.
+
+The teacher (ANN_LSTM_IDS: per-step MLP, bidirectional LSTM and 8-head attention
+over windows of 10 consecutive flows) is accurate but costly per prediction.
+The student sees the same window, collapsed into summary features
+(last row, mean and std of every feature, i.e. 3 x 45 inputs). It is trained
+against the teacher's temperature-softened probabilities, blended with the hard
+labels:
+
+    loss = alpha * T^2 * KL(softmax(teacher / T) || softmax(student / T))
+           + (1 - alpha) * CE(student, label)
+
+Two students are available:
+    ann     LightweightANN widths (256→128→64) over the window summary
+    narrow  a 64→32 MLP over the same inputs
+
+The report compares teacher and student on a held-out split: accuracy,
+agreement with the teacher, parameter count, batch throughput and single-window
+latency.
+
+Teacher weights come from the notebook (best_ann_lstm_model.pth). They must be
+trained on the 45 FEATURE_NAMES columns. Without them, --teacher-epochs trains a
+teacher here first.
+
+Usage:
+    python distill.py --data labeled_features.parquet --teacher best_ann_lstm_model.pth
+    python distill.py --data labeled_features.csv --teacher-epochs 5 --student narrow --json-out distill.json
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from numpy.lib.stride_tricks import sliding_window_view
+
+from inference import FEATURE_NAMES, ANN_LSTM_IDS, LightweightANN
+
+STUDENT_HIDDEN_SIZES = {"ann": (256, 128, 64), "narrow": (64, 32)}
+
+
+# -------------------------------
+# Windows
+# -------------------------------
+def make_windows(features, labels, seq_len=10):
+    """
+    Sliding windows over consecutive rows, labelled by their last row (as in the
+    notebook's create_sequences). Returns a (N - seq_len + 1, seq_len, F) view, not a copy.
+    """
+    windows = sliding_window_view(features, seq_len, axis=0).transpose(0, 2, 1)
+    return windows, labels[seq_len - 1:]
+
+
+def window_summary(windows):
+    """(N, seq_len, F) → (N, 3F): last row, mean and std per feature"""
+    windows = np.asarray(windows, dtype=np.float32)
+    return np.concatenate([windows[:, -1], windows.mean(axis=1), windows.std(axis=1)], axis=1)
+
+
+def build_student(kind, num_features, num_classes):
+    return LightweightANN(3 * num_features, num_classes, hidden_sizes=STUDENT_HIDDEN_SIZES[kind])
+
+
+def load_teacher(path, num_classes, device):
+    state = torch.load(path, map_location=device)
+    input_size = state["feature_extractor.0.weight"].shape[1]
+    if input_size != len(FEATURE_NAMES):
+        raise ValueError(f"Teacher expects {input_size} features, the app serves {len(FEATURE_NAMES)}; "
+                         "retrain it on FEATURE_NAMES or use --teacher-epochs")
+    teacher = ANN_LSTM_IDS(input_size, num_classes)
+    teacher.load_state_dict(state)
+    return teacher.to(device).eval()
+
+
+# -------------------------------
+# Training
+# -------------------------------
+def _batches(n, batch_size, rng):
+    order = rng.permutation(n)
+    for lo in range(0, n, batch_size):
+        yield order[lo:lo + batch_size]
+
+
+def train_teacher(windows, labels, num_classes, epochs=5, batch_size=512, lr=1e-3, device=None, seed=0):
+    device = device or torch.device("cpu")
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+    teacher = ANN_LSTM_IDS(windows.shape[2], num_classes).to(device)
+    optimizer = torch.optim.Adam(teacher.parameters(), lr=lr)
+    for _ in range(epochs):
+        teacher.train()
+        for idx in _batches(len(windows), batch_size, rng):
+            x = torch.as_tensor(np.ascontiguousarray(windows[idx]), dtype=torch.float32, device=device)
+            y = torch.as_tensor(labels[idx], dtype=torch.long, device=device)
+            optimizer.zero_grad()
+            F.cross_entropy(teacher(x), y).backward()
+            optimizer.step()
+    return teacher.eval()
+
+
+@torch.no_grad()
+def teacher_logits(teacher, windows, batch_size=2048, device=None):
+    device = device or next(teacher.parameters()).device
+    out = [
+        teacher(torch.as_tensor(np.ascontiguousarray(windows[lo:lo + batch_size]), dtype=torch.float32,
+                                device=device)).cpu()
+        for lo in range(0, len(windows), batch_size)
+    ]
+    return torch.cat(out) if out else torch.empty(0)
+
+
+def distill(student, summaries, labels, soft_logits, epochs=10, batch_size=512, lr=1e-3,
+            temperature=4.0, alpha=0.7, device=None, seed=0):
+    """Train the student on teacher logits + hard labels; returns per-epoch mean loss"""
+    device = device or torch.device("cpu")
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+    student.to(device)
+    optimizer = torch.optim.Adam(student.parameters(), lr=lr)
+    summaries_t = torch.as_tensor(summaries, dtype=torch.float32)
+    labels_t = torch.as_tensor(labels, dtype=torch.long)
+    history = []
+    for _ in range(epochs):
+        student.train()
+        losses = []
+        for idx in _batches(len(summaries), batch_size, rng):
+            x, y, t = summaries_t[idx].to(device), labels_t[idx].to(device), soft_logits[idx].to(device)
+            logits = student(x)
+            soft = F.kl_div(F.log_softmax(logits / temperature, dim=1), F.softmax(t / temperature, dim=1),
+                            reduction="batchmean") * temperature ** 2
+            loss = alpha * soft + (1 - alpha) * F.cross_entropy(logits, y)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            losses.append(float(loss.item()))
+        history.append(float(np.mean(losses)))
+    return student.eval(), history
+
+
+# -------------------------------
+# Report
+# -------------------------------
+@torch.no_grad()
+def measure_latency(model, sample, batch_size=1024, repeats=20):
+    """(ms per batch_size rows, p50 ms for a single row) on the current torch thread count"""
+    model.eval()
+    batch = sample[:batch_size]
+    single = sample[:1]
+    model(batch)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model(batch)
+    batch_ms = 1000 * (time.perf_counter() - start) / repeats
+    singles = []
+    for _ in range(repeats * 5):
+        t0 = time.perf_counter()
+        model(single)
+        singles.append(time.perf_counter() - t0)
+    return batch_ms, 1000 * float(np.median(singles))
+
+
+def compare(teacher, student, test_windows, test_labels, batch_size=1024):
+    test_windows = np.ascontiguousarray(test_windows, dtype=np.float32)
+    teacher_pred = teacher_logits(teacher, test_windows).argmax(dim=1).numpy()
+    summaries = torch.as_tensor(window_summary(test_windows))
+    with torch.no_grad():
+        student_pred = student(summaries).argmax(dim=1).numpy()
+
+    report = {"rows": int(len(test_labels))}
+    for name, model, pred, sample in (
+        ("teacher", teacher, teacher_pred, torch.as_tensor(test_windows)),
+        ("student", student, student_pred, summaries),
+    ):
+        batch_ms, single_ms = measure_latency(model, sample, batch_size)
+        report[name] = {
+            "accuracy": round(float((pred == test_labels).mean()), 4),
+            "params": int(sum(p.numel() for p in model.parameters())),
+            "batch_ms": round(batch_ms, 3),
+            "rows_per_second": round(min(batch_size, len(sample)) / max(batch_ms / 1000, 1e-9), 1),
+            "single_ms": round(single_ms, 4),
+        }
+    report["agreement"] = round(float((teacher_pred == student_pred).mean()), 4)
+    report["speedup"] = round(report["teacher"]["batch_ms"] / max(report["student"]["batch_ms"], 1e-9), 2)
+    return report
+
+
+def run(features, labels, num_classes, teacher=None, student_kind="ann", seq_len=10, test_size=0.2,
+        teacher_epochs=5, epochs=10, temperature=4.0, alpha=0.7, batch_size=512, seed=0, device=None):
+    """Windows → (teacher) → distilled student; returns (teacher, student, report)"""
+    device = device or torch.device("cpu")
+    windows, window_labels = make_windows(np.asarray(features, dtype=np.float32), np.asarray(labels), seq_len)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(windows))
+    n_test = max(1, int(len(order) * test_size))
+    test_idx, train_idx = order[:n_test], order[n_test:]
+
+    if teacher is None:
+        teacher = train_teacher(windows[train_idx], window_labels[train_idx], num_classes, teacher_epochs,
+                                batch_size, device=device, seed=seed)
+    soft = teacher_logits(teacher, windows[train_idx], device=device)
+    student = build_student(student_kind, windows.shape[2], num_classes)
+    student, history = distill(student, window_summary(windows[train_idx]), window_labels[train_idx], soft,
+                               epochs, batch_size, temperature=temperature, alpha=alpha, device=device, seed=seed)
+
+    teacher.cpu(), student.cpu()
+    report = compare(teacher, student, windows[test_idx], window_labels[test_idx])
+    report.update(student_kind=student_kind, seq_len=seq_len, temperature=temperature, alpha=alpha,
+                  distill_loss=[round(h, 4) for h in history])
+    return teacher, student, report
+
+
+def save_student(path, student, student_kind, seq_len, class_names):
+    torch.save({
+        "state_dict": student.state_dict(),
+        "architecture": {"kind": "window_summary", "hidden_sizes": list(STUDENT_HIDDEN_SIZES[student_kind]),
+                         "input_size": 3 * len(FEATURE_NAMES), "seq_len": seq_len},
+        "classes": [str(c) for c in class_names],
+    }, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def main():
+    from feature_store import read_features
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+    parser = argparse.ArgumentParser(description="Distill the ANN-LSTM teacher into a compact MLP student")
+    parser.add_argument("--data", required=True, help="Labeled feature file (FEATURE_NAMES + Label), in flow order")
+    parser.add_argument("--teacher", help="ANN_LSTM_IDS state dict (e.g. best_ann_lstm_model.pth)")
+    parser.add_argument("--teacher-epochs", type=int, default=5, help="Train a teacher first when --teacher is unset")
+    parser.add_argument("--save-teacher", help="Where to save a teacher trained here")
+    parser.add_argument("--student", choices=sorted(STUDENT_HIDDEN_SIZES), default="ann")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--seq-len", type=int, default=10)
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--alpha", type=float, default=0.7, help="Weight of the soft-label term")
+    parser.add_argument("--output", default="distilled_student.pth")
+    parser.add_argument("--json-out", help="Write the accuracy/latency report as JSON")
+    args = parser.parse_args()
+
+    frame = read_features(args.data)
+    scaler = StandardScaler().fit(frame[FEATURE_NAMES].to_numpy(dtype=np.float64))
+    features = scaler.transform(frame[FEATURE_NAMES].to_numpy(dtype=np.float64)).astype(np.float32)
+    label_encoder = LabelEncoder().fit(frame["Label"].astype(str))
+    labels = label_encoder.transform(frame["Label"].astype(str))
+    num_classes = len(label_encoder.classes_)
+    print(f"📚 {len(frame):,} rows, {num_classes} classes, windows of {args.seq_len}")
+
+    teacher = load_teacher(args.teacher, num_classes, torch.device("cpu")) if args.teacher else None
+    teacher, student, report = run(features, labels, num_classes, teacher, args.student, args.seq_len,
+                                   teacher_epochs=args.teacher_epochs, epochs=args.epochs,
+                                   temperature=args.temperature, alpha=args.alpha)
+    if args.save_teacher and not args.teacher:
+        torch.save(teacher.state_dict(), args.save_teacher)
+
+    print(f"{'':<10}{'accuracy':>10}{'params':>12}{'ms/1k rows':>12}{'rows/s':>12}{'ms/row':>10}")
+    for name in ("teacher", "student"):
+        r = report[name]
+        print(f"{name:<10}{r['accuracy']:>10.2%}{r['params']:>12,}{r['batch_ms']:>12.2f}"
+              f"{r['rows_per_second']:>12,.0f}{r['single_ms']:>10.3f}")
+    print(f"🤝 Student agrees with teacher on {report['agreement']:.2%}; {report['speedup']:.1f}x faster per batch")
+
+    save_student(args.output, student, args.student, args.seq_len, label_encoder.classes_)
+    print(f"💾 Student saved to {args.output}")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
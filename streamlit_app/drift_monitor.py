@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Streaming drift and out-of-distribution monitor for incoming feature vectors.
+
+The StandardScaler remembers the training distribution (mean_, var_). Traffic
+that drifts away from it still gets confident-looking predictions, so
+DriftMonitor watches what is actually being scored, in fixed memory:
+
+    running moments   per-feature count/mean/M2, merged per batch with Chan's
+                      parallel Welford update (exact, numerically stable)
+    quantile sketch   per-feature fixed-bin histogram in scaled space
+                      (N_BINS bins over ±BIN_RANGE standard deviations plus two
+                      overflow bins), so quantiles and PSI come from bin counts
+    OOD flag          squared Mahalanobis distance of each scaled row, with the
+                      precision matrix of the reference data when fit_reference()
+                      was called (identity otherwise), above a threshold taken
+                      from the reference distances (or a chi-square quantile)
+
+Drift scores compare the live stream against the scaler's statistics:
+    z       |live mean - train mean| / train std   (per feature)
+    ratio   live std / train std                   (per feature)
+    psi     population stability index against the reference histogram
+
+observe() is a handful of vectorized numpy operations per batch; gauges are
+refreshed every `publish_every` rows, so the per-row cost stays at a few
+microseconds even for single-row calls.
+
+Usage:
+    python drift_monitor.py live_features.parquet            # drift report against train_features
+"""
+
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+from inference import FEATURE_NAMES
+import metrics
+
+N_BINS = 64
+BIN_RANGE = 8.0
+
+DRIFT_ROWS = metrics.counter("drift_rows_total", "Feature rows seen by the drift monitor")
+OOD_ROWS = metrics.counter("ood_rows_total", "Rows flagged out-of-distribution (Mahalanobis distance)")
+OOD_FRACTION = metrics.gauge("ood_fraction", "Share of monitored rows flagged out-of-distribution")
+FEATURE_DRIFT_Z = metrics.gauge("feature_drift_zscore", "|live mean - train mean| / train std", ("feature",))
+FEATURE_STD_RATIO = metrics.gauge("feature_std_ratio", "Live std / train std", ("feature",))
+FEATURE_PSI = metrics.gauge("feature_psi", "Population stability index vs the reference histogram", ("feature",))
+DRIFT_MAX_Z = metrics.gauge("drift_max_zscore", "Largest per-feature mean shift in train standard deviations")
+DRIFT_MAX_PSI = metrics.gauge("drift_max_psi", "Largest per-feature population stability index")
+
+
+def _bin_edges():
+    return np.linspace(-BIN_RANGE, BIN_RANGE, N_BINS + 1)
+
+
+def _histogram(scaled):
+    """(N, F) scaled rows → (F, N_BINS + 2) counts; bins 0 and -1 catch the overflow"""
+    n_features = scaled.shape[1]
+    bins = np.clip(((scaled + BIN_RANGE) * (N_BINS / (2 * BIN_RANGE))).astype(np.int64) + 1, 0, N_BINS + 1)
+    bins[scaled < -BIN_RANGE] = 0
+    offsets = bins + np.arange(n_features) * (N_BINS + 2)
+    return np.bincount(offsets.ravel(), minlength=n_features * (N_BINS + 2)).reshape(n_features, N_BINS + 2)
+
+
+class DriftMonitor:
+    """Fixed-memory running statistics and OOD flags for scored feature rows"""
+
+    def __init__(self, scaler, feature_names=FEATURE_NAMES, ood_quantile=0.999, publish_every=256):
+        self.feature_names = list(feature_names)
+        self.train_mean = np.asarray(scaler.mean_, dtype=np.float64)
+        self.train_std = np.sqrt(np.asarray(scaler.var_, dtype=np.float64))
+        self.train_std[self.train_std == 0] = 1.0
+        self.ood_quantile = ood_quantile
+        self.publish_every = publish_every
+
+        n = len(self.feature_names)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.histogram = np.zeros((n, N_BINS + 2), dtype=np.int64)
+        self.ood_count = 0
+        self._since_publish = 0
+
+        self.precision = None
+        self.reference_histogram = None
+        from scipy.stats import chi2
+        self.ood_threshold = float(chi2.ppf(ood_quantile, df=n))
+
+    def _scale(self, features):
+        return (np.asarray(features, dtype=np.float64).reshape(-1, len(self.feature_names)) - self.train_mean) \
+            / self.train_std
+
+    def fit_reference(self, features, shrinkage=0.05):
+        """
+        Use in-distribution rows (e.g. train_features) for the Mahalanobis precision
+        matrix, the OOD threshold and the PSI reference histogram.
+        """
+        scaled = self._scale(features)
+        covariance = np.cov(scaled, rowvar=False)
+        covariance = (1 - shrinkage) * covariance + shrinkage * np.eye(len(covariance))  # keep it invertible
+        self.precision = np.linalg.inv(covariance)
+        self.ood_threshold = float(np.quantile(self.distances(scaled, scaled=True), self.ood_quantile))
+        self.reference_histogram = _histogram(scaled)
+        return self
+
+    def distances(self, features, scaled=False):
+        """Squared Mahalanobis distance of each row in scaled space"""
+        z = features if scaled else self._scale(features)
+        if self.precision is None:
+            return np.einsum("ij,ij->i", z, z)
+        return np.einsum("ij,jk,ik->i", z, self.precision, z)
+
+    def observe(self, features):
+        """Fold a batch into the running statistics; returns the per-row OOD mask"""
+        scaled = self._scale(features)
+        d2 = self.distances(scaled, scaled=True)
+        ood = d2 > self.ood_threshold
+
+        n_b = len(scaled)
+        mean_b = scaled.mean(axis=0)
+        m2_b = ((scaled - mean_b) ** 2).sum(axis=0)
+        histogram = _histogram(scaled)
+        with self._lock:
+            n_a = self.count
+            total = n_a + n_b
+            delta = mean_b - self.mean
+            self.mean += delta * (n_b / total)
+            self.m2 += m2_b + delta ** 2 * (n_a * n_b / total)
+            self.count = total
+            self.histogram += histogram
+            self.ood_count += int(ood.sum())
+            self._since_publish += n_b
+            publish = self._since_publish >= self.publish_every
+            if publish:
+                self._since_publish = 0
+
+        DRIFT_ROWS.inc(n_b)
+        if ood.any():
+            OOD_ROWS.inc(int(ood.sum()))
+        if publish:
+            self.publish()
+        return ood
+
+    # -------------------------------
+    # Scores
+    # -------------------------------
+    def quantiles(self, qs=(0.5, 0.99)):
+        """Per-feature quantiles from the sketch, in raw (unscaled) units; shape (len(qs), F)"""
+        with self._lock:
+            histogram = self.histogram.copy()
+        edges = _bin_edges()
+        cumulative = np.cumsum(histogram, axis=1)
+        totals = np.maximum(cumulative[:, -1], 1)
+        out = np.empty((len(qs), histogram.shape[0]))
+        for i, q in enumerate(qs):
+            target = q * totals
+            b = np.argmax(cumulative >= target[:, None], axis=1)  # sketch bin holding the quantile
+            inner = np.clip(b - 1, 0, N_BINS - 1)
+            below = np.where(b > 0, cumulative[np.arange(len(b)), np.maximum(b - 1, 0)], 0)
+            in_bin = np.maximum(histogram[np.arange(len(b)), b], 1)
+            fraction = np.clip((target - below) / in_bin, 0, 1)
+            lo, hi = edges[inner], edges[inner + 1]
+            value = np.where(b == 0, -BIN_RANGE, np.where(b == N_BINS + 1, BIN_RANGE, lo + fraction * (hi - lo)))
+            out[i] = value * self.train_std + self.train_mean
+        return out
+
+    def psi(self, eps=1e-4):
+        """Population stability index per feature (needs fit_reference); None otherwise"""
+        if self.reference_histogram is None:
+            return None
+        with self._lock:
+            live = self.histogram.astype(np.float64)
+        reference = self.reference_histogram.astype(np.float64)
+        p = live / np.maximum(live.sum(axis=1, keepdims=True), 1) + eps
+        r = reference / np.maximum(reference.sum(axis=1, keepdims=True), 1) + eps
+        return ((p - r) * np.log(p / r)).sum(axis=1)
+
+    def report(self):
+        with self._lock:
+            count, mean, m2, ood_count = self.count, self.mean.copy(), self.m2.copy(), self.ood_count
+        std = np.sqrt(m2 / max(count - 1, 1))
+        z = np.abs(mean)  # scaled space: train mean is 0 and train std is 1
+        psi = self.psi()
+        order = np.argsort(-(psi if psi is not None else z))
+        return {
+            "rows": count,
+            "ood_rows": ood_count,
+            "ood_fraction": round(ood_count / max(count, 1), 6),
+            "ood_threshold": round(self.ood_threshold, 3),
+            "max_zscore": round(float(z.max()), 4) if count else 0.0,
+            "max_psi": round(float(psi.max()), 4) if psi is not None and count else None,
+            "features": [
+                {"feature": self.feature_names[i], "zscore": round(float(z[i]), 4),
+                 "std_ratio": round(float(std[i]), 4),
+                 **({"psi": round(float(psi[i]), 4)} if psi is not None else {})}
+                for i in order
+            ],
+        }
+
+    def publish(self):
+        """Refresh the drift gauges (called every publish_every rows)"""
+        with self._lock:
+            count, mean, m2, ood_count = self.count, self.mean.copy(), self.m2.copy(), self.ood_count
+        if not count:
+            return
+        std = np.sqrt(m2 / max(count - 1, 1))
+        z = np.abs(mean)
+        for name, zi, si in zip(self.feature_names, z, std):
+            FEATURE_DRIFT_Z.set(zi, feature=name)
+            FEATURE_STD_RATIO.set(si, feature=name)
+        DRIFT_MAX_Z.set(z.max())
+        OOD_FRACTION.set(ood_count / count)
+        psi = self.psi()
+        if psi is not None:
+            for name, value in zip(self.feature_names, psi):
+                FEATURE_PSI.set(value, feature=name)
+            DRIFT_MAX_PSI.set(psi.max())
+
+
+def monitor_from_artifacts(scaler, base_dir=None, reference_rows=20000):
+    """DriftMonitor with the reference fitted on (a sample of) train_features when it is available"""
+    from feature_store import read_features
+
+    monitor = DriftMonitor(scaler)
+    base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+    try:
+        train = read_features(os.path.join(base_dir, "train_features.csv"), columns=FEATURE_NAMES)
+    except Exception as e:
+        print(f"Drift monitor without reference data: {e}")
+        return monitor
+    reference = train.to_numpy(dtype=np.float64)
+    if len(reference) > reference_rows:
+        reference = reference[np.random.default_rng(0).choice(len(reference), reference_rows, replace=False)]
+    return monitor.fit_reference(reference)
+
+
+def main():
+    from feature_store import read_features
+    from inference import load_artifacts
+
+    parser = argparse.ArgumentParser(description="Drift/OOD report for a feature file against the training scaler")
+    parser.add_argument("path", help="CSV or Parquet file with the 45 FEATURE_NAMES columns")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--top", type=int, default=10, help="Most drifted features to print")
+    parser.add_argument("--json-out", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    _, scaler, _, _, _ = load_artifacts()
+    monitor = monitor_from_artifacts(scaler)
+    features = read_features(args.path, columns=FEATURE_NAMES).to_numpy(dtype=np.float64)
+    for lo in range(0, len(features), args.batch_size):
+        monitor.observe(features[lo:lo + args.batch_size])
+
+    report = monitor.report()
+    print(f"📈 {report['rows']:,} rows, {report['ood_rows']:,} out-of-distribution ({report['ood_fraction']:.2%}, "
+          f"threshold d² > {report['ood_threshold']:.1f}); max mean shift {report['max_zscore']:.2f} σ")
+    print(f"   {'feature':<18}{'z':>8}{'std ratio':>11}{'psi':>8}")
+    for f in report["features"][:args.top]:
+        print(f"   {f['feature']:<18}{f['zscore']:>8.2f}{f['std_ratio']:>11.2f}{f.get('psi', float('nan')):>8.3f}")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Columnar storage for feature tables and score outputs.
+
+Feature tables (train_features.csv and friends) convert once into typed
+Parquet: the 45 FEATURE_NAMES columns as float32 and Label dictionary-encoded.
+The conversion streams, so CSVs larger than memory are fine. Loaders call
+read_features(), which picks the Parquet copy when it is at least as new as
+the CSV.
+
+Score outputs are Arrow IPC (Feather v2) files written uncompressed, so
+read_scores() memory-maps them and builds the table without copying or parsing.
+
+Usage:
+    python feature_store.py train_features.csv            # → train_features.parquet
+    python feature_store.py big.csv -o big.parquet --row-group-size 262144
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from inference import FEATURE_NAMES
+
+LABEL_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+
+def feature_schema(include_label=True):
+    fields = [pa.field(name, pa.float32()) for name in FEATURE_NAMES]
+    if include_label:
+        fields.append(pa.field("Label", LABEL_TYPE))
+    return pa.schema(fields)
+
+
+def convert_csv_to_parquet(csv_path, parquet_path=None, row_group_size=128 * 1024, block_size=16 << 20):
+    """Stream a feature CSV into typed Parquet; returns (parquet_path, rows)"""
+    parquet_path = parquet_path or os.path.splitext(csv_path)[0] + ".parquet"
+    column_types = {name: pa.float32() for name in FEATURE_NAMES}
+    column_types["Label"] = pa.string()
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(column_types=column_types),
+    )
+    has_label = "Label" in reader.schema.names
+    schema = feature_schema(include_label=has_label)
+
+    rows = 0
+    tmp_path = parquet_path + ".tmp"
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        pending, pending_rows = [], 0
+        for batch in reader:
+            table = pa.Table.from_batches([batch]).select(schema.names).cast(schema)
+            pending.append(table)
+            pending_rows += len(table)
+            if pending_rows >= row_group_size:
+                writer.write_table(pa.concat_tables(pending).combine_chunks(), row_group_size=row_group_size)
+                rows += pending_rows
+                pending, pending_rows = [], 0
+        if pending:
+            writer.write_table(pa.concat_tables(pending).combine_chunks(), row_group_size=row_group_size)
+            rows += pending_rows
+    os.replace(tmp_path, parquet_path)  # readers never see a half-written file
+    return parquet_path, rows
+
+
+def preferred_path(path):
+    """The Parquet sibling of a CSV when it exists and is at least as new, else the path itself"""
+    base, ext = os.path.splitext(path)
+    if ext.lower() != ".csv":
+        return path
+    parquet_path = base + ".parquet"
+    if os.path.exists(parquet_path) and (
+        not os.path.exists(path) or os.path.getmtime(parquet_path) >= os.path.getmtime(path)
+    ):
+        return parquet_path
+    return path
+
+
+def read_features(path, columns=None):
+    """Load a feature table as a DataFrame, preferring the typed Parquet copy"""
+    import pandas as pd
+
+    path = preferred_path(path)
+    if path.endswith((".parquet", ".pq")):
+        return pq.read_table(path, columns=columns).to_pandas()
+    return pd.read_csv(path, usecols=columns)
+
+
+# -------------------------------
+# Score outputs (Arrow IPC)
+# -------------------------------
+def scores_schema(class_names):
+    return pa.schema(
+        [pa.field("location", pa.int64()),
+         pa.field("threat_class", LABEL_TYPE),
+         pa.field("confidence", pa.float32()),
+         pa.field("suspicion", pa.float32())]
+        + [pa.field(f"p_{name}", pa.float32()) for name in class_names]
+    )
+
+
+class ScoresWriter:
+    """
+    Streams score blocks into an uncompressed Arrow IPC file (memory-mappable).
+    The file appears under its final name only on close().
+    """
+
+    def __init__(self, path, class_names):
+        self.path = path
+        self.class_names = [str(c) for c in class_names]
+        self.schema = scores_schema(self.class_names)
+        self._dictionary = pa.array(self.class_names, pa.string())
+        self._tmp_path = path + ".tmp"
+        self._writer = ipc.new_file(self._tmp_path, self.schema)
+        self.rows = 0
+
+    def write(self, location, predicted, confidences, suspicion, probabilities):
+        columns = [
+            pa.array(location, pa.int64()),
+            pa.DictionaryArray.from_arrays(pa.array(predicted, pa.int32()), self._dictionary),
+            pa.array(confidences, pa.float32()),
+            pa.array(suspicion, pa.float32()),
+        ] + [pa.array(probabilities[:, i], pa.float32()) for i in range(len(self.class_names))]
+        self._writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=self.schema))
+        self.rows += len(location)
+
+    def close(self):
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+
+def read_scores(path):
+    """
+    Memory-map an Arrow IPC score file, or every *.arrow part in a directory,
+    into one table without copying.
+    """
+    paths = sorted(glob.glob(os.path.join(path, "*.arrow"))) if os.path.isdir(path) else [path]
+    tables = [ipc.open_file(pa.memory_map(p, "r")).read_all() for p in paths]
+    if not tables:
+        raise FileNotFoundError(f"No Arrow score files in {path}")
+    return pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a feature CSV into typed float32 Parquet")
+    parser.add_argument("csv", help="Feature CSV (FEATURE_NAMES columns, optional Label)")
+    parser.add_argument("-o", "--output", help="Parquet path (default: alongside the CSV)")
+    parser.add_argument("--row-group-size", type=int, default=128 * 1024)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    path, rows = convert_csv_to_parquet(args.csv, args.output, args.row_group_size)
+    elapsed = time.perf_counter() - start
+    before, after = os.path.getsize(args.csv), os.path.getsize(path)
+    print(f"✅ {rows:,} rows → {path} in {elapsed:.2f}s "
+          f"({before / 1e6:.1f} MB CSV → {after / 1e6:.1f} MB Parquet)")
+
+
+if __name__ == "__main__":
+    main()
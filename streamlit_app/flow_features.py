@@ -0,0 +1,721 @@
+#!/usr/bin/env python3
+"""
+Streaming flow-feature extraction from pcap/pcapng into the 45-feature schema.
+
+Packets are read in large chunks and decoded column-wise: the only per-packet
+Python work is advancing the record offset, every header field is gathered with
+numpy fancy indexing into a structured PACKET_DTYPE batch. Batches (from a
+capture file or any replayed packet stream producing PACKET_DTYPE arrays) feed
+FlowFeatureExtractor, which keeps per-flow state in flat numpy arrays and emits
+one FEATURE_NAMES-ordered row per flow window of `window` packets.
+
+Feature definitions (CIC-IoMT style, computed per window of a bidirectional flow;
+"fwd" = direction of the flow's first packet, "bwd" = the reply direction):
+    Header_Length   mean IP + transport header length
+    Protocol_Type   IP protocol number
+    Duration        seconds between first and last packet of the window
+    Rate/Srate/Drate packets per second (all / fwd / bwd)
+    *_flag_number   1 if any packet in the window carried the TCP flag
+    *_count         packets carrying ACK/SYN/FIN/RST
+    HTTP..LLC       1 if any packet matched the protocol (ports / link layer)
+    Tot_sum, Min, Max, AVG, Std   packet length statistics
+    Tot_size        length of the last packet in the window
+    IAT             mean inter-arrival time within the flow
+    Number          packets in the window
+    Magnitude       sqrt(mean fwd length + mean bwd length)
+    Radius          sqrt(var fwd length + var bwd length)
+    Covariance      covariance of each packet length with the latest length seen
+                    in the opposite direction
+    Variance        var bwd length / var fwd length
+    Weight          fwd packets * bwd packets
+
+Usage:
+    python flow_features.py capture.pcap -o features.csv
+    python flow_features.py capture.pcapng --window 100 --idle-timeout 30
+"""
+
+import argparse
+import struct
+import time
+
+import numpy as np
+
+from inference import FEATURE_NAMES
+
+# One decoded packet per row
+PACKET_DTYPE = np.dtype([
+    ('ts', 'f8'),            # capture timestamp (seconds)
+    ('wire_len', 'u4'),      # original packet length
+    ('src_ip', 'u4'),        # IPv4 address (IPv6 folded to 32 bits)
+    ('dst_ip', 'u4'),
+    ('sport', 'u2'),
+    ('dport', 'u2'),
+    ('proto', 'u1'),         # IP protocol number (0 for non-IP)
+    ('tcp_flags', 'u1'),
+    ('header_len', 'u2'),    # IP + transport header bytes
+    ('link', 'u1'),          # LINK_* code below
+])
+
+LINK_OTHER, LINK_IPV4, LINK_IPV6, LINK_ARP, LINK_LLC = 0, 1, 2, 3, 4
+
+PROTOCOL_COLUMNS = ['HTTP', 'HTTPS', 'DNS', 'Telnet', 'SMTP', 'SSH', 'IRC',
+                    'TCP', 'UDP', 'DHCP', 'ARP', 'ICMP', 'IGMP', 'IPv', 'LLC']
+_BIT = {name: np.uint32(1 << i) for i, name in enumerate(PROTOCOL_COLUMNS)}
+
+APP_PORTS = {
+    'HTTP': (80, 8000, 8080), 'HTTPS': (443, 8443), 'DNS': (53, 5353), 'Telnet': (23,),
+    'SMTP': (25, 465, 587), 'SSH': (22,), 'IRC': (6667, 6697), 'DHCP': (67, 68),
+}
+_PORT_BITS = np.zeros(65536, dtype=np.uint32)
+for _name, _ports in APP_PORTS.items():
+    _PORT_BITS[list(_ports)] |= _BIT[_name]
+
+TCP_FLAGS = [('fin', 0x01), ('syn', 0x02), ('rst', 0x04), ('psh', 0x08),
+             ('ack', 0x10), ('ece', 0x40), ('cwr', 0x80)]
+
+# Additive per-window accumulators (one column each in the state matrix)
+SUM_FIELDS = ['count', 'fwd_n', 'bwd_n', 'len_sum', 'len_sq', 'fwd_sum', 'fwd_sq',
+              'bwd_sum', 'bwd_sq', 'hdr_sum', 'iat_sum', 'iat_n',
+              'pair_n', 'pair_sx', 'pair_sy', 'pair_sxy'] + [name for name, _ in TCP_FLAGS]
+_S = {name: i for i, name in enumerate(SUM_FIELDS)}
+
+_PAD = 128  # zero bytes appended to every chunk so header gathers never run off the end
+
+
+# -------------------------------
+# Capture file readers
+# -------------------------------
+def _u16be(buf, idx):
+    return (buf[idx].astype(np.uint32) << 8) | buf[idx + 1]
+
+
+def _u32be(buf, idx):
+    return ((buf[idx].astype(np.uint32) << 24) | (buf[idx + 1].astype(np.uint32) << 16)
+            | (buf[idx + 2].astype(np.uint32) << 8) | buf[idx + 3])
+
+
+def _u32(buf, idx, little):
+    b = [buf[idx + i].astype(np.uint64) for i in range(4)]
+    if little:
+        return b[0] | (b[1] << 8) | (b[2] << 16) | (b[3] << 24)
+    return (b[0] << 24) | (b[1] << 16) | (b[2] << 8) | b[3]
+
+
+def decode_packets(buf, data_off, caplen, wire_len, ts, linktype):
+    """
+    Decode link/IP/transport headers for packets at data_off within the uint8
+    buffer `buf` (which must have _PAD zero bytes of slack). Returns PACKET_DTYPE rows.
+    """
+    n = len(data_off)
+    out = np.zeros(n, dtype=PACKET_DTYPE)
+    out['ts'] = ts
+    out['wire_len'] = wire_len
+    if n == 0:
+        return out
+    off = data_off.astype(np.int64)
+    end = off + caplen.astype(np.int64)
+
+    # Link layer → ethertype + layer-3 offset
+    if linktype == 1:                                   # Ethernet (+ one VLAN tag)
+        et = _u16be(buf, off + 12)
+        vlan = (et == 0x8100) | (et == 0x88A8)
+        ethertype = np.where(vlan, _u16be(buf, off + 16), et)
+        l3 = off + np.where(vlan, 18, 14)
+        llc = ethertype < 0x0600
+    elif linktype == 113:                               # Linux cooked capture
+        ethertype = _u16be(buf, off + 14)
+        l3 = off + 16
+        llc = np.zeros(n, dtype=bool)
+    elif linktype == 276:                               # Linux cooked capture v2
+        ethertype = _u16be(buf, off)
+        l3 = off + 20
+        llc = np.zeros(n, dtype=bool)
+    elif linktype == 0:                                 # BSD loopback (host-order family)
+        family = _u32(buf, off, little=True)
+        ethertype = np.where(family == 2, 0x0800, np.where(np.isin(family, (24, 28, 30)), 0x86DD, 0))
+        l3 = off + 4
+        llc = np.zeros(n, dtype=bool)
+    else:                                               # raw IP (101, 12, 14, 228, 229, ...)
+        version = buf[off] >> 4
+        ethertype = np.where(version == 4, 0x0800, np.where(version == 6, 0x86DD, 0))
+        l3 = off
+        llc = np.zeros(n, dtype=bool)
+
+    v4 = (ethertype == 0x0800) & (l3 + 20 <= end)
+    v6 = (ethertype == 0x86DD) & (l3 + 40 <= end)
+    arp = (ethertype == 0x0806) & (l3 + 28 <= end)
+
+    link = np.full(n, LINK_OTHER, dtype=np.uint8)
+    link[v4] = LINK_IPV4
+    link[v6] = LINK_IPV6
+    link[arp] = LINK_ARP
+    link[llc] = LINK_LLC
+    out['link'] = link
+
+    ihl = np.where(v4, (buf[l3] & 0x0F).astype(np.int64) * 4, np.where(v6, 40, 0))
+    proto = np.where(v4, buf[l3 + 9], np.where(v6, buf[l3 + 6], 0)).astype(np.uint8)
+
+    src = np.where(v4, _u32be(buf, l3 + 12), 0)
+    dst = np.where(v4, _u32be(buf, l3 + 16), 0)
+    if v6.any():
+        src6 = _u32be(buf, l3 + 8) ^ _u32be(buf, l3 + 12) ^ _u32be(buf, l3 + 16) ^ _u32be(buf, l3 + 20)
+        dst6 = _u32be(buf, l3 + 24) ^ _u32be(buf, l3 + 28) ^ _u32be(buf, l3 + 32) ^ _u32be(buf, l3 + 36)
+        src = np.where(v6, src6, src)
+        dst = np.where(v6, dst6, dst)
+    if arp.any():
+        src = np.where(arp, _u32be(buf, l3 + 14), src)
+        dst = np.where(arp, _u32be(buf, l3 + 24), dst)
+    out['src_ip'] = src
+    out['dst_ip'] = dst
+    out['proto'] = proto
+
+    l4 = l3 + ihl
+    ip = v4 | v6
+    tcp = ip & (proto == 6) & (l4 + 14 <= end)
+    udp = ip & (proto == 17) & (l4 + 8 <= end)
+    icmp = ip & ((proto == 1) | (proto == 58)) & (l4 + 8 <= end)
+    ports = tcp | udp
+
+    out['sport'] = np.where(ports, _u16be(buf, l4), 0)
+    out['dport'] = np.where(ports, _u16be(buf, l4 + 2), 0)
+    out['tcp_flags'] = np.where(tcp, buf[l4 + 13], 0)
+    tcp_hdr = (buf[l4 + 12] >> 4).astype(np.int64) * 4
+    out['header_len'] = ihl + np.where(tcp, tcp_hdr, np.where(udp | icmp, 8, 0))
+    return out
+
+
+def _read_pcap(f, header, chunk_bytes):
+    magic = header[:4]
+    if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+        little, endian = True, '<'
+    elif magic in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+        little, endian = False, '>'
+    else:
+        raise ValueError("Not a pcap file")
+    nanos = magic in (b'\x4d\x3c\xb2\xa1', b'\xa1\xb2\x3c\x4d')
+    header += f.read(24 - len(header))
+    linktype = struct.unpack(endian + 'I', header[20:24])[0] & 0x0FFFFFFF
+    incl_len = struct.Struct(endian + 'I')
+
+    leftover = b''
+    while True:
+        data = f.read(chunk_bytes)
+        if not data and not leftover:
+            break
+        buf = leftover + data
+        # Walk record headers: the only per-packet Python loop
+        starts = []
+        pos, limit = 0, len(buf)
+        while pos + 16 <= limit:
+            nxt = pos + 16 + incl_len.unpack_from(buf, pos + 8)[0]
+            if nxt > limit:
+                break
+            starts.append(pos)
+            pos = nxt
+        leftover = buf[pos:]
+        if not starts:
+            if not data:
+                break
+            continue
+
+        arr = np.frombuffer(buf[:pos] + bytes(_PAD), dtype=np.uint8)
+        rec = np.asarray(starts, dtype=np.int64)
+        ts_sec = _u32(arr, rec, little).astype(np.float64)
+        ts_frac = _u32(arr, rec + 4, little).astype(np.float64)
+        caplen = _u32(arr, rec + 8, little)
+        wire = _u32(arr, rec + 12, little)
+        ts = ts_sec + ts_frac / (1e9 if nanos else 1e6)
+        yield decode_packets(arr, rec + 16, caplen, wire, ts, linktype)
+        if not data:
+            break
+
+
+def _read_pcapng(f, header, chunk_bytes):
+    interfaces = []   # (linktype, ts divisor) per interface id
+    endian = '<'
+    leftover = header
+    while True:
+        data = f.read(chunk_bytes)
+        buf = leftover + data
+        limit = len(buf)
+        epb_starts, epb_if = [], []
+        pos = 0
+        while pos + 12 <= limit:
+            block_type, block_len = struct.unpack_from(endian + 'II', buf, pos)
+            if block_type == 0x0A0D0D0A:                  # Section header: re-read byte order
+                bom = buf[pos + 8:pos + 12]
+                endian = '<' if bom == b'\x4d\x3c\x2b\x1a' else '>'
+                block_len = struct.unpack_from(endian + 'I', buf, pos + 4)[0]
+                if pos + block_len > limit:
+                    break
+                interfaces = []
+            elif pos + block_len > limit:
+                break
+            elif block_type == 1:                         # Interface description
+                linktype = struct.unpack_from(endian + 'H', buf, pos + 8)[0]
+                divisor = 1e6
+                opt = pos + 16
+                while opt + 4 <= pos + block_len - 4:
+                    code, length = struct.unpack_from(endian + 'HH', buf, opt)
+                    if code == 0:
+                        break
+                    if code == 9 and length >= 1:         # if_tsresol
+                        res = buf[opt + 4]
+                        divisor = float(2 ** (res & 0x7F)) if res & 0x80 else float(10 ** res)
+                    opt += 4 + ((length + 3) & ~3)
+                interfaces.append((linktype, divisor))
+            elif block_type == 6:                         # Enhanced packet
+                epb_starts.append(pos)
+                epb_if.append(struct.unpack_from(endian + 'I', buf, pos + 8)[0])
+            if block_len < 12:
+                raise ValueError("Corrupt pcapng block")
+            pos += block_len
+        leftover = buf[pos:]
+
+        if epb_starts:
+            little = endian == '<'
+            arr = np.frombuffer(buf[:pos] + bytes(_PAD), dtype=np.uint8)
+            rec = np.asarray(epb_starts, dtype=np.int64)
+            if_ids = np.asarray(epb_if, dtype=np.int64)
+            ts_raw = (_u32(arr, rec + 12, little) << np.uint64(32)) | _u32(arr, rec + 16, little)
+            caplen = _u32(arr, rec + 20, little)
+            wire = _u32(arr, rec + 24, little)
+            # Decode per interface so each group has a single link type
+            for if_id in np.unique(if_ids):
+                linktype, divisor = interfaces[if_id] if if_id < len(interfaces) else (1, 1e6)
+                m = if_ids == if_id
+                ts = ts_raw[m].astype(np.float64) / divisor
+                yield decode_packets(arr, rec[m] + 28, caplen[m], wire[m], ts, linktype)
+        if not data:
+            break
+
+
+def read_packets(path, chunk_bytes=8 << 20):
+    """Yield PACKET_DTYPE batches from a pcap or pcapng file"""
+    with open(path, 'rb') as f:
+        header = f.read(4)
+        if header == b'\x0a\x0d\x0d\x0a':
+            yield from _read_pcapng(f, header, chunk_bytes)
+        else:
+            yield from _read_pcap(f, header, chunk_bytes)
+
+
+def write_pcap(path, packets, linktype=1):
+    """Write (timestamp, frame_bytes) pairs as a classic little-endian pcap (used for replays/tests)"""
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, linktype))
+        for ts, frame in packets:
+            sec = int(ts)
+            f.write(struct.pack('<IIII', sec, int(round((ts - sec) * 1e6)), len(frame), len(frame)))
+            f.write(frame)
+
+
+# -------------------------------
+# Flow aggregation
+# -------------------------------
+def _mix64(x):
+    """splitmix64 finalizer (vectorized, wraps modulo 2**64)"""
+    x = x.astype(np.uint64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+class FlowFeatureExtractor:
+    """
+    Incremental per-flow windowing over PACKET_DTYPE batches.
+
+    State is a struct-of-arrays flow table: a sorted uint64 key index for
+    vectorized lookup plus one row per flow in flat numpy arrays (an
+    accumulator matrix for the open window and a few per-flow scalars).
+    update() returns (features, meta) for every window that completed in
+    the batch; flush() emits the partial windows still open.
+    """
+
+    META_DTYPE = np.dtype([('src_ip', 'u4'), ('dst_ip', 'u4'), ('sport', 'u2'), ('dport', 'u2'),
+                           ('proto', 'u1'), ('first_ts', 'f8'), ('last_ts', 'f8'), ('packets', 'u4')])
+
+    def __init__(self, window=10, idle_timeout=60.0, min_packets=2, initial_capacity=4096):
+        self.window = int(window)
+        self.idle_timeout = idle_timeout
+        self.min_packets = min_packets
+        self.n = 0
+        self.packets_seen = 0
+        self.windows_emitted = 0
+        self._sorted_keys = np.empty(0, dtype=np.uint64)
+        self._sorted_slots = np.empty(0, dtype=np.int64)
+        self._alloc(initial_capacity)
+
+    # --- flow table storage ---
+    def _alloc(self, capacity):
+        self.cap = capacity
+        self.acc = np.zeros((capacity, len(SUM_FIELDS)), dtype=np.float64)
+        self.w_min = np.zeros(capacity)
+        self.w_max = np.zeros(capacity)
+        self.w_first = np.zeros(capacity)
+        self.w_last = np.zeros(capacity)
+        self.w_last_len = np.zeros(capacity)
+        self.w_bits = np.zeros(capacity, dtype=np.uint32)
+        self.last_ts = np.zeros(capacity)
+        self.last_fwd_len = np.zeros(capacity)
+        self.last_bwd_len = np.zeros(capacity)
+        self.has_fwd = np.zeros(capacity, dtype=bool)
+        self.has_bwd = np.zeros(capacity, dtype=bool)
+        self.init_ep = np.zeros(capacity, dtype=np.uint64)
+        self.key = np.zeros(capacity, dtype=np.uint64)
+        self.meta = np.zeros(capacity, dtype=[('src_ip', 'u4'), ('dst_ip', 'u4'), ('sport', 'u2'),
+                                              ('dport', 'u2'), ('proto', 'u1')])
+
+    _ROW_ARRAYS = ('acc', 'w_min', 'w_max', 'w_first', 'w_last', 'w_last_len', 'w_bits', 'last_ts',
+                   'last_fwd_len', 'last_bwd_len', 'has_fwd', 'has_bwd', 'init_ep', 'key', 'meta')
+
+    def _grow(self, needed):
+        capacity = self.cap
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.cap:
+            return
+        old = {name: getattr(self, name) for name in self._ROW_ARRAYS}
+        self._alloc(capacity)
+        for name, arr in old.items():
+            getattr(self, name)[:len(arr)] = arr
+
+    @property
+    def active_flows(self):
+        return self.n
+
+    # --- main entry points ---
+    def update(self, packets):
+        """Consume one PACKET_DTYPE batch; returns (features float32 [k, 45], meta [k])"""
+        if len(packets) == 0:
+            return self._empty()
+        self.packets_seen += len(packets)
+        W = self.window
+
+        ts = packets['ts']
+        length = packets['wire_len'].astype(np.float64)
+        ep_src = (packets['src_ip'].astype(np.uint64) << np.uint64(16)) | packets['sport']
+        ep_dst = (packets['dst_ip'].astype(np.uint64) << np.uint64(16)) | packets['dport']
+        lo, hi = np.minimum(ep_src, ep_dst), np.maximum(ep_src, ep_dst)
+        keys = _mix64(lo) ^ _mix64(hi ^ (packets['proto'].astype(np.uint64) << np.uint64(48)))
+
+        # Group packets by flow, time-ordered within each flow
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        order = np.lexsort((ts, inverse))
+        inv = inverse[order]
+        ts = ts[order]
+        length = length[order]
+        ep_src = ep_src[order]
+        pk = packets[order]
+
+        flow_start = np.flatnonzero(np.r_[True, inv[1:] != inv[:-1]])
+        flow_count = np.diff(np.r_[flow_start, len(inv)])
+
+        slots = self._lookup_or_create(uniq, pk[flow_start], ep_src[flow_start])
+        slot = np.repeat(slots, flow_count)
+        seen_before = np.repeat(self.last_ts[slots] > 0, flow_count)
+        at_flow_start = np.zeros(len(inv), dtype=bool)
+        at_flow_start[flow_start] = True
+
+        fwd = ep_src == self.init_ep[slot]
+        bwd = ~fwd
+
+        # Inter-arrival time (first packet of the batch continues from the flow's last_ts)
+        prev_ts = np.r_[ts[:1], ts[:-1]]
+        prev_ts = np.where(at_flow_start, self.last_ts[slot], prev_ts)
+        iat_ok = ~at_flow_start | seen_before
+        iat = np.where(iat_ok, ts - prev_ts, 0.0)
+
+        # Latest opposite-direction length (forward-filled within the flow)
+        idx = np.arange(len(inv))
+        ff_fwd = np.maximum.accumulate(np.where(fwd, idx, -1))
+        ff_bwd = np.maximum.accumulate(np.where(bwd, idx, -1))
+        group_first = np.repeat(flow_start, flow_count)
+        opp_idx = np.where(fwd, ff_bwd, ff_fwd)
+        opp_in_batch = opp_idx >= group_first
+        opp_state_ok = np.where(fwd, self.has_bwd[slot], self.has_fwd[slot])
+        opp_len = np.where(opp_in_batch, length[np.maximum(opp_idx, 0)],
+                           np.where(fwd, self.last_bwd_len[slot], self.last_fwd_len[slot]))
+        pair_ok = opp_in_batch | opp_state_ok
+
+        # Window index relative to each flow's open window
+        rank = idx - group_first
+        widx = (np.repeat(self.acc[slots, _S['count']], flow_count).astype(np.int64) + rank) // W
+        win_start = np.flatnonzero(np.r_[True, (inv[1:] != inv[:-1]) | (widx[1:] != widx[:-1])])
+        win_end = np.r_[win_start[1:], len(inv)] - 1
+
+        # Per-packet contributions → per-window sums in one reduceat
+        contrib = np.zeros((len(inv), len(SUM_FIELDS)))
+        contrib[:, _S['count']] = 1.0
+        contrib[:, _S['fwd_n']] = fwd
+        contrib[:, _S['bwd_n']] = bwd
+        contrib[:, _S['len_sum']] = length
+        contrib[:, _S['len_sq']] = length * length
+        contrib[:, _S['fwd_sum']] = length * fwd
+        contrib[:, _S['fwd_sq']] = length * length * fwd
+        contrib[:, _S['bwd_sum']] = length * bwd
+        contrib[:, _S['bwd_sq']] = length * length * bwd
+        contrib[:, _S['hdr_sum']] = pk['header_len']
+        contrib[:, _S['iat_sum']] = iat
+        contrib[:, _S['iat_n']] = iat_ok
+        contrib[:, _S['pair_n']] = pair_ok
+        contrib[:, _S['pair_sx']] = length * pair_ok
+        contrib[:, _S['pair_sy']] = opp_len * pair_ok
+        contrib[:, _S['pair_sxy']] = length * opp_len * pair_ok
+        flags = pk['tcp_flags']
+        for name, bit in TCP_FLAGS:
+            contrib[:, _S[name]] = (flags & bit) != 0
+        sums = np.add.reduceat(contrib, win_start, axis=0)
+
+        bits = _PORT_BITS[pk['sport']] | _PORT_BITS[pk['dport']]
+        proto, link = pk['proto'], pk['link']
+        bits |= np.where(proto == 6, _BIT['TCP'], 0).astype(np.uint32)
+        bits |= np.where(proto == 17, _BIT['UDP'], 0).astype(np.uint32)
+        bits |= np.where((proto == 1) | (proto == 58), _BIT['ICMP'], 0).astype(np.uint32)
+        bits |= np.where(proto == 2, _BIT['IGMP'], 0).astype(np.uint32)
+        bits |= np.where(link == LINK_ARP, _BIT['ARP'], 0).astype(np.uint32)
+        bits |= np.where((link == LINK_IPV4) | (link == LINK_IPV6), _BIT['IPv'], 0).astype(np.uint32)
+        bits |= np.where(link == LINK_LLC, _BIT['LLC'], 0).astype(np.uint32)
+
+        g_slot = slot[win_start]
+        g_min = np.minimum.reduceat(length, win_start)
+        g_max = np.maximum.reduceat(length, win_start)
+        g_bits = np.bitwise_or.reduceat(bits, win_start)
+        g_first = ts[win_start]
+        g_last = ts[win_end]
+        g_last_len = length[win_end]
+
+        # Windows continuing the flow's open window merge with the stored accumulators
+        cont = (widx[win_start] == 0) & (self.acc[g_slot, _S['count']] > 0)
+        cs = g_slot[cont]
+        sums[cont] += self.acc[cs]
+        g_min[cont] = np.minimum(g_min[cont], self.w_min[cs])
+        g_max[cont] = np.maximum(g_max[cont], self.w_max[cs])
+        g_bits[cont] |= self.w_bits[cs]
+        g_first[cont] = self.w_first[cs]
+
+        complete = sums[:, _S['count']] >= W
+        features = self._features(sums[complete], g_min[complete], g_max[complete], g_first[complete],
+                                  g_last[complete], g_last_len[complete], g_bits[complete],
+                                  self.meta['proto'][g_slot[complete]])
+        meta = self._meta(g_slot[complete], g_first[complete], g_last[complete], sums[complete, _S['count']])
+
+        # The last window of each flow in the batch becomes (or clears) its open window
+        last_of_flow = np.r_[g_slot[1:] != g_slot[:-1], True]
+        open_w = last_of_flow & ~complete
+        closed = last_of_flow & complete
+        os_, cl = g_slot[open_w], g_slot[closed]
+        self.acc[cl] = 0.0
+        self.acc[os_] = sums[open_w]
+        self.w_min[os_] = g_min[open_w]
+        self.w_max[os_] = g_max[open_w]
+        self.w_bits[os_] = g_bits[open_w]
+        self.w_first[os_] = g_first[open_w]
+        self.w_last[os_] = g_last[open_w]
+        self.w_last_len[os_] = g_last_len[open_w]
+
+        # Per-flow state carried across batches
+        flow_end = np.r_[flow_start[1:], len(inv)] - 1
+        self.last_ts[slots] = ts[flow_end]
+        end_fwd, end_bwd = ff_fwd[flow_end], ff_bwd[flow_end]
+        has_f, has_b = end_fwd >= flow_start, end_bwd >= flow_start
+        self.last_fwd_len[slots[has_f]] = length[end_fwd[has_f]]
+        self.last_bwd_len[slots[has_b]] = length[end_bwd[has_b]]
+        self.has_fwd[slots] |= has_f
+        self.has_bwd[slots] |= has_b
+
+        self.windows_emitted += len(features)
+        if self.idle_timeout is not None:
+            idle_features, idle_meta = self._evict_idle(ts.max() - self.idle_timeout)
+            if len(idle_features):
+                features = np.concatenate([features, idle_features])
+                meta = np.concatenate([meta, idle_meta])
+        return features, meta
+
+    def flush(self):
+        """Emit every open window with at least min_packets packets and reset the table"""
+        features, meta = self._evict(np.ones(self.n, dtype=bool))
+        return features, meta
+
+    # --- internals ---
+    def _empty(self):
+        return np.zeros((0, len(FEATURE_NAMES)), dtype=np.float32), np.zeros(0, dtype=self.META_DTYPE)
+
+    def _lookup_or_create(self, uniq, first_pk, first_ep):
+        pos = np.searchsorted(self._sorted_keys, uniq)
+        if len(self._sorted_keys):
+            pos_c = np.minimum(pos, len(self._sorted_keys) - 1)
+            found = self._sorted_keys[pos_c] == uniq
+        else:
+            pos_c = pos
+            found = np.zeros(len(uniq), dtype=bool)
+        slots = np.empty(len(uniq), dtype=np.int64)
+        slots[found] = self._sorted_slots[pos_c[found]]
+
+        new = ~found
+        n_new = int(new.sum())
+        if n_new:
+            self._grow(self.n + n_new)
+            new_slots = np.arange(self.n, self.n + n_new)
+            self.n += n_new
+            slots[new] = new_slots
+            self.key[new_slots] = uniq[new]
+            self.init_ep[new_slots] = first_ep[new]
+            fp = first_pk[new]
+            self.meta['src_ip'][new_slots] = fp['src_ip']
+            self.meta['dst_ip'][new_slots] = fp['dst_ip']
+            self.meta['sport'][new_slots] = fp['sport']
+            self.meta['dport'][new_slots] = fp['dport']
+            self.meta['proto'][new_slots] = fp['proto']
+            # uniq is sorted, so the new keys are too: O(F) merge into the index
+            self._sorted_keys = np.insert(self._sorted_keys, pos[new], uniq[new])
+            self._sorted_slots = np.insert(self._sorted_slots, pos[new], new_slots)
+        return slots
+
+    def _meta(self, slots, first, last, count):
+        meta = np.zeros(len(slots), dtype=self.META_DTYPE)
+        for name in ('src_ip', 'dst_ip', 'sport', 'dport', 'proto'):
+            meta[name] = self.meta[name][slots]
+        meta['first_ts'] = first
+        meta['last_ts'] = last
+        meta['packets'] = count
+        return meta
+
+    def _evict_idle(self, cutoff):
+        idle = self.last_ts[:self.n] < cutoff
+        if not idle.any():
+            return self._empty()
+        return self._evict(idle)
+
+    def _evict(self, mask):
+        """Emit open windows of the masked flows, then compact them out of the table"""
+        slots = np.flatnonzero(mask)
+        emit = slots[self.acc[slots, _S['count']] >= self.min_packets]
+        features = self._features(self.acc[emit], self.w_min[emit], self.w_max[emit], self.w_first[emit],
+                                  self.w_last[emit], self.w_last_len[emit], self.w_bits[emit],
+                                  self.meta['proto'][emit])
+        meta = self._meta(emit, self.w_first[emit], self.w_last[emit], self.acc[emit, _S['count']])
+        self.windows_emitted += len(features)
+
+        keep = np.flatnonzero(~mask[:self.n])
+        for name in self._ROW_ARRAYS:
+            arr = getattr(self, name)
+            arr[:len(keep)] = arr[keep]
+        self.n = len(keep)
+        order = np.argsort(self.key[:self.n], kind='stable')
+        self._sorted_keys = self.key[:self.n][order]
+        self._sorted_slots = order.astype(np.int64)
+        return features, meta
+
+    @staticmethod
+    def _features(sums, w_min, w_max, first, last, last_len, bits, proto):
+        k = len(sums)
+        out = np.zeros((k, len(FEATURE_NAMES)), dtype=np.float64)
+        if k == 0:
+            return out.astype(np.float32)
+        col = {name: i for i, name in enumerate(FEATURE_NAMES)}
+        s = lambda name: sums[:, _S[name]]  # noqa: E731
+
+        n = s('count')
+        duration = last - first
+        per_sec = np.where(duration > 0, 1.0 / np.where(duration > 0, duration, 1.0), 0.0)
+        avg = s('len_sum') / n
+        fwd_n, bwd_n = s('fwd_n'), s('bwd_n')
+        fwd_mean = np.where(fwd_n > 0, s('fwd_sum') / np.maximum(fwd_n, 1), 0.0)
+        bwd_mean = np.where(bwd_n > 0, s('bwd_sum') / np.maximum(bwd_n, 1), 0.0)
+        fwd_var = np.where(fwd_n > 0, np.maximum(s('fwd_sq') / np.maximum(fwd_n, 1) - fwd_mean ** 2, 0), 0.0)
+        bwd_var = np.where(bwd_n > 0, np.maximum(s('bwd_sq') / np.maximum(bwd_n, 1) - bwd_mean ** 2, 0), 0.0)
+        pn = np.maximum(s('pair_n'), 1)
+        cov = np.where(s('pair_n') > 0,
+                       s('pair_sxy') / pn - (s('pair_sx') / pn) * (s('pair_sy') / pn), 0.0)
+
+        out[:, col['Header_Length']] = s('hdr_sum') / n
+        out[:, col['Protocol_Type']] = proto
+        out[:, col['Duration']] = duration
+        out[:, col['Rate']] = n * per_sec
+        out[:, col['Srate']] = fwd_n * per_sec
+        out[:, col['Drate']] = bwd_n * per_sec
+        for name, _ in TCP_FLAGS:
+            out[:, col[f'{name}_flag_number']] = s(name) > 0
+        for name in ('ack', 'syn', 'fin', 'rst'):
+            out[:, col[f'{name}_count']] = s(name)
+        for name in PROTOCOL_COLUMNS:
+            out[:, col[name]] = (bits & _BIT[name]) != 0
+        out[:, col['Tot_sum']] = s('len_sum')
+        out[:, col['Min']] = w_min
+        out[:, col['Max']] = w_max
+        out[:, col['AVG']] = avg
+        out[:, col['Std']] = np.sqrt(np.maximum(s('len_sq') / n - avg ** 2, 0))
+        out[:, col['Tot_size']] = last_len
+        out[:, col['IAT']] = s('iat_sum') / np.maximum(s('iat_n'), 1)
+        out[:, col['Number']] = n
+        out[:, col['Magnitude']] = np.sqrt(fwd_mean + bwd_mean)
+        out[:, col['Radius']] = np.sqrt(fwd_var + bwd_var)
+        out[:, col['Covariance']] = cov
+        out[:, col['Variance']] = np.where(fwd_var > 0, bwd_var / np.where(fwd_var > 0, fwd_var, 1.0), 0.0)
+        out[:, col['Weight']] = fwd_n * bwd_n
+        return out.astype(np.float32)
+
+
+def extract_features(packet_batches, window=10, idle_timeout=60.0, min_packets=2):
+    """
+    Run a FlowFeatureExtractor over an iterable of PACKET_DTYPE batches (read_packets()
+    or a replayed stream) and yield (features, meta) for every batch that emitted rows,
+    including the final flush.
+    """
+    extractor = FlowFeatureExtractor(window=window, idle_timeout=idle_timeout, min_packets=min_packets)
+    for batch in packet_batches:
+        features, meta = extractor.update(batch)
+        if len(features):
+            yield features, meta
+    features, meta = extractor.flush()
+    if len(features):
+        yield features, meta
+
+
+def main():
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Extract 45-feature flow windows from a capture file")
+    parser.add_argument("capture", help="pcap or pcapng file")
+    parser.add_argument("-o", "--output", help="CSV file for the feature rows (FEATURE_NAMES columns)")
+    parser.add_argument("--window", type=int, default=10, help="Packets per flow window")
+    parser.add_argument("--idle-timeout", type=float, default=60.0, help="Seconds before an idle flow is flushed")
+    parser.add_argument("--min-packets", type=int, default=2, help="Smallest partial window emitted on flush")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    packets = 0
+    rows = 0
+    extractor = FlowFeatureExtractor(args.window, args.idle_timeout, args.min_packets)
+    header_written = False
+
+    def _write(features):
+        nonlocal header_written
+        if args.output:
+            pd.DataFrame(features, columns=FEATURE_NAMES).to_csv(
+                args.output, mode='a' if header_written else 'w', header=not header_written, index=False
+            )
+            header_written = True
+
+    for batch in read_packets(args.capture):
+        packets += len(batch)
+        features, _ = extractor.update(batch)
+        rows += len(features)
+        _write(features)
+    features, _ = extractor.flush()
+    rows += len(features)
+    _write(features)
+
+    elapsed = time.perf_counter() - start
+    print(f"📦 {packets:,} packets → {rows:,} flow windows in {elapsed:.2f}s "
+          f"({packets / max(elapsed, 1e-9):,.0f} packets/s)")
+    if args.output:
+        print(f"💾 Features written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+# Model definition and instrumented batch inference
+#
+# Kept free of Streamlit so offline tools (batch scoring, pipelines, training
+# helpers) can import the same model and predictor the app uses.
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+# Shared instrumentation lives next to the API bridge
+_BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "backend"))
+if _BACKEND_DIR not in sys.path:
+    sys.path.append(_BACKEND_DIR)
+
+import metrics  # noqa: E402
+
+# Feature names (45 features as specified), in schema order; types, ranges and the
+# validator live in backend/feature_schema.py
+from feature_schema import FEATURE_NAMES, FeatureValidationError, validate_features  # noqa: E402
+
+
+# LightweightANN Model Definition (matching your architecture)
+class LightweightANN(nn.Module):
+    def __init__(self, input_size, num_classes, hidden_sizes=(256, 128, 64), dropouts=(0.3, 0.2, 0.1)):
+        super().__init__()
+        self.hidden_sizes = tuple(int(h) for h in hidden_sizes)
+        layers, width = [], input_size
+        for i, hidden in enumerate(hidden_sizes):
+            layers += [nn.Linear(width, hidden), nn.ReLU(), nn.Dropout(dropouts[min(i, len(dropouts) - 1)])]
+            width = hidden
+        layers.append(nn.Linear(width, num_classes))
+        self.layers = nn.Sequential(*layers)
+
+    def forward(self, x):
+        return self.layers(x)
+
+
+def save_model_checkpoint(path, model):
+    """
+    Write LightweightANN weights with their architecture recorded, atomically, so
+    pruned or re-sized variants load without knowing their widths in advance.
+    """
+    first = model.layers[0]
+    torch.save({
+        "state_dict": model.state_dict(),
+        "architecture": {"input_size": first.in_features, "hidden_sizes": list(model.hidden_sizes)},
+    }, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load_model_checkpoint(path, num_classes, device):
+    """
+    LightweightANN from a checkpoint: either a bare state dict (original training
+    script; widths are read off the weight shapes) or a save_model_checkpoint() file.
+    """
+    checkpoint = torch.load(path, map_location=device)
+    if "state_dict" in checkpoint:
+        state, architecture = checkpoint["state_dict"], checkpoint.get("architecture") or {}
+    else:
+        state, architecture = checkpoint, {}
+    weights = sorted((int(k.split(".")[1]), v) for k, v in state.items() if k.endswith(".weight"))
+    hidden_sizes = architecture.get("hidden_sizes") or [w.shape[0] for _, w in weights[:-1]]
+    input_size = architecture.get("input_size") or weights[0][1].shape[1]
+    model = LightweightANN(input_size, num_classes, hidden_sizes=hidden_sizes)
+    model.load_state_dict(state)
+    return model
+
+
+# ANN-LSTM hybrid from IDS_using_ANN_LSTM.ipynb: input is (batch, seq_len, features)
+class ANN_LSTM_IDS(nn.Module):
+    def __init__(self, input_size, num_classes, hidden_dim=64, num_layers=1):
+        super().__init__()
+        self.feature_extractor = nn.Sequential(
+            nn.Linear(input_size, 128),
+            nn.ReLU(),
+            nn.Dropout(0.4),
+            nn.Linear(128, 64),
+            nn.ReLU(),
+        )
+        self.lstm = nn.LSTM(input_size=64, hidden_size=hidden_dim, num_layers=num_layers, batch_first=True,
+                            dropout=0.3 if num_layers > 1 else 0.0, bidirectional=True)
+        self.attention = nn.MultiheadAttention(embed_dim=hidden_dim * 2, num_heads=8, dropout=0.1, batch_first=True)
+        self.dropout_post_lstm = nn.Dropout(0.3)
+        self.classifier = nn.Sequential(
+            nn.Linear(hidden_dim * 2, 64),
+            nn.ReLU(),
+            nn.Dropout(0.4),
+            nn.Linear(64, num_classes)
+        )
+
+    def forward(self, x):
+        batch_size, seq_len, features = x.size()
+        features_extracted = self.feature_extractor(x.reshape(-1, features)).view(batch_size, seq_len, -1)
+        lstm_out, _ = self.lstm(features_extracted)
+        lstm_out = self.dropout_post_lstm(lstm_out)
+        attn_out, _ = self.attention(lstm_out, lstm_out, lstm_out)
+        return self.classifier(attn_out[:, -1, :])
+
+
+# Instrumentation
+INFERENCE_STAGE_LATENCY = metrics.histogram(
+    "inference_stage_seconds", "Inference latency split by stage (validate/scale/forward/postprocess/materialize)", ("stage",)
+)
+INFERENCE_BATCH_SIZE = metrics.histogram(
+    "inference_batch_size", "Rows per inference call", buckets=metrics.SIZE_BUCKETS
+)
+INFERENCE_ROWS = metrics.counter("inference_rows_total", "Rows scored by the real model")
+ARTIFACT_LOAD_LATENCY = metrics.histogram(
+    "artifact_load_seconds", "Time to load model and preprocessing artifacts", ("artifact",)
+)
+MODEL_SWAPS = metrics.counter("serving_model_swaps_total", "Serving model replacements by source", ("source",))
+
+
+def _forward(features, model, scaler, device, temperature):
+    features = np.asarray(features, dtype=np.float64)
+    if features.ndim == 1:
+        features = features.reshape(1, -1)
+    INFERENCE_BATCH_SIZE.observe(len(features))
+    INFERENCE_ROWS.inc(len(features))
+
+    with INFERENCE_STAGE_LATENCY.time(stage="scale"):
+        features_scaled = scaler.transform(features)
+
+    with INFERENCE_STAGE_LATENCY.time(stage="forward"):
+        features_tensor = torch.as_tensor(features_scaled, dtype=torch.float32).to(device)
+        with torch.no_grad():
+            return torch.softmax(model(features_tensor) / temperature, dim=1)
+
+
+def check_feature_row(features):
+    """
+    Check one row (FEATURE_NAMES order, or a {name: value} dict) against the feature
+    schema before it reaches the scaler. Returns (row as a list, issues that were
+    clipped away); raises FeatureValidationError when the row can't be scored
+    (missing or non-finite values, two transport protocols set).
+    """
+    with INFERENCE_STAGE_LATENCY.time(stage="validate"):
+        report = validate_features([features])
+    issues = report.row_issues(0)
+    if report.rejected[0]:
+        raise FeatureValidationError("Invalid features: " + ", ".join(issues), report)
+    return report.rows[0].tolist(), issues
+
+
+def predict_batch(features, model, scaler, label_encoder, device, temperature=1.0):
+    """
+    Score a batch of feature rows (N x 45, FEATURE_NAMES order) with the real model.
+    temperature comes from calibration.json (see calibrate.py); 1.0 is the raw softmax.
+    Returns (threat_classes, confidences, probabilities) as numpy arrays.
+    """
+    probabilities = _forward(features, model, scaler, device, temperature)
+
+    with INFERENCE_STAGE_LATENCY.time(stage="postprocess"):
+        probabilities = probabilities.cpu().numpy()
+        predicted = probabilities.argmax(axis=1)
+        confidences = probabilities[np.arange(len(predicted)), predicted]
+        threat_classes = np.asarray(label_encoder.classes_)[predicted]
+
+    return threat_classes, confidences, probabilities
+
+
+def predict_top_k(features, model, scaler, label_encoder, device, k=1, temperature=1.0):
+    """
+    Fast path for high-volume scoring: only the k most likely classes per row leave
+    torch, so the full N x classes matrix is never copied out or turned into dicts.
+    Returns (top_classes N x k, top_probabilities N x k); column 0 is the prediction
+    and its (calibrated) confidence.
+    """
+    probabilities = _forward(features, model, scaler, device, temperature)
+    with INFERENCE_STAGE_LATENCY.time(stage="postprocess"):
+        top_probabilities, top_index = torch.topk(probabilities, min(k, probabilities.shape[1]), dim=1)
+        top_classes = np.asarray(label_encoder.classes_)[top_index.cpu().numpy()]
+    return top_classes, top_probabilities.cpu().numpy()
+
+
+CALIBRATION_FILE = "calibration.json"
+
+
+def load_temperature(base_dir=None):
+    """Softmax temperature fitted by calibrate.py; 1.0 (uncalibrated) when absent or unreadable"""
+    import json
+
+    path = os.path.join(base_dir or os.path.dirname(os.path.abspath(__file__)), CALIBRATION_FILE)
+    if not os.path.exists(path):
+        return 1.0
+    try:
+        with open(path) as f:
+            return float(json.load(f)["temperature"])
+    except Exception as e:
+        print(f"Could not load {path}: {e}")
+        return 1.0
+
+
+def timed_load(artifact, loader, *args, **kwargs):
+    """Call loader(*args, **kwargs) and record how long the artifact took to load"""
+    start = time.perf_counter()
+    try:
+        return loader(*args, **kwargs)
+    finally:
+        ARTIFACT_LOAD_LATENCY.observe(time.perf_counter() - start, artifact=artifact)
+
+
+def get_recommendations_for_threat(threat_class):
+    """Generate recommendations based on threat class"""
+    if threat_class.lower() in ['benign', 'normal']:
+        return ["✅ Traffic appears normal", "📊 Continue monitoring", "🔄 Keep systems updated"]
+    elif 'ddos' in threat_class.lower():
+        return ["🚨 Block source IP immediately", "🛡️ Activate DDoS protection", "📈 Scale infrastructure"]
+    elif 'port' in threat_class.lower() or 'scan' in threat_class.lower():
+        return ["🔒 Block scanning IP", "🔍 Strengthen firewall rules", "🔧 Check vulnerabilities"]
+    else:
+        return ["⚠️ Investigate threat immediately", "🛡️ Implement security measures", "📞 Contact security team"]
+
+
+def determine_risk_level(threat_class, confidence):
+    """Determine risk level (thresholds assume a temperature-calibrated confidence, see calibrate.py)"""
+    if threat_class.lower() in ['benign', 'normal']:
+        return "Low"
+    elif 'ddos' in threat_class.lower():
+        return "Critical" if confidence > 0.8 else "High"
+    else:
+        return "High" if confidence > 0.8 else "Medium"
+
+
+def load_artifacts(base_dir=None, device=None):
+    """
+    Streamlit-free artifact loader for offline tools.
+
+    Loads scaler/label encoder (falling back to fitting them on train_features,
+    Parquet copy preferred)
+    and best_model.pth. Without weights the model keeps a seeded random init (the
+    same in every process) and use_real_model is False.
+    Returns (model, scaler, label_encoder, device, use_real_model).
+    """
+    import joblib
+
+    base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+    device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    def _first(names, artifact):
+        for name in names:
+            path = os.path.join(base_dir, name)
+            if os.path.exists(path):
+                try:
+                    return timed_load(artifact, joblib.load, path)
+                except Exception as e:
+                    print(f"Could not load {path}: {e}")
+        return None
+
+    scaler = _first(["scaler.pkl", "scaler_from_synth.pkl"], "scaler")
+    label_encoder = _first(["label_encoder.pkl", "label_encoder_from_synth.pkl"], "label_encoder")
+
+    if scaler is None or label_encoder is None:
+        from sklearn.preprocessing import StandardScaler, LabelEncoder
+        from feature_store import read_features
+
+        train = read_features(os.path.join(base_dir, "train_features.csv"))
+        scaler = scaler or StandardScaler().fit(train[FEATURE_NAMES].to_numpy(dtype=np.float64))
+        label_encoder = label_encoder or LabelEncoder().fit(train["Label"].astype(str).values)
+
+    with torch.random.fork_rng():
+        torch.manual_seed(0)
+        model = LightweightANN(len(FEATURE_NAMES), len(label_encoder.classes_))
+    use_real_model = False
+    model_path = os.path.join(base_dir, "best_model.pth")
+    if os.path.exists(model_path):
+        model = timed_load("model", load_model_checkpoint, model_path, len(label_encoder.classes_), device)
+        use_real_model = True
+    model.to(device).eval()
+    return model, scaler, label_encoder, device, use_real_model
+
+
+# Everything needed to score, swapped as one unit
+ModelBundle = namedtuple("ModelBundle", "model scaler label_encoder device version loaded_at temperature",
+                         defaults=(1.0,))
+
+
+class ServingModel:
+    """
+    Holder for the bundle currently used for scoring.
+
+    Callers take a snapshot with current() and score with it; swap() publishes
+    a new bundle with a single reference assignment, so in-flight requests keep
+    using the bundle they started with and never see a half-updated model/scaler pair.
+    """
+
+    def __init__(self, model, scaler, label_encoder, device, version="initial", temperature=1.0):
+        self._lock = threading.Lock()
+        self._bundle = ModelBundle(model, scaler, label_encoder, device, version, time.time(), temperature)
+
+    def current(self):
+        return self._bundle
+
+    def swap(self, model, scaler=None, version=None, source="manual", label_encoder=None, temperature=None):
+        """Publish a new model (and optionally scaler/label encoder/temperature); returns the replaced bundle"""
+        with self._lock:
+            previous = self._bundle
+            self._bundle = ModelBundle(
+                model, scaler if scaler is not None else previous.scaler,
+                label_encoder if label_encoder is not None else previous.label_encoder,
+                previous.device, version or f"{source}-{int(time.time())}", time.time(),
+                temperature if temperature is not None else previous.temperature
+            )
+        MODEL_SWAPS.inc(source=source)
+        return previous
+
+    def predict(self, features):
+        bundle = self.current()
+        return predict_batch(features, bundle.model, bundle.scaler, bundle.label_encoder, bundle.device,
+                             bundle.temperature)
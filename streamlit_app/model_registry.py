@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Hot model reload and shadow (A/B) scoring.
+
+ModelRegistry watches an artifact directory (best_model.pth, scaler.pkl,
+label_encoder.pkl, calibration.json). When the files change it loads them on its own thread and
+publishes them with ServingModel.swap(), so replacing best_model.pth no longer
+needs a Streamlit restart and requests already scoring finish on the old bundle.
+A change is only picked up once the files have been still for `settle_seconds`,
+so a copy that is still in progress is never loaded.
+
+In-process fine-tuning (online_update.OnlineUpdater) publishes through
+registry.publish(), which swaps the model in and checkpoints it to the artifact
+directory under the same lock as the reload, then records those files as already
+served. So a reload never throws away fine-tuned weights: whichever was written
+last wins. Files copied in after an online round replace it, and the next round
+fine-tunes on top of them.
+
+Shadow mode: point candidate_dir at a second artifact directory and set
+shadow_fraction. registry.predict() scores with the serving bundle as usual and
+queues a sampled fraction of the rows for the candidate. A background thread
+scores them and records disagreement and latency for both models. The queue is
+bounded and never blocks: when it is full the sample is dropped and counted.
+
+Usage:
+    python model_registry.py --candidate-dir ./candidate --shadow-fraction 0.2 --rows 5000
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import torch
+
+from inference import CALIBRATION_FILE, FEATURE_NAMES, predict_batch, load_artifacts, load_temperature
+import metrics
+
+ARTIFACT_FILES = ("best_model.pth", "scaler.pkl", "label_encoder.pkl", CALIBRATION_FILE)
+
+MODEL_RELOADS = metrics.counter("model_reloads_total", "Artifact directory reload attempts by outcome",
+                                ("role", "outcome"))
+SHADOW_ROWS = metrics.counter("shadow_rows_total", "Rows scored by the shadow candidate")
+SHADOW_DISAGREEMENTS = metrics.counter("shadow_disagreements_total",
+                                       "Shadow rows where candidate and serving model predict different classes")
+SHADOW_DROPPED = metrics.counter("shadow_dropped_total", "Sampled rows dropped because the shadow queue was full")
+SHADOW_LATENCY = metrics.histogram("shadow_score_seconds", "Scoring latency per batch, serving vs candidate",
+                                   ("model",))
+SHADOW_DISAGREEMENT_RATE = metrics.gauge("shadow_disagreement_ratio", "Cumulative shadow disagreement ratio")
+
+
+def artifact_signature(artifact_dir):
+    """(name, mtime_ns, size) of each artifact present; changes whenever one is replaced"""
+    signature = []
+    for name in ARTIFACT_FILES:
+        try:
+            st = os.stat(os.path.join(artifact_dir, name))
+        except OSError:
+            continue
+        signature.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(signature)
+
+
+class ModelRegistry:
+    """Keeps a ServingModel in sync with an artifact directory and shadow-scores a candidate"""
+
+    def __init__(self, serving, artifact_dir=None, candidate_dir=None, shadow_fraction=0.0,
+                 poll_interval=5.0, settle_seconds=1.0, shadow_queue_size=256, seed=None, monitor=None):
+        self.serving = serving
+        self.monitor = monitor  # optional drift_monitor.DriftMonitor fed with every scored row
+        self.artifact_dir = artifact_dir or os.path.dirname(os.path.abspath(__file__))
+        self.candidate_dir = candidate_dir
+        self.shadow_fraction = shadow_fraction
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.rng = np.random.default_rng(seed)
+
+        # The bundle handed in was loaded from the current files
+        self._signature = artifact_signature(self.artifact_dir)
+        self._candidate_signature = None
+        self._reload_lock = threading.Lock()  # check() vs publish(): one writer of _signature and the files
+        self.candidate = None  # (model, scaler, label_encoder, version, temperature)
+        self.loaded_from_file = any(name == "best_model.pth" for name, _, _ in self._signature)
+
+        self._shadow_queue = queue.Queue(maxsize=shadow_queue_size)
+        self._stop = threading.Event()
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self._reset_shadow_stats()
+
+    # -------------------------------
+    # Reload
+    # -------------------------------
+    def _settled(self, signature):
+        newest = max((mtime for _, mtime, _ in signature), default=0) / 1e9
+        return time.time() - newest >= self.settle_seconds
+
+    def _load(self, artifact_dir):
+        bundle = self.serving.current()
+        model, scaler, label_encoder, _, use_real_model = load_artifacts(artifact_dir, bundle.device)
+        return model, scaler, label_encoder, use_real_model, load_temperature(artifact_dir)
+
+    def check(self):
+        """Reload the serving bundle if the artifact files changed; returns True when swapped"""
+        with self._reload_lock:
+            return self._check()
+
+    def _check(self):
+        signature = artifact_signature(self.artifact_dir)
+        if signature == self._signature or not self._settled(signature):
+            return False
+        self._signature = signature  # a broken file is not retried until it changes again
+        try:
+            model, scaler, label_encoder, use_real_model, temperature = self._load(self.artifact_dir)
+        except Exception as e:
+            MODEL_RELOADS.inc(role="serving", outcome="error")
+            print(f"Model reload from {self.artifact_dir} failed, keeping {self.serving.current().version}: {e}")
+            return False
+        if not use_real_model:
+            MODEL_RELOADS.inc(role="serving", outcome="skipped")
+            return False
+        version = f"file-{max(mtime for _, mtime, _ in signature) // 1_000_000}"
+        self.serving.swap(model, scaler, version=version, source="reload", label_encoder=label_encoder,
+                          temperature=temperature)
+        self.loaded_from_file = True
+        MODEL_RELOADS.inc(role="serving", outcome="swapped")
+        print(f"🔄 Serving model reloaded from {self.artifact_dir} ({version})")
+        return True
+
+    def publish(self, model, scaler, version, source="online_update"):
+        """
+        Swap in a model built in this process and checkpoint it to the artifact
+        directory, so the watcher sees its own files rather than a change to reload.
+        Returns the replaced bundle.
+        """
+        from online_update import save_artifacts
+
+        with self._reload_lock:
+            previous = self.serving.swap(model, scaler, version=version, source=source)
+            save_artifacts(self.artifact_dir, self.serving.current())
+            self._signature = artifact_signature(self.artifact_dir)
+            self.loaded_from_file = True
+        return previous
+
+    def check_candidate(self):
+        """(Re)load the shadow candidate if its directory changed; returns True when loaded"""
+        if not self.candidate_dir:
+            return False
+        signature = artifact_signature(self.candidate_dir)
+        if not signature or signature == self._candidate_signature or not self._settled(signature):
+            return False
+        self._candidate_signature = signature
+        try:
+            model, scaler, label_encoder, use_real_model, temperature = self._load(self.candidate_dir)
+        except Exception as e:
+            MODEL_RELOADS.inc(role="candidate", outcome="error")
+            print(f"Candidate load from {self.candidate_dir} failed: {e}")
+            return False
+        if not use_real_model:
+            MODEL_RELOADS.inc(role="candidate", outcome="skipped")
+            return False
+        self.set_candidate(model, scaler, label_encoder,
+                           version=f"candidate-{max(mtime for _, mtime, _ in signature) // 1_000_000}",
+                           temperature=temperature)
+        MODEL_RELOADS.inc(role="candidate", outcome="swapped")
+        return True
+
+    def _reset_shadow_stats(self):
+        self.shadow_stats = {"rows": 0, "disagreements": 0, "dropped": 0,
+                             "serving_seconds": 0.0, "candidate_seconds": 0.0}
+
+    def set_candidate(self, model, scaler, label_encoder=None, version="candidate", temperature=1.0):
+        self.candidate = (model, scaler, label_encoder or self.serving.current().label_encoder, version, temperature)
+        with self._stats_lock:
+            self._reset_shadow_stats()
+
+    def promote_candidate(self):
+        """Make the shadow candidate the serving model; returns the replaced bundle"""
+        if self.candidate is None:
+            raise RuntimeError("No shadow candidate loaded")
+        model, scaler, label_encoder, version, temperature = self.candidate
+        self.candidate = None
+        return self.serving.swap(model, scaler, version=version, source="promote", label_encoder=label_encoder,
+                                 temperature=temperature)
+
+    # -------------------------------
+    # Scoring
+    # -------------------------------
+    def predict(self, features, bundle=None):
+        """
+        Score with the serving bundle (or the snapshot passed in); a sampled fraction
+        is queued for the candidate.
+        """
+        bundle = bundle or self.serving.current()
+        self.observe(features)
+        start = time.perf_counter()
+        result = predict_batch(features, bundle.model, bundle.scaler, bundle.label_encoder, bundle.device,
+                               bundle.temperature)
+        elapsed = time.perf_counter() - start
+
+        if self.candidate is not None and self.shadow_fraction > 0 and self.rng.random() < self.shadow_fraction:
+            try:
+                self._shadow_queue.put_nowait((np.asarray(features, dtype=np.float64), result[0], elapsed))
+            except queue.Full:
+                SHADOW_DROPPED.inc()
+                with self._stats_lock:
+                    self.shadow_stats["dropped"] += 1
+        return result
+
+    def observe(self, features):
+        """Feed scored rows to the drift monitor; returns the OOD mask (None without a monitor)"""
+        if self.monitor is None:
+            return None
+        return self.monitor.observe(features)
+
+    def _shadow_score(self, features, serving_classes, serving_seconds):
+        candidate = self.candidate
+        if candidate is None:
+            return
+        model, scaler, label_encoder, _, temperature = candidate
+        start = time.perf_counter()
+        candidate_classes, _, _ = predict_batch(features, model, scaler, label_encoder,
+                                                self.serving.current().device, temperature)
+        candidate_seconds = time.perf_counter() - start
+
+        disagreements = int((np.asarray(candidate_classes) != np.asarray(serving_classes)).sum())
+        SHADOW_ROWS.inc(len(candidate_classes))
+        SHADOW_DISAGREEMENTS.inc(disagreements)
+        SHADOW_LATENCY.observe(serving_seconds, model="serving")
+        SHADOW_LATENCY.observe(candidate_seconds, model="candidate")
+        with self._stats_lock:
+            stats = self.shadow_stats
+            stats["rows"] += len(candidate_classes)
+            stats["disagreements"] += disagreements
+            stats["serving_seconds"] += serving_seconds
+            stats["candidate_seconds"] += candidate_seconds
+            SHADOW_DISAGREEMENT_RATE.set(stats["disagreements"] / max(stats["rows"], 1))
+
+    def drain_shadow(self):
+        """Score everything queued for the candidate on the calling thread (tests and CLI)"""
+        while True:
+            try:
+                item = self._shadow_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._shadow_score(*item)
+
+    def shadow_report(self):
+        with self._stats_lock:
+            stats = dict(self.shadow_stats)
+        rows = max(stats["rows"], 1)
+        return {
+            "serving_version": self.serving.current().version,
+            "candidate_version": self.candidate[3] if self.candidate else None,
+            "rows": stats["rows"],
+            "dropped": stats["dropped"],
+            "disagreement_rate": round(stats["disagreements"] / rows, 4),
+            "serving_ms_per_row": round(1000 * stats["serving_seconds"] / rows, 4),
+            "candidate_ms_per_row": round(1000 * stats["candidate_seconds"] / rows, 4),
+        }
+
+    # -------------------------------
+    # Background threads
+    # -------------------------------
+    def _watch_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+                self.check_candidate()
+            except Exception as e:
+                print(f"Model registry check failed: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _shadow_loop(self):
+        while not self._stop.is_set():
+            try:
+                item = self._shadow_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._shadow_score(*item)
+            except Exception as e:
+                print(f"Shadow scoring failed: {e}")
+
+    def start(self):
+        """Start the watcher and shadow threads (daemon); returns self"""
+        for target, name in ((self._watch_loop, "model-registry-watch"), (self._shadow_loop, "model-registry-shadow")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+def main():
+    from inference import ServingModel
+
+    parser = argparse.ArgumentParser(description="Shadow-score a candidate model against the serving model")
+    parser.add_argument("--artifact-dir", help="Serving artifacts (default: this directory)")
+    parser.add_argument("--candidate-dir", required=True, help="Candidate best_model.pth/scaler.pkl directory")
+    parser.add_argument("--features", default=None, help="Feature file to replay (default: train_features)")
+    parser.add_argument("--rows", type=int, default=2000, help="Rows to replay, one request each")
+    parser.add_argument("--shadow-fraction", type=float, default=1.0)
+    parser.add_argument("--json-out", help="Write the shadow report as JSON")
+    args = parser.parse_args()
+
+    from feature_store import read_features
+
+    model, scaler, label_encoder, device, _ = load_artifacts(args.artifact_dir, torch.device("cpu"))
+    serving = ServingModel(model, scaler, label_encoder, device, temperature=load_temperature(args.artifact_dir))
+    registry = ModelRegistry(serving, args.artifact_dir,
+                             candidate_dir=args.candidate_dir, shadow_fraction=args.shadow_fraction,
+                             settle_seconds=0, seed=0)
+    if not registry.check_candidate():
+        print(f"❌ No loadable candidate in {args.candidate_dir}")
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    frame = read_features(args.features or os.path.join(base_dir, "train_features.csv"))
+    rows = frame[FEATURE_NAMES].to_numpy(dtype=np.float64)[:args.rows]
+    registry.start()
+    for row in rows:
+        registry.predict(row)
+    while not registry._shadow_queue.empty():
+        time.sleep(0.05)
+    registry.stop()
+    registry.drain_shadow()
+
+    report = registry.shadow_report()
+    print(f"🧪 Shadow: {report['rows']:,} rows, disagreement {report['disagreement_rate']:.2%}, "
+          f"serving {report['serving_ms_per_row']:.3f} ms/row vs candidate {report['candidate_ms_per_row']:.3f} ms/row")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Incremental fine-tuning of the serving LightweightANN from analyst labels.
+
+Analysts label analyses through the bridge
+(POST /api/threat-analysis/<id>/label). The updater polls
+GET /api/threat-analysis/labels?since=<seq> and, for each new batch of labels:
+
+    1. folds the new rows into a copy of the scaler (StandardScaler.partial_fit)
+    2. fine-tunes a copy of the serving model for a few small epochs on the new
+       rows mixed with a replay sample from train_features, so earlier classes
+       are not forgotten
+    3. publishes the copy with ServingModel.swap(); requests already scoring keep
+       the previous bundle, so there is no restart and no half-updated state
+
+With --save-dir the updated best_model.pth / scaler.pkl are also written
+atomically, so other processes watching that directory can pick them up.
+Inside the app the updater is given the ModelRegistry and publishes through it
+instead: each round is checkpointed to the watched app directory as it is
+swapped in, so a hot reload never discards the fine-tuning.
+
+Usage:
+    python online_update.py --bridge http://localhost:5000 --once
+    python online_update.py --bridge http://localhost:5000 --interval 60 --save-dir ./online_artifacts
+"""
+
+import argparse
+import copy
+import os
+import threading
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from inference import FEATURE_NAMES, ServingModel, load_artifacts, save_model_checkpoint
+import metrics
+
+ONLINE_UPDATES = metrics.counter("online_updates_total", "Online fine-tuning rounds by outcome", ("outcome",))
+ONLINE_SAMPLES = metrics.counter("online_update_samples_total", "Labeled samples consumed by online fine-tuning")
+ONLINE_UPDATE_LATENCY = metrics.histogram("online_update_seconds", "Wall time of one online fine-tuning round")
+ONLINE_SKIPPED = metrics.counter("online_update_skipped_total", "Labels left out of fine-tuning by reason", ("reason",))
+
+
+def load_replay_buffer(base_dir=None):
+    """Raw features and labels from train_features (Parquet copy preferred)"""
+    from feature_store import read_features
+
+    base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+    train = read_features(os.path.join(base_dir, "train_features.csv"))
+    return train[FEATURE_NAMES].to_numpy(dtype=np.float64), train["Label"].astype(str).to_numpy()
+
+
+def _feature_row(record):
+    """The record's 45 features in FEATURE_NAMES order, or None if any is missing or not a finite number"""
+    features = record.get("features")
+    if not isinstance(features, dict):
+        return None
+    try:
+        row = [float(features[name]) for name in FEATURE_NAMES]
+    except (KeyError, TypeError, ValueError):
+        return None
+    return row if np.all(np.isfinite(row)) else None
+
+
+def labels_to_arrays(records):
+    """
+    Bridge label records → (features N x 45, label strings, records skipped).
+    Labels whose analysis was stored without (complete) features are skipped, not
+    zero-filled: an all-zero row is traffic that can't exist, and training on it
+    would teach the model to map it to whatever the analyst chose.
+    """
+    rows, labels = [], []
+    for record in records:
+        row = _feature_row(record)
+        if row is not None:
+            rows.append(row)
+            labels.append(str(record.get("label")))
+    skipped = len(records) - len(rows)
+    if skipped:
+        ONLINE_SKIPPED.inc(skipped, reason="missing_features")
+    features = np.array(rows, dtype=np.float64).reshape(-1, len(FEATURE_NAMES))
+    return features, np.array(labels, dtype=str), skipped
+
+
+class OnlineUpdater:
+    """Fine-tunes copies of the serving bundle and swaps them in"""
+
+    def __init__(self, serving, replay_features, replay_labels, lr=1e-3, epochs=5, batch_size=32,
+                 replay_ratio=1, seed=0, registry=None):
+        self.serving = serving
+        self.registry = registry  # model_registry.ModelRegistry: publish and checkpoint through it
+        self.lr = lr
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.replay_ratio = replay_ratio
+        self.rng = np.random.default_rng(seed)
+        self.rounds = 0
+
+        label_encoder = serving.current().label_encoder
+        known = np.isin(replay_labels, label_encoder.classes_)
+        self.replay_features = replay_features[known]
+        self.replay_targets = label_encoder.transform(replay_labels[known]) if known.any() else np.empty(0, int)
+
+    def update(self, features, labels):
+        """One fine-tuning round on newly labeled rows; returns a stats dict"""
+        start = time.perf_counter()
+        bundle = self.serving.current()
+        classes = list(bundle.label_encoder.classes_)
+        known = np.isin(labels, classes)
+        features, labels = np.asarray(features, dtype=np.float64)[known], np.asarray(labels)[known]
+        stats = {"received": int(len(known)), "used": int(known.sum()), "skipped_unknown_label": int((~known).sum())}
+        if stats["skipped_unknown_label"]:
+            ONLINE_SKIPPED.inc(stats["skipped_unknown_label"], reason="unknown_label")
+        if not len(features):
+            ONLINE_UPDATES.inc(outcome="skipped")
+            return stats
+        targets = bundle.label_encoder.transform(labels)
+
+        # Work on copies; the serving bundle stays untouched until the swap
+        scaler = copy.deepcopy(bundle.scaler)
+        scaler.partial_fit(features)
+        model = copy.deepcopy(bundle.model).to(bundle.device)
+
+        def _accuracy():
+            model.eval()
+            with torch.no_grad():
+                x = torch.as_tensor(scaler.transform(features), dtype=torch.float32, device=bundle.device)
+                return float((model(x).argmax(dim=1).cpu().numpy() == targets).mean())
+
+        stats["accuracy_before"] = _accuracy()
+        optimizer = torch.optim.Adam(model.parameters(), lr=self.lr)
+        loss_fn = nn.CrossEntropyLoss()
+        losses = []
+        model.train()
+        for _ in range(self.epochs):
+            order = self.rng.permutation(len(features))
+            for lo in range(0, len(order), self.batch_size):
+                idx = order[lo:lo + self.batch_size]
+                x, y = features[idx], targets[idx]
+                if len(self.replay_features):
+                    replay = self.rng.integers(0, len(self.replay_features), len(idx) * self.replay_ratio)
+                    x = np.vstack([x, self.replay_features[replay]])
+                    y = np.concatenate([y, self.replay_targets[replay]])
+                x = torch.as_tensor(scaler.transform(x), dtype=torch.float32, device=bundle.device)
+                y = torch.as_tensor(y, dtype=torch.long, device=bundle.device)
+                optimizer.zero_grad()
+                loss = loss_fn(model(x), y)
+                loss.backward()
+                optimizer.step()
+                losses.append(float(loss.item()))
+        stats["accuracy_after"] = _accuracy()
+        model.eval()
+
+        self.rounds += 1
+        version = f"online-{self.rounds}-{int(time.time())}"
+        if self.registry is not None:
+            self.registry.publish(model, scaler, version=version, source="online_update")
+        else:
+            self.serving.swap(model, scaler, version=version, source="online_update")
+        ONLINE_UPDATES.inc(outcome="swapped")
+        ONLINE_SAMPLES.inc(len(features))
+        ONLINE_UPDATE_LATENCY.observe(time.perf_counter() - start)
+        stats.update(version=version, loss=float(np.mean(losses)), seconds=round(time.perf_counter() - start, 3))
+        return stats
+
+
+def save_artifacts(save_dir, bundle):
+    """Atomically write the bundle's weights and scaler (best_model.pth / scaler.pkl)"""
+    import joblib
+
+    os.makedirs(save_dir, exist_ok=True)
+    model_path = os.path.join(save_dir, "best_model.pth")
+    scaler_path = os.path.join(save_dir, "scaler.pkl")
+    joblib.dump(bundle.scaler, scaler_path + ".tmp")
+    # Scaler first: a watcher reacting to the new weights must already see the matching scaler
+    os.replace(scaler_path + ".tmp", scaler_path)
+    return save_model_checkpoint(model_path, bundle.model)
+
+
+def fetch_labels(bridge_url, since, limit=500, timeout=5):
+    import requests
+
+    response = requests.get(
+        bridge_url.rstrip("/") + "/api/threat-analysis/labels",
+        params={"since": since, "limit": limit}, timeout=timeout
+    )
+    response.raise_for_status()
+    return response.json().get("data") or []
+
+
+def poll_once(updater, bridge_url, since, min_labels=1, save_dir=None):
+    """Fetch labels after `since` and run one round; returns (new since, stats or None)"""
+    records = fetch_labels(bridge_url, since)
+    if len(records) < min_labels:
+        return since, None
+    features, labels, missing = labels_to_arrays(records)
+    stats = updater.update(features, labels)
+    stats["skipped_missing_features"] = missing
+    if save_dir and stats.get("version"):
+        save_artifacts(save_dir, updater.serving.current())
+    return max(int(r["seq"]) for r in records), stats
+
+
+def start_background_updater(serving, bridge_url, interval=60.0, min_labels=1, save_dir=None, since=0,
+                             registry=None):
+    """Run poll_once every `interval` seconds in a daemon thread; returns (thread, stop event)"""
+    replay_features, replay_labels = load_replay_buffer()
+    updater = OnlineUpdater(serving, replay_features, replay_labels, registry=registry)
+    stop = threading.Event()
+
+    def _loop():
+        cursor = since
+        while not stop.is_set():
+            try:
+                cursor, stats = poll_once(updater, bridge_url, cursor, min_labels, save_dir)
+                if stats and stats.get("version"):
+                    print(f"🔁 Online update {stats['version']}: {stats['used']} labels, "
+                          f"accuracy {stats['accuracy_before']:.2f} → {stats['accuracy_after']:.2f}")
+            except Exception as e:
+                ONLINE_UPDATES.inc(outcome="error")
+                print(f"Online update failed: {e}")
+            stop.wait(interval)
+
+    thread = threading.Thread(target=_loop, name="online-updater", daemon=True)
+    thread.start()
+    return thread, stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune the model from analyst labels on the bridge")
+    parser.add_argument("--bridge", default=os.environ.get("API_BRIDGE_URL", "http://localhost:5000"))
+    parser.add_argument("--since", type=int, default=0, help="Only use labels after this label seq")
+    parser.add_argument("--interval", type=float, default=60.0, help="Seconds between polls")
+    parser.add_argument("--min-labels", type=int, default=1, help="Wait for at least this many new labels")
+    parser.add_argument("--save-dir", help="Write updated best_model.pth/scaler.pkl here after each round")
+    parser.add_argument("--once", action="store_true", help="Run a single round and exit")
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--replay-ratio", type=int, default=1, help="Replay rows per labeled row")
+    args = parser.parse_args()
+
+    model, scaler, label_encoder, device, use_real_model = load_artifacts()
+    if not use_real_model:
+        print("⚠️ best_model.pth not found: fine-tuning the untrained demo weights")
+    serving = ServingModel(model, scaler, label_encoder, device)
+    replay_features, replay_labels = load_replay_buffer()
+    updater = OnlineUpdater(serving, replay_features, replay_labels, lr=args.lr, epochs=args.epochs,
+                            replay_ratio=args.replay_ratio)
+    print(f"📚 Replay buffer: {len(updater.replay_features):,} rows; polling {args.bridge}")
+
+    since = args.since
+    while True:
+        since, stats = poll_once(updater, args.bridge, since, args.min_labels, args.save_dir)
+        if stats:
+            print(f"🔁 {stats}")
+        elif args.once:
+            print("ℹ️ No new labels")
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Offline pcap replay scoring pipeline.
+
+Runs a capture through four stages, each in its own thread and connected by
+bounded queues so a slow stage applies back-pressure instead of buffering the
+whole capture:
+
+    parse      read_packets()              pcap/pcapng → PACKET_DTYPE batches
+    aggregate  FlowFeatureExtractor        packet batches → 45-feature flow windows
+    score      predict_batch()             flow windows → class / confidence (batched;
+                                           behind the benign pre-filter with --cascade),
+                                           plus top contributing features per alert (--explain)
+    sink       JSONL file or bridge POST   scored windows → alerts
+
+At the end each stage reports packets/s or flows/s. Busy time is time spent
+working, not waiting on a queue, so the stage with the highest utilization is
+the one limiting throughput.
+
+Usage:
+    python pcap_pipeline.py capture.pcap --out alerts.jsonl
+    python pcap_pipeline.py capture.pcapng --post http://localhost:5000 --alerts-only
+    python pcap_pipeline.py capture.pcap --window 100 --batch-size 4096 --json-out stages.json
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from cascade import cascade_predict, load_prefilter
+from flow_features import FlowFeatureExtractor, read_packets
+from inference import (
+    FEATURE_NAMES, predict_batch, predict_top_k, load_artifacts, load_temperature,
+    get_recommendations_for_threat, determine_risk_level
+)
+
+_DONE = object()
+
+
+class StageStats:
+    """Counters for one pipeline stage"""
+
+    def __init__(self, name, in_unit, out_unit):
+        self.name = name
+        self.in_unit = in_unit
+        self.out_unit = out_unit
+        self.items_in = 0
+        self.items_out = 0
+        self.busy = 0.0
+        self.wall = 0.0
+        self.error = None
+
+    def as_dict(self):
+        wall = max(self.wall, 1e-9)
+        return {
+            "stage": self.name,
+            "in": self.items_in, "in_unit": self.in_unit,
+            "out": self.items_out, "out_unit": self.out_unit,
+            "busy_s": round(self.busy, 4),
+            "wall_s": round(self.wall, 4),
+            "utilization": round(self.busy / wall, 4),
+            "in_per_s": round(self.items_in / wall, 1),
+            "out_per_s": round(self.items_out / wall, 1),
+            "capacity_per_s": round(self.items_in / max(self.busy, 1e-9), 1) if self.items_in else None,
+        }
+
+
+def _put(outbox, item, stop):
+    """Blocking put that gives up once another stage has failed"""
+    while not stop.is_set():
+        try:
+            outbox.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _drain(inbox, stop):
+    """Yield queue items until the end marker, or until another stage has failed"""
+    while not stop.is_set():
+        try:
+            item = inbox.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _run_stage(stats, source, handle, finish, outbox, stop, from_queue=True):
+    """
+    Pull items from `source` (a queue, or an iterator for the first stage), pass each
+    to handle(item) → [(output, n_in, n_out)], then finish() → same, and forward outputs.
+    """
+    start = time.perf_counter()
+    try:
+        items = _drain(source, stop) if from_queue else iter(source)
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                break
+            if not from_queue:
+                stats.busy += time.perf_counter() - t0   # reading the capture is this stage's work
+            t0 = time.perf_counter()
+            results = handle(item)
+            stats.busy += time.perf_counter() - t0
+            for output, n_in, n_out in results:
+                stats.items_in += n_in
+                stats.items_out += n_out
+                if outbox is not None and output is not None:
+                    _put(outbox, output, stop)
+
+        t0 = time.perf_counter()
+        results = finish() if finish else []
+        stats.busy += time.perf_counter() - t0
+        for output, n_in, n_out in results:
+            stats.items_in += n_in
+            stats.items_out += n_out
+            if outbox is not None and output is not None:
+                _put(outbox, output, stop)
+    except Exception as e:
+        stats.error = e
+        stop.set()
+    finally:
+        if outbox is not None:
+            _put(outbox, _DONE, stop)
+        stats.wall = time.perf_counter() - start
+
+
+# -------------------------------
+# Stage bodies
+# -------------------------------
+def _ip(value):
+    return socket.inet_ntoa(struct.pack('!I', int(value)))
+
+
+def _alert_mask(classes, confidences, alerts_only, min_confidence):
+    """Rows that become alerts (benign dropped with alerts_only, low confidence dropped)"""
+    keep = np.asarray(confidences) >= min_confidence
+    if alerts_only:
+        keep &= ~np.isin(np.char.lower(np.asarray(classes, dtype=str)), ['benign', 'normal'])
+    return keep
+
+
+def _alert_records(features, meta, classes, confidences, probabilities, ood, explanations, class_names, model_used,
+                   alerts_only, min_confidence, include_features):
+    records = []
+    keep = _alert_mask(classes, confidences, alerts_only, min_confidence)
+    for i in np.flatnonzero(keep):
+        threat_class = str(classes[i])
+        confidence = float(confidences[i])
+        m = meta[i]
+        if isinstance(probabilities, tuple):  # top-k fast path: (class names N x k, probabilities N x k)
+            top_classes, top_probabilities = probabilities
+            class_probabilities = {str(c): float(p) for c, p in zip(top_classes[i], top_probabilities[i])}
+        else:
+            class_probabilities = {class_names[j]: float(probabilities[i, j]) for j in range(len(class_names))}
+        record = {
+            "threat_class": threat_class,
+            "confidence": confidence,
+            "probabilities": class_probabilities,
+            "recommendations": get_recommendations_for_threat(threat_class),
+            "risk_level": determine_risk_level(threat_class, confidence),
+            "timestamp": datetime.fromtimestamp(float(m['last_ts'])).isoformat(),
+            "model_used": model_used,
+            "flow": {
+                "src": _ip(m['src_ip']), "dst": _ip(m['dst_ip']),
+                "sport": int(m['sport']), "dport": int(m['dport']), "proto": int(m['proto']),
+                "packets": int(m['packets']),
+                "first_ts": float(m['first_ts']), "last_ts": float(m['last_ts']),
+            },
+        }
+        if ood is not None:
+            record["ood"] = bool(ood[i])
+        if explanations is not None and explanations[i] is not None:
+            record["attributions"] = explanations[i]
+        if include_features:
+            record["features"] = dict(zip(FEATURE_NAMES, features[i].tolist()))
+        records.append(record)
+    return records
+
+
+def _jsonl_sink(path):
+    f = open(path, "w")
+
+    def write(records):
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+    return write, f.close
+
+
+def _post_sink(bridge_url, timeout=3.0, device_id=None):
+    import requests
+
+    session = requests.Session()
+    if device_id:
+        # The bridge partitions history by device (X-Device-ID when the alert doesn't name one)
+        session.headers["X-Device-ID"] = device_id
+    url = bridge_url.rstrip("/") + "/api/threat-analysis"
+    failures = [0]
+
+    def post(records):
+        for record in records:
+            try:
+                response = session.post(url, json=record, timeout=timeout)
+                if response.status_code != 200:
+                    failures[0] += 1
+            except requests.RequestException:
+                failures[0] += 1
+
+    def close():
+        session.close()
+        if failures[0]:
+            print(f"⚠️ {failures[0]} alerts could not be delivered to {url}")
+
+    return post, close
+
+
+def run_pipeline(capture, sink, model, scaler, label_encoder, device, use_real_model=True,
+                 window=10, idle_timeout=60.0, batch_size=2048, queue_size=8, chunk_bytes=8 << 20,
+                 alerts_only=False, min_confidence=0.0, include_features=False, temperature=1.0, top_k=None,
+                 monitor=None, explainer=None, prefilter=None):
+    """
+    Run the staged pipeline over `capture`; `sink(records)` receives lists of alert
+    dicts. Returns the list of StageStats (parse, aggregate, score, sink).
+    With top_k, alerts carry only the top_k class probabilities (smaller payloads,
+    no full probability matrix); temperature calibrates the confidences.
+    With a drift_monitor.DriftMonitor, every window is tracked and alerts carry an `ood` flag.
+    With an attribution.AttributionEngine, alerts carry their top contributing features;
+    only windows that become alerts are explained.
+    With a cascade.Prefilter, windows it clears as benign skip the network.
+    """
+    stop = threading.Event()
+    q_packets, q_windows, q_scored = (queue.Queue(maxsize=queue_size) for _ in range(3))
+    stats = [
+        StageStats("parse", "bytes", "packets"),
+        StageStats("aggregate", "packets", "flows"),
+        StageStats("score", "flows", "flows"),
+        StageStats("sink", "flows", "alerts"),
+    ]
+    class_names = [str(c) for c in label_encoder.classes_]
+    model_used = "real" if use_real_model else "demo"
+
+    # parse: the iterator does the reading, so count packets on the way out
+    def parse(batch):
+        return [(batch, 0, len(batch))]
+
+    extractor = FlowFeatureExtractor(window=window, idle_timeout=idle_timeout)
+
+    def aggregate(batch):
+        features, meta = extractor.update(batch)
+        return [((features, meta) if len(features) else None, len(batch), len(features))]
+
+    def aggregate_finish():
+        features, meta = extractor.flush()
+        return [((features, meta) if len(features) else None, 0, len(features))]
+
+    pending = []
+
+    def _score_pending():
+        if not pending:
+            return []
+        features = np.concatenate([f for f, _ in pending])
+        meta = np.concatenate([m for _, m in pending])
+        pending.clear()
+        out = []
+        for lo in range(0, len(features), batch_size):
+            f, m = features[lo:lo + batch_size], meta[lo:lo + batch_size]
+            if prefilter is not None:
+                classes, confidences, probabilities, _ = cascade_predict(f, prefilter, model, scaler, label_encoder,
+                                                                         device, temperature)
+                if top_k:
+                    order = np.argsort(-probabilities, axis=1)[:, :top_k]
+                    probabilities = (np.asarray(class_names)[order], np.take_along_axis(probabilities, order, 1))
+            elif top_k:
+                top_classes, top_probabilities = predict_top_k(f, model, scaler, label_encoder, device, top_k,
+                                                               temperature)
+                classes, confidences = top_classes[:, 0], top_probabilities[:, 0]
+                probabilities = (top_classes, top_probabilities)
+            else:
+                classes, confidences, probabilities = predict_batch(f, model, scaler, label_encoder, device,
+                                                                    temperature)
+            ood = monitor.observe(f) if monitor is not None else None
+            explanations = None
+            if explainer is not None:
+                keep = np.flatnonzero(_alert_mask(classes, confidences, alerts_only, min_confidence))
+                explanations = [None] * len(f)
+                for i, explained in zip(keep, explainer.explain(f[keep], model, scaler, device)):
+                    explanations[i] = explained
+            out.append(((f, m, classes, confidences, probabilities, ood, explanations), len(f), len(f)))
+        return out
+
+    def score(item):
+        pending.append(item)
+        if sum(len(f) for f, _ in pending) >= batch_size:
+            return _score_pending()
+        return []
+
+    def deliver(item):
+        records = _alert_records(*item, class_names, model_used, alerts_only, min_confidence, include_features)
+        if records:
+            sink(records)
+        return [(None, len(item[0]), len(records))]
+
+    threads = [
+        threading.Thread(target=_run_stage, name="parse", daemon=True,
+                         args=(stats[0], read_packets(capture, chunk_bytes), parse, None, q_packets, stop, False)),
+        threading.Thread(target=_run_stage, name="aggregate", daemon=True,
+                         args=(stats[1], q_packets, aggregate, aggregate_finish, q_windows, stop)),
+        threading.Thread(target=_run_stage, name="score", daemon=True,
+                         args=(stats[2], q_windows, score, _score_pending, q_scored, stop)),
+        threading.Thread(target=_run_stage, name="sink", daemon=True,
+                         args=(stats[3], q_scored, deliver, None, None, stop)),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # The parser only knows its output count; its input is the capture itself
+    stats[0].items_in = os.path.getsize(capture)
+    for s in stats:
+        if s.error is not None:
+            raise RuntimeError(f"Pipeline stage '{s.name}' failed: {s.error}") from s.error
+    return stats
+
+
+def print_report(stats, elapsed):
+    print(f"\n📊 Pipeline stages ({elapsed:.2f}s wall)")
+    print(f"   {'stage':<10}{'in':>21}{'out':>21}{'in/s':>14}{'out/s':>14}{'busy':>9}{'util':>7}")
+    rows = [s.as_dict() for s in stats]
+    for r in rows:
+        print(f"   {r['stage']:<10}{r['in']:>13,} {r['in_unit']:<7}{r['out']:>13,} {r['out_unit']:<7}"
+              f"{r['in_per_s']:>14,.0f}{r['out_per_s']:>14,.0f}{r['busy_s']:>8.2f}s{r['utilization']:>7.0%}")
+    bottleneck = max(rows, key=lambda r: r["utilization"])
+    print(f"\n🐢 Limiting stage: {bottleneck['stage']} ({bottleneck['utilization']:.0%} busy)")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a recorded capture through the staged SecureGluco pipeline")
+    parser.add_argument("capture", help="pcap or pcapng file")
+    sink_group = parser.add_mutually_exclusive_group()
+    sink_group.add_argument("--out", default="alerts.jsonl", help="JSONL alert file (default alerts.jsonl)")
+    sink_group.add_argument("--post", metavar="BRIDGE_URL", help="POST alerts to the API bridge instead")
+    parser.add_argument("--device-id", default=os.environ.get("DEVICE_ID"),
+                        help="Device the capture was taken from (with --post; default $DEVICE_ID)")
+    parser.add_argument("--window", type=int, default=10, help="Packets per flow window")
+    parser.add_argument("--idle-timeout", type=float, default=60.0, help="Seconds before an idle flow is flushed")
+    parser.add_argument("--batch-size", type=int, default=2048, help="Flow windows per model call")
+    parser.add_argument("--queue-size", type=int, default=8, help="Batches buffered between stages")
+    parser.add_argument("--alerts-only", action="store_true", help="Drop windows classified as benign")
+    parser.add_argument("--min-confidence", type=float, default=0.0)
+    parser.add_argument("--include-features", action="store_true", help="Include the 45 features in each alert")
+    parser.add_argument("--top-k", type=int, default=None,
+                        help="Only include the top K class probabilities per alert (faster, smaller)")
+    parser.add_argument("--drift", action="store_true",
+                        help="Track drift against the training scaler and flag out-of-distribution windows")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Clear confidently benign windows with the cascade.json pre-filter before the model")
+    parser.add_argument("--explain", type=int, default=0, metavar="K",
+                        help="Attach the K features that contributed most to each alert")
+    parser.add_argument("--explain-method", choices=("input_x_gradient", "integrated_gradients"),
+                        default="input_x_gradient")
+    parser.add_argument("--json-out", help="Write per-stage statistics as JSON")
+    args = parser.parse_args()
+
+    model, scaler, label_encoder, device, use_real_model = load_artifacts()
+    temperature = load_temperature()
+    monitor = None
+    if args.drift:
+        from drift_monitor import monitor_from_artifacts
+        monitor = monitor_from_artifacts(scaler)
+    prefilter = load_prefilter() if args.cascade else None
+    if args.cascade and prefilter is None:
+        parser.error("--cascade needs cascade.json next to the model (run cascade.py first)")
+    explainer = None
+    if args.explain:
+        from attribution import AttributionEngine
+        explainer = AttributionEngine(args.explain_method, top_k=args.explain, max_rows=args.batch_size)
+    if not use_real_model:
+        print("⚠️ best_model.pth not found: scoring with untrained weights (demo)")
+
+    if args.post:
+        sink, close = _post_sink(args.post, device_id=args.device_id)
+        target = args.post
+    else:
+        sink, close = _jsonl_sink(args.out)
+        target = args.out
+
+    print(f"🚀 Replaying {args.capture} → {target}")
+    start = time.perf_counter()
+    try:
+        stats = run_pipeline(
+            args.capture, sink, model, scaler, label_encoder, device, use_real_model,
+            window=args.window, idle_timeout=args.idle_timeout, batch_size=args.batch_size,
+            queue_size=args.queue_size, alerts_only=args.alerts_only,
+            min_confidence=args.min_confidence, include_features=args.include_features,
+            temperature=temperature, top_k=args.top_k, monitor=monitor, explainer=explainer,
+            prefilter=prefilter
+        )
+    finally:
+        close()
+    rows = print_report(stats, time.perf_counter() - start)
+    if monitor is not None:
+        drift = monitor.report()
+        top = drift["features"][0] if drift["features"] else None
+        print(f"📈 Drift: {drift['ood_rows']:,}/{drift['rows']:,} windows out-of-distribution; "
+              f"most drifted feature {top['feature'] if top else '-'} ({top['zscore'] if top else 0:.2f} σ)")
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"💾 Stage statistics written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Structured pruning and hidden-width search for LightweightANN.
+
+Two ways to find narrower variants of the hand-picked 256→128→64 widths:
+
+    prune   start from the serving model and repeatedly drop the least important
+            hidden neurons of every layer (importance = L2 norm of a neuron's
+            incoming weights times that of its outgoing weights), slicing the
+            weight matrices so the result is a genuinely smaller dense network.
+            Each step is fine-tuned before the next one.
+    search  train a small grid of width configurations from scratch
+
+Every variant is evaluated on a held-out split of train_features. The Pareto table
+covers accuracy, agreement with the starting model, FLOPs per row, parameter count
+and latency. The chosen variant is the cheapest by FLOPs that stays within
+--max-accuracy-drop of the starting model. It is written with its
+architecture recorded (save_model_checkpoint), so load_artifacts() and the app's
+load_model_and_preprocessors() load it as best_model.pth unchanged.
+
+Usage:
+    python prune.py                                   # prune steps + width search, table only
+    python prune.py --output pruned_model.pth --json-out pareto.json
+    python prune.py --data labeled.parquet --keep 0.75 0.5 0.25 --no-search
+"""
+
+import argparse
+import copy
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from inference import FEATURE_NAMES, LightweightANN, load_artifacts, save_model_checkpoint
+
+DEFAULT_KEEP = (0.75, 0.5, 0.375, 0.25, 0.125)
+DEFAULT_SEARCH = ((128, 64, 32), (128, 64), (64, 32), (64, 32, 16), (32, 16))
+
+
+def linear_layers(model):
+    return [m for m in model.layers if isinstance(m, nn.Linear)]
+
+
+def flops_per_row(model):
+    """Multiply-adds of the dense layers, counted as 2 FLOPs each"""
+    return int(sum(2 * layer.in_features * layer.out_features for layer in linear_layers(model)))
+
+
+def param_count(model):
+    return int(sum(p.numel() for p in model.parameters()))
+
+
+def neuron_importance(model):
+    """Per hidden layer: ||incoming row|| * ||outgoing column|| for every neuron"""
+    layers = linear_layers(model)
+    scores = []
+    for layer, following in zip(layers[:-1], layers[1:]):
+        incoming = torch.cat([layer.weight, layer.bias[:, None]], dim=1).norm(dim=1)
+        outgoing = following.weight.norm(dim=0)
+        scores.append((incoming * outgoing).detach())
+    return scores
+
+
+@torch.no_grad()
+def prune_widths(model, hidden_sizes):
+    """A new LightweightANN keeping the most important neurons of each hidden layer"""
+    layers = linear_layers(model)
+    keep = [
+        torch.sort(torch.topk(score, int(width)).indices).values
+        for score, width in zip(neuron_importance(model), hidden_sizes)
+    ]
+    pruned = LightweightANN(layers[0].in_features, layers[-1].out_features, hidden_sizes=hidden_sizes)
+    previous = None
+    for i, (source, target) in enumerate(zip(layers, linear_layers(pruned))):
+        weight, bias = source.weight, source.bias
+        if previous is not None:
+            weight = weight[:, previous]
+        if i < len(keep):
+            weight, bias = weight[keep[i]], bias[keep[i]]
+            previous = keep[i]
+        target.weight.copy_(weight)
+        target.bias.copy_(bias)
+    return pruned
+
+
+def fine_tune(model, x, y, epochs=3, batch_size=256, lr=1e-3, seed=0):
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    x_t, y_t = torch.as_tensor(x, dtype=torch.float32), torch.as_tensor(y, dtype=torch.long)
+    for _ in range(epochs):
+        model.train()
+        for idx in np.array_split(rng.permutation(len(x)), max(1, len(x) // batch_size)):
+            optimizer.zero_grad()
+            F.cross_entropy(model(x_t[idx]), y_t[idx]).backward()
+            optimizer.step()
+    return model.eval()
+
+
+@torch.no_grad()
+def evaluate(model, x, y, reference_pred=None, batch_size=1024, repeats=20):
+    model.eval()
+    x_t = torch.as_tensor(x, dtype=torch.float32)
+    pred = model(x_t).argmax(dim=1).numpy()
+
+    batch = x_t[:batch_size]
+    model(batch)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model(batch)
+    batch_ms = 1000 * (time.perf_counter() - start) / repeats
+    singles = []
+    for _ in range(repeats * 5):
+        t0 = time.perf_counter()
+        model(x_t[:1])
+        singles.append(time.perf_counter() - t0)
+
+    return {
+        "hidden_sizes": list(model.hidden_sizes),
+        "accuracy": round(float((pred == y).mean()), 4),
+        "agreement": round(float((pred == reference_pred).mean()), 4) if reference_pred is not None else 1.0,
+        "flops": flops_per_row(model),
+        "params": param_count(model),
+        "batch_ms": round(batch_ms, 3),
+        "single_ms": round(1000 * float(np.median(singles)), 4),
+    }, pred
+
+
+def mark_pareto(rows, keys=(("accuracy", max), ("flops", min), ("batch_ms", min))):
+    """Flag rows no other row beats on every key (and strictly on one)"""
+    def better_or_equal(a, b):
+        return all((a[k] >= b[k]) if sense is max else (a[k] <= b[k]) for k, sense in keys)
+
+    for row in rows:
+        row["pareto"] = not any(
+            other is not row and better_or_equal(other, row) and any(other[k] != row[k] for k, _ in keys)
+            for other in rows
+        )
+    return rows
+
+
+def choose(rows, max_accuracy_drop):
+    baseline = rows[0]["accuracy"]
+    eligible = [r for r in rows if r["accuracy"] >= baseline - max_accuracy_drop]
+    return min(eligible, key=lambda r: (r["flops"], -r["accuracy"]))
+
+
+def run(model, x_train, y_train, x_test, y_test, keep=DEFAULT_KEEP, search=DEFAULT_SEARCH,
+        epochs=3, max_accuracy_drop=0.005, seed=0):
+    """Returns (rows sorted by FLOPs with Pareto flags, {variant name: model}, chosen row)"""
+    model = copy.deepcopy(model).cpu().eval()
+    base_row, reference = evaluate(model, x_test, y_test)
+    base_row["variant"] = "baseline"
+    rows, models = [base_row], {"baseline": model}
+
+    current = model
+    base_widths = np.asarray(model.hidden_sizes)
+    for fraction in keep:
+        widths = tuple(int(w) for w in np.maximum(1, np.round(base_widths * fraction)))
+        current = fine_tune(prune_widths(current, widths), x_train, y_train, epochs, seed=seed)
+        row, _ = evaluate(current, x_test, y_test, reference)
+        row["variant"] = f"prune-{fraction:g}"
+        rows.append(row)
+        models[row["variant"]] = current
+
+    for widths in search:
+        torch.manual_seed(seed)
+        candidate = LightweightANN(model.layers[0].in_features, linear_layers(model)[-1].out_features,
+                                   hidden_sizes=widths)
+        candidate = fine_tune(candidate, x_train, y_train, epochs * 3, seed=seed)
+        row, _ = evaluate(candidate, x_test, y_test, reference)
+        row["variant"] = "search-" + "x".join(str(w) for w in widths)
+        rows.append(row)
+        models[row["variant"]] = candidate
+
+    chosen = choose(rows, max_accuracy_drop)
+    rows = mark_pareto(rows)
+    return sorted(rows, key=lambda r: r["flops"], reverse=True), models, chosen
+
+
+def main():
+    from feature_store import read_features
+
+    parser = argparse.ArgumentParser(description="Prune / width-search LightweightANN and print a Pareto table")
+    parser.add_argument("--data", help="Labeled feature file (default: train_features)")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--keep", type=float, nargs="+", default=list(DEFAULT_KEEP),
+                        help="Width fractions for successive prune steps")
+    parser.add_argument("--no-search", action="store_true", help="Skip the from-scratch width grid")
+    parser.add_argument("--epochs", type=int, default=3, help="Fine-tune epochs per prune step")
+    parser.add_argument("--base-epochs", type=int, default=5, help="Training epochs when no best_model.pth exists")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.005)
+    parser.add_argument("--output", help="Write the chosen variant here (load it as best_model.pth)")
+    parser.add_argument("--json-out", help="Write the Pareto table as JSON")
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)  # latency comparable to one scoring worker
+    model, scaler, label_encoder, _, use_real_model = load_artifacts(device=torch.device("cpu"))
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    frame = read_features(args.data or os.path.join(base_dir, "train_features.csv"))
+    known = frame["Label"].astype(str).isin(label_encoder.classes_).to_numpy()
+    x = scaler.transform(frame[FEATURE_NAMES].to_numpy(dtype=np.float64)[known]).astype(np.float32)
+    y = label_encoder.transform(frame["Label"].astype(str).to_numpy()[known])
+
+    order = np.random.default_rng(0).permutation(len(x))
+    n_test = max(1, int(len(x) * args.test_size))
+    test, train = order[:n_test], order[n_test:]
+    print(f"📚 {len(train):,} train / {len(test):,} held-out rows, {len(set(y))} classes present")
+    if not use_real_model:
+        print(f"⚠️ best_model.pth not found: training a baseline for {args.base_epochs} epochs first")
+        model = fine_tune(model, x[train], y[train], args.base_epochs)
+
+    rows, models, chosen = run(model, x[train], y[train], x[test], y[test], args.keep,
+                               () if args.no_search else DEFAULT_SEARCH, args.epochs, args.max_accuracy_drop)
+
+    print(f"{'variant':<20}{'widths':<16}{'accuracy':>9}{'agree':>8}{'kFLOPs':>9}{'params':>9}"
+          f"{'ms/1k':>8}{'ms/row':>8}  pareto")
+    for r in rows:
+        mark = "★" if r["pareto"] else ""
+        chosen_mark = " ← chosen" if r is chosen else ""
+        print(f"{r['variant']:<20}{'→'.join(map(str, r['hidden_sizes'])):<16}{r['accuracy']:>9.2%}"
+              f"{r['agreement']:>8.2%}{r['flops'] / 1000:>9.1f}{r['params']:>9,}{r['batch_ms']:>8.2f}"
+              f"{r['single_ms']:>8.3f}  {mark}{chosen_mark}")
+
+    if args.output:
+        save_model_checkpoint(args.output, models[chosen["variant"]])
+        print(f"💾 {chosen['variant']} saved to {args.output} (architecture recorded; load as best_model.pth)")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"rows": rows, "chosen": chosen["variant"]}, f, indent=2)
+        print(f"💾 Pareto table written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
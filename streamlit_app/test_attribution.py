@@ -0,0 +1,43 @@
+# streamlit_app/test_attribution.py
+# Batched attributions must match the per-row definition, satisfy completeness and be served from cache on repeat.
+import numpy as np
+import torch
+
+from attribution import ATTRIBUTION_ROWS, AttributionEngine, integrated_gradients, input_x_gradient
+from inference import FEATURE_NAMES, load_artifacts
+
+
+def test_batched_attributions_match_definition():
+    model, _, _, _, _ = load_artifacts(device=torch.device("cpu"))
+    x = torch.as_tensor(np.random.default_rng(0).normal(size=(16, len(FEATURE_NAMES))), dtype=torch.float32)
+    logits = model(x).detach()
+    targets = logits.argmax(dim=1)
+
+    batched, _ = input_x_gradient(model, x)
+    row = x[3:4].clone().requires_grad_(True)
+    model(row)[0, targets[3]].backward()
+    assert torch.allclose(batched[3], (x[3] * row.grad[0]), atol=1e-5)
+
+    # completeness: integrated gradients add up to logit(x) - logit(baseline)
+    ig, _ = integrated_gradients(model, x, steps=64, max_batch=256)
+    baseline_logits = model(torch.zeros_like(x)).detach()
+    expected = logits.gather(1, targets[:, None])[:, 0] - baseline_logits.gather(1, targets[:, None])[:, 0]
+    assert torch.allclose(ig.sum(dim=1), expected, atol=0.02)
+
+
+def test_engine_caches_and_bounds_rows():
+    model, scaler, _, device, _ = load_artifacts(device=torch.device("cpu"))
+    features = np.random.default_rng(1).gamma(2.0, 50.0, size=(10, len(FEATURE_NAMES)))
+    engine = AttributionEngine(top_k=3, max_rows=8)
+
+    explained = engine.explain(features, model, scaler, device)
+    assert len(explained) == 10 and explained[8] is None and explained[9] is None
+    assert [len(e) for e in explained[:8]] == [3] * 8
+    assert {"feature", "value", "attribution"} <= set(explained[0][0])
+    magnitudes = [abs(item["attribution"]) for item in explained[0]]
+    assert magnitudes == sorted(magnitudes, reverse=True)
+
+    hits = ATTRIBUTION_ROWS.value(cache="hit")
+    again = engine.explain(features[:4], model, scaler, device, top_k=5)
+    assert ATTRIBUTION_ROWS.value(cache="hit") == hits + 4
+    assert [item["feature"] for item in again[0][:3]] == [item["feature"] for item in explained[0]]
@@ -0,0 +1,100 @@
+# streamlit_app/test_batch_score.py
+# Sharded scoring must see every row exactly once and merge to the single-process result.
+import numpy as np
+import pandas as pd
+
+from batch_score import csv_shards, _read_csv_range, score_file
+from feature_schema import BINARY, ONE_HOT_GROUPS, SCHEMA
+from inference import FEATURE_NAMES
+
+
+def _feature_file(tmp_path, rows=600):
+    rng = np.random.default_rng(1)
+    frame = pd.DataFrame(rng.gamma(2.0, 50.0, size=(rows, len(FEATURE_NAMES))).round(3), columns=FEATURE_NAMES)
+    # Keep the rows valid for the feature schema: 0/1 indicators, one transport protocol
+    binary = [feature.name for feature in SCHEMA if feature.kind == BINARY]
+    frame[binary] = rng.integers(0, 2, size=(rows, len(binary)))
+    transport = list(ONE_HOT_GROUPS["transport"])
+    frame[transport] = np.eye(len(transport), dtype=int)[rng.integers(0, len(transport), rows)]
+    frame["Protocol_Type"] = rng.choice([1, 6, 17], rows)
+    frame["Label"] = "Benign"
+    path = tmp_path / "features.csv"
+    frame.to_csv(path, index=False)
+    return str(path), frame
+
+
+def test_csv_byte_ranges_cover_every_row_once(tmp_path):
+    path, frame = _feature_file(tmp_path)
+    parts = [_read_csv_range(path, lo, hi) for _, _, lo, hi in csv_shards(path, 13)]
+
+    merged = pd.concat([p for p, _ in parts], ignore_index=True)
+    assert len(merged) == len(frame)
+    assert np.allclose(merged[FEATURE_NAMES].to_numpy(), frame[FEATURE_NAMES].to_numpy())
+
+    # Byte offsets point at the start of each row
+    offsets = np.concatenate([o for _, o in parts])
+    with open(path, "rb") as f:
+        f.seek(int(offsets[123]))
+        assert float(f.readline().split(b",")[0]) == frame.iloc[123, 0]
+
+
+def test_csv_shards_are_capped_in_bytes(tmp_path):
+    path, frame = _feature_file(tmp_path)
+    shards = csv_shards(path, 2, max_bytes=4096)
+    assert len(shards) > 2 and all(hi - lo <= 4096 for _, _, lo, hi in shards)
+    assert sum(len(_read_csv_range(path, lo, hi)[0]) for _, _, lo, hi in shards) == len(frame)
+
+    summary = score_file(path, workers=1, shards_per_worker=1, shard_bytes=16384)
+    assert summary["rows"] == len(frame) and summary["shards"] == len(csv_shards(path, 1, max_bytes=16384)) > 1
+
+
+def test_pool_merge_matches_single_shard(tmp_path):
+    path, frame = _feature_file(tmp_path)
+    single = score_file(path, workers=1, top_k=5, shards_per_worker=1)
+    pooled = score_file(path, workers=2, top_k=5, shards_per_worker=5)
+
+    assert single["rows"] == pooled["rows"] == len(frame)
+    assert single["validation"]["rejected"] == pooled["validation"]["rejected"] == 0
+    assert single["class_counts"] == pooled["class_counts"]
+    # Saturated suspicion scores tie, so compare scores rather than which tied row won
+    assert np.allclose([t["suspicion"] for t in single["top_suspicious"]],
+                       [t["suspicion"] for t in pooled["top_suspicious"]])
+
+
+def test_parquet_conversion_and_arrow_scores(tmp_path):
+    from feature_store import convert_csv_to_parquet, preferred_path, read_features, read_scores
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    csv_path, frame = _feature_file(tmp_path)
+    parquet_path, rows = convert_csv_to_parquet(csv_path, row_group_size=200)
+    assert rows == len(frame) and preferred_path(csv_path) == parquet_path
+
+    schema = pq.read_schema(parquet_path)
+    assert schema.field("Rate").type == pa.float32()
+    assert pa.types.is_dictionary(schema.field("Label").type)
+    assert np.allclose(read_features(csv_path)[FEATURE_NAMES].to_numpy(), frame[FEATURE_NAMES].to_numpy(), rtol=1e-6)
+
+    summary = score_file(parquet_path, workers=1, scores_out=str(tmp_path / "scores"))
+    assert summary["shards"] == 3
+    scores = read_scores(str(tmp_path / "scores"))
+    assert scores.num_rows == len(frame)
+    assert sorted(scores.column("location").to_pylist()) == list(range(len(frame)))
+    counts = pd.Series(scores.column("threat_class").to_pylist()).value_counts().to_dict()
+    assert counts == {k: v for k, v in summary["class_counts"].items() if v}
+
+
+def test_invalid_rows_are_reported_not_scored(tmp_path):
+    from feature_store import read_scores
+
+    path, frame = _feature_file(tmp_path)
+    frame.loc[[5, 400], "UDP"] = frame.loc[[5, 400], "TCP"] = 1  # two transport protocols
+    frame.loc[7, "Rate"] = -1.0  # clipped to 0
+    frame.to_csv(path, index=False)
+
+    summary = score_file(path, workers=2, shards_per_worker=2, scores_out=str(tmp_path / "scores"))
+    validation = summary["validation"]
+    assert summary["rows"] == len(frame) and sum(summary["class_counts"].values()) == len(frame) - 2
+    assert validation["rejected"] == 2 and validation["clipped"] == 1
+    assert validation["issues"] == {"Rate": {"below_min": 1}, "transport": {"one_hot": 2}}
+    assert read_scores(str(tmp_path / "scores")).num_rows == len(frame) - 2
@@ -0,0 +1,33 @@
+# streamlit_app/test_calibrate.py
+# Temperature scaling must fix over-confidence without changing predictions; top-k must agree with the full path.
+import numpy as np
+import torch
+
+from calibrate import calibration_report, fit_temperature
+from inference import FEATURE_NAMES, predict_batch, predict_top_k, load_artifacts
+
+
+def test_temperature_softens_overconfident_logits():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 4, 4000)
+    clean = torch.nn.functional.one_hot(torch.as_tensor(labels), 4).float() * 2.0
+    noisy = clean + torch.as_tensor(rng.normal(scale=1.0, size=(4000, 4)), dtype=torch.float32)
+    logits = noisy * 5.0  # same argmax, wildly over-confident
+
+    temperature = fit_temperature(logits, labels)
+    report = calibration_report(logits, labels, temperature)
+    assert temperature > 2.0
+    assert report["after"]["ece"] < report["before"]["ece"] / 2
+    assert report["after"]["accuracy"] == report["before"]["accuracy"]
+
+
+def test_top_k_fast_path_matches_full_probabilities():
+    model, scaler, label_encoder, device, _ = load_artifacts(device=torch.device("cpu"))
+    features = np.random.default_rng(1).gamma(2.0, 50.0, size=(32, len(FEATURE_NAMES)))
+
+    classes, confidences, probabilities = predict_batch(features, model, scaler, label_encoder, device, 1.7)
+    top_classes, top_probabilities = predict_top_k(features, model, scaler, label_encoder, device, 2, 1.7)
+    assert top_classes.shape == top_probabilities.shape == (32, 2)
+    assert np.array_equal(top_classes[:, 0], classes)
+    assert np.allclose(top_probabilities[:, 0], confidences, atol=1e-6)
+    assert np.allclose(top_probabilities[:, 1], np.sort(probabilities, axis=1)[:, -2], atol=1e-6)
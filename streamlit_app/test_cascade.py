@@ -0,0 +1,44 @@
+# streamlit_app/test_cascade.py
+# The pre-filter must only short-circuit rows it clears; everything else is scored exactly as by the full model.
+import numpy as np
+import torch
+
+from cascade import Prefilter, cascade_predict, fit_prefilter, sweep
+from inference import FEATURE_NAMES, load_artifacts, predict_batch
+
+
+def _benign_and_attacks(scaler, n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    z = rng.normal(size=(2 * n, len(FEATURE_NAMES)))
+    z[n:, FEATURE_NAMES.index("Rate")] += 4.0  # attacks: much higher rate
+    is_benign = np.arange(2 * n) < n
+    return scaler.inverse_transform(z), is_benign
+
+
+def test_prefilter_clears_benign_and_passes_the_rest_to_the_model():
+    model, scaler, label_encoder, device, _ = load_artifacts(device=torch.device("cpu"))
+    features, is_benign = _benign_and_attacks(scaler)
+    prefilter = fit_prefilter(features, is_benign, scaler, threshold=0.9)
+
+    # scaler folded into the weights, and the JSON round trip keeps them
+    restored = Prefilter.from_dict(prefilter.to_dict())
+    assert np.allclose(restored.benign_probability(features), prefilter.benign_probability(features))
+
+    classes, confidences, probabilities, cleared = cascade_predict(features, prefilter, model, scaler,
+                                                                   label_encoder, device)
+    assert 0.3 < cleared[is_benign].mean() and cleared[~is_benign].mean() < 0.05
+    assert set(classes[cleared]) == {"Benign"}
+    assert np.allclose(probabilities.sum(axis=1), 1.0, atol=1e-5)
+
+    full_classes, _, full_probabilities = predict_batch(features[~cleared], model, scaler, label_encoder, device)
+    assert np.array_equal(classes[~cleared], full_classes)
+    assert np.allclose(probabilities[~cleared], full_probabilities)
+
+
+def test_threshold_sweep_trades_short_circuit_for_recall():
+    p_benign = np.linspace(0.0, 1.0, 1001)
+    model_attack = p_benign < 0.97  # the model flags everything the pre-filter is unsure about
+    rows = sweep(p_benign, model_attack, thresholds=(0.9, 0.95, 0.99))
+    assert [r["short_circuit"] for r in rows] == sorted((r["short_circuit"] for r in rows), reverse=True)
+    assert rows[0]["recall_loss_vs_model"] > 0 and rows[-1]["recall_loss_vs_model"] == 0
+    assert "recall_loss_vs_labels" not in rows[0]
@@ -0,0 +1,32 @@
+# streamlit_app/test_distill.py
+# The distilled student must track the LSTM teacher from window summaries alone.
+import numpy as np
+
+from distill import make_windows, window_summary, run
+from inference import FEATURE_NAMES
+
+
+def _labeled_runs(rows=3000, classes=4, run_length=40, seed=0):
+    """Consecutive runs of one class, each class shifting a few features"""
+    rng = np.random.default_rng(seed)
+    labels = np.repeat(rng.integers(0, classes, rows // run_length + 1), run_length)[:rows]
+    features = rng.normal(size=(rows, len(FEATURE_NAMES))).astype(np.float32)
+    features[:, :classes] += 3.0 * np.eye(classes, dtype=np.float32)[labels]
+    return features, labels
+
+
+def test_windows_are_labelled_by_last_row():
+    features, labels = _labeled_runs(rows=50)
+    windows, window_labels = make_windows(features, labels, seq_len=10)
+    assert windows.shape == (41, 10, len(FEATURE_NAMES))
+    assert np.array_equal(windows[5, -1], features[14]) and window_labels[5] == labels[14]
+    assert window_summary(windows).shape == (41, 3 * len(FEATURE_NAMES))
+
+
+def test_student_matches_teacher_and_is_cheaper():
+    features, labels = _labeled_runs()
+    _, _, report = run(features, labels, 4, student_kind="narrow", teacher_epochs=4, epochs=6, batch_size=64)
+    assert report["teacher"]["accuracy"] > 0.9
+    assert report["student"]["accuracy"] > 0.9
+    assert report["agreement"] > 0.9
+    assert report["student"]["params"] < report["teacher"]["params"]
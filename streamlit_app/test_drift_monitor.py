@@ -0,0 +1,46 @@
+# streamlit_app/test_drift_monitor.py
+# Streaming statistics must match batch numpy, and shifted/OOD traffic must be flagged.
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+from drift_monitor import DriftMonitor
+from inference import FEATURE_NAMES
+
+F = len(FEATURE_NAMES)
+
+
+def _monitor(rng):
+    train = rng.normal(10.0, 2.0, size=(5000, F))
+    return DriftMonitor(StandardScaler().fit(train), publish_every=1).fit_reference(train)
+
+
+def test_streaming_moments_and_quantiles_match_numpy():
+    rng = np.random.default_rng(0)
+    monitor = _monitor(rng)
+    live = rng.normal(10.0, 2.0, size=(3000, F))
+    for lo in range(0, len(live), 97):  # uneven batches
+        monitor.observe(live[lo:lo + 97])
+
+    scaled = (live - monitor.train_mean) / monitor.train_std
+    assert np.allclose(monitor.mean, scaled.mean(axis=0))
+    assert np.allclose(monitor.m2 / (monitor.count - 1), scaled.var(axis=0, ddof=1))
+    median, p99 = monitor.quantiles((0.5, 0.99))
+    assert np.allclose(median, np.median(live, axis=0), atol=0.3)
+    assert np.allclose(p99, np.quantile(live, 0.99, axis=0), atol=0.5)
+
+    report = monitor.report()
+    assert report["max_zscore"] < 0.15 and report["max_psi"] < 0.05
+    assert report["ood_fraction"] < 0.01
+
+
+def test_shifted_feature_and_outliers_are_flagged():
+    rng = np.random.default_rng(1)
+    monitor = _monitor(rng)
+    live = rng.normal(10.0, 2.0, size=(2000, F))
+    live[:, FEATURE_NAMES.index("Rate")] += 6.0  # three train std
+    live[:20] += 40.0
+    ood = monitor.observe(live)
+
+    assert ood[:20].all() and ood[20:].mean() < 0.05
+    top = monitor.report()["features"][0]
+    assert top["feature"] == "Rate" and top["zscore"] > 2.5 and top["psi"] > 1.0
@@ -0,0 +1,158 @@
+# streamlit_app/test_flow_features.py
+# Flow windows extracted from synthetic captures must match hand-computed features.
+import struct
+
+import numpy as np
+
+from flow_features import FlowFeatureExtractor, read_packets, write_pcap, extract_features
+from inference import FEATURE_NAMES
+
+COL = {name: i for i, name in enumerate(FEATURE_NAMES)}
+CLIENT, SERVER = (10, 0, 0, 2), (10, 0, 0, 1)
+
+
+def _frame(src, dst, sport, dport, proto=6, flags=0x10, payload=0):
+    if proto == 6:
+        l4 = struct.pack('!HHIIBBHHH', sport, dport, 0, 0, 5 << 4, flags, 1024, 0, 0)
+    else:
+        l4 = struct.pack('!HHHH', sport, dport, 8 + payload, 0)
+    l4 += bytes(payload)
+    ip = struct.pack('!BBHHHBBH4B4B', 0x45, 0, 20 + len(l4), 0, 0, 64, proto, 0, *src, *dst)
+    return bytes(6) + bytes(6) + b'\x08\x00' + ip + l4
+
+
+def _tcp_session(n, start=1000.0, step=0.01):
+    """n packets alternating client → server (SYN first) and server → client"""
+    packets = []
+    for i in range(n):
+        if i % 2 == 0:
+            frame = _frame(CLIENT, SERVER, 40000, 443, flags=0x02 if i == 0 else 0x18, payload=10 * i)
+        else:
+            frame = _frame(SERVER, CLIENT, 443, 40000, flags=0x10, payload=5)
+        packets.append((start + i * step, frame))
+    return packets
+
+
+def _write_pcapng(path, packets):
+    def block(block_type, body):
+        body += bytes(-len(body) % 4)
+        return struct.pack('<II', block_type, len(body) + 12) + body + struct.pack('<I', len(body) + 12)
+
+    with open(path, 'wb') as f:
+        f.write(block(0x0A0D0D0A, struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1)))
+        f.write(block(1, struct.pack('<HHI', 1, 0, 65535)))
+        for ts, frame in packets:
+            ticks = int(round(ts * 1e6))
+            f.write(block(6, struct.pack('<IIIII', 0, ticks >> 32, ticks & 0xFFFFFFFF, len(frame), len(frame)) + frame))
+
+
+def test_window_features_from_pcap(tmp_path):
+    path = tmp_path / "session.pcap"
+    write_pcap(path, _tcp_session(10))
+
+    batches = list(read_packets(str(path)))
+    assert sum(len(b) for b in batches) == 10
+
+    rows = list(extract_features(batches, window=10))
+    features = np.concatenate([f for f, _ in rows])
+    meta = np.concatenate([m for _, m in rows])
+    assert features.shape == (1, len(FEATURE_NAMES))
+    row = features[0]
+
+    lengths = np.array([len(f) for _, f in _tcp_session(10)], dtype=float)
+    fwd, bwd = lengths[0::2], lengths[1::2]
+    assert row[COL['Number']] == 10
+    assert row[COL['Protocol_Type']] == 6
+    assert row[COL['TCP']] == 1 and row[COL['HTTPS']] == 1 and row[COL['IPv']] == 1 and row[COL['UDP']] == 0
+    assert row[COL['syn_count']] == 1 and row[COL['syn_flag_number']] == 1
+    assert row[COL['ack_count']] == 9 and row[COL['psh_flag_number']] == 1
+    assert np.isclose(row[COL['Duration']], 0.09, atol=1e-5)
+    assert np.isclose(row[COL['IAT']], 0.01, atol=1e-5)
+    assert np.isclose(row[COL['Rate']], 10 / 0.09, rtol=1e-3)
+    assert np.isclose(row[COL['Srate']], 5 / 0.09, rtol=1e-3)
+    assert row[COL['Tot_sum']] == lengths.sum()
+    assert row[COL['Min']] == lengths.min() and row[COL['Max']] == lengths.max()
+    assert np.isclose(row[COL['Std']], lengths.std(), rtol=1e-4)
+    assert row[COL['Header_Length']] == 40
+    assert np.isclose(row[COL['Magnitude']], np.sqrt(fwd.mean() + bwd.mean()), rtol=1e-5)
+    assert row[COL['Weight']] == 25
+
+    assert meta['sport'][0] == 40000 and meta['dport'][0] == 443
+    assert meta['packets'][0] == 10
+
+
+def test_pcapng_matches_pcap_and_batching_is_invisible(tmp_path):
+    packets = _tcp_session(25) + [
+        (1000.5 + i * 0.001, _frame((10, 0, 0, 9), (8, 8, 8, 8), 5353, 53, proto=17, payload=30))
+        for i in range(12)
+    ]
+    packets.sort(key=lambda p: p[0])
+    write_pcap(tmp_path / "mixed.pcap", packets)
+    _write_pcapng(tmp_path / "mixed.pcapng", packets)
+
+    def extract(path, chunk_bytes, window):
+        extractor = FlowFeatureExtractor(window=window)
+        out = [extractor.update(b)[0] for b in read_packets(str(path), chunk_bytes=chunk_bytes)]
+        out.append(extractor.flush()[0])
+        rows = np.concatenate(out)
+        return rows[np.lexsort(rows.T[::-1])]
+
+    whole = extract(tmp_path / "mixed.pcap", 1 << 20, window=4)
+    # Small chunks split flows and windows across batches; results must not change
+    assert np.allclose(whole, extract(tmp_path / "mixed.pcap", 300, window=4), rtol=1e-5)
+    assert np.allclose(whole, extract(tmp_path / "mixed.pcapng", 1 << 20, window=4), rtol=1e-5)
+
+    udp = whole[whole[:, COL['UDP']] == 1]
+    assert (udp[:, COL['DNS']] == 1).all() and udp[:, COL['Number']].sum() == 12
+    # 25 TCP packets in windows of 4 → six full windows plus one single-packet remainder (dropped)
+    assert (whole[:, COL['TCP']] == 1).sum() == 6
+
+
+def test_idle_flows_are_flushed_and_compacted(tmp_path):
+    write_pcap(tmp_path / "early.pcap", _tcp_session(4, start=0.0))
+    write_pcap(tmp_path / "late.pcap", _tcp_session(2, start=100.0))
+    extractor = FlowFeatureExtractor(window=100, idle_timeout=5.0)
+
+    for batch in read_packets(str(tmp_path / "early.pcap")):
+        extractor.update(batch)
+    assert extractor.active_flows == 1
+
+    # A new connection 100s later evicts the idle one and emits its partial window
+    late = np.concatenate(list(read_packets(str(tmp_path / "late.pcap"))))
+    late['sport'][late['sport'] == 40000] = 40001
+    late['dport'][late['dport'] == 40000] = 40001
+    features, meta = extractor.update(late)
+    assert len(features) == 1 and features[0, COL['Number']] == 4
+    assert meta['sport'][0] == 40000
+    assert extractor.active_flows == 1
+
+
+def test_replay_pipeline_scores_every_window(tmp_path):
+    from inference import load_artifacts
+    from pcap_pipeline import run_pipeline
+
+    write_pcap(tmp_path / "replay.pcap", _tcp_session(40))
+    model, scaler, label_encoder, device, _ = load_artifacts()
+    alerts = []
+    stats = run_pipeline(str(tmp_path / "replay.pcap"), alerts.extend, model, scaler, label_encoder, device,
+                         window=10, queue_size=1)
+
+    assert [s.name for s in stats] == ["parse", "aggregate", "score", "sink"]
+    assert stats[0].items_out == stats[1].items_in == 40
+    assert stats[1].items_out == stats[2].items_out == len(alerts) == 4
+    assert alerts[0]["flow"]["dport"] == 443 and alerts[0]["flow"]["packets"] == 10
+    assert alerts[0]["threat_class"] in label_encoder.classes_
+
+    # Top-k fast path: same predictions, only k classes in the payload
+    top = []
+    run_pipeline(str(tmp_path / "replay.pcap"), top.extend, model, scaler, label_encoder, device,
+                 window=10, queue_size=1, top_k=2)
+    assert [a["threat_class"] for a in top] == [a["threat_class"] for a in alerts]
+    assert all(len(a["probabilities"]) == 2 for a in top)
+
+    # Explained alerts carry their top contributing features
+    from attribution import AttributionEngine
+    explained = []
+    run_pipeline(str(tmp_path / "replay.pcap"), explained.extend, model, scaler, label_encoder, device,
+                 window=10, queue_size=1, top_k=2, explainer=AttributionEngine(top_k=3))
+    assert all(len(a["attributions"]) == 3 for a in explained)
@@ -0,0 +1,79 @@
+# streamlit_app/test_model_registry.py
+# Replacing best_model.pth must hot-swap the serving bundle; shadow scoring stays off the request path.
+import os
+import shutil
+
+import numpy as np
+import torch
+
+from inference import FEATURE_NAMES, LightweightANN, ServingModel, load_artifacts
+from model_registry import ModelRegistry
+from online_update import OnlineUpdater
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _artifact_dir(path, seed):
+    os.makedirs(path, exist_ok=True)
+    for name in ("scaler.pkl", "label_encoder.pkl"):
+        shutil.copy(os.path.join(APP_DIR, name), path)
+    model, _, label_encoder, _, _ = load_artifacts(str(path), torch.device("cpu"))
+    torch.manual_seed(seed)
+    torch.save(LightweightANN(len(FEATURE_NAMES), len(label_encoder.classes_)).state_dict(),
+               os.path.join(path, "best_model.pth"))
+    return str(path)
+
+
+def test_reload_swaps_and_shadow_records_disagreement(tmp_path):
+    serving_dir = _artifact_dir(tmp_path / "serving", seed=1)
+    model, scaler, label_encoder, device, use_real_model = load_artifacts(serving_dir, torch.device("cpu"))
+    assert use_real_model
+    serving = ServingModel(model, scaler, label_encoder, device)
+    registry = ModelRegistry(serving, serving_dir, candidate_dir=_artifact_dir(tmp_path / "candidate", seed=2),
+                             shadow_fraction=1.0, settle_seconds=0, seed=0)
+    assert not registry.check()  # nothing changed yet
+
+    old = serving.current()
+    _artifact_dir(tmp_path / "serving", seed=3)
+    os.utime(os.path.join(serving_dir, "best_model.pth"), ns=(0, 10 ** 18))
+    assert registry.check()
+    new = serving.current()
+    assert new is not old and new.version.startswith("file-")
+    assert not torch.equal(new.model.layers[0].weight, old.model.layers[0].weight)
+
+    assert registry.check_candidate()
+    rows = np.random.default_rng(0).gamma(2.0, 50.0, size=(64, len(FEATURE_NAMES)))
+    for row in rows:
+        registry.predict(row)
+    registry.drain_shadow()
+    report = registry.shadow_report()
+    assert report["rows"] == len(rows) and report["dropped"] == 0
+    assert 0.0 <= report["disagreement_rate"] <= 1.0
+
+    registry.promote_candidate()
+    assert serving.current().version == report["candidate_version"]
+
+
+def test_online_update_is_checkpointed_and_survives_reload(tmp_path):
+    serving_dir = _artifact_dir(tmp_path / "serving", seed=1)
+    model, scaler, label_encoder, device, _ = load_artifacts(serving_dir, torch.device("cpu"))
+    serving = ServingModel(model, scaler, label_encoder, device)
+    registry = ModelRegistry(serving, serving_dir, settle_seconds=0)
+
+    known = str(label_encoder.classes_[0])
+    rng = np.random.default_rng(0)
+    updater = OnlineUpdater(serving, rng.normal(size=(32, len(FEATURE_NAMES))), np.array([known] * 32),
+                            epochs=1, registry=registry)
+    stats = updater.update(rng.gamma(2.0, 50.0, size=(8, len(FEATURE_NAMES))), np.array([known] * 8))
+
+    # The fine-tuned bundle is on disk and the watcher treats the files as its own
+    tuned = serving.current()
+    assert tuned.version == stats["version"]
+    assert not registry.check() and serving.current() is tuned
+    on_disk, _, _, _, _ = load_artifacts(serving_dir, torch.device("cpu"))
+    assert torch.equal(on_disk.layers[0].weight, tuned.model.layers[0].weight)
+
+    # Files written after the online round win
+    _artifact_dir(tmp_path / "serving", seed=3)
+    os.utime(os.path.join(serving_dir, "best_model.pth"), ns=(0, 10 ** 18))
+    assert registry.check() and serving.current().version.startswith("file-")
@@ -0,0 +1,37 @@
+# streamlit_app/test_online_update.py
+# Online fine-tuning must swap in a new bundle without touching the one being served.
+import numpy as np
+import torch
+
+from inference import FEATURE_NAMES, ServingModel, load_artifacts
+from online_update import OnlineUpdater, labels_to_arrays
+
+
+def test_update_swaps_copy_and_skips_unknown_labels():
+    model, scaler, label_encoder, device, _ = load_artifacts(device=torch.device("cpu"))
+    serving = ServingModel(model, scaler, label_encoder, device)
+    before = serving.current()
+    weights = {k: v.clone() for k, v in before.model.state_dict().items()}
+    seen = int(before.scaler.n_samples_seen_)
+
+    known = str(label_encoder.classes_[0])
+    records = [{"label": known, "features": {name: 1.0 + i for name in FEATURE_NAMES}} for i in range(8)]
+    records.append({"label": "NotAClass", "features": {name: 1.0 for name in FEATURE_NAMES}})
+    # labels on analyses stored without (complete) features are skipped, never zero-filled
+    records.append({"label": known, "features": {}})
+    records.append({"label": known, "features": dict(records[0]["features"], Rate=None)})
+    records.append({"label": known})
+    features, labels, missing = labels_to_arrays(records)
+    assert features.shape == (9, len(FEATURE_NAMES)) and missing == 3 and not (features == 0).all(axis=1).any()
+
+    rng = np.random.default_rng(0)
+    updater = OnlineUpdater(serving, rng.normal(size=(32, len(FEATURE_NAMES))), np.array([known] * 32), epochs=1)
+    stats = updater.update(features, labels)
+
+    assert stats["used"] == 8 and stats["skipped_unknown_label"] == 1
+    after = serving.current()
+    assert after is not before and after.version == stats["version"]
+    assert int(after.scaler.n_samples_seen_) == seen + 8
+    # The previous bundle is untouched, so in-flight requests keep consistent state
+    assert int(before.scaler.n_samples_seen_) == seen
+    assert all(torch.equal(v, before.model.state_dict()[k]) for k, v in weights.items())
@@ -111,6 +111,7 @@ if app_mod is None:
         return probs
 
     def predict_threat(features, model, scaler, label_encoder, device, use_real_model):
+        # Same return shape as the app's predict_threat; this fallback doesn't check or clip the row
         features_scaled = scaler.transform([features])
         try:
             import torch
@@ -125,14 +126,16 @@ if app_mod is None:
                     label_encoder.classes_[i]: float(probabilities[i])
                     for i in range(len(label_encoder.classes_))
                 }
-                return threat_class, confidence, all_probabilities
+                return threat_class, confidence, all_probabilities, list(features), []
         except Exception:
             probs = _fallback_probs_from_features(features, label_encoder)
             pred_idx = int(np.argmax(probs))
             return (
                 label_encoder.inverse_transform([pred_idx])[0],
                 float(probs[pred_idx]),
-                {label_encoder.classes_[i]: float(probs[i]) for i in range(len(probs))}
+                {label_encoder.classes_[i]: float(probs[i]) for i in range(len(probs))},
+                list(features),
+                []
             )
 
 # -------------------------------
@@ -142,8 +145,13 @@ try:
     if not isinstance(FEATURE_NAMES, (list, tuple)):
         # If it's a set (or other), convert to list in deterministic order
         if isinstance(FEATURE_NAMES, set):
-            print("WARNING: FEATURE_NAMES imported as set — converting to sorted list (order may differ).")
-            FEATURE_NAMES = sorted(list(FEATURE_NAMES))
+            # A set has no order; take the model's order from the feature schema instead
+            try:
+                from feature_schema import feature_order
+                FEATURE_NAMES = feature_order(FEATURE_NAMES)
+            except (ImportError, ValueError):
+                print("WARNING: FEATURE_NAMES imported as set — falling back to default feature ordering.")
+                FEATURE_NAMES = DEFAULT_FEATURE_NAMES.copy()
         else:
             # if it's something unexpected, try list() conversion then fallback to default
             try:
@@ -285,7 +293,7 @@ for name, sample_dict in SAMPLE_DICTS.items():
     if len(sample_vec) != len(FEATURE_NAMES):
         print(f"Sample '{name}' has incorrect length ({len(sample_vec)} != {len(FEATURE_NAMES)}) - skipping")
         continue
-    threat_class, confidence, all_probabilities = predict_threat(
+    threat_class, confidence, all_probabilities, _, _ = predict_threat(
         sample_vec, model, scaler, label_encoder, device, use_real_model
     )
     print(f"Sample: {name}")
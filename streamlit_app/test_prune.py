@@ -0,0 +1,38 @@
+# streamlit_app/test_prune.py
+# Pruned variants must be real smaller networks that the serving loaders can read back.
+import torch
+
+from inference import FEATURE_NAMES, LightweightANN, load_model_checkpoint, save_model_checkpoint
+from prune import flops_per_row, mark_pareto, prune_widths
+
+
+def test_prune_keeps_function_at_full_width_and_slices_below_it():
+    torch.manual_seed(0)
+    model = LightweightANN(len(FEATURE_NAMES), 4).eval()
+    x = torch.randn(16, len(FEATURE_NAMES))
+
+    same = prune_widths(model, (256, 128, 64)).eval()
+    assert torch.allclose(same(x), model(x), atol=1e-5)
+
+    small = prune_widths(model, (64, 32, 16))
+    assert small.hidden_sizes == (64, 32, 16)
+    assert flops_per_row(small) < flops_per_row(model) / 9
+
+
+def test_checkpoint_records_architecture_and_bare_state_dicts_still_load(tmp_path):
+    small = LightweightANN(len(FEATURE_NAMES), 4, hidden_sizes=(48, 24))
+    path = save_model_checkpoint(str(tmp_path / "pruned.pth"), small)
+    assert load_model_checkpoint(path, 4, torch.device("cpu")).hidden_sizes == (48, 24)
+
+    bare = str(tmp_path / "best_model.pth")
+    torch.save(LightweightANN(len(FEATURE_NAMES), 4).state_dict(), bare)
+    assert load_model_checkpoint(bare, 4, torch.device("cpu")).hidden_sizes == (256, 128, 64)
+
+
+def test_pareto_flags_dominated_rows():
+    rows = mark_pareto([
+        {"accuracy": 0.95, "flops": 100, "batch_ms": 1.0},
+        {"accuracy": 0.94, "flops": 120, "batch_ms": 1.2},   # worse everywhere
+        {"accuracy": 0.90, "flops": 10, "batch_ms": 0.2},
+    ])
+    assert [r["pareto"] for r in rows] == [True, False, True]
@@ -0,0 +1,35 @@
+# streamlit_app/test_synth_traffic.py
+# Synthetic rows must be reproducible, follow the class mix and profiles, and round-trip through the feature store.
+import numpy as np
+
+from feature_store import read_features
+from inference import FEATURE_NAMES
+from synth_traffic import CLASSES, PROFILES, generate, parse_mix, stream, write_file
+
+
+def test_rows_follow_mix_profiles_and_seed():
+    features, labels = generate(200000, mix=parse_mix("Benign=0.7,DDoS=0.2,Recon=0.1"), seed=7)
+    assert features.shape == (200000, len(FEATURE_NAMES)) and features.dtype == np.float32
+    assert set(labels) == {"Benign", "DDoS", "Recon"}
+    assert abs((labels == "Benign").mean() - 0.7) < 0.01
+
+    col = {name: i for i, name in enumerate(FEATURE_NAMES)}
+    for name in ("Benign", "DDoS"):
+        rows = features[labels == name]
+        # log-normal noise keeps the mean at the profile center
+        assert np.isclose(rows[:, col["Rate"]].mean(), PROFILES[name]["Rate"], rtol=0.02)
+        assert np.allclose(rows[:, col["Srate"]] + rows[:, col["Drate"]], rows[:, col["Rate"]], rtol=1e-5)
+        assert np.all(rows[:, col["Min"]] <= rows[:, col["AVG"]]) and np.all(rows[:, col["AVG"]] <= rows[:, col["Max"]])
+    assert set(np.unique(features[:, col["syn_flag_number"]])) == {0.0, 1.0}
+
+    again, _ = generate(200000, mix=parse_mix("Benign=0.7,DDoS=0.2,Recon=0.1"), seed=7)
+    assert np.array_equal(features, again)
+
+
+def test_streamed_parquet_and_csv_round_trip(tmp_path):
+    for name in ("synth.parquet", "synth.csv"):
+        path = str(tmp_path / name)
+        assert write_file(path, stream(10000, batch_size=3000, seed=1)) == 10000
+        frame = read_features(path)
+        assert list(frame.columns) == FEATURE_NAMES + ["Label"]
+        assert len(frame) == 10000 and set(frame["Label"].astype(str)) == set(CLASSES)